@@ -0,0 +1,205 @@
+"""
+The cheap parts of authentication: who a logged-in request belongs to, and
+password hashing kept off the request threads.
+
+Every @login_required request loads its user. UserCache keeps the identity
+of recently seen users (id, username, email, settings) for USER_CACHE_TTL
+seconds, so polling /get-slides doesn't read the user table each time.
+Views change an account through the User model and then invalidate its
+entry; other worker processes pick the change up when their entry expires.
+current_user is a CachedUser: read it, never write to it.
+
+bcrypt is slow on purpose (BCRYPT_LOG_ROUNDS: each extra round doubles the
+cost). PasswordHasher runs it on PASSWORD_HASH_WORKERS threads of its own,
+so a burst of logins takes that many cores at most, and refuses work once
+PASSWORD_HASH_QUEUE requests are already waiting: sign-ins are answered 503
+instead of tying up every worker. Hashes made with another number of rounds
+are upgraded at the next successful login.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_login import UserMixin
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+
+from models import User, db
+
+
+class CachedUser(UserMixin):
+    """Identity of a logged-in user, detached from the database session"""
+
+    def __init__(self, id, username, email, response_cache_enabled=True):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.response_cache_enabled = response_cache_enabled
+
+    @classmethod
+    def from_row(cls, row):
+        """From a User (or a row with its columns)"""
+        return cls(row.id, row.username, row.email, row.response_cache_enabled)
+
+
+class UserCache:
+    """Thread-safe LRU + TTL cache of user id -> CachedUser"""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id, load):
+        """
+        Cached identity of a user, else load(user_id) (not cached when None)
+        Returns: CachedUser or None
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        user = load(user_id)
+        if user is not None:
+            self.put(user)
+        return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Forget a user after a change to their account"""
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+def load_identity(user_id):
+    """
+    Read a user's identity from the database
+    Returns: CachedUser or None
+    """
+    row = db.session.execute(
+        select(User.id, User.username, User.email, User.response_cache_enabled).where(User.id == user_id)
+    ).first()
+    return CachedUser.from_row(row) if row is not None else None
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password hashes waiting, the request should be retried later"""
+
+
+class PasswordHasher:
+    """bcrypt hashing and checks on a bounded pool of threads"""
+
+    def __init__(self, bcrypt, rounds=12, workers=2, max_pending=4):
+        self.bcrypt = bcrypt
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # Running plus waiting
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(('hashes', 'checks', 'busy', 'upgrades', 'pending', 'peak_pending'), 0)
+        self._seconds = 0.0
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+            self._counters['peak_pending'] = max(self._counters['peak_pending'], self._counters['pending'])
+
+    def _run(self, counter, function, *args):
+        """
+        function(*args) on the pool, waiting for its result
+        Raises: PasswordHasherBusy when the pool's queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count(busy=1)
+            raise PasswordHasherBusy()
+        self._count(pending=1, **{counter: 1})
+        started = time.perf_counter()
+        try:
+            return self._executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._counters['pending'] -= 1
+                self._seconds += time.perf_counter() - started
+
+    def hash(self, password):
+        """Returns: bcrypt hash (str) with the configured rounds"""
+        return self._run('hashes', self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def check(self, password_hash, password):
+        return self._run('checks', self.bcrypt.check_password_hash, password_hash, password)
+
+    def needs_upgrade(self, password_hash):
+        """Whether a hash was made with another number of rounds ("$2b$12$...")"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def upgraded(self):
+        self._count(upgrades=1)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            done = counters['hashes'] + counters['checks']
+            counters.update({
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "mean_ms": round(self._seconds / done * 1000, 1) if done else 0.0,
+            })
+            return counters
+
+
+def existing_account(username, email):
+    """
+    Which of a username and an email is already taken (one query)
+    Returns: "username", "email" or None
+    """
+    rows = db.session.execute(
+        select(User.username, User.email).where(or_(User.username == username, User.email == email)).limit(2)
+    ).all()
+    if any(row.username == username for row in rows):
+        return "username"
+    return "email" if rows else None
+
+
+def create_user(username, email, password_hash):
+    """
+    Insert an account; the unique constraints settle a race with another sign-up
+    Returns: (User, None) or (None, "username" | "email") when one is taken
+    """
+    user = User(username=username, email=email, password=password_hash)
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return None, "email" if "user.email" in str(e.orig) else "username"
+    return user, None
@@ -0,0 +1,301 @@
+"""
+Admission control for the generation endpoints.
+
+/chat, /chat/stream, /batch, /update and /upload-image each cost tokens,
+estimated before any work is done: a model call, plus a little per slide
+the model reads or writes and per image downloaded or processed (one
+typical new deck is about 1 token). Every request is charged to two token
+buckets - the user's own and a global one for the whole deployment - which
+refill at ADMISSION_*_RATE tokens a minute up to ADMISSION_*_BURST. The
+buckets are rows of the rate_bucket table, so every worker process on the
+database shares them, and charging both is one short write transaction.
+
+A request that finds too few tokens can still reserve them when they will
+be there within ADMISSION_MAX_WAIT seconds and fewer than
+ADMISSION_QUEUE_DEPTH requests of this process are already waiting: the
+bucket goes into debt, so later requests queue behind it, and the request
+sleeps until its turn. Anything else is refused at once with 429 and a
+Retry-After header, before a prompt is built or a model called. A request
+costing more than a bucket holds empties it, except a /batch request: it
+costs a deck per prompt, and one that would never fit is refused with the
+number of prompts that do.
+"""
+import asyncio
+import functools
+import logging
+import math
+import threading
+import time
+
+from flask import jsonify, request, session
+from flask_login import current_user
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from instrumentation import log
+from models import Presentation, RateBucket, db, db_step
+from services import admission
+
+# Cost estimates (tokens)
+MODEL_CALL_COST = 0.5
+SLIDE_COST = 0.02  # per slide the model reads or writes
+IMAGE_COST = 0.04  # per image downloaded or processed
+UPLOAD_COST = 0.1  # an uploaded image: decoded and resized on the server
+EXPECTED_DECK_SLIDES = 8
+
+GLOBAL_KEY = 'global'
+
+
+def deck_cost(slides=EXPECTED_DECK_SLIDES):
+    """Tokens of generating a new deck and its images"""
+    return MODEL_CALL_COST + slides * (SLIDE_COST + IMAGE_COST)
+
+
+def chat_cost():
+    return deck_cost()
+
+
+def update_cost():
+    """
+    Tokens of an edit: the model reads the deck (its size from the request
+    or, when the slides aren't sent, from the stored deck) and one new slide
+    may need an image
+    """
+    data = request.get_json(silent=True) or {}
+    slides = data.get('slides')
+    if isinstance(slides, list):
+        count = len(slides)
+    else:
+        presentation_id = data.get('presentation_id') or session.get('presentation_id')
+        count = db.session.execute(
+            select(Presentation.slide_count).where(Presentation.id == presentation_id,
+                                                   Presentation.user_id == current_user.id)
+        ).scalar() or 0
+    return MODEL_CALL_COST + count * SLIDE_COST + IMAGE_COST
+
+
+def upload_cost():
+    return UPLOAD_COST
+
+
+def take_tokens(buckets, cost, now, max_wait):
+    """
+    Charge cost to every bucket in one transaction, all or none
+    buckets: [(key, rate in tokens per second, capacity)]
+    Returns: (True, seconds until the tokens are there - 0 for now) or, when
+    that is more than max_wait, (False, seconds until they would be)
+    """
+    with db.engine.connect() as connection:
+        # A write first: the transaction holds the write lock before it reads
+        connection.execute(insert(RateBucket).values([
+            {"key": key, "tokens": capacity, "updated_at": now} for key, _, capacity in buckets
+        ]).on_conflict_do_nothing())
+        rows = {row.key: row for row in connection.execute(
+            select(RateBucket.key, RateBucket.tokens, RateBucket.updated_at)
+            .where(RateBucket.key.in_([key for key, _, _ in buckets]))
+        )}
+        wait = 0.0
+        levels = {}
+        for key, rate, capacity in buckets:
+            row = rows[key]
+            level = min(capacity, row.tokens + max(0.0, now - row.updated_at) * rate) - cost
+            levels[key] = level
+            if level < 0:
+                wait = max(wait, -level / rate)
+        if wait > max_wait:
+            connection.rollback()
+            return False, wait
+        for key, level in levels.items():
+            connection.execute(update(RateBucket).where(RateBucket.key == key).values(tokens=level, updated_at=now))
+        connection.commit()
+    return True, wait
+
+
+class AdmissionControl:
+    """
+    Per-user and global token buckets (rates in tokens per minute, 0: no
+    limit), and this process's queue of requests waiting for their turn
+    """
+
+    def __init__(self, user_rate=10, user_burst=10, global_rate=300, global_burst=100,
+                 max_wait=10.0, queue_depth=8):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_wait = max_wait
+        self.queue_depth = queue_depth
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.refused = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.user_rate > 0 or self.global_rate > 0
+
+    def buckets(self, user_id):
+        buckets = []
+        if self.user_rate > 0:
+            buckets.append((f"user:{user_id}", self.user_rate / 60.0, self.user_burst))
+        if self.global_rate > 0:
+            buckets.append((GLOBAL_KEY, self.global_rate / 60.0, self.global_burst))
+        return buckets
+
+    def reserve(self, user_id, cost):
+        """
+        Reserve cost tokens for one of a user's requests
+        Returns: (admitted, seconds): admitted after waiting seconds (then
+        call done_waiting()), or refused until about seconds from now
+        """
+        buckets = self.buckets(user_id)
+        # A request costing more than a bucket holds empties it instead
+        cost = min([cost] + [capacity for _, _, capacity in buckets])
+        with self._lock:
+            # Only reserve ahead while there is room in the queue
+            queue_room = self._waiting < self.queue_depth
+            if queue_room:
+                self._waiting += 1
+        admitted, wait = take_tokens(buckets, cost, time.time(), self.max_wait if queue_room else 0.0)
+        with self._lock:
+            if queue_room and not (admitted and wait > 0):
+                self._waiting -= 1
+            if not admitted:
+                self.refused += 1
+            else:
+                self.admitted += 1
+                if wait > 0:
+                    self.queued += 1
+                    self.wait_seconds += wait
+        return admitted, wait
+
+    def oversize(self, user_id, cost):
+        """
+        Check a request that can't be split against the buckets: costing
+        more than one holds, it would never be admitted
+        Returns: None if it fits, else (the smallest capacity, seconds an
+        empty bucket takes to refill)
+        """
+        too_small = [(capacity, capacity / rate) for _, rate, capacity in self.buckets(user_id) if cost > capacity]
+        if not too_small:
+            return None
+        with self._lock:
+            self.refused += 1
+        return min(capacity for capacity, _ in too_small), max(seconds for _, seconds in too_small)
+
+    def done_waiting(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def admit(self, user_id, cost):
+        """
+        Charge a request, sleeping until its turn if it has to queue
+        Returns: None when admitted, else the 429 response
+        """
+        admitted, wait = self.reserve(user_id, cost)
+        if not admitted:
+            return too_many_requests(user_id, cost, wait)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self.done_waiting()
+        return None
+
+    async def aadmit(self, user_id, cost):
+        """admit() for the event loop: the reservation runs on a worker thread"""
+        admitted, wait = await db_step(self.reserve, user_id, cost)
+        if not admitted:
+            return too_many_requests(user_id, cost, wait)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.done_waiting()
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "refused": self.refused,
+                "waiting": self._waiting,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+def admission_from_config(config):
+    return AdmissionControl(
+        user_rate=config['ADMISSION_USER_RATE'],
+        user_burst=config['ADMISSION_USER_BURST'],
+        global_rate=config['ADMISSION_GLOBAL_RATE'],
+        global_burst=config['ADMISSION_GLOBAL_BURST'],
+        max_wait=config['ADMISSION_MAX_WAIT'],
+        queue_depth=config['ADMISSION_QUEUE_DEPTH']
+    )
+
+
+def too_many_requests(user_id, cost, retry_after, error=None, **fields):
+    """
+    429 with the seconds until the request could be admitted
+    error: message instead of the default one, fields: more of the body
+    """
+    seconds = max(1, math.ceil(retry_after))
+    log("admission_refused", logging.WARNING, user_id=user_id, cost=round(cost, 2), retry_after=seconds,
+        path=request.path)
+    response = jsonify({"error": error or f"Too many requests, try again in {seconds}s", "retry_after": seconds,
+                        **fields})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+
+def admit_request(cost):
+    """
+    Charge the current request to its user's token buckets
+    Returns: None when admitted, else the 429 response
+    """
+    if not admission.enabled:
+        return None
+    return admission.admit(current_user.id, cost)
+
+
+def admit_batch(decks):
+    """
+    Charge a /batch request for its new decks. A batch costing more than a
+    bucket holds is refused with 429, the number of prompts that do fit and
+    the time an empty bucket takes to refill, rather than capped at the
+    burst like other requests
+    Returns: None when admitted, else the 429 response
+    """
+    if not admission.enabled:
+        return None
+    cost = decks * deck_cost()
+    oversize = admission.oversize(current_user.id, cost)
+    if oversize is not None:
+        capacity, refill = oversize
+        fits = int(capacity // deck_cost())
+        return too_many_requests(current_user.id, cost, refill,
+                                 f"A batch of {decks} decks is more than your limit allows, "
+                                 f"send at most {fits} prompts at a time", max_prompts=fits)
+    return admission.admit(current_user.id, cost)
+
+
+def admission_required(cost):
+    """
+    Charge a view's requests to the current user's token buckets (apply
+    after login_required)
+    cost: function() -> tokens, called in the request
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            refused = admit_request(cost())
+            if refused is not None:
+                return refused
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
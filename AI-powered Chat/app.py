@@ -1,646 +1,205 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
-import google.generativeai as genai
+"""
+Flask entry point.
+
+create_app() builds an app: settings from the environment (config.py), the
+extensions, the auth, chat and media blueprints, and the CLI commands. The
+model client, caches, stores, job queue and media sweeper are created on
+first use (services.py), and the libraries only some requests need -
+requests, Pillow, python-pptx, the Gemini SDK - are imported by the code
+that uses them. Starting a worker is importing Flask and the models plus
+one query to see that the database is up to date.
+
+`app` - what `gunicorn app:app` and `flask --app app` load - is created
+from the environment the first time it is looked up, so importing this
+module to call create_app() with other settings doesn't build it.
+"""
+import hashlib
+import hmac
+import logging
 import os
-import json
-import base64
-import requests
-from io import BytesIO
-from PIL import Image
-from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
+import threading
 import time
-import urllib.parse
-from datetime import datetime
-
-# Load environment variables
-load_dotenv()
+from functools import partial
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///presentations.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-CORS(app)
+from flask import Flask, Response, current_app, g, request
+from flask_cors import CORS
 
-# Initialize extensions
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
+import auth_views
+import chat_views
+import media_views
+from commands import COMMANDS
+from config import config_from_env
+from http_cache import ASSET_URL_PREFIX, asset_integrity, asset_url, serve_asset
+from instrumentation import HTTP_SECONDS, REGISTRY, configure_logging, log, new_request_id, request_id_var
+from models import (configure_sqlite, db, mark_schema_current, schema_fingerprint, stored_schema_fingerprint,
+                    upgrade_schema)
+from search_index import backfill_search_index, create_search_index
+from services import EXTENSION_NAME, Services, get_services
+from session_state import backfill_summaries
+
+# Bump when a data backfill is added to prepare_database(), so databases
+# whose schema is already current run it once too
+DATA_VERSION = 1
+
+# Components that keep their own counters are reported as gauges on each
+# scrape: (metric prefix, services.Services attribute)
+COLLECTORS = [
+    ('slides_llm', 'llm'),
+    ('slides_jobs', 'job_queue'),
+    ('slides_response_cache', 'response_cache'),
+    ('slides_image_cache', 'image_cache'),
+    ('slides_export_cache', 'export_cache'),
+    ('slides_presentation_store', 'presentation_store'),
+    ('slides_conversation', 'conversation_memory'),
+    ('slides_media', 'media_sweeper'),
+    ('slides_assets', 'assets'),
+    ('slides_admission', 'admission'),
+    ('slides_user_cache', 'user_cache'),
+    ('slides_passwords', 'passwords'),
+]
+
+
+def create_app(config=None):
+    """
+    Build the app from environment settings, then config (a dict of
+    overrides), and bring its database up to date
+    Returns: Flask app
+    """
+    app = Flask(__name__)
+    app.config.update(config_from_env(app.instance_path))
+    if config:
+        app.config.update(config)
+    CORS(app)
+    configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'])
+
+    # Initialize extensions
+    db.init_app(app)
+    auth_views.login_manager.init_app(app)
+    app.extensions[EXTENSION_NAME] = Services(app)
+
+    # Create upload folder if it doesn't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    app.register_blueprint(auth_views.bp)
+    app.register_blueprint(chat_views.bp)
+    app.register_blueprint(media_views.bp)
+    app.add_url_rule('/metrics', 'metrics', metrics)
+    app.add_url_rule(ASSET_URL_PREFIX + '<path:filename>', 'asset', serve_asset)
+    app.add_template_global(asset_url)
+    app.add_template_global(asset_integrity)
+    app.before_request(start_request)
+    app.before_request(start_background_workers)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
+    for command in COMMANDS:
+        app.cli.add_command(command)
+
+    services = app.extensions[EXTENSION_NAME]
+    for prefix, name in COLLECTORS:
+        REGISTRY.register_collector(prefix, partial(services.stats, name))
+
+    if app.config['LLM_BACKEND'] == 'gemini' and not app.config['GEMINI_API_KEY']:
+        log("gemini_api_key_missing", logging.WARNING, detail="generation requests will fail")
 
-# Configure upload settings
-UPLOAD_FOLDER = 'static/uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    with app.app_context():
+        configure_sqlite(db.engine)
+        prepare_database()
+    return app
 
-# Create upload folder if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def prepare_database():
+    """
+    Upgrade the schema, create the search index and run the data backfills,
+    unless that was already done for the current models (checked with one
+    query, so a new worker doesn't inspect every table and scan the decks)
+    Returns: whether anything was run
+    """
+    fingerprint = hashlib.sha256(f"{schema_fingerprint()}:{DATA_VERSION}".encode()).hexdigest()
+    if stored_schema_fingerprint(db.engine) == fingerprint:
+        return False
+
+    started = time.perf_counter()
+    upgrade_schema(db.engine)
+    create_search_index(db.engine)
+    backfilled = backfill_summaries()
+    if backfilled:
+        log("summaries_backfilled", presentations=backfilled)
+    indexed = backfill_search_index()
+    if indexed:
+        log("search_index_backfilled", presentations=indexed)
+    mark_schema_current(db.engine, fingerprint)
+    log("database_prepared", duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    return True
+
+
+def start_request():
+    """Give the request an ID (the caller's X-Request-ID if sent) for its logs"""
+    g.request_started = time.perf_counter()
+    g.request_id = new_request_id(request.headers.get('X-Request-ID'))
+    request_id_var.set(g.request_id)
+
+
+def start_background_workers():
+    """Start this process's job workers and media sweeper with its first request (not for CLI commands)"""
+    services = get_services()
+    services.job_queue.start()
+    services.media_sweeper.start()
+
+
+def finish_request(response):
+    """
+    Record the request's latency and log it
+    For streamed responses this is the time to the first byte.
+    """
+    seconds = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    HTTP_SECONDS.observe(seconds, method=request.method, endpoint=endpoint, status=response.status_code)
+    # Only if the request already loaded the user, don't query for it here
+    user = g.get('_login_user')
+    log("request", logging.DEBUG if endpoint in ('static', 'asset', 'metrics') else logging.INFO,
+        method=request.method, path=request.path, endpoint=endpoint, status=response.status_code,
+        duration_ms=round(seconds * 1000, 2), user_id=user.get_id() if user is not None else None)
+    response.headers['X-Request-ID'] = g.request_id
+    return response
 
 
-# Database Models
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    presentations = db.relationship('Presentation', backref='user', lazy=True, cascade='all, delete-orphan')
+def end_request(error=None):
+    request_id_var.set(None)
 
 
-class Presentation(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    slides_data = db.Column(db.Text, nullable=False)  # JSON string
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+def metrics():
+    """
+    Prometheus metrics of this worker process (text exposition format):
+    per-stage and per-request latency histograms, model tokens and retries,
+    downloaded image sizes, and cache/job counters
+    Requires "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
+_default_app = None
+_default_app_lock = threading.Lock()
 
 
-def fetch_image_from_unsplash(query, index=0):
-    """
-    Fetch a relevant image from Unsplash based on search query
-    Returns: image URL or None
-    """
-    try:
-        # Using Unsplash Source API (no API key required)
-        # Format: https://source.unsplash.com/{WIDTH}x{HEIGHT}/?{KEYWORD}
-        
-        # Clean and improve search query
-        # Remove common words and use top keywords
-        stop_words = ['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about']
-        words = [w.lower() for w in query.split() if w.lower() not in stop_words]
-        
-        # Use top 3-4 most relevant keywords
-        search_term = ','.join(words[:4])
-        
-        # Build URL - Unsplash Source uses comma-separated keywords
-        image_url = f"https://source.unsplash.com/800x600/?{search_term}"
-        
-        print(f"   → Testing URL: {image_url}")
-        
-        # Test if image is accessible
-        response = requests.get(image_url, timeout=10, allow_redirects=True)
-        
-        if response.status_code == 200:
-            # Get the final redirected URL
-            final_url = response.url
-            print(f"   → Redirected to: {final_url[:60]}...")
-            return final_url
-        elif response.status_code == 503:
-            # Unsplash unavailable, use fallback
-            print(f"   → Unsplash unavailable (503), using fallback...")
-            return fetch_image_fallback(query, index)
-        else:
-            print(f"   → Status code: {response.status_code}")
-            return fetch_image_fallback(query, index)
-        
-    except Exception as e:
-        print(f"   → Error: {str(e)}")
-        print(f"   → Using fallback service...")
-        return fetch_image_fallback(query, index)
-
-
-def fetch_image_fallback(query, index=0):
-    """
-    Fallback image service using Lorem Picsum (always available)
-    Returns: image URL
-    """
-    try:
-        # Lorem Picsum provides random images with optional seed
-        # Format: https://picsum.photos/seed/{SEED}/800/600
-        seed = f"{query.replace(' ', '-')}-{index}"
-        fallback_url = f"https://picsum.photos/seed/{seed}/800/600"
-        
-        print(f"   → Fallback URL: {fallback_url}")
-        
-        # Test if accessible
-        response = requests.head(fallback_url, timeout=5)
-        if response.status_code == 200:
-            return fallback_url
-        
-        # If even fallback fails, use basic Lorem Picsum
-        return f"https://picsum.photos/800/600?random={index}"
-        
-    except Exception as e:
-        print(f"   → Fallback error: {str(e)}")
-        # Last resort: basic random image
-        return f"https://picsum.photos/800/600?random={index}"
-
-
-def download_and_save_image(image_url, slide_index):
-    """
-    Download image from URL and save to uploads folder
-    Returns: local file path or None
-    """
-    try:
-        print(f"   → Downloading image...")
-        response = requests.get(image_url, timeout=15, stream=True)
-        
-        if response.status_code == 200:
-            # Generate filename
-            timestamp = int(time.time())
-            filename = f"slide_{slide_index}_{timestamp}.jpg"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            # Save image
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            # Verify file was saved
-            file_size = os.path.getsize(filepath)
-            print(f"   → Saved {file_size} bytes to {filename}")
-            
-            # Return relative URL for frontend
-            return f"/static/uploads/{filename}"
-        else:
-            print(f"   → Download failed: Status {response.status_code}")
-            return None
-        
-    except Exception as e:
-        print(f"   → Download error: {str(e)}")
-        return None
-
-# Configure Gemini AI
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Initialize Gemini model - using gemini-2.5-pro-preview-05-06
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-# Store current presentation data
-current_presentation = {"slides": []}
-
-# Store uploaded images
-uploaded_images = []
-
-
-@app.route('/')
-def index():
-    """Render the main chat interface or login page"""
-    if current_user.is_authenticated:
-        return render_template('index.html', username=current_user.username)
-    return redirect(url_for('login'))
-
-
-@app.route('/signup', methods=['GET', 'POST'])
-def signup():
-    """Handle user registration"""
-    if current_user.is_authenticated:
-        return redirect(url_for('index'))
-    
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-        username = data.get('username')
-        email = data.get('email')
-        password = data.get('password')
-        
-        # Validation
-        if not username or not email or not password:
-            if request.is_json:
-                return jsonify({"error": "All fields are required"}), 400
-            flash('All fields are required', 'error')
-            return render_template('signup.html')
-        
-        # Check if user exists
-        if User.query.filter_by(username=username).first():
-            if request.is_json:
-                return jsonify({"error": "Username already exists"}), 400
-            flash('Username already exists', 'error')
-            return render_template('signup.html')
-        
-        if User.query.filter_by(email=email).first():
-            if request.is_json:
-                return jsonify({"error": "Email already registered"}), 400
-            flash('Email already registered', 'error')
-            return render_template('signup.html')
-        
-        # Create new user
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-        new_user = User(username=username, email=email, password=hashed_password)
-        db.session.add(new_user)
-        db.session.commit()
-        
-        if request.is_json:
-            return jsonify({"success": True, "message": "Account created successfully"})
-        
-        flash('Account created successfully! Please log in.', 'success')
-        return redirect(url_for('login'))
-    
-    return render_template('signup.html')
-
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    """Handle user login"""
-    if current_user.is_authenticated:
-        return redirect(url_for('index'))
-    
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-        username = data.get('username')
-        password = data.get('password')
-        
-        if not username or not password:
-            if request.is_json:
-                return jsonify({"error": "Username and password required"}), 400
-            flash('Username and password required', 'error')
-            return render_template('login.html')
-        
-        user = User.query.filter_by(username=username).first()
-        
-        if user and bcrypt.check_password_hash(user.password, password):
-            login_user(user)
-            if request.is_json:
-                return jsonify({"success": True, "username": user.username})
-            return redirect(url_for('index'))
-        else:
-            if request.is_json:
-                return jsonify({"error": "Invalid username or password"}), 401
-            flash('Invalid username or password', 'error')
-            return render_template('login.html')
-    
-    return render_template('login.html')
-
-
-@app.route('/logout')
-@login_required
-def logout():
-    """Handle user logout"""
-    logout_user()
-    flash('You have been logged out', 'info')
-    return redirect(url_for('login'))
-
-
-@app.route('/history')
-@login_required
-def history():
-    """Show user's presentation history"""
-    presentations = Presentation.query.filter_by(user_id=current_user.id).order_by(Presentation.updated_at.desc()).all()
-    return render_template('history.html', presentations=presentations, username=current_user.username)
-
-
-@app.route('/chat', methods=['POST'])
-@login_required
-def chat():
-    """
-    Handle chat requests for generating PowerPoint slides
-    Expects: {"prompt": "user message", "include_images": []}
-    Returns: {"slides": [...], "message": "AI response"}
-    """
-    global current_presentation
-    
-    try:
-        data = request.get_json()
-        user_prompt = data.get('prompt', '')
-        include_images = data.get('include_images', [])
-        
-        if not user_prompt:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        # Add image context to prompt if images are included
-        image_context = ""
-        if include_images:
-            image_context = f"\n\nNote: User wants to include {len(include_images)} image(s) in the presentation. Add 'image_placeholder' field to slides where images should appear."
-        
-        # Create a detailed prompt for Gemini to generate slide content
-        # Add personalized greeting with user's name
-        user_greeting = f"Hello {current_user.username}! "
-        
-        system_prompt = user_greeting + """You are an AI assistant specialized in creating PowerPoint presentations with images.
-        
-        CRITICAL: You MUST add image_search_query to EVERY slide (except pure text conclusion slides).
-        
-        Your response MUST be in this exact JSON format:
-        {
-          "slides": [
-            {
-              "title": "Slide Title",
-              "content": ["Point 1", "Point 2", "Point 3"],
-              "image_search_query": "specific descriptive search terms",
-              "image_position": "right"
-            }
-          ],
-          "message": "A brief confirmation message to the user"
-        }
-        
-        MANDATORY RULES:
-        - EVERY slide MUST have "image_search_query" field (cannot be empty or null)
-        - Use very specific, descriptive search terms for images
-        - For title slides: use dramatic, relevant background images
-        - For content slides: use illustrative, topic-related images
-        - image_position options: "right" (default), "left", "center", "background" (for title slides)
-        
-        EXAMPLES OF GOOD image_search_query:
-        - "artificial intelligence neural network visualization"
-        - "climate change melting glacier arctic"
-        - "healthy food colorful vegetables fruits"
-        - "modern office teamwork collaboration"
-        - "space exploration rocket launch"
-        
-        Guidelines:
-        - Create 5-7 slides unless specified otherwise
-        - Each slide needs clear title and 3-5 bullet points
-        - First slide (title): use "background" position
-        - Content slides: use "right" or "left" position
-        - Last slide (conclusion): use "center" or "background"
-        - Make image searches highly specific to slide content
-        
-        User request: """ + user_prompt
-        
-        # Generate content using Gemini
-        print(f"\n🤖 Sending prompt to Gemini AI...")
-        response = model.generate_content(system_prompt)
-        response_text = response.text.strip()
-        print(f"\n📝 AI Response (first 500 chars):\n{response_text[:500]}...\n")
-        
-        # Extract JSON from response (handle markdown code blocks)
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        # Parse JSON response
-        try:
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, create a structured response
-            result = {
-                "slides": [
-                    {
-                        "title": "Generated Content",
-                        "content": response_text.split('\n')[:5]
-                    }
-                ],
-                "message": "Slides generated successfully!"
-            }
-        
-        # Fetch images for slides that have image_search_query
-        slides_with_images = result.get("slides", [])
-        print(f"\n🖼️ Processing {len(slides_with_images)} slides for images...")
-        
-        for index, slide in enumerate(slides_with_images):
-            image_query = slide.get("image_search_query", "")
-            
-            if image_query and image_query.strip():
-                query = image_query.strip()
-                print(f"\n📸 Slide {index + 1}: Searching for '{query}'")
-                
-                # Fetch image from Unsplash
-                image_url = fetch_image_from_unsplash(query, index)
-                
-                if image_url:
-                    print(f"   ✓ Found image URL: {image_url[:50]}...")
-                    # Download and save image
-                    local_url = download_and_save_image(image_url, index)
-                    if local_url:
-                        slide["image_url"] = local_url
-                        slide["has_image"] = True
-                        print(f"   ✅ Image saved: {local_url}")
-                    else:
-                        slide["has_image"] = False
-                        print(f"   ❌ Failed to save image")
-                else:
-                    slide["has_image"] = False
-                    print(f"   ❌ No image found for query")
-            else:
-                slide["has_image"] = False
-                print(f"\n⚠️ Slide {index + 1}: No image_search_query provided by AI")
-        
-        # Count successful images
-        images_added = sum(1 for s in slides_with_images if s.get("has_image", False))
-        print(f"\n✅ Successfully added {images_added}/{len(slides_with_images)} images\n")
-        
-        result["slides"] = slides_with_images
-        
-        # Store the current presentation
-        current_presentation = {"slides": result.get("slides", [])}
-        
-        # Save presentation to database
-        try:
-            # Extract title from first slide or use default
-            title = result.get("slides", [{}])[0].get("title", "Untitled Presentation") if result.get("slides") else "Untitled Presentation"
-            slides_json = json.dumps(result.get("slides", []))
-            
-            presentation = Presentation(
-                title=title,
-                user_id=current_user.id,
-                slides_data=slides_json
-            )
-            db.session.add(presentation)
-            db.session.commit()
-            
-            result["presentation_id"] = presentation.id
-            print(f"\n💾 Presentation saved: ID={presentation.id}, Title='{title}'")
-        except Exception as save_error:
-            print(f"Warning: Could not save presentation: {save_error}")
-        
-        # Add personalized message
-        if "message" not in result or not result["message"]:
-            result["message"] = f"Great work, {current_user.username}! Your slides are ready!"
-        else:
-            result["message"] = f"{current_user.username}, " + result["message"]
-        
-        return jsonify(result)
-    
-    except Exception as e:
-        print(f"Error in /chat: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route('/update', methods=['POST'])
-def update():
-    """
-    Handle slide update requests
-    Expects: {"prompt": "edit instruction", "slides": [current slides]}
-    Returns: {"slides": [...], "message": "AI response"}
-    """
-    global current_presentation
-    
-    try:
-        data = request.get_json()
-        user_prompt = data.get('prompt', '')
-        current_slides = data.get('slides', current_presentation.get("slides", []))
-        
-        if not user_prompt:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        # Create prompt for updating slides
-        system_prompt = f"""You are an AI assistant helping to edit PowerPoint presentations.
-        
-        Current slides:
-        {json.dumps(current_slides, indent=2)}
-        
-        User wants to: {user_prompt}
-        
-        Please provide the UPDATED complete slide deck in this JSON format:
-        {{
-          "slides": [
-            {{
-              "title": "Slide Title",
-              "content": ["Point 1", "Point 2", "Point 3"]
-            }}
-          ],
-          "message": "Brief description of changes made"
-        }}
-        
-        Important:
-        - Return ALL slides, including unchanged ones
-        - Make only the changes requested by the user
-        - Maintain the same structure and format
-        - If editing a specific slide number, count from 1 (not 0)
-        """
-        
-        # Generate updated content
-        response = model.generate_content(system_prompt)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        # Parse JSON response
-        try:
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Failed to parse AI response"}), 500
-        
-        # Update stored presentation
-        current_presentation = {"slides": result.get("slides", [])}
-        
-        return jsonify(result)
-    
-    except Exception as e:
-        print(f"Error in /update: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route('/get-slides', methods=['GET'])
-@login_required
-def get_slides():
-    """Get current presentation slides"""
-    return jsonify(current_presentation)
-
-
-@app.route('/load-presentation/<int:presentation_id>')
-@login_required
-def load_presentation(presentation_id):
-    """Load a specific presentation from history"""
-    presentation = Presentation.query.filter_by(id=presentation_id, user_id=current_user.id).first()
-    
-    if not presentation:
-        return jsonify({"error": "Presentation not found"}), 404
-    
-    slides = json.loads(presentation.slides_data)
-    return jsonify({
-        "slides": slides,
-        "title": presentation.title,
-        "created_at": presentation.created_at.isoformat(),
-        "updated_at": presentation.updated_at.isoformat()
-    })
-
-
-@app.route('/delete-presentation/<int:presentation_id>', methods=['DELETE'])
-@login_required
-def delete_presentation(presentation_id):
-    """Delete a presentation"""
-    presentation = Presentation.query.filter_by(id=presentation_id, user_id=current_user.id).first()
-    
-    if not presentation:
-        return jsonify({"error": "Presentation not found"}), 404
-    
-    db.session.delete(presentation)
-    db.session.commit()
-    
-    return jsonify({"success": True, "message": "Presentation deleted"})
-
-
-@app.route('/upload-image', methods=['POST'])
-def upload_image():
-    """
-    Handle image uploads for slides
-    Returns: {"success": true, "filename": "...", "url": "..."}
-    """
-    global uploaded_images
-    
-    try:
-        if 'image' not in request.files:
-            return jsonify({"error": "No image file provided"}), 400
-        
-        file = request.files['image']
-        
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-        
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid conflicts
-            import time
-            timestamp = str(int(time.time()))
-            filename = f"{timestamp}_{filename}"
-            
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Store image info
-            image_url = f"/static/uploads/{filename}"
-            uploaded_images.append({
-                "filename": filename,
-                "url": image_url,
-                "path": filepath
-            })
-            
-            return jsonify({
-                "success": True,
-                "filename": filename,
-                "url": image_url
-            })
-        else:
-            return jsonify({"error": "Invalid file type. Allowed: png, jpg, jpeg, gif, bmp, webp"}), 400
-    
-    except Exception as e:
-        print(f"Error in /upload-image: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route('/get-images', methods=['GET'])
-def get_images():
-    """Get list of uploaded images"""
-    return jsonify({"images": uploaded_images})
+def __getattr__(name):
+    """Create the module's `app` from the environment on first lookup"""
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app
 
 
 if __name__ == '__main__':
+    application = create_app()
     # Create database tables
-    with app.app_context():
+    with application.app_context():
         db.create_all()
         print("✅ Database tables created")
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
+
+    application.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,251 @@
+"""
+ASGI entry point, for an async server:
+
+    uvicorn asgi:app --workers 4
+
+POST /chat and POST /update spend nearly all their time waiting on Gemini
+and the image hosts. Here they are served by the coroutines of
+async_views.py on the server's event loop: a request waiting for the model
+or an image download holds no thread, so a process keeps as many
+generations in flight as LLM_MAX_IN_FLIGHT and ASYNC_HTTP_MAX_CONNECTIONS
+allow instead of one per thread. Their database steps run on the loop's
+worker threads.
+
+Every other request goes to the unchanged Flask app, run as a WSGI app on a
+pool of ASGI_SYNC_THREADS threads (streamed responses included), so the
+sync views behave as they do under a threaded WSGI server. Requests are
+routed with the Flask app's URL map, so a coroutine view gets the same
+endpoint, URL rule and view arguments as the sync view it stands in for,
+and request bodies are capped at MAX_CONTENT_LENGTH (413) on both paths.
+The WSGI entry point (`gunicorn app:app`) still serves everything with the
+sync views.
+
+`app` is created from the environment the first time it is looked up (from
+app.app, so both entry points share one Flask app in a process);
+create_asgi_app() wraps another one.
+"""
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+import async_views
+from services import get_services
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ of an ASGI HTTP request, for Flask's request context"""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        # Repeated headers are joined, as WSGI servers do
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    # The body has been read whole: a chunked one has no Content-Length header
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+async def read_body(scope, receive, limit=None):
+    """
+    The request body, unless it is larger than limit bytes (by its
+    Content-Length or as it arrives); the rest of it is not read then
+    Returns: bytes, or None when it is too large
+    """
+    if limit is not None:
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length' and value.isdigit() and int(value) > limit:
+                return None
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if limit is not None and len(body) > limit:
+            return None
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def too_large(**view_args):
+    raise RequestEntityTooLarge()
+
+
+async def send_response(response, send):
+    """Send a (non-streamed) Flask response"""
+    headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+    response.close()
+
+
+def run_wsgi(wsgi_app, environ, send, loop):
+    """
+    Run a WSGI app on the calling (pool) thread, sending its response through
+    the event loop chunk by chunk as it is produced
+    """
+    def send_message(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and started.get("sent"):
+            raise exc_info[1].with_traceback(exc_info[2])
+        started["message"] = {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+        }
+
+    def start():
+        if not started.get("sent"):
+            started["sent"] = True
+            send_message(started["message"])
+
+    body = wsgi_app(environ, start_response)
+    try:
+        for chunk in body:
+            if chunk:
+                start()
+                send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    start()
+    send_message({'type': 'http.response.body', 'body': b''})
+
+
+class AsyncApp:
+    """
+    ASGI app: the endpoints of async_views.ROUTES as coroutines, the rest of
+    the Flask app on a thread pool
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.sync_pool = ThreadPoolExecutor(max_workers=flask_app.config['ASGI_SYNC_THREADS'],
+                                            thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        body = await read_body(scope, receive, self.flask_app.config['MAX_CONTENT_LENGTH'])
+        environ = wsgi_environ(scope, body or b'')
+        if body is None:
+            # Answered by the Flask app's error handlers, like the WSGI path's 413
+            await send_response(await self.dispatch(too_large, environ), send)
+            return
+        view = self.async_view(environ)
+        if view is None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.sync_pool, run_wsgi, self.flask_app, environ, send, loop)
+            return
+        await send_response(await self.dispatch(view, environ), send)
+
+    def async_view(self, environ):
+        """
+        Coroutine view of the request's endpoint in the Flask URL map
+        Returns: coroutine function, or None for a sync view (or no match:
+        the Flask app answers the 404, 405 or redirect)
+        """
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        return async_views.ROUTES.get(endpoint)
+
+    async def dispatch(self, view, environ):
+        """
+        Run an async view the way Flask runs a sync one: in a request context
+        (per task, Flask's contexts are context variables) whose URL rule,
+        endpoint and view arguments come from the URL map, with the
+        before/after request handlers, the session cookie and the error
+        handlers
+        Returns: Response
+        """
+        app = self.flask_app
+        ctx = app.request_context(environ)
+        ctx.push()
+        try:
+            try:
+                if ctx.request.url_rule is None and ctx.request.routing_exception is None:
+                    ctx.match_request()
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view(**(ctx.request.view_args or {}))
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.finalize_request(rv)
+        except Exception as e:
+            return app.handle_exception(e)
+        finally:
+            ctx.pop()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                services = get_services(self.flask_app)
+                if services.created('async_http'):
+                    await services.async_http.aclose()
+                self.sync_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(flask_app=None):
+    """
+    ASGI app around a Flask app (default: app.app, created from the environment)
+    Returns: AsyncApp
+    """
+    if flask_app is None:
+        import app as wsgi_entry
+        flask_app = wsgi_entry.app
+    return AsyncApp(flask_app)
+
+
+_default_app = None
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Create the module's `app` on first lookup"""
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_asgi_app()
+    return _default_app
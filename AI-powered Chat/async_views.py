@@ -0,0 +1,129 @@
+"""
+Async versions of the views that spend their time waiting on the model and
+the image hosts, served on the event loop of the ASGI app (asgi.py).
+
+They take the same requests and give the same responses as chat_views.chat
+and chat_views.update, and share their steps: only the model call and the
+image downloads are awaited here, the database work runs on worker threads
+(models.db_step).
+"""
+import functools
+import logging
+
+from flask import current_app, jsonify, request, session
+from flask_login import current_user
+
+from admission import chat_cost, update_cost
+from chat_views import (UpdateError, enqueue_chat, needs_image, plan_update, read_update, save_update,
+                        wants_async)
+from generation import agenerate_deck, count_images
+from instrumentation import log, stage
+from llm_client import LLMError
+from models import db_step
+from services import admission, llm
+from session_state import slide_hashes
+from slide_images import add_images_async
+
+
+def login_required(view):
+    """flask_login.login_required for coroutines: the user is loaded on a worker thread"""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        if not await db_step(lambda: current_user.is_authenticated):
+            return current_app.login_manager.unauthorized()
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+def admission_required(cost):
+    """admission.admission_required for coroutines"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            if admission.enabled:
+                user_id, tokens = await db_step(lambda: (current_user.id, cost()))
+                refused = await admission.aadmit(user_id, tokens)
+                if refused is not None:
+                    return refused
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@login_required
+@admission_required(chat_cost)
+async def chat():
+    """
+    POST /chat on the event loop (see chat_views.chat)
+    Requests for a background job are queued on a worker thread.
+    """
+    try:
+        data = request.get_json()
+        user_prompt = data.get('prompt', '')
+        include_images = data.get('include_images', [])
+
+        if not user_prompt:
+            return jsonify({"error": "No prompt provided"}), 400
+
+        if wants_async():
+            return await db_step(enqueue_chat, data, user_prompt, include_images)
+
+        result = await agenerate_deck(current_user._get_current_object(), user_prompt, include_images)
+        result["slide_hashes"] = slide_hashes(result["slides"])
+
+        # Make it the user's current deck
+        if result.get("presentation_id") is not None:
+            session['presentation_id'] = result["presentation_id"]
+
+        return jsonify(result)
+
+    except LLMError as e:
+        # Timed out, overloaded or failing after retries
+        log("chat_failed", logging.WARNING, error=str(e), status=e.status)
+        return jsonify({"error": str(e)}), e.status
+
+    except Exception as e:
+        log("chat_failed", logging.ERROR, exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@login_required
+@admission_required(update_cost)
+async def update():
+    """POST /update on the event loop (see chat_views.update)"""
+    try:
+        plan = await db_step(plan_update, request.get_json())
+
+        with stage("llm_call", mode=plan["mode"], memory_tokens=plan["memory_tokens"]) as span:
+            response = await llm.agenerate(plan["system_prompt"])
+            span.update(attempts=response.attempts, prompt_tokens=response.prompt_tokens,
+                        output_tokens=response.output_tokens)
+
+        result, slides, changed, mode = read_update(plan, response)
+
+        new_images = needs_image(slides, changed)
+        if new_images:
+            with stage("images", slides=len(new_images)) as span:
+                await add_images_async(plan["user_id"], slides, new_images)
+                count_images(span, [slides[index] for index in new_images])
+
+        return await db_step(save_update, plan, result, slides, changed, mode)
+
+    except UpdateError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    except LLMError as e:
+        # Timed out, overloaded or failing after retries
+        log("update_failed", logging.WARNING, error=str(e), status=e.status)
+        return jsonify({"error": str(e)}), e.status
+
+    except Exception as e:
+        log("update_failed", logging.ERROR, exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+# Endpoint of the Flask URL map -> view, served by asgi.py instead of the sync one
+ROUTES = {
+    'chat.chat': chat,
+    'chat.update': update,
+}
@@ -0,0 +1,147 @@
+"""
+Accounts: sign up, log in and out, and loading the logged-in user (cached,
+see accounts.py).
+"""
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
+from flask_login import LoginManager, current_user, login_required, login_user, logout_user
+from sqlalchemy import select, update
+
+from accounts import CachedUser, PasswordHasherBusy, create_user, existing_account, load_identity
+from models import User, db, release_connection
+from services import passwords, user_cache
+
+bp = Blueprint('auth', __name__)
+
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+login_manager.login_message = 'Please log in to access this page.'
+
+
+TAKEN = {"username": "Username already exists", "email": "Email already registered"}
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return user_cache.get(int(user_id), load_identity)
+
+
+def form_error(template, message, status=400):
+    """
+    An error for the JSON API (with status), or the form again with the
+    message flashed
+    """
+    if status == 503:
+        headers = {'Retry-After': '1'}
+    else:
+        headers = {}
+        if not request.is_json:
+            status = 200
+    if request.is_json:
+        return jsonify({"error": message}), status, headers
+    flash(message, 'error')
+    return render_template(template), status, headers
+
+
+def hasher_busy(template):
+    return form_error(template, "Too many sign-ins right now, please try again in a moment", 503)
+
+
+@bp.route('/signup', methods=['GET', 'POST'])
+def signup():
+    """Handle user registration"""
+    if current_user.is_authenticated:
+        return redirect(url_for('chat.index'))
+    
+    if request.method == 'POST':
+        data = request.get_json() if request.is_json else request.form
+        username = data.get('username')
+        email = data.get('email')
+        password = data.get('password')
+        
+        # Validation
+        if not username or not email or not password:
+            return form_error('signup.html', "All fields are required")
+        
+        # Check if user exists (before the hash is paid for)
+        taken = existing_account(username, email)
+        if taken:
+            return form_error('signup.html', TAKEN[taken])
+        release_connection()
+        
+        # Create new user
+        try:
+            hashed_password = passwords.hash(password)
+        except PasswordHasherBusy:
+            return hasher_busy('signup.html')
+        _, taken = create_user(username, email, hashed_password)
+        if taken:
+            return form_error('signup.html', TAKEN[taken])
+        
+        if request.is_json:
+            return jsonify({"success": True, "message": "Account created successfully"})
+        
+        flash('Account created successfully! Please log in.', 'success')
+        return redirect(url_for('auth.login'))
+    
+    return render_template('signup.html')
+
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    """Handle user login"""
+    if current_user.is_authenticated:
+        return redirect(url_for('chat.index'))
+    
+    if request.method == 'POST':
+        data = request.get_json() if request.is_json else request.form
+        username = data.get('username')
+        password = data.get('password')
+        
+        if not username or not password:
+            return form_error('login.html', "Username and password required")
+        
+        account = db.session.execute(
+            select(User.id, User.username, User.email, User.response_cache_enabled, User.password)
+            .where(User.username == username)
+        ).first()
+        # No connection held while bcrypt runs
+        release_connection()
+        
+        try:
+            valid = account is not None and passwords.check(account.password, password)
+        except PasswordHasherBusy:
+            return hasher_busy('login.html')
+        if not valid:
+            return form_error('login.html', "Invalid username or password", 401)
+        
+        if passwords.needs_upgrade(account.password):
+            upgrade_password(account.id, password)
+        user = CachedUser.from_row(account)
+        user_cache.put(user)
+        login_user(user)
+        if request.is_json:
+            return jsonify({"success": True, "username": user.username})
+        return redirect(url_for('chat.index'))
+    
+    return render_template('login.html')
+
+
+def upgrade_password(user_id, password):
+    """Rehash a password made with another bcrypt cost, after it was checked"""
+    try:
+        hashed_password = passwords.hash(password)
+    except PasswordHasherBusy:
+        # Next time
+        return
+    db.session.execute(update(User).where(User.id == user_id).values(password=hashed_password))
+    db.session.commit()
+    passwords.upgraded()
+
+
+@bp.route('/logout')
+@login_required
+def logout():
+    """Handle user logout"""
+    logout_user()
+    flash('You have been logged out', 'info')
+    return redirect(url_for('auth.login'))
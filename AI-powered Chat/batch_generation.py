@@ -0,0 +1,219 @@
+"""
+Batch deck generation: one deck per line of a CSV or JSONL file of prompts.
+
+BatchRunner generates the decks a few at a time (the batch's concurrency, on
+top of the LLM client's own cap on requests in flight) and saves the
+finished ones in groups with PresentationStore.create_many(), so a batch of
+hundreds costs a handful of transactions instead of one per deck. All decks
+go through the same image cache, so an image search term shared by several
+decks is downloaded once, even when they look it up at the same time.
+
+run() is a generator of progress events, streamed as NDJSON by /batch and
+printed by `flask generate-batch`:
+
+    {"event": "started", "total": 120, "concurrency": 4}
+    {"event": "generated", "index": 0, "slides": 7, "cached": null, "seconds": 1.9}
+    {"event": "failed", "index": 3, "error": "Model request timed out"}
+    {"event": "saved", "decks": [{"index": 0, "presentation_id": 57}, ...]}
+    {"event": "done", "generated": 119, "failed": 1, "seconds": 61.2, "decks_per_minute": 116.7}
+
+When the consumer stops early (the client disconnected), decks that are
+not started yet are dropped and the finished ones are still saved.
+"""
+import contextvars
+import csv
+import io
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import log
+
+# Longest prompt accepted from a batch file (characters)
+MAX_PROMPT_LENGTH = 2000
+
+
+class BatchInputError(ValueError):
+    """The batch file can't be read or has no prompts"""
+
+
+def _item(value, line):
+    if isinstance(value, str):
+        value = {"prompt": value}
+    if not isinstance(value, dict):
+        raise BatchInputError(f"Line {line}: expected a prompt string or an object with \"prompt\"")
+    prompt = str(value.get("prompt") or '').strip()
+    if not prompt:
+        raise BatchInputError(f"Line {line}: no prompt")
+    if len(prompt) > MAX_PROMPT_LENGTH:
+        raise BatchInputError(f"Line {line}: prompt is longer than {MAX_PROMPT_LENGTH} characters")
+    title = str(value.get("title") or '').strip()[:200]
+    return {"prompt": prompt, "title": title or None}
+
+
+def parse_prompts(data, fmt, max_prompts):
+    """
+    Read a batch file
+    fmt: "csv" (a "prompt" column, optional "title"; without that header the
+    first column is the prompt) or "jsonl" (one prompt string or
+    {"prompt", "title"} object per line)
+    max_prompts: most prompts accepted (None: no limit)
+    Returns: list of {"prompt": str, "title": str or None}
+    Raises: BatchInputError
+    """
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise BatchInputError("Batch file must be UTF-8 text")
+
+    items = []
+    if fmt == 'jsonl':
+        for line, text in enumerate(data.splitlines(), 1):
+            if not text.strip():
+                continue
+            try:
+                value = json.loads(text)
+            except ValueError:
+                raise BatchInputError(f"Line {line}: not valid JSON")
+            items.append(_item(value, line))
+    elif fmt == 'csv':
+        rows = list(csv.reader(io.StringIO(data)))
+        header = [cell.strip().lower() for cell in rows[0]] if rows else []
+        if 'prompt' in header:
+            prompt_column = header.index('prompt')
+            title_column = header.index('title') if 'title' in header else None
+            rows = rows[1:]
+            start = 2
+        else:
+            prompt_column, title_column, start = 0, None, 1
+        for line, row in enumerate(rows, start):
+            if not any(cell.strip() for cell in row):
+                continue
+            items.append(_item({
+                "prompt": row[prompt_column] if prompt_column < len(row) else '',
+                "title": row[title_column] if title_column is not None and title_column < len(row) else None,
+            }, line))
+    else:
+        raise BatchInputError(f"Unknown batch format: {fmt}")
+
+    return _checked(items, max_prompts)
+
+
+def prompt_items(values, max_prompts):
+    """
+    Batch items from a JSON list of prompt strings or {"prompt", "title"} objects
+    Returns: list of {"prompt": str, "title": str or None}
+    Raises: BatchInputError
+    """
+    if not isinstance(values, list):
+        raise BatchInputError("\"prompts\" must be a list")
+    return _checked([_item(value, line) for line, value in enumerate(values, 1)], max_prompts)
+
+
+def _checked(items, max_prompts):
+    if not items:
+        raise BatchInputError("No prompts in the batch")
+    if max_prompts is not None and len(items) > max_prompts:
+        raise BatchInputError(f"Too many prompts: {len(items)} (at most {max_prompts} per batch)")
+    return items
+
+
+def batch_format(filename=None, content_type=None):
+    """
+    Format of a batch file from its name or content type
+    Returns: "csv", "jsonl" or None
+    """
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type == 'text/csv':
+        return 'csv'
+    if content_type in ('application/jsonl', 'application/x-ndjson', 'application/x-jsonlines'):
+        return 'jsonl'
+    return None
+
+
+class BatchRunner:
+    """
+    Generates the decks of one batch
+
+    build(item) -> result dict with "slides" (and "cached"), runs on the
+    batch's worker threads; save(results) -> presentation IDs, called on the
+    consuming thread with the finished results (each item dict plus
+    "slides") whenever save_every of them are waiting, and at the end.
+    """
+
+    def __init__(self, build, save, concurrency=4, save_every=25):
+        self.build = build
+        self.save = save
+        self.concurrency = max(1, int(concurrency))
+        self.save_every = max(1, int(save_every))
+
+    def _build(self, index, item):
+        started = time.perf_counter()
+        try:
+            return index, self.build(item), None, time.perf_counter() - started
+        except Exception as e:
+            log("batch_deck_failed", logging.WARNING, index=index, error=str(e))
+            return index, None, str(e) or type(e).__name__, time.perf_counter() - started
+
+    def _save(self, finished):
+        ids = self.save(finished)
+        return {"event": "saved", "decks": [
+            {"index": item["index"], "presentation_id": presentation_id}
+            for item, presentation_id in zip(finished, ids)
+        ]}
+
+    def run(self, items):
+        """
+        Generate a deck for every item
+        Yields: progress event dicts (see the module docstring)
+        """
+        started = time.perf_counter()
+        generated = failed = 0
+        finished = []
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch')
+        # Each job runs in a copy of this thread's context: logs keep the request ID
+        pending = {
+            executor.submit(contextvars.copy_context().run, self._build, index, item)
+            for index, item in enumerate(items)
+        }
+        try:
+            yield {"event": "started", "total": len(items), "concurrency": self.concurrency}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda future: future.result()[0]):
+                    index, result, error, seconds = future.result()
+                    if error is not None:
+                        failed += 1
+                        yield {"event": "failed", "index": index, "error": error}
+                        continue
+                    generated += 1
+                    finished.append(dict(items[index], index=index, slides=result["slides"]))
+                    yield {"event": "generated", "index": index, "slides": len(result["slides"]),
+                           "cached": result.get("cached"), "seconds": round(seconds, 2)}
+                if len(finished) >= self.save_every:
+                    saved, finished = self._save(finished), []
+                    yield saved
+            if finished:
+                saved, finished = self._save(finished), []
+                yield saved
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if finished:
+                # Stopped early: keep the decks that were already paid for
+                try:
+                    self._save(finished)
+                except Exception as e:
+                    log("batch_save_failed", logging.ERROR, exc_info=True, decks=len(finished), error=str(e))
+
+        seconds = time.perf_counter() - started
+        summary = {"event": "done", "generated": generated, "failed": failed, "seconds": round(seconds, 1),
+                   "decks_per_minute": round(generated / seconds * 60, 1) if seconds else 0.0}
+        log("batch_done", **{key: value for key, value in summary.items() if key != "event"})
+        yield summary
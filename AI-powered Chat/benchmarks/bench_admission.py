@@ -0,0 +1,137 @@
+"""
+Latency of well-behaved users while abusive clients flood /chat, with and without admission control.
+
+A server process (the threaded WSGI server of bench_async.py, --threads
+threads) runs with the stub model answering after --latency seconds. For
+--duration seconds:
+
+- --users well-behaved users each send a /chat, wait --think seconds, and
+  send the next one (about 6 decks a minute, under their limit)
+- --abusers users each keep --abuser-connections requests going at once,
+  resending --abuser-retry-delay seconds after a 429 whatever Retry-After
+  says
+
+Runs: only the well-behaved users (baseline), then with the abusers and
+admission control off, then with it on (ADMISSION_USER_RATE,
+ADMISSION_USER_BURST). It reports p50/p99 of the well-behaved users'
+decks, their 429s, the decks the abusers got and how fast they were
+refused, and the model calls made.
+
+    python benchmarks/bench_admission.py --users 8 --abusers 2 --duration 40
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from bench_async import log_in, start_server
+from harness import StubImageServer, summarize
+
+
+async def client_loop(client, name, deadline, think, retry_delay, record, delay=0.0):
+    """/chat requests until the deadline, each recorded as record(status, seconds)"""
+    await asyncio.sleep(delay)
+    number = 0
+    while time.monotonic() < deadline:
+        number += 1
+        started = time.perf_counter()
+        try:
+            response = await client.post('/chat', json={'prompt': f"Create a presentation about {name} {number}"})
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        record(status, time.perf_counter() - started)
+        if status == 429:
+            await asyncio.sleep(retry_delay)
+        elif think:
+            await asyncio.sleep(think)
+
+
+async def drive(url, users, abusers, args):
+    """Every client's loop until the deadline; results per kind of user"""
+    results = {kind: {"ok": [], "refused": [], "errors": {}} for kind in ("well_behaved", "abusive")}
+
+    def recorder(kind):
+        def record(status, seconds):
+            if status == 200:
+                results[kind]["ok"].append(seconds)
+            elif status == 429:
+                results[kind]["refused"].append(seconds)
+            else:
+                results[kind]["errors"][str(status)] = results[kind]["errors"].get(str(status), 0) + 1
+        return record
+
+    deadline = time.monotonic() + args.duration
+    clients, loops = [], []
+    for index, cookies in enumerate(users):
+        client = httpx.AsyncClient(base_url=url, cookies=cookies, timeout=300)
+        clients.append(client)
+        # First requests spread over one think time
+        loops.append(client_loop(client, f"user {index}", deadline, args.think, 0, recorder("well_behaved"),
+                                 delay=args.think * index / len(users)))
+    for index, cookies in enumerate(abusers):
+        limits = httpx.Limits(max_connections=args.abuser_connections)
+        client = httpx.AsyncClient(base_url=url, cookies=cookies, timeout=300, limits=limits)
+        clients.append(client)
+        for connection in range(args.abuser_connections):
+            loops.append(client_loop(client, f"abuser {index}-{connection}", deadline, 0, args.abuser_retry_delay,
+                                     recorder("abusive")))
+    await asyncio.gather(*loops)
+    for client in clients:
+        await client.aclose()
+    return results
+
+
+def run(name, images, args, abusive, **env):
+    server, url = start_server('sync', images, args, admission=True, RESPONSE_CACHE_ENABLED=0, **env)
+    try:
+        users = [log_in(url, f"user{index}") for index in range(args.users)]
+        abusers = [log_in(url, f"abuser{index}") for index in range(args.abusers if abusive else 0)]
+        results = asyncio.run(drive(url, users, abusers, args))
+        llm = httpx.get(url + '/stats/llm', cookies=users[0], timeout=30).json()
+    finally:
+        server.terminate()
+        server.wait()
+    good, bad = results["well_behaved"], results["abusive"]
+    report = {
+        "run": name,
+        "well_behaved": {"decks": len(good["ok"]), "latency": summarize(good["ok"]),
+                         "refused": len(good["refused"]), "errors": good["errors"]},
+        "model_calls": llm["requests"],
+    }
+    if abusive:
+        report["abusive"] = {"decks": len(bad["ok"]), "refused": len(bad["refused"]),
+                             "refusal_latency": summarize(bad["refused"]), "errors": bad["errors"]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=8, help='well-behaved users')
+    parser.add_argument('--think', type=float, default=10.0, help="seconds between a well-behaved user's requests")
+    parser.add_argument('--abusers', type=int, default=2)
+    parser.add_argument('--abuser-connections', type=int, default=32, help='concurrent requests per abuser')
+    parser.add_argument('--abuser-retry-delay', type=float, default=0.2, help='seconds before resending after a 429')
+    parser.add_argument('--duration', type=float, default=40.0)
+    parser.add_argument('--threads', type=int, default=16, help='threads of the server')
+    parser.add_argument('--latency', type=float, default=1.0, help='stub model latency (s)')
+    parser.add_argument('--image-latency', type=float, default=0.1, help='stub image host latency (s)')
+    parser.add_argument('--user-rate', type=float, default=10, help='ADMISSION_USER_RATE (tokens/minute)')
+    parser.add_argument('--user-burst', type=float, default=10, help='ADMISSION_USER_BURST')
+    args = parser.parse_args()
+
+    limits = {"ADMISSION_USER_RATE": args.user_rate, "ADMISSION_USER_BURST": args.user_burst}
+    off = {"ADMISSION_USER_RATE": 0, "ADMISSION_GLOBAL_RATE": 0}
+    report = {"users": args.users, "abusers": args.abusers, "abuser_connections": args.abuser_connections,
+              "duration_s": args.duration, "threads": args.threads, "latency_s": args.latency, "runs": []}
+    with StubImageServer(latency=args.image_latency) as images:
+        report["runs"].append(run("baseline (no abusers)", images, args, False, **limits))
+        report["runs"].append(run("abusers, admission off", images, args, True, **off))
+        report["runs"].append(run("abusers, admission on", images, args, True, **limits))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
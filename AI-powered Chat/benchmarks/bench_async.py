@@ -0,0 +1,171 @@
+"""
+Generations one server process keeps in flight: threaded WSGI server vs. the ASGI app.
+
+Each run starts a fresh server process on a throwaway database, with the
+stub model answering after --latency seconds and the stub image host after
+--image-latency, and sends /chat requests with distinct prompts (response
+cache off) from --clients concurrent clients, --rounds each:
+
+- sync: the WSGI app on a server with a fixed pool of --threads threads,
+  the way `gunicorn --worker-class gthread --threads N app:app` runs it
+- async: `uvicorn asgi:app`, with /chat served by async_views on the event
+  loop
+
+It reports throughput, p50/p99 latency, failed requests, the most model
+calls in flight at once (from /stats/llm) and the server's peak thread
+count and memory (sampled from /proc).
+
+    python benchmarks/bench_async.py --clients 16 64 256 --latency 1.0 --image-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from harness import StubImageServer, boot_app, free_port, serve_pooled, summarize, use_stub_model, wait_until_serving
+
+
+def serve(args):
+    """Child process: the app on the requested server, until killed"""
+    app = boot_app(UNSPLASH_SOURCE_URL=args.image_url, PICSUM_URL=args.image_url, RESPONSE_CACHE_ENABLED=0,
+                   admission=args.admission)
+    use_stub_model(app, latency=args.latency, max_in_flight=10_000)
+    if args.serve == 'async':
+        import uvicorn
+        from asgi import create_asgi_app
+        uvicorn.run(create_asgi_app(app), host='127.0.0.1', port=args.port, log_level='warning', backlog=2048)
+        return
+
+    serve_pooled(app, args.port, args.threads)
+
+
+def process_status(pid):
+    """Threads and resident memory (KB) of a process"""
+    status = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('Threads', 'VmRSS'):
+                status[name] = int(value.split()[0])
+    return status
+
+
+def start_server(mode, images, args, admission=False, **env):
+    """
+    Server process for a run (env: settings for its app), admission control
+    off unless admission is set
+    Returns: (Popen, base URL) once it answers
+    """
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port),
+               '--image-url', images.url, '--latency', str(args.latency), '--threads', str(args.threads)]
+    if admission:
+        command.append('--admission')
+    # The server's log lines go to stderr, away from the report
+    server = subprocess.Popen(command, stdout=sys.stderr,
+                              env={**os.environ, **{key: str(value) for key, value in env.items()}})
+    url = f"http://127.0.0.1:{port}"
+    wait_until_serving(server, url)
+    return server, url
+
+
+def log_in(url, username='bench'):
+    """Session cookies of a new user"""
+    with httpx.Client(base_url=url, timeout=30) as client:
+        client.post('/signup', json={'username': username, 'email': f'{username}@example.com',
+                                     'password': 'bench-password'})
+        response = client.post('/login', json={'username': username, 'password': 'bench-password'})
+        assert response.status_code == 200, response.text
+        return dict(client.cookies)
+
+
+async def drive(url, cookies, pid, clients, rounds):
+    """clients concurrent /chat loops; server threads and memory sampled meanwhile"""
+    latencies, failures, peaks = [], {}, {"Threads": 0, "VmRSS": 0}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async def sample():
+        while True:
+            for name, value in process_status(pid).items():
+                peaks[name] = max(peaks[name], value)
+            await asyncio.sleep(0.05)
+
+    async def client_loop(client, number):
+        for round_number in range(rounds):
+            prompt = f"Create a presentation about topic {number}-{round_number}"
+            started = time.perf_counter()
+            try:
+                response = await client.post('/chat', json={'prompt': prompt})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures[str(status)] = failures.get(str(status), 0) + 1
+
+    sampler = asyncio.ensure_future(sample())
+    async with httpx.AsyncClient(base_url=url, cookies=cookies, limits=limits, timeout=300) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, number) for number in range(clients)))
+        elapsed = time.perf_counter() - started
+    sampler.cancel()
+    return latencies, failures, peaks, elapsed
+
+
+def run(mode, clients, images, args):
+    server, url = start_server(mode, images, args)
+    try:
+        cookies = log_in(url)
+        latencies, failures, peaks, elapsed = asyncio.run(drive(url, cookies, server.pid, clients, args.rounds))
+        llm = httpx.get(url + '/stats/llm', cookies=cookies, timeout=30).json()
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "mode": mode,
+        "clients": clients,
+        "decks": len(latencies),
+        "failed": failures,
+        "decks_per_second": round(len(latencies) / elapsed, 2),
+        "latency": summarize(latencies),
+        "llm_peak_in_flight": llm.get("peak_in_flight"),
+        "peak_threads": peaks["Threads"],
+        "peak_rss_mb": round(peaks["VmRSS"] / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--rounds', type=int, default=3, help='/chat requests per client')
+    parser.add_argument('--threads', type=int, default=16, help='threads of the sync server')
+    parser.add_argument('--latency', type=float, default=1.0, help='stub model latency (s)')
+    parser.add_argument('--image-latency', type=float, default=0.2, help='stub image host latency (s)')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--image-url', help=argparse.SUPPRESS)
+    parser.add_argument('--admission', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    report = {"latency_s": args.latency, "image_latency_s": args.image_latency,
+              "sync_threads": args.threads, "rounds": args.rounds, "runs": []}
+    with StubImageServer(latency=args.image_latency) as images:
+        for clients in args.clients:
+            for mode in args.modes:
+                report["runs"].append(run(mode, clients, images, args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+Authenticated-request hot path: cached user loader, bcrypt on a bounded pool, single-query sign-up.
+
+Each server run is a fresh process (the WSGI app on --threads threads):
+
+- polling: --clients clients repeat GET /get-slides for --duration seconds,
+  the user loaded from the database on every request (USER_CACHE_TTL=0, the
+  old loader) vs. from the user cache
+- login storm: --clients clients log in over and over while --pollers
+  logged-in users poll /get-slides. Before: bcrypt on every request thread
+  at once (PASSWORD_HASH_WORKERS=--threads, no queue limit); after: on
+  PASSWORD_HASH_WORKERS threads (default: one per core) with 503s past
+  PASSWORD_HASH_QUEUE waiting sign-ins, which the clients retry after
+  Retry-After. Reports logins/s and the latency of the polls.
+
+In this process: SQL statements and time per /get-slides request with and
+without the user cache, time per hash for each --cost-rounds
+(BCRYPT_LOG_ROUNDS), and the statements and time of a sign-up with the old
+two existence queries vs. the single one.
+
+    python benchmarks/bench_auth.py --clients 32 --duration 10 --rounds 12
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from harness import StubImageServer, boot_app, free_port, logged_in_client, serve_pooled, summarize, use_stub_model, wait_until_serving
+
+
+def serve(args):
+    """Child process: the app on a pool of threads, until killed (settings from the environment)"""
+    serve_pooled(boot_app(), args.port, args.threads)
+
+
+def start_server(args, **env):
+    """
+    Server process with settings env
+    Returns: (Popen, base URL) once it answers
+    """
+    port = free_port()
+    env = {"BCRYPT_LOG_ROUNDS": args.rounds, **env}
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port), '--threads', str(args.threads)]
+    # The server's log lines go to stderr, away from the report
+    server = subprocess.Popen(command, stdout=sys.stderr,
+                              env={**os.environ, **{key: str(value) for key, value in env.items()}})
+    url = f"http://127.0.0.1:{port}"
+    wait_until_serving(server, url)
+    return server, url
+
+
+async def sign_up(client, username):
+    await client.post('/signup', json={'username': username, 'email': f'{username}@example.com',
+                                       'password': 'bench-password'})
+
+
+async def log_in(client, username):
+    """Returns: the response status (after waiting out the Retry-After of a 503)"""
+    response = await client.post('/login', json={'username': username, 'password': 'bench-password'})
+    if response.status_code == 503:
+        await asyncio.sleep(float(response.headers.get('Retry-After', 1)))
+    return response.status_code
+
+
+async def repeat(deadline, request, latencies, failures):
+    """request() until the deadline, recording latencies and failed statuses"""
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            status = await request()
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures[str(status)] = failures.get(str(status), 0) + 1
+
+
+async def polling(url, args):
+    """clients logged-in users polling /get-slides"""
+    clients = [httpx.AsyncClient(base_url=url, timeout=60) for _ in range(args.clients)]
+    # One account at a time, sign-ups may be refused while the hashers are busy
+    for number, client in enumerate(clients):
+        await sign_up(client, f"poll{number}")
+        await log_in(client, f"poll{number}")
+    latencies, failures = [], {}
+
+    async def poll(client):
+        return (await client.get('/get-slides')).status_code
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    await asyncio.gather(*(repeat(deadline, lambda c=client: poll(c), latencies, failures) for client in clients))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        await client.aclose()
+    return {"requests_per_second": round(len(latencies) / elapsed, 1), "latency": summarize(latencies),
+            "failed": failures}
+
+
+async def login_storm(url, args):
+    """clients logging in over and over while pollers poll /get-slides"""
+    loggers = [httpx.AsyncClient(base_url=url, timeout=300) for _ in range(args.clients)]
+    pollers = [httpx.AsyncClient(base_url=url, timeout=300) for _ in range(args.pollers)]
+    for number, client in enumerate(loggers):
+        await sign_up(client, f"storm{number}")
+    for number, client in enumerate(pollers):
+        await sign_up(client, f"poller{number}")
+        await log_in(client, f"poller{number}")
+    logins, login_failures, polls, poll_failures = [], {}, [], {}
+
+    async def poll(client):
+        return (await client.get('/get-slides')).status_code
+
+    async def relog(client, number):
+        client.cookies.clear()
+        return await log_in(client, f"storm{number}")
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    await asyncio.gather(
+        *(repeat(deadline, lambda c=client, n=number: relog(c, n), logins, login_failures)
+          for number, client in enumerate(loggers)),
+        *(repeat(deadline, lambda c=client: poll(c), polls, poll_failures) for client in pollers)
+    )
+    elapsed = time.perf_counter() - started
+    for client in loggers + pollers:
+        await client.aclose()
+    return {"logins_per_second": round(len(logins) / elapsed, 2), "login_latency": summarize(logins),
+            "login_failed": login_failures, "poll_latency": summarize(polls), "poll_failed": poll_failures}
+
+
+def run(name, scenario, args, **env):
+    server, url = start_server(args, **env)
+    try:
+        result = asyncio.run(scenario(url, args))
+        stats = httpx.get(url + '/metrics', timeout=30).text
+    finally:
+        server.terminate()
+        server.wait()
+    busy = [line for line in stats.splitlines() if line.startswith('slides_passwords_busy ')]
+    if busy:
+        result["hasher_busy"] = int(float(busy[0].split()[1]))
+    return {"run": name, **result}
+
+
+def hash_cost(rounds_list):
+    """Milliseconds per bcrypt hash and check for each cost factor"""
+    from flask_bcrypt import Bcrypt
+    bcrypt = Bcrypt()
+    costs = {}
+    for rounds in rounds_list:
+        started = time.perf_counter()
+        hashed = bcrypt.generate_password_hash('bench-password', rounds)
+        hashed_at = time.perf_counter()
+        bcrypt.check_password_hash(hashed, 'bench-password')
+        costs[rounds] = {"hash_ms": round((hashed_at - started) * 1000, 1),
+                         "check_ms": round((time.perf_counter() - hashed_at) * 1000, 1)}
+    return costs
+
+
+def polling_statements(app, count):
+    """SQL statements and time per GET /get-slides in this process: user loaded per request vs. cached"""
+    from sqlalchemy import event
+
+    from accounts import UserCache
+    from models import db
+    from services import get_services
+    client = logged_in_client(app, 'inproc')
+    client.post('/chat', json={'prompt': 'A deck to poll'})
+    statements = []
+    results = {}
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+    for name, ttl in (("user loaded per request (before)", 0), ("user cache", 60)):
+        get_services(app).user_cache = UserCache(ttl=ttl)
+        client.get('/get-slides')
+        statements.clear()
+        started = time.perf_counter()
+        for _ in range(count):
+            client.get('/get-slides')
+        elapsed = time.perf_counter() - started
+        results[name] = {"statements_per_request": round(len(statements) / count, 2),
+                         "ms_per_request": round(elapsed / count * 1000, 3)}
+    return results
+
+
+def signup_queries(app, count):
+    """Statements and time per sign-up: old existence checks vs. existing_account()"""
+    from sqlalchemy import event
+
+    from accounts import create_user, existing_account
+    from models import User, db
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+        def old(username, email):
+            # The checks signup() made before
+            return User.query.filter_by(username=username).first() or User.query.filter_by(email=email).first()
+
+        results = {}
+        for name, check in (("two queries (before)", old), ("one query", existing_account)):
+            statements.clear()
+            started = time.perf_counter()
+            for number in range(count):
+                username = f"{name[:3]}{number}"
+                if not check(username, f"{username}@example.com"):
+                    create_user(username, f"{username}@example.com", 'hash')
+            elapsed = time.perf_counter() - started
+            results[name] = {"statements_per_signup": round(len(statements) / count, 2),
+                             "ms_per_signup": round(elapsed / count * 1000, 3)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--pollers', type=int, default=4, help='users polling during the login storm')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per run')
+    parser.add_argument('--threads', type=int, default=16, help='threads of the server')
+    parser.add_argument('--rounds', type=int, default=12, help='BCRYPT_LOG_ROUNDS of the server')
+    parser.add_argument('--cost-rounds', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--polls', type=int, default=2000, help='requests of the in-process polling comparison')
+    parser.add_argument('--signups', type=int, default=2000, help='sign-ups of the query comparison')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    report = {"clients": args.clients, "threads": args.threads, "rounds": args.rounds, "cpus": os.cpu_count(),
+              "duration_s": args.duration}
+    report["polling"] = [
+        run("user loaded per request (before)", polling, args, USER_CACHE_TTL=0),
+        run("user cache", polling, args),
+    ]
+    report["login_storm"] = [
+        run("bcrypt on request threads (before)", login_storm, args,
+            PASSWORD_HASH_WORKERS=args.threads, PASSWORD_HASH_QUEUE=10_000),
+        run("bounded bcrypt pool", login_storm, args),
+    ]
+    report["hash_cost"] = hash_cost(args.cost_rounds)
+    with StubImageServer(latency=0) as images:
+        app = boot_app(BCRYPT_LOG_ROUNDS=4, UNSPLASH_SOURCE_URL=images.url, PICSUM_URL=images.url)
+        use_stub_model(app)
+        report["polling_in_process"] = polling_statements(app, args.polls)
+        report["signup"] = signup_queries(app, args.signups)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Batch generation throughput: decks per minute, /batch vs. one /chat call at a time.
+
+Prompts are "Deck about product N"; the stub model answers each with a deck
+on one of --topics topics, so image search terms repeat across decks like
+they do for a catalogue of similar products. Every run starts with an empty
+image cache.
+
+- sequential: --sequential prompts sent to /chat one after the other (what
+  a script calling the API did before)
+- batch: --decks prompts as one CSV upload to /batch, at each --concurrency,
+  reporting decks/minute, time to the first finished deck, requests that
+  reached the image host and time spent saving
+
+    python benchmarks/bench_batch.py --decks 200 --latency 0.5 --image-latency 0.1
+"""
+import argparse
+import json
+import re
+import time
+
+from harness import StubImageServer, boot_app, canned_deck, logged_in_client, use_stub_model
+from services import get_services
+
+
+def responder(topics):
+    """Stub model: a deck on topic N % topics for the prompt about product N"""
+    def respond(prompt):
+        match = re.search(r'product (\d+)', prompt)
+        number = int(match.group(1)) if match else 0
+        deck = canned_deck(topic=f"topic {number % topics}")
+        return "```json\n" + json.dumps(deck) + "\n```"
+    return respond
+
+
+def run_sequential(app, client, images, count):
+    get_services(app).image_cache.clear()
+    images.requests = 0
+    started = time.perf_counter()
+    for n in range(count):
+        response = client.post('/chat', json={'prompt': f'Deck about product {n}'})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    elapsed = time.perf_counter() - started
+    return {"mode": "sequential /chat", "decks": count, "seconds": round(elapsed, 1),
+            "decks_per_minute": round(count / elapsed * 60, 1), "image_requests": images.requests}
+
+
+def run_batch(app, client, images, count, concurrency):
+    from instrumentation import STAGE_SECONDS
+    get_services(app).image_cache.clear()
+    images.requests = 0
+    saving = STAGE_SECONDS.snapshot(stage="db_save", provider='', outcome="ok")["sum"]
+    body = "prompt\n" + "".join(f"Deck about product {n}\n" for n in range(count))
+
+    started = time.perf_counter()
+    first_deck = None
+    events = {}
+    response = client.post(f'/batch?concurrency={concurrency}', data=body, content_type='text/csv',
+                           buffered=False)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    for line in response.iter_encoded():
+        for text in line.decode().splitlines():
+            event = json.loads(text)
+            events[event["event"]] = events.get(event["event"], 0) + 1
+            if event["event"] == "generated" and first_deck is None:
+                first_deck = time.perf_counter() - started
+            if event["event"] == "done":
+                done = event
+    response.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": "batch", "concurrency": concurrency, "decks": done["generated"], "failed": done["failed"],
+        "seconds": round(elapsed, 1), "decks_per_minute": round(done["generated"] / elapsed * 60, 1),
+        "first_deck_s": round(first_deck, 2), "image_requests": images.requests,
+        "save_transactions": events.get("saved", 0),
+        "save_ms": round((STAGE_SECONDS.snapshot(stage="db_save", provider='', outcome="ok")["sum"] - saving) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--decks', type=int, default=200)
+    parser.add_argument('--sequential', type=int, default=20, help='decks for the one-at-a-time baseline')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--topics', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.5, help='stub model seconds per deck')
+    parser.add_argument('--image-latency', type=float, default=0.1, help='stub image host seconds per request')
+    args = parser.parse_args()
+
+    max_concurrency = max(args.concurrency)
+    with StubImageServer(latency=args.image_latency) as images:
+        app = boot_app(UNSPLASH_SOURCE_URL=images.url, PICSUM_URL=images.url, RESPONSE_CACHE_ENABLED=0,
+                              JOB_WORKERS=0, LLM_MAX_IN_FLIGHT=max_concurrency,
+                              IMAGE_POOL_WORKERS=max(16, max_concurrency * 4))
+        use_stub_model(app, responder(args.topics), latency=args.latency, max_in_flight=max_concurrency)
+        client = logged_in_client(app)
+
+        report = {"model_latency_s": args.latency, "image_latency_s": args.image_latency, "topics": args.topics,
+                  "runs": [run_sequential(app, client, images, args.sequential)]}
+        for concurrency in args.concurrency:
+            report["runs"].append(run_batch(app, client, images, args.decks, concurrency))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Prompt size of /update over a long editing session, with and without conversation memory.
+
+One deck is created with /chat and then edited --turns times through
+/update with a mix of single-slide and whole-deck instructions. The stand-in
+model rewrites the slides it is given without changing their size, so the
+deck part of the prompt stays the same and any growth comes from the
+conversation. For each strategy:
+
+- none: no memory (CONVERSATION_TOKEN_BUDGET=0), every edit is stateless
+- memory: the configured budget, older requests folded into a summary
+- transcript: every earlier request and reply sent verbatim (a budget
+  that is never reached), the naive way to give the model the history
+
+it reports the prompt and conversation tokens at a few turns, their growth
+per turn over the second half of the session, whether the request the
+deck was created from and the previous instruction are still in the last
+prompt, and the /update latency (the stand-in model answers at once, so it
+is the server-side overhead). Tokens are counted with
+conversation.count_tokens().
+
+    python benchmarks/bench_conversation.py --turns 50 --slides 10
+"""
+import argparse
+import json
+import time
+
+from harness import StubImageServer, boot_app, canned_deck, canned_responder, logged_in_client, summarize, use_stub_model
+from services import get_services
+
+ORIGIN = "Create a 10 slide presentation about climate change for a city council meeting"
+
+EDITS = [
+    "Make slide {n} more concise",
+    "Rewrite slide {n} for an audience of high school students",
+    "Add a statistic about renewable energy investment to slide {n}",
+    "Change the title of slide {n} to something catchier",
+    "Use a more formal tone on slide {n}",
+    "Replace the image on slide {n} with something about wind turbines",
+    "Make every slide use shorter bullet points",
+    "Mention the 2015 Paris agreement on slide {n}",
+]
+
+MEMORY_START = "Earlier in this conversation"
+
+
+class RewritingModel:
+    """Answers an edit prompt in the format it asks for, keeping every slide the same size"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if '"patch"' in prompt:
+            targeted = json.loads(prompt.split('when slides are only being added):', 1)[1].split('\n', 2)[1])
+            patch = [{"op": "replace", "slide": int(number), "data": rotate(slide)}
+                     for number, slide in targeted.items()]
+            answer = {"patch": patch, "message": f"Updated slide {', '.join(targeted)} as requested."}
+        else:
+            slides = json.loads(prompt.split('Current slides:', 1)[1].split('\n', 2)[1])
+            answer = {"slides": [rotate(slide) for slide in slides], "message": "Updated every slide."}
+        return "```json\n" + json.dumps(answer) + "\n```"
+
+
+def rotate(slide):
+    slide = dict(slide)
+    slide["content"] = slide["content"][1:] + slide["content"][:1]
+    return slide
+
+
+def memory_part(prompt):
+    """Conversation section of an edit prompt"""
+    if MEMORY_START not in prompt:
+        return ""
+    return prompt.split(MEMORY_START, 1)[1].split("User wants to:", 1)[0]
+
+
+def run_session(app, client, model, budget, turns, slide_count):
+    from conversation import ConversationMemory, count_tokens
+    config = app.config
+    get_services(app).conversation_memory = ConversationMemory(
+        budget=budget, summary_budget=config['CONVERSATION_SUMMARY_TOKENS']
+    )
+    use_stub_model(app, canned_responder(canned_deck(slide_count)))
+    response = client.post('/chat', json={'prompt': ORIGIN})
+    assert response.status_code == 200, response.get_json()
+    presentation_id = response.get_json()["presentation_id"]
+
+    use_stub_model(app, model)
+    model.prompts.clear()
+    prompt_tokens, memory_tokens, latencies = [], [], []
+    instruction = None
+    for turn in range(turns):
+        instruction = EDITS[turn % len(EDITS)].format(n=(turn * 3) % slide_count + 1)
+        started = time.perf_counter()
+        response = client.post('/update', json={'prompt': instruction, 'presentation_id': presentation_id})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_json()
+        prompt = model.prompts[-1]
+        prompt_tokens.append(count_tokens(prompt))
+        memory_tokens.append(count_tokens(memory_part(prompt)))
+
+    checkpoints = sorted({1, 10, turns // 2, turns} & set(range(1, turns + 1)))
+    half = turns // 2
+    last_prompt = model.prompts[-1]
+    previous = EDITS[(turns - 2) % len(EDITS)].format(n=((turns - 2) * 3) % slide_count + 1) if turns > 1 else None
+    return {
+        "prompt_tokens": {f"turn_{n}": prompt_tokens[n - 1] for n in checkpoints},
+        "memory_tokens": {f"turn_{n}": memory_tokens[n - 1] for n in checkpoints},
+        "max_prompt_tokens": max(prompt_tokens),
+        "growth_per_turn": round((prompt_tokens[-1] - prompt_tokens[half - 1]) / (turns - half), 1) if half else 0.0,
+        "origin_in_last_prompt": ORIGIN.split(' for ')[0] in last_prompt,
+        "previous_request_in_last_prompt": previous is not None and previous in last_prompt,
+        "update": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--turns', type=int, default=50)
+    parser.add_argument('--slides', type=int, default=10, help='slides of the edited deck')
+    args = parser.parse_args()
+
+    with StubImageServer(latency=0) as images:
+        app = boot_app(UNSPLASH_SOURCE_URL=images.url, PICSUM_URL=images.url)
+        client = logged_in_client(app)
+        model = RewritingModel()
+        budget = app.config['CONVERSATION_TOKEN_BUDGET']
+
+        report = {"turns": args.turns, "slides": args.slides, "budget_tokens": budget}
+        for name, strategy_budget in (("none", 0), ("memory", budget), ("transcript", 10 ** 9)):
+            report[name] = run_session(app, client, model, strategy_budget, args.turns, args.slides)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
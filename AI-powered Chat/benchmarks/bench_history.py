@@ -0,0 +1,161 @@
+"""
+History listing with many saved decks: keyset pages vs. loading everything.
+
+Seeds one user with --decks presentations (plus decks of other users), the
+way an upgraded database would look (listing columns not filled yet), then
+reports:
+
+- backfill: time to fill slide_count/summary of every deck
+- full_load: the old listing query (every row of the user, slides_data
+  included) - latency and Python memory peak
+- pages: /history.json latency at the first, middle and last pages while
+  walking the whole history with the cursor, and the first /history page
+- plan: SQLite query plan of a page query (should seek the covering index)
+
+    python benchmarks/bench_history.py --decks 100000 --page-size 24
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from harness import boot_app, canned_deck, logged_in_client, summarize
+
+
+def seed(db_path, user_id, decks, other_users, slides_per_deck):
+    """Insert decks straight into SQLite, listing columns left NULL/0 like before the upgrade"""
+    rng = random.Random(1)
+    connection = sqlite3.connect(db_path)
+    connection.executemany(
+        'INSERT INTO user (id, username, email, password, created_at) VALUES (?, ?, ?, ?, ?)',
+        [(user_id + n, f"other{n}", f"other{n}@example.com", 'x', datetime.utcnow()) for n in range(1, other_users + 1)]
+    )
+    start = datetime(2023, 1, 1)
+    batch = []
+    total = decks + decks // 4
+    for index in range(total):
+        owner = user_id if index < decks else user_id + 1 + index % other_users
+        topic = f"topic {index}"
+        slides = canned_deck(slides_per_deck, topic)["slides"]
+        for slide in slides:
+            slide["image_url"] = f"/static/uploads/img_{index:032x}.jpg"
+            slide["has_image"] = True
+        # Some decks share an updated_at, which the cursor has to break by id
+        updated = start + timedelta(seconds=rng.randrange(total * 10) // 2 * 2)
+        batch.append((slides[0]["title"], owner, json.dumps(slides), updated, updated))
+        if len(batch) == 5000:
+            connection.executemany(
+                'INSERT INTO presentation (title, user_id, slides_data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)', batch
+            )
+            batch = []
+    if batch:
+        connection.executemany(
+            'INSERT INTO presentation (title, user_id, slides_data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)', batch
+        )
+    connection.commit()
+    connection.execute('ANALYZE')
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--decks', type=int, default=100000, help='decks of the benchmarked user')
+    parser.add_argument('--other-users', type=int, default=50)
+    parser.add_argument('--slides', type=int, default=7, help='slides per deck')
+    parser.add_argument('--page-size', type=int, default=24)
+    parser.add_argument('--full-loads', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='slides-history-')
+    app = boot_app(workdir)
+    client = logged_in_client(app)
+    db_path = os.path.join(workdir, 'bench.db')
+    with app.app_context():
+        from models import Presentation, User, db
+        from session_state import backfill_summaries
+        user_id = User.query.filter_by(username='bench').one().id
+
+    started = time.perf_counter()
+    seed(db_path, user_id, args.decks, args.other_users, args.slides)
+    report = {"decks": args.decks, "seed_s": round(time.perf_counter() - started, 1),
+              "db_mb": round(os.path.getsize(db_path) / 1024 / 1024, 1)}
+
+    with app.app_context():
+        started = time.perf_counter()
+        filled = backfill_summaries()
+        report["backfill"] = {"decks": filled, "seconds": round(time.perf_counter() - started, 2)}
+
+        full = []
+        tracemalloc.start()
+        for _ in range(args.full_loads):
+            started = time.perf_counter()
+            rows = Presentation.query.filter_by(user_id=user_id).order_by(Presentation.updated_at.desc()).all()
+            full.append(time.perf_counter() - started)
+            del rows
+            db.session.expunge_all()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report["full_load"] = {**summarize(full), "python_peak_mb": round(peak / 1024 / 1024, 1)}
+
+    latencies, cursors, seen, cursor = [], [], set(), None
+    tracemalloc.start()
+    while True:
+        cursors.append(cursor)
+        url = f'/history.json?limit={args.page_size}' + (f'&cursor={cursor}' if cursor else '')
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - started)
+        page = response.get_json()
+        seen.update(item["id"] for item in page["presentations"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    middle = len(latencies) // 2
+    report["pages"] = {
+        "pages": len(latencies),
+        "decks_listed": len(seen),
+        "complete": len(seen) == args.decks,
+        "first_10": summarize(latencies[:10]),
+        "middle_10": summarize(latencies[middle - 5:middle + 5]),
+        "last_10": summarize(latencies[-10:]),
+        "all": summarize(latencies),
+        "python_peak_mb": round(peak / 1024 / 1024, 1),
+    }
+
+    # Plan of the statement a page in the middle actually sends
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        client.get(f'/history.json?limit={args.page_size}&cursor={cursors[middle]}')
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    statement, parameters = next(item for item in statements if 'FROM presentation' in item[0])
+    connection = sqlite3.connect(db_path)
+    report["plan"] = [row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    connection.close()
+
+    html = []
+    for _ in range(20):
+        started = time.perf_counter()
+        client.get('/history').get_data()
+        html.append(time.perf_counter() - started)
+    report["history_html_first_page"] = summarize(html)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
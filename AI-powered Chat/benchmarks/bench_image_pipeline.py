@@ -0,0 +1,60 @@
+"""
+Benchmark /chat latency with the serial vs. the concurrent image pipeline.
+
+A stub image server injects a fixed latency into every request. Each slide
+costs two round-trips (resolve + download), so with the serial loop a deck of
+N slides takes about 2 * N * latency, while the concurrent pipeline should
+bring it down to about 2 * latency (the slowest single slide). The image
+cache is cleared before every run so each request pays the full image cost;
+the "cached" row shows repeated topics served from the cache instead.
+
+    python benchmarks/bench_image_pipeline.py --slides 7 --latency 0.2 --runs 20
+"""
+import argparse
+import json
+import time
+
+from harness import StubImageServer, boot_app, canned_deck, canned_responder, logged_in_client, summarize, use_stub_model
+from services import get_services
+
+
+def run(app, client, runs, cold=True):
+    latencies = []
+    for _ in range(runs):
+        if cold:
+            get_services(app).image_cache.clear()
+        started = time.perf_counter()
+        response = client.post('/chat', json={'prompt': 'climate change'})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--slides', type=int, default=7)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per image request')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with StubImageServer(latency=args.latency) as stub:
+        app = boot_app(UNSPLASH_SOURCE_URL=stub.url, PICSUM_URL=stub.url, RESPONSE_CACHE_ENABLED=0)
+        use_stub_model(app, canned_responder(canned_deck(args.slides)))
+        client = logged_in_client(app)
+
+        results = {}
+        for label, concurrency in (('serial', 1), ('concurrent', args.slides)):
+            app.config['IMAGE_DECK_CONCURRENCY'] = concurrency
+            results[label] = summarize(run(app, client, args.runs))
+        results['cached'] = summarize(run(app, client, args.runs, cold=False))
+        results['image_cache'] = get_services(app).image_cache.stats()
+
+    results['expected_ms'] = {
+        'sum_of_slides': round(2 * args.slides * args.latency * 1000, 1),
+        'slowest_slide': round(2 * args.latency * 1000, 1),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
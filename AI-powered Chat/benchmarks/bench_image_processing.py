@@ -0,0 +1,119 @@
+"""
+Image processing stage: cost per image and bytes saved.
+
+Feeds synthetic camera-sized photos (JPEG with EXIF orientation and GPS,
+and a PNG with transparency) through process_image() and reports:
+
+- time per image on first sight (decode + resize + encode) and when the
+  same bytes come again (no decode)
+- bytes: source vs. slide-sized JPEG vs. preview thumbnail, and the
+  preview page weight of a deck using thumbnails instead of the originals
+- that no EXIF/GPS survives in the stored files
+
+    python benchmarks/bench_image_processing.py --runs 10 --slides 7
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from harness import summarize
+
+from image_processing import process_image
+
+
+def camera_photo(width, height, seed):
+    """
+    Detail at every scale (upscaled noise plus grain) so it compresses and
+    downsizes like a photo, saved like a phone would (EXIF orientation + GPS)
+    """
+    channels = []
+    for channel in range(3):
+        coarse = Image.effect_noise((width // 40, height // 40), 90 + seed + channel).resize((width, height), Image.BICUBIC)
+        medium = Image.effect_noise((width // 8, height // 8), 60).resize((width, height), Image.BICUBIC)
+        grain = Image.effect_noise((width, height), 20)
+        channels.append(Image.blend(Image.blend(coarse, medium, 0.35), grain, 0.15))
+    image = Image.merge('RGB', channels)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90
+    exif[0x010F] = 'BenchCam'
+    exif[0x8825] = {1: 'N', 2: (52.0, 22.0, 10.0)}  # GPS
+    buf = BytesIO()
+    image.save(buf, 'JPEG', quality=92, exif=exif)
+    return buf.getvalue()
+
+
+def transparent_png(width, height):
+    image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    image.paste(Image.effect_noise((width // 2, height // 2), 40).convert('RGBA'), (width // 4, height // 4))
+    buf = BytesIO()
+    image.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def has_metadata(path):
+    with Image.open(path) as image:
+        return bool(image.getexif()) or 'icc_profile' in image.info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--slides', type=int, default=7, help='images in the preview page weight estimate')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='slides-images-')
+    sources = {
+        "jpeg_4000x3000": [camera_photo(4000, 3000, seed) for seed in range(args.runs)],
+        "png_2000x2000_alpha": [transparent_png(2000, 2000) for _ in range(1)],
+    }
+
+    report = {}
+    for name, images in sources.items():
+        first, again, results = [], [], []
+        for data in images:
+            started = time.perf_counter()
+            results.append(process_image(data, folder))
+            first.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            process_image(data, folder)
+            again.append(time.perf_counter() - started)
+
+        meta = results[0]["meta"]
+        report[name] = {
+            "first": summarize(first),
+            "seen_before": summarize(again),
+            "source_kb": round(meta["source_bytes"] / 1024, 1),
+            "slide_kb": round(meta["bytes"] / 1024, 1),
+            "thumb_kb": round(meta["thumb_bytes"] / 1024, 1),
+            "slide_size": [meta["width"], meta["height"]],
+            "thumb_size": [meta["thumb_width"], meta["thumb_height"]],
+            "metadata_left": any(
+                has_metadata(os.path.join(folder, result[key]))
+                for result in results for key in ("filename", "thumbnail")
+            ),
+        }
+
+    photos = sources["jpeg_4000x3000"]
+    deck = [process_image(photos[i % len(photos)], folder)["meta"] for i in range(args.slides)]
+    original = sum(meta["source_bytes"] for meta in deck)
+    thumbs = sum(meta["thumb_bytes"] for meta in deck)
+    report["preview_page_weight"] = {
+        "slides": args.slides,
+        "originals_kb": round(original / 1024, 1),
+        "thumbnails_kb": round(thumbs / 1024, 1),
+        "reduction": round(original / thumbs, 1),
+    }
+
+    shutil.rmtree(folder)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
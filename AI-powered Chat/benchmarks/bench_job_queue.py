@@ -0,0 +1,163 @@
+"""
+Background job queue: fairness under one heavy user, cancellation, crash recovery.
+
+- fairness: one heavy user queues --heavy-jobs decks at once while
+  --light-users users each queue a deck every --light-interval seconds.
+  Turnaround (queued -> done) is reported for light and heavy users with
+  the fair scheduler and with plain FIFO order, on the real /chat job
+  handler (stub model and image hosts)
+- cancel: a queued job is dropped at once, a running job stops at its
+  next check
+- recovery: a worker that dies holding a job (its lease runs out) - the
+  job is queued again and finished by another worker
+
+    python benchmarks/bench_job_queue.py --workers 4 --heavy-jobs 200 --light-users 5
+"""
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+
+from harness import StubImageServer, boot_app, canned_responder, summarize, use_stub_model
+from services import get_services
+
+
+def make_users(app, count):
+    from models import User, db
+    with app.app_context():
+        users = [User(username=f"user{n}", email=f"user{n}@example.com", password='x') for n in range(count)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def turnaround(app, job_ids):
+    from models import GenerationJob
+    with app.app_context():
+        jobs = GenerationJob.query.filter(GenerationJob.id.in_(job_ids)).all()
+        return [(job.finished_at - job.created_at).total_seconds() for job in jobs if job.status == 'done']
+
+
+def run_fairness(app, fair, args, heavy_user, light_users):
+    from job_queue import JobQueue
+    queue = JobQueue(app, handlers=get_services(app).job_queue.handlers, workers=args.workers,
+                     poll_interval=0.02, fair=fair)
+    heavy_ids, light_ids = [], []
+
+    with app.app_context():
+        for n in range(args.heavy_jobs):
+            heavy_ids.append(queue.enqueue(heavy_user, "chat", {"prompt": f"heavy deck {n}"}))
+
+    def light(user_id, offset):
+        time.sleep(offset)
+        with app.app_context():
+            for n in range(args.light_jobs):
+                light_ids.append(queue.enqueue(user_id, "chat", {"prompt": f"light deck {user_id} {n}"}))
+                time.sleep(args.light_interval)
+
+    started = time.perf_counter()
+    queue.start()
+    producers = [threading.Thread(target=light, args=(user_id, index * args.light_interval / len(light_users)))
+                 for index, user_id in enumerate(light_users)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+
+    with app.app_context():
+        while queue.stats()["queued"] or queue.stats()["running"]:
+            time.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    queue.stop()
+
+    light_times = turnaround(app, light_ids)
+    heavy_times = turnaround(app, heavy_ids)
+    return {
+        "scheduler": "fair" if fair else "fifo",
+        "elapsed_s": round(elapsed, 1),
+        "jobs_per_s": round((len(light_times) + len(heavy_times)) / elapsed, 1),
+        "light": summarize(light_times),
+        "heavy": summarize(heavy_times),
+    }
+
+
+def run_cancel(app, user_id):
+    from job_queue import JobQueue
+    release = threading.Event()
+
+    def slow(user_id, payload, check_cancelled):
+        release.wait(5)
+        check_cancelled()
+        return {"ok": True}
+
+    queue = JobQueue(app, handlers={"slow": slow}, workers=1, poll_interval=0.02)
+    with app.app_context():
+        running_id = queue.enqueue(user_id, "slow", {})
+        queued_id = queue.enqueue(user_id, "slow", {})
+        queue.start()
+        while queue.get(user_id, running_id)["status"] != "running":
+            time.sleep(0.01)
+        queued_status = queue.cancel(user_id, queued_id)
+        queue.cancel(user_id, running_id)
+        release.set()
+        while queue.get(user_id, running_id)["status"] == "running":
+            time.sleep(0.01)
+        report = {"queued_job": queued_status, "running_job": queue.get(user_id, running_id)["status"]}
+    queue.stop()
+    return report
+
+
+def run_recovery(app, user_id, lease):
+    from job_queue import JobQueue
+    done = {"ok": True}
+    dying = JobQueue(app, handlers={"work": lambda *args: done}, lease=lease)
+    survivor = JobQueue(app, handlers={"work": lambda *args: done}, workers=1, lease=lease,
+                        poll_interval=0.05)
+    with app.app_context():
+        job_id = dying.enqueue(user_id, "work", {})
+        # Claimed, then the process "dies": no lease renewal, never finished
+        dying.claim("dead-host:1:0")
+        started = time.perf_counter()
+        survivor.start()
+        while survivor.get(user_id, job_id)["status"] != "done":
+            time.sleep(0.05)
+            if time.perf_counter() - started > lease * 10:
+                break
+        job = survivor.get(user_id, job_id)
+    survivor.stop()
+    return {"lease_s": lease, "status": job["status"], "attempts": job["attempts"],
+            "recovered_after_s": round(time.perf_counter() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--heavy-jobs', type=int, default=200)
+    parser.add_argument('--light-users', type=int, default=5)
+    parser.add_argument('--light-jobs', type=int, default=8, help='jobs per light user')
+    parser.add_argument('--light-interval', type=float, default=2.0)
+    parser.add_argument('--latency', type=float, default=0.25, help='stub model seconds per deck')
+    args = parser.parse_args()
+
+    with StubImageServer(latency=0.01) as images:
+        app = boot_app(UNSPLASH_SOURCE_URL=images.url, PICSUM_URL=images.url,
+                              RESPONSE_CACHE_ENABLED=0, JOB_WORKERS=0)
+        use_stub_model(app, canned_responder(), latency=args.latency, max_in_flight=args.workers)
+        users = make_users(app, 1 + args.light_users)
+        heavy_user, light_users = users[0], users[1:]
+
+        report = {"workers": args.workers, "heavy_jobs": args.heavy_jobs,
+                  "light_jobs": args.light_users * args.light_jobs}
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            report["fairness"] = [run_fairness(app, fair, args, heavy_user, light_users)
+                                  for fair in (False, True)]
+            report["cancel"] = run_cancel(app, heavy_user)
+            report["recovery"] = run_recovery(app, heavy_user, lease=2)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
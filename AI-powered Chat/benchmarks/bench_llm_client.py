@@ -0,0 +1,149 @@
+"""
+LLM client behaviour under failures and load, against the stub backend.
+
+- retries: success rate and latency with injected 429/503 failures, with
+  and without retries
+- in_flight: many threads calling at once never exceed max_in_flight
+- timeout: a backend slower than the timeout frees the caller on time
+- async: many concurrent agenerate() calls on one event loop
+- no_api_key: the app imports without GEMINI_API_KEY and /chat answers
+  with an error instead of the process failing at startup
+
+    python benchmarks/bench_llm_client.py --failure-rate 0.3 --calls 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from harness import APP_DIR, summarize
+
+from llm_client import LLMClient, LLMError, LLMTimeout, StubBackend
+
+
+def run_retries(calls, failure_rate, latency):
+    report = {}
+    for retries in (0, 3):
+        client = LLMClient(StubBackend(latency=latency, failure_rate=failure_rate, seed=1),
+                           max_retries=retries, backoff_base=0.02, backoff_max=0.2, seed=1)
+        latencies, ok = [], 0
+        for _ in range(calls):
+            started = time.perf_counter()
+            try:
+                client.generate("User request: retries")
+                ok += 1
+            except LLMError:
+                pass
+            latencies.append(time.perf_counter() - started)
+        stats = client.stats()
+        report[f"max_retries_{retries}"] = {
+            "success_rate": round(ok / calls, 3),
+            "retries": stats["retries"],
+            **summarize(latencies),
+        }
+    return report
+
+
+def run_in_flight(threads, max_in_flight, latency):
+    client = LLMClient(StubBackend(latency=latency), max_in_flight=max_in_flight)
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client.generate, args=("User request: load",)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    stats = client.stats()
+    return {
+        "threads": threads,
+        "max_in_flight": max_in_flight,
+        "peak_in_flight": stats["peak_in_flight"],
+        "elapsed_s": round(elapsed, 2),
+        "expected_s": round(latency * -(-threads // max_in_flight), 2),
+    }
+
+
+def run_timeout(timeout, latency):
+    client = LLMClient(StubBackend(latency=latency), timeout=timeout, max_retries=0)
+    started = time.perf_counter()
+    try:
+        client.generate("User request: slow")
+        outcome = "answered"
+    except LLMTimeout:
+        outcome = "timed out"
+    return {"timeout_s": timeout, "backend_latency_s": latency, "outcome": outcome,
+            "caller_waited_s": round(time.perf_counter() - started, 2)}
+
+
+def run_async(calls, max_in_flight, latency):
+    client = LLMClient(StubBackend(latency=latency), max_in_flight=max_in_flight)
+
+    async def main():
+        return await asyncio.gather(*(client.agenerate("User request: async") for _ in range(calls)))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    return {
+        "calls": calls,
+        "max_in_flight": max_in_flight,
+        "completed": len(results),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "peak_in_flight": client.stats()["peak_in_flight"],
+    }
+
+
+NO_KEY_SCRIPT = """
+import tempfile, os, json
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'db.sqlite')
+os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+import app
+app.app.config['TESTING'] = True
+with app.app.app_context():
+    app.db.create_all()
+client = app.app.test_client()
+client.post('/signup', json={'username': 'nokey', 'email': 'nokey@example.com', 'password': 'pw'})
+client.post('/login', json={'username': 'nokey', 'password': 'pw'})
+response = client.post('/chat', json={'prompt': 'anything'})
+print(json.dumps({"status": response.status_code, "error": response.get_json().get("error")}))
+"""
+
+
+def run_no_api_key():
+    env = {key: value for key, value in os.environ.items() if key not in ('GEMINI_API_KEY', 'LLM_BACKEND')}
+    result = subprocess.run([sys.executable, '-c', NO_KEY_SCRIPT], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        return {"imported": False, "stderr": result.stderr[-500:]}
+    return {"imported": True, **json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--failure-rate', type=float, default=0.3)
+    parser.add_argument('--latency', type=float, default=0.01, help='stub seconds per call (retries run)')
+    args = parser.parse_args()
+
+    report = {
+        "retries": run_retries(args.calls, args.failure_rate, args.latency),
+        "in_flight": run_in_flight(threads=64, max_in_flight=8, latency=0.1),
+        "timeout": run_timeout(timeout=0.5, latency=3.0),
+        "async": run_async(calls=500, max_in_flight=100, latency=0.2),
+        "no_api_key": run_no_api_key(),
+    }
+    print(json.dumps(report, indent=2))
+
+    ok = (report["in_flight"]["peak_in_flight"] <= report["in_flight"]["max_in_flight"]
+          and report["timeout"]["outcome"] == "timed out"
+          and report["no_api_key"]["imported"])
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Recovery rate and cost of the model-output JSON parser.
+
+Runs three things and prints a JSON report:
+
+- corpus: the malformed responses in llm_corpus.jsonl, comparing the old
+  ```json slicing + json.loads against parse_model_json()
+- fuzz: random truncations, trailing commas, stray prose and missing fences
+  applied to valid decks; any exception other than ModelOutputError fails
+  the run
+- cost: time per parse of clean responses, for the old slicing, the full
+  parser and the streaming parser fed in 64-character chunks
+
+    python benchmarks/bench_llm_json.py --fuzz 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from harness import canned_deck
+
+from llm_json import ModelOutputError, SlideStreamParser, parse_model_json
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_corpus.jsonl')
+
+
+def legacy_parse(response_text):
+    """The ```json slicing that /chat and /update used before"""
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        response_text = response_text[json_start:json_end].strip()
+    elif "```" in response_text:
+        json_start = response_text.find("```") + 3
+        json_end = response_text.find("```", json_start)
+        response_text = response_text[json_start:json_end].strip()
+    try:
+        return len(json.loads(response_text).get("slides", []))
+    except (json.JSONDecodeError, AttributeError):
+        return 0
+
+
+def new_parse(text):
+    try:
+        return len(parse_model_json(text)["slides"])
+    except ModelOutputError:
+        return 0
+
+
+def stream_parse(text, chunk_size=64):
+    parser = SlideStreamParser()
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+    return len(parser.document()["slides"])
+
+
+def run_corpus():
+    report = {"cases": 0, "legacy_ok": 0, "parser_ok": 0, "stream_ok": 0, "failures": []}
+    with open(CORPUS) as f:
+        for line in f:
+            case = json.loads(line)
+            expected = case["expect_slides"]
+            report["cases"] += 1
+            report["legacy_ok"] += legacy_parse(case["text"]) == expected
+            got = new_parse(case["text"])
+            report["parser_ok"] += got == expected
+            report["stream_ok"] += stream_parse(case["text"]) == expected
+            if got != expected:
+                report["failures"].append(case["name"])
+    return report
+
+
+def mutate(rng, text):
+    """Apply one or more faults seen in real model output"""
+    faults = rng.sample(['truncate', 'trailing_comma', 'prose', 'fence', 'drop_fence_end'], rng.randint(1, 3))
+    for fault in faults:
+        if fault == 'truncate':
+            text = text[:rng.randint(len(text) // 3, len(text))]
+        elif fault == 'trailing_comma':
+            positions = [i for i, c in enumerate(text) if c in '}]']
+            for pos in sorted(rng.sample(positions, min(3, len(positions))), reverse=True):
+                text = text[:pos] + ',' + text[pos:]
+        elif fault == 'prose':
+            text = "Sure, here are your slides:\n" + text + "\nLet me know if you'd like changes!"
+        elif fault == 'fence':
+            text = "```json\n" + text + "\n```"
+        elif fault == 'drop_fence_end':
+            text = text.replace("\n```", "")
+    return text, faults
+
+
+def run_fuzz(iterations, seed):
+    rng = random.Random(seed)
+    report = {"iterations": iterations, "legacy_any_slides": 0, "parser_any_slides": 0, "errors": 0}
+    for _ in range(iterations):
+        text = json.dumps(canned_deck(rng.randint(3, 12)), indent=rng.choice([None, 2]))
+        text, faults = mutate(rng, text)
+        report["legacy_any_slides"] += legacy_parse(text) > 0
+        try:
+            report["parser_any_slides"] += new_parse(text) > 0
+            stream_parse(text)
+        except Exception as e:
+            report["errors"] += 1
+            print(f"parser error with faults {faults}: {e!r}", file=sys.stderr)
+    return report
+
+
+def time_per_call(func, text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return round((time.perf_counter() - started) / repeat * 1e6, 1)
+
+
+def run_cost(repeat):
+    report = {}
+    for slides in (7, 50):
+        text = "```json\n" + json.dumps(canned_deck(slides), indent=2) + "\n```"
+        report[f"{slides}_slides_us"] = {
+            "legacy": time_per_call(legacy_parse, text, repeat),
+            "parser": time_per_call(new_parse, text, repeat),
+            "stream": time_per_call(stream_parse, text, repeat),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--fuzz', type=int, default=2000, help='number of fuzzed responses')
+    parser.add_argument('--repeat', type=int, default=200, help='parses per timing')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    report = {
+        "corpus": run_corpus(),
+        "fuzz": run_fuzz(args.fuzz, args.seed),
+        "cost": run_cost(args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+    if report["fuzz"]["errors"] or report["corpus"]["failures"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
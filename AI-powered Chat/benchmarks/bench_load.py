@@ -0,0 +1,275 @@
+"""
+End-to-end load test: scripted user sessions against a server process, per-endpoint latency, checked against a baseline.
+
+A server process (the WSGI app on --threads threads, a fresh database)
+runs with the stub model (randomized decks of 4-12 slides after
+--model-latency, a share --model-failure-rate of calls failing with
+429/503, which the LLM client retries) and two stub image
+hosts: "Unsplash" answers 503 to a share --image-error-rate of requests,
+sending those slides down the fetch_image_fallback path to "Picsum". The
+response cache is off and admission control too (--admission keeps it on),
+so every deck is generated.
+
+--users concurrent users each sign up, log in and then work through
+--sessions sessions, with seeded random topics:
+
+    /chat (new deck) -> --edits x /update -> /history -> /history.json
+    -> /load-presentation/<id> -> /get-slides -> every other session
+    /delete-presentation/<id>
+
+The report (JSON) has throughput, and count, errors and p50/p95/p99 per
+endpoint, plus what the stub model and image hosts saw. It is compared with
+the baseline file (--baseline), and any of these is a regression:
+
+- a p95 more than --tolerance (plus --slack-ms) above the baseline's, on
+  endpoints with at least --min-samples requests
+- an error rate more than --error-tolerance above the baseline's
+- a throughput more than --tolerance below the baseline's
+
+Regressions are listed in the report and the run exits with status 1.
+--save-baseline records the run as the new baseline instead. Baselines
+only compare on the same machine and settings.
+
+    python benchmarks/bench_load.py --users 16 --sessions 3
+    python benchmarks/bench_load.py --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from harness import (StubImageServer, boot_app, free_port, make_jpeg, random_responder, serve_pooled, summarize,
+                     use_stub_model, wait_until_serving)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_baseline.json')
+
+TOPICS = ["climate change", "renewable energy", "the history of jazz", "machine learning basics", "ocean currents",
+          "urban gardening", "the roman empire", "sleep science", "volcanoes", "remote team management",
+          "coffee roasting", "space telescopes", "personal finance", "bird migration", "electric cars"]
+EDITS = ["Add a slide about {topic} in practice", "Make slide 2 more concise", "Add a summary slide",
+         "Rewrite slide 1 for a younger audience", "Add examples to slide 3"]
+
+SIGN_IN_RETRIES = 30
+
+# Settings a baseline is only comparable with
+WORKLOAD = ('users', 'sessions', 'edits', 'threads', 'model_latency', 'model_failure_rate', 'image_latency',
+            'image_error_rate', 'image_size', 'admission', 'seed')
+
+
+def serve(args):
+    """Child process: the app on a pool of threads, until killed (image hosts from the environment)"""
+    app = boot_app(admission=args.admission)
+    use_stub_model(app, random_responder(args.seed), latency=args.model_latency,
+                   failure_rate=args.model_failure_rate, seed=args.seed, max_in_flight=args.threads)
+    serve_pooled(app, args.port, args.threads)
+
+
+def start_server(args, unsplash, picsum):
+    """
+    Server process with the stub model and image hosts
+    Returns: (Popen, base URL) once it answers
+    """
+    port = free_port()
+    env = {
+        "UNSPLASH_SOURCE_URL": unsplash.url,
+        "PICSUM_URL": picsum.url,
+        "RESPONSE_CACHE_ENABLED": 0,
+    }
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)] + sys.argv[1:]
+    # The server's log lines go to stderr, away from the report
+    server = subprocess.Popen(command, stdout=sys.stderr,
+                              env={**os.environ, **{key: str(value) for key, value in env.items()}})
+    url = f"http://127.0.0.1:{port}"
+    wait_until_serving(server, url)
+    return server, url
+
+
+class Recorder:
+    """Latencies and failures per endpoint"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, client, method, path, endpoint=None, retries=0, **kwargs):
+        """
+        One request, timed under endpoint (default: "METHOD path"), sent
+        again up to retries times after the Retry-After of a 503 (the time
+        waiting included)
+        Returns: httpx.Response, or None when it failed (status >= 400 or no answer)
+        """
+        endpoint = endpoint or f"{method} {path}"
+        started = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                response = await client.request(method, path, **kwargs)
+            except httpx.HTTPError as e:
+                response, failure = None, type(e).__name__
+                break
+            failure = str(response.status_code) if response.status_code >= 400 else None
+            if response.status_code != 503 or 'Retry-After' not in response.headers or attempt == retries:
+                break
+            await asyncio.sleep(float(response.headers['Retry-After']))
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+        if failure is not None:
+            errors = self.errors.setdefault(endpoint, {})
+            errors[failure] = errors.get(failure, 0) + 1
+            return None
+        return response
+
+    def report(self):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            errors = self.errors.get(endpoint, {})
+            failed = sum(errors.values())
+            endpoints[endpoint] = {**summarize(latencies), "errors": errors,
+                                   "error_rate": round(failed / len(latencies), 4)}
+        return endpoints
+
+
+async def user_session(url, number, args, recorder):
+    """One user: sign up, log in and run args.sessions editing sessions"""
+    rng = random.Random(args.seed * 1000 + number)
+    username = f"load{number}"
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        # Sign-ins are refused with 503 while the password hashers are busy
+        await recorder.call(client, 'POST', '/signup', retries=SIGN_IN_RETRIES, json={
+            'username': username, 'email': f'{username}@example.com', 'password': 'load-password'})
+        if await recorder.call(client, 'POST', '/login', retries=SIGN_IN_RETRIES,
+                               json={'username': username, 'password': 'load-password'}) is None:
+            return
+
+        for session_number in range(args.sessions):
+            topic = rng.choice(TOPICS)
+            prompt = f"Create a presentation about {topic} ({number}-{session_number})"
+            response = await recorder.call(client, 'POST', '/chat', json={'prompt': prompt})
+            presentation_id = response.json().get('presentation_id') if response is not None else None
+            if presentation_id is None:
+                continue
+
+            for _ in range(args.edits):
+                edit = rng.choice(EDITS).format(topic=topic)
+                await recorder.call(client, 'POST', '/update', json={'prompt': edit, 'presentation_id': presentation_id})
+
+            await recorder.call(client, 'GET', '/history')
+            await recorder.call(client, 'GET', '/history.json')
+            await recorder.call(client, 'GET', f'/load-presentation/{presentation_id}',
+                                endpoint='GET /load-presentation/<id>')
+            await recorder.call(client, 'GET', '/get-slides')
+            if session_number % 2:
+                await recorder.call(client, 'DELETE', f'/delete-presentation/{presentation_id}',
+                                    endpoint='DELETE /delete-presentation/<id>')
+
+
+def run(args):
+    width, height = args.image_size
+    body = make_jpeg(width, height)
+    with StubImageServer(latency=args.image_latency, body=body, error_rate=args.image_error_rate,
+                         seed=args.seed) as unsplash, \
+            StubImageServer(latency=args.image_latency, body=body) as picsum:
+        server, url = start_server(args, unsplash, picsum)
+        try:
+            recorder = Recorder()
+
+            async def drive():
+                await asyncio.gather(*(user_session(url, number, args, recorder) for number in range(args.users)))
+
+            started = time.perf_counter()
+            asyncio.run(drive())
+            elapsed = time.perf_counter() - started
+            llm = httpx.get(url + '/stats/llm', timeout=30,
+                            cookies=httpx.post(url + '/login', timeout=30, json={
+                                'username': 'load0', 'password': 'load-password'}).cookies).json()
+        finally:
+            server.terminate()
+            server.wait()
+
+        endpoints = recorder.report()
+        requests = sum(stats["n"] for stats in endpoints.values())
+        return {
+            "settings": {name: getattr(args, name) for name in WORKLOAD},
+            "elapsed_s": round(elapsed, 2),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 2),
+            "decks_per_second": round((endpoints.get("POST /chat", {}).get("n", 0)
+                                       - sum(endpoints.get("POST /chat", {}).get("errors", {}).values())) / elapsed, 2),
+            "endpoints": endpoints,
+            "model": {name: llm.get(name) for name in ('requests', 'failures', 'retries', 'peak_in_flight')},
+            "image_hosts": {"unsplash_requests": unsplash.requests, "unsplash_503s": unsplash.errors,
+                            "picsum_requests": picsum.requests},
+        }
+
+
+def regressions(report, baseline, args):
+    """What got worse than the baseline, as readable lines"""
+    found = []
+    if report["requests_per_second"] < baseline["requests_per_second"] * (1 - args.tolerance):
+        found.append(f"throughput {report['requests_per_second']} req/s < baseline "
+                     f"{baseline['requests_per_second']} req/s - {args.tolerance:.0%}")
+    for endpoint, before in baseline["endpoints"].items():
+        now = report["endpoints"].get(endpoint)
+        if now is None:
+            found.append(f"{endpoint}: no requests (baseline {before['n']})")
+            continue
+        limit = before["p95_ms"] * (1 + args.tolerance) + args.slack_ms
+        # The p95 of a handful of requests is their slowest one
+        if min(now["n"], before["n"]) >= args.min_samples and now["p95_ms"] > limit:
+            found.append(f"{endpoint}: p95 {now['p95_ms']} ms > {round(limit, 1)} ms (baseline {before['p95_ms']} ms)")
+        if now["error_rate"] > before["error_rate"] + args.error_tolerance:
+            found.append(f"{endpoint}: error rate {now['error_rate']} > baseline {before['error_rate']} "
+                         f"+ {args.error_tolerance}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=16, help='concurrent users')
+    parser.add_argument('--sessions', type=int, default=3, help='editing sessions per user')
+    parser.add_argument('--edits', type=int, default=2, help='/update requests per session')
+    parser.add_argument('--threads', type=int, default=16, help='threads of the server')
+    parser.add_argument('--model-latency', type=float, default=0.3, help='stub model latency (s)')
+    parser.add_argument('--model-failure-rate', type=float, default=0.05, help='share of model calls failing')
+    parser.add_argument('--image-latency', type=float, default=0.05, help='stub image host latency (s)')
+    parser.add_argument('--image-error-rate', type=float, default=0.2, help='share of 503s from "Unsplash"')
+    parser.add_argument('--image-size', type=int, nargs=2, default=[800, 600], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--admission', action='store_true', help='keep admission control on')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline report (JSON)')
+    parser.add_argument('--save-baseline', action='store_true', help='record this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 increase / throughput drop')
+    parser.add_argument('--slack-ms', type=float, default=50.0, help='allowed p95 increase on top (ms)')
+    parser.add_argument('--min-samples', type=int, default=30, help='fewest requests to compare p95s of')
+    parser.add_argument('--error-tolerance', type=float, default=0.02, help='allowed error rate increase')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    report = run(args)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        report["baseline"] = f"saved to {args.baseline}"
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != report["settings"]:
+            report["baseline_settings_differ"] = baseline["settings"]
+        report["regressions"] = regressions(report, baseline, args)
+    print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
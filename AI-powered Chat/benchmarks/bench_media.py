@@ -0,0 +1,149 @@
+"""
+Media tracking: cost of reference counting, quota checks and the sweeper.
+
+- refs: time to create, edit (one image swapped) and delete a deck with
+  --images images, with the media table holding --decks decks of one user;
+  create_deck_no_images is the same deck without image URLs (no media work)
+- quota: media_usage() for that user (checked before every deck's image
+  downloads and every upload)
+- sweep: deleting --orphans unused files from the upload folder
+- layout: largest directory and listing time for --orphans files, sharded
+  (ab/cd/img_...) vs. all in one folder
+
+    python benchmarks/bench_media.py --decks 20000 --images 7 --orphans 20000
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+
+from harness import boot_app, logged_in_client, summarize
+from services import get_services
+
+
+def image_slides(index, count):
+    slides = []
+    for n in range(count):
+        digest = hashlib.sha256(f"{index}-{n}".encode()).hexdigest()
+        stem = f"/static/uploads/{digest[:2]}/{digest[2:4]}/img_{digest[:32]}"
+        slides.append({"title": f"Slide {n + 1}", "content": ["Point"], "has_image": True,
+                       "image_url": f"{stem}.jpg", "thumbnail_url": f"{stem}_thumb.webp"})
+    return slides
+
+
+def register_deck_files(slides, owner_id):
+    from media_store import deck_media_paths, register_media
+    register_media([(path, 50_000) for path in sorted(deck_media_paths(slides))], owner_id)
+
+
+def timed(fn, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def write_files(folder, count, sharded):
+    for n in range(count):
+        digest = hashlib.sha256(str(n).encode()).hexdigest()
+        name = f"{digest[:2]}/{digest[2:4]}/img_{digest[:32]}.jpg" if sharded else f"img_{digest[:32]}.jpg"
+        path = os.path.join(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 64)
+
+
+def layout(count):
+    report = {}
+    for sharded in (False, True):
+        folder = tempfile.mkdtemp(prefix='slides-layout-')
+        write_files(folder, count, sharded)
+        sizes = Counter()
+        started = time.perf_counter()
+        for directory, _, names in os.walk(folder):
+            sizes[directory] = len(names)
+        report["sharded" if sharded else "flat"] = {
+            "directories": len(sizes), "largest_directory": max(sizes.values()),
+            "walk_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--decks', type=int, default=20000)
+    parser.add_argument('--images', type=int, default=7, help='images per deck')
+    parser.add_argument('--orphans', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='slides-media-')
+    app = boot_app(workdir)
+    logged_in_client(app)
+    from media_store import MediaSweeper, media_usage, register_untracked_files
+    from models import MediaFile, User, db
+    store = get_services(app).presentation_store
+    report = {"decks": args.decks, "images_per_deck": args.images}
+
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench').one().id
+        started = time.perf_counter()
+        for start in range(0, args.decks, 500):
+            decks = [image_slides(index, args.images) for index in range(start, min(start + 500, args.decks))]
+            for slides in decks:
+                register_deck_files(slides, user_id)
+            store.create_many(user_id, [(slides, None) for slides in decks])
+        report["seed_s"] = round(time.perf_counter() - started, 1)
+        report["media_rows"] = MediaFile.query.count()
+
+        counter = iter(range(10 ** 9))
+
+        def create():
+            slides = image_slides(f"new-{next(counter)}", args.images)
+            register_deck_files(slides, user_id)
+            return store.create(user_id, slides), slides
+
+        presentation_id, slides = create()
+        created = [create()[0] for _ in range(args.runs)]
+
+        def swap_image():
+            slides[0] = image_slides(f"swap-{next(counter)}", 1)[0]
+            register_deck_files(slides[:1], user_id)
+            db.session.commit()
+            store.save(user_id, presentation_id, list(slides))
+
+        deletions = iter(created)
+        plain = [{k: v for k, v in slide.items() if k not in ('image_url', 'thumbnail_url')}
+                 for slide in image_slides("plain", args.images)]
+        report["refs"] = {
+            "create_deck_no_images": timed(lambda: store.create(user_id, plain), args.runs),
+            "create_deck": timed(create, args.runs),
+            "edit_swap_one_image": timed(swap_image, args.runs),
+            "delete_deck": timed(lambda: store.delete(user_id, next(deletions)), args.runs),
+        }
+        report["quota"] = {"media_usage": timed(lambda: media_usage(user_id), args.runs),
+                           "used_mb": round(media_usage(user_id) / 1024 / 1024, 1)}
+
+        folder = app.config['UPLOAD_FOLDER']
+        write_files(folder, args.orphans, sharded=True)
+        started = time.perf_counter()
+        registered = register_untracked_files(folder)
+        register_s = time.perf_counter() - started
+        sweeper = MediaSweeper(app, folder, grace_period=0)
+        started = time.perf_counter()
+        files, freed = sweeper.sweep()
+        sweep_s = time.perf_counter() - started
+        report["sweep"] = {"registered": registered, "register_s": round(register_s, 2), "deleted": files,
+                           "sweep_s": round(sweep_s, 2), "files_per_s": round(files / sweep_s) if sweep_s else None}
+
+    report["layout"] = layout(args.orphans)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Instrumentation: where a /chat request spends its time, and what measuring costs.
+
+- breakdown: runs --requests /chat calls (stub model with --latency seconds,
+  stub image hosts with --image-latency seconds), then scrapes /metrics and
+  reports count and mean of every stage histogram, next to the /chat mean
+- overhead: cost of one stage() (histogram + JSON log line), with the log
+  line enabled and filtered out by LOG_LEVEL
+- slow_stdout: time the caller spends logging --lines events to a stream
+  that takes 2 ms per write, through the log queue vs. writing each line
+  inline like print() did
+
+    python benchmarks/bench_metrics.py --requests 20 --latency 0.3 --image-latency 0.1
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import re
+import time
+
+from harness import StubImageServer, boot_app, canned_responder, logged_in_client, use_stub_model
+
+SAMPLE = re.compile(r'^(\w+)_(sum|count)\{(.*)\} (\S+)$')
+
+
+class SlowStream(io.StringIO):
+    """A stdout that is slow to write to (a full pipe, a busy log shipper)"""
+
+    def write(self, text):
+        time.sleep(0.002)
+        return super().write(text)
+
+
+def scrape(client, metric):
+    """
+    Read one histogram's sums and counts back from /metrics
+    Returns: {labels: {"count": n, "mean_ms": ms}}
+    """
+    series = {}
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        match = SAMPLE.match(line)
+        if match and match.group(1) == metric:
+            series.setdefault(match.group(3), {})[match.group(2)] = float(match.group(4))
+    return {
+        labels: {"count": int(values["count"]), "mean_ms": round(values["sum"] / values["count"] * 1000, 1)}
+        for labels, values in sorted(series.items()) if values.get("count")
+    }
+
+
+def per_call(fn, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return round((time.perf_counter() - started) / runs * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.3, help='stub model seconds per deck')
+    parser.add_argument('--image-latency', type=float, default=0.1, help='stub image host seconds per request')
+    parser.add_argument('--runs', type=int, default=20000, help='stage() calls for the overhead test')
+    parser.add_argument('--lines', type=int, default=200)
+    args = parser.parse_args()
+
+    import instrumentation
+    from instrumentation import configure_logging, log, stage
+
+    report = {}
+    with StubImageServer(latency=args.image_latency) as images:
+        app = boot_app(UNSPLASH_SOURCE_URL=images.url, PICSUM_URL=images.url,
+                              RESPONSE_CACHE_ENABLED=0, JOB_WORKERS=0)
+        use_stub_model(app, canned_responder(), latency=args.latency)
+        client = logged_in_client(app)
+        for n in range(args.requests):
+            response = client.post('/chat', json={'prompt': f'deck {n}'})
+            assert response.status_code == 200, response.get_data(as_text=True)
+        report["breakdown"] = {
+            "requests": scrape(client, 'slides_http_request_seconds'),
+            "stages": scrape(client, 'slides_stage_seconds'),
+        }
+
+    with open(os.devnull, 'w') as devnull:
+        configure_logging('INFO', 'json', devnull)
+
+        def timed_stage():
+            with stage("bench", provider="x") as span:
+                span["field"] = 1
+
+        report["overhead_us"] = {
+            "stage_logged": per_call(timed_stage, args.runs),
+            "histogram_only": per_call(lambda: instrumentation.STAGE_SECONDS.observe(0.01, stage="bench"), args.runs),
+        }
+        configure_logging('WARNING', 'json', devnull)
+        report["overhead_us"]["stage_log_filtered"] = per_call(timed_stage, args.runs)
+
+    slow = SlowStream()
+    configure_logging('INFO', 'json', slow)
+    started = time.perf_counter()
+    for n in range(args.lines):
+        log("bench", logging.INFO, n=n)
+    queued = time.perf_counter() - started
+    started = time.perf_counter()
+    for n in range(args.lines):
+        slow.write(json.dumps({"event": "bench", "n": n}) + "\n")
+    printed = time.perf_counter() - started
+    configure_logging('WARNING', 'json', io.StringIO())
+    report["slow_stdout"] = {"lines": args.lines, "log_queue_ms": round(queued * 1000, 1),
+                             "inline_ms": round(printed * 1000, 1)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
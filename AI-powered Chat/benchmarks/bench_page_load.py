@@ -0,0 +1,279 @@
+"""
+Bytes and requests of a page load, first visit vs. repeat visit, with HTTP caching and compression on and off.
+
+A simulated browser with an HTTP cache loads the main page the way a
+returning user does: the HTML, every stylesheet and script it links (and
+the font the icon stylesheet uses), then the current deck through
+/get-slides, /load-presentation and the uploaded images through
+/get-images. The cache honours Cache-Control (immutable, max-age,
+no-cache) and revalidates with If-None-Match. Each mode is measured on a
+first visit (empty cache), a repeat visit, and a repeat visit after the deck
+was edited:
+
+- before: how the app answered until now - assets under plain names,
+  revalidated on every load, nothing compressed, and no validators on the
+  deck JSON so it is downloaded again every time
+- after: fingerprinted assets cached for a year, brotli/gzip, and ETags
+  with 304s for the deck JSON
+
+Bootstrap, Bootstrap Icons and PptxGenJS are counted as served by the app
+in both modes. Unless --vendor-dir points at a folder filled by `flask
+vendor-assets`, stand-ins of the same sizes are generated: CSS/JS-like
+text, and random bytes for the fonts (compressed already, like woff2).
+It reports the requests, 304s, bytes received (bodies and headers), the
+server time of the page load, and an estimated load time over a network of
+--bandwidth-mbps and --rtt-ms, with each group of requests the page can
+send at once costing one round trip.
+
+    python benchmarks/bench_page_load.py --slides 20 --repeats 20
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from urllib.parse import urljoin, urlsplit
+
+from harness import StubImageServer, boot_app, canned_deck, canned_responder, logged_in_client, summarize, use_stub_model
+from http_cache import FINGERPRINT_LENGTH, VENDOR_LIBRARIES
+from services import get_services
+
+# Sizes of the pinned releases (bytes)
+VENDOR_SIZES = {
+    'bootstrap.min.css': 232_914,
+    'bootstrap.bundle.min.js': 80_420,
+    'bootstrap-icons/bootstrap-icons.css': 95_327,
+    'bootstrap-icons/fonts/bootstrap-icons.woff2': 121_340,
+    'bootstrap-icons/fonts/bootstrap-icons.woff': 164_168,
+    'pptxgen.bundle.js': 468_236,
+}
+
+FONT_FACE = ('@font-face{font-display:block;font-family:"bootstrap-icons";'
+             'src:url("./fonts/bootstrap-icons.woff2?8d200481aa7f02a2d63a331fc782cfaf") format("woff2"),'
+             'url("./fonts/bootstrap-icons.woff?8d200481aa7f02a2d63a331fc782cfaf") format("woff")}\n')
+
+_PLAIN_NAME = re.compile(r'\.[0-9a-f]{%d}(\.[^./]+)$' % FINGERPRINT_LENGTH)
+_PAGE_LINKS = re.compile(r'<(?:link[^>]+href|script[^>]+src)="([^"]+)"')
+_CSS_FONT = re.compile(r'src:\s*url\("?([^")]+)"?\)')
+
+
+def stand_in_text(size, kind, rng):
+    """CSS- or JS-like text of about size bytes"""
+    words = ['btn', 'nav', 'card', 'modal', 'form', 'row', 'col', 'text', 'bg', 'border', 'flex', 'grid',
+             'dropdown', 'toast', 'tooltip', 'carousel', 'offcanvas', 'primary', 'secondary', 'active', 'show']
+    properties = ['display', 'margin', 'padding', 'color', 'border-radius', 'font-size', 'line-height',
+                  'transition', 'background-color', 'box-shadow', 'width', 'z-index']
+    parts, length = [], 0
+    while length < size:
+        name = '-'.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        if kind == 'css':
+            body = ';'.join(f"{rng.choice(properties)}:{rng.randint(0, 999)}px" for _ in range(rng.randint(1, 4)))
+            part = f".{name}-{rng.randint(0, 99)}{{{body}}}"
+        else:
+            part = (f"function {name.replace('-', '_')}{rng.randint(0, 999)}(t,e){{var n=t.{rng.choice(words)}"
+                    f"({rng.randint(0, 99)});return e&&n.{rng.choice(properties).replace('-', '')}||null}}")
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)[:size]
+
+
+def write_stand_ins(folder, seed=0):
+    """Files the size of the vendored libraries, in folder"""
+    rng = random.Random(seed)
+    for name, size in VENDOR_SIZES.items():
+        path = os.path.join(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if name.endswith(('.woff2', '.woff')):
+            data = rng.randbytes(size)
+        else:
+            text = stand_in_text(size, 'css' if name.endswith('.css') else 'js', rng)
+            if name == 'bootstrap-icons/bootstrap-icons.css':
+                text = FONT_FACE + text[len(FONT_FACE):]
+            data = text.encode()
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def decode(response):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'br':
+        import brotli
+        return brotli.decompress(response.data)
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    return response.data
+
+
+class Browser:
+    """
+    Test client with a browser's HTTP cache
+    caching: whether the server's validators and Cache-Control are used
+    (False: every JSON response downloaded in full, as without ETags)
+    compression: whether to send Accept-Encoding
+    """
+
+    def __init__(self, client, caching=True, compression=True):
+        self.client = client
+        self.caching = caching
+        self.compression = compression
+        self.cache = {}
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes = 0
+        self.from_cache = 0
+        self.round_trips = 0
+
+    def get(self, url):
+        """
+        GET through the cache
+        Returns: (decoded body, whether a request was sent)
+        """
+        entry = self.cache.get(url)
+        if entry is not None and entry["fresh"]:
+            self.from_cache += 1
+            return entry["body"], False
+
+        headers = {}
+        if self.compression:
+            headers['Accept-Encoding'] = 'br, gzip'
+        if entry is not None and entry["etag"]:
+            headers['If-None-Match'] = entry["etag"]
+        response = self.client.get(url, headers=headers)
+        self.requests += 1
+        self.bytes += len(response.data) + sum(len(key) + len(value) + 4 for key, value in response.headers.items())
+        if response.status_code == 304:
+            self.not_modified += 1
+            return entry["body"], True
+        assert response.status_code == 200, (url, response.status_code)
+
+        body = decode(response)
+        cache_control = response.cache_control
+        is_json = response.mimetype == 'application/json'
+        etag = response.headers.get('ETag') if self.caching or not is_json else None
+        self.cache[url] = {
+            "etag": etag,
+            "body": body,
+            # max-age=0 and no-cache mean revalidate; the test run never outlives a year
+            "fresh": bool(cache_control.max_age) and not cache_control.no_cache,
+        }
+        return body, True
+
+    def wave(self, urls):
+        """Requests the page sends at once: one round trip if any goes to the network"""
+        results = [self.get(url) for url in urls]
+        if any(sent for _, sent in results):
+            self.round_trips += 1
+        return [body for body, _ in results]
+
+
+def asset_links(html, fingerprints):
+    """Local stylesheets and scripts of a page, as plain names when fingerprints is off"""
+    links = [url for url in _PAGE_LINKS.findall(html) if url.startswith('/assets/')]
+    if not fingerprints:
+        links = [_PLAIN_NAME.sub(r'\1', url) for url in links]
+    return links
+
+
+def load_page(browser, presentation_id, fingerprints):
+    """One page load: the HTML, its assets, the icon font, the deck and the images"""
+    [html] = browser.wave(['/'])
+    links = asset_links(html.decode(), fingerprints)
+    external = [url for url in _PAGE_LINKS.findall(html.decode()) if url.startswith('http')]
+    assert not external, f"not vendored: {external}"
+    bodies = browser.wave(links)
+    fonts = []
+    for url, body in zip(links, bodies):
+        if url.endswith('.css'):
+            # A browser downloads the first format it supports (woff2)
+            fonts += [urlsplit(urljoin(url, font)).path for font in _CSS_FONT.findall(body.decode())]
+    browser.wave(fonts)
+    browser.wave(['/get-slides', '/get-images', f'/load-presentation/{presentation_id}'])
+
+
+def measure(browser, presentation_id, fingerprints, bandwidth, rtt):
+    browser.reset_counters()
+    started = time.perf_counter()
+    load_page(browser, presentation_id, fingerprints)
+    seconds = time.perf_counter() - started
+    network_seconds = browser.round_trips * rtt + browser.bytes * 8 / bandwidth
+    return {
+        "requests": browser.requests,
+        "not_modified": browser.not_modified,
+        "from_cache": browser.from_cache,
+        "kb_received": round(browser.bytes / 1024, 1),
+        "round_trips": browser.round_trips,
+        "server_ms": round(seconds * 1000, 1),
+        "estimated_load_ms": round((seconds + network_seconds) * 1000),
+    }
+
+
+def edit_deck(app, user_id, presentation_id, step):
+    with app.app_context():
+        store = get_services(app).presentation_store
+        slides = [dict(slide) for slide in store.get(user_id, presentation_id)["slides"]]
+        slides[0]["title"] = f"Edited {step}"
+        store.save(user_id, presentation_id, slides)
+
+
+def run_mode(app, client, user_id, presentation_id, caching, args):
+    bandwidth, rtt = args.bandwidth_mbps * 1e6, args.rtt_ms / 1000
+    first, repeat, edited, repeat_times = None, None, None, []
+    for step in range(args.repeats):
+        browser = Browser(client, caching=caching, compression=caching)
+        first = measure(browser, presentation_id, caching, bandwidth, rtt)
+        repeat = measure(browser, presentation_id, caching, bandwidth, rtt)
+        repeat_times.append(repeat["server_ms"] / 1000)
+        edit_deck(app, user_id, presentation_id, step)
+        edited = measure(browser, presentation_id, caching, bandwidth, rtt)
+    return {"first_visit": first, "repeat_visit": repeat, "repeat_after_edit": edited,
+            "repeat_visit_server": summarize(repeat_times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--slides', type=int, default=20, help='slides of the current deck')
+    parser.add_argument('--repeats', type=int, default=20, help='page loads per measurement')
+    parser.add_argument('--bandwidth-mbps', type=float, default=10.0)
+    parser.add_argument('--rtt-ms', type=float, default=80.0)
+    parser.add_argument('--vendor-dir', default=None, help='folder filled by `flask vendor-assets` (default: stand-ins)')
+    args = parser.parse_args()
+
+    vendor_dir = args.vendor_dir
+    if vendor_dir is None:
+        vendor_dir = tempfile.mkdtemp(prefix='slides-vendor-')
+        write_stand_ins(vendor_dir)
+    missing = [name for name in VENDOR_LIBRARIES if not os.path.exists(os.path.join(vendor_dir, name))]
+    if missing:
+        parser.error(f"missing from {vendor_dir}: {', '.join(missing)}")
+
+    with StubImageServer(latency=0) as images:
+        app = boot_app(UNSPLASH_SOURCE_URL=images.url, PICSUM_URL=images.url, ASSET_VENDOR_FOLDER=vendor_dir)
+        client = logged_in_client(app)
+        use_stub_model(app, canned_responder(canned_deck(args.slides)))
+        response = client.post('/chat', json={'prompt': 'Create a presentation about climate change'})
+        assert response.status_code == 200, response.get_json()
+        presentation_id = response.get_json()["presentation_id"]
+        with app.app_context():
+            from models import User
+            user_id = User.query.filter_by(username='bench').one().id
+
+        report = {
+            "slides": args.slides,
+            "network": {"bandwidth_mbps": args.bandwidth_mbps, "rtt_ms": args.rtt_ms},
+            "vendored": "stand-ins" if args.vendor_dir is None else vendor_dir,
+        }
+        for mode, caching in (("before", False), ("after", True)):
+            report[mode] = run_mode(app, client, user_id, presentation_id, caching, args)
+        before, after = report["before"]["repeat_visit"], report["after"]["repeat_visit"]
+        report["repeat_visit_bytes_saved_pct"] = round(100 * (1 - after["kb_received"] / before["kb_received"]), 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
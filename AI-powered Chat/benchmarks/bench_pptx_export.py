@@ -0,0 +1,126 @@
+"""
+Server-side .pptx export: render time, memory and cache reuse.
+
+For decks of 5, 50 and 500 slides (every slide with a local image, cycling
+through a set of distinct photos):
+
+- render: time and peak RSS growth of render_pptx() in a fresh process
+- endpoint: /export/<id>.pptx latency on the first download (renders) and
+  on repeat downloads of the unchanged deck (cached file)
+
+    python benchmarks/bench_pptx_export.py --sizes 5 50 500 --images 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from PIL import Image
+
+from harness import boot_app, canned_deck, logged_in_client, summarize
+from services import get_services
+
+
+def make_deck(size, image_urls):
+    slides = canned_deck(size)["slides"]
+    for index, slide in enumerate(slides):
+        slide["image_url"] = image_urls[index % len(image_urls)]
+        slide["has_image"] = True
+        slide["image_position"] = ("right", "left", "top", "bottom")[index % 4]
+    return slides
+
+
+def write_images(folder, count):
+    os.makedirs(folder, exist_ok=True)
+    urls = []
+    for index in range(count):
+        filename = f"img_bench_{index}.jpg"
+        # Noise compresses like a photo would, unlike a flat color
+        photo = Image.merge('RGB', [Image.effect_noise((1600, 1200), 40 + index) for _ in range(3)])
+        photo.save(os.path.join(folder, filename), 'JPEG', quality=85)
+        urls.append(f"/static/uploads/{filename}")
+    return urls
+
+
+def memory_kb(field):
+    """VmRSS / VmHWM of this process from /proc (Linux); ru_maxrss would include the parent's"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def render_in_process(slides, upload_folder, out_path, results):
+    from pptx_export import render_pptx
+
+    def image_path(url):
+        return os.path.join(upload_folder, os.path.basename(url))
+
+    before = memory_kb('VmRSS')
+    started = time.perf_counter()
+    render_pptx(slides, image_path, out_path)
+    elapsed = time.perf_counter() - started
+    after = memory_kb('VmHWM')
+    results.put({
+        "render_s": round(elapsed, 3),
+        "peak_rss_growth_mb": round((after - before) / 1024, 1),
+        "file_mb": round(os.path.getsize(out_path) / 1024 / 1024, 2),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 500])
+    parser.add_argument('--images', type=int, default=20, help='distinct photos in the upload folder')
+    parser.add_argument('--repeat', type=int, default=10, help='cached downloads per deck')
+    args = parser.parse_args()
+
+    app = boot_app()
+    client = logged_in_client(app)
+    upload_folder = app.config['UPLOAD_FOLDER']
+    image_urls = write_images(upload_folder, args.images)
+    # Created with the export cache, on the first export
+    os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
+    ctx = multiprocessing.get_context('spawn')
+
+    report = []
+    for size in args.sizes:
+        slides = make_deck(size, image_urls)
+
+        results = ctx.Queue()
+        out_path = os.path.join(app.config['EXPORT_FOLDER'], f"bench_{size}.pptx")
+        process = ctx.Process(target=render_in_process, args=(slides, upload_folder, out_path, results))
+        process.start()
+        render = results.get(timeout=600)
+        process.join()
+        os.unlink(out_path)
+
+        with app.app_context():
+            presentation_id = get_services(app).presentation_store.create(1, slides)
+
+        started = time.perf_counter()
+        response = client.get(f'/export/{presentation_id}.pptx')
+        first = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+
+        cached = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.get(f'/export/{presentation_id}.pptx')
+            response.get_data()
+            cached.append(time.perf_counter() - started)
+
+        report.append({
+            "slides": size,
+            "render": render,
+            "endpoint_first_ms": round(first * 1000, 1),
+            "endpoint_cached": summarize(cached),
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,578 @@
+// Slide preview rendering: the old full rebuild vs. the keyed, virtualized
+// renderer (static/js/slide_preview.js), on an emulated DOM (no browser).
+//
+// For decks of --sizes slides it times, and counts the DOM nodes created:
+//
+// - initial: an empty preview -> the whole deck (a /chat or /load-presentation)
+// - edit: one slide's text changed (an /update)
+// - insert: a slide added at the front, every other slide renumbered
+// - image: one slide's image arriving (an image_ready event)
+// - no-op: the same deck again (a /get-slides reload)
+//
+// and reports the nodes and <img> elements in the preview afterwards. The
+// renderer sees a viewport of --viewport px on an emulated layout (cards of
+// a fixed height per bullet point and thumbnail); its IntersectionObserver
+// is answered synchronously after each render, and that time is counted.
+// Absolute times are those of the emulated DOM, not of a browser's; the
+// node counts are what a browser would build.
+//
+//     node benchmarks/bench_preview.js --sizes 10 50 200 500 --repeat 5
+
+'use strict';
+
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+
+// ---------------------------------------------------------------------------
+// Emulated DOM: just what the two renderers use
+
+const VOID_TAGS = new Set(['img', 'br', 'hr', 'input', 'meta', 'link']);
+const counters = { created: 0 };
+
+function escapeText(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+function unescapeText(text) {
+    return text.replace(/&lt;/g, '<').replace(/&gt;/g, '>').replace(/&quot;/g, '"')
+        .replace(/&#39;/g, "'").replace(/&amp;/g, '&');
+}
+
+class Node {
+    constructor() {
+        counters.created += 1;
+        this.parentNode = null;
+    }
+
+    get nextSibling() {
+        const siblings = this.parentNode ? this.parentNode.childNodes : [];
+        return siblings[siblings.indexOf(this) + 1] || null;
+    }
+
+    remove() {
+        if (this.parentNode) {
+            const siblings = this.parentNode.childNodes;
+            siblings.splice(siblings.indexOf(this), 1);
+            this.parentNode = null;
+        }
+    }
+
+    replaceWith(node) {
+        const parent = this.parentNode;
+        parent.insertBefore(node, this);
+        this.remove();
+    }
+}
+
+class Text extends Node {
+    constructor(data) {
+        super();
+        this.data = data;
+    }
+
+    get textContent() {
+        return this.data;
+    }
+}
+
+class ClassList {
+    constructor(element) {
+        this.element = element;
+    }
+
+    names() {
+        return this.element.className.split(/\s+/).filter(Boolean);
+    }
+
+    contains(name) {
+        return this.names().includes(name);
+    }
+
+    add(name) {
+        if (!this.contains(name)) this.element.className = [...this.names(), name].join(' ');
+    }
+
+    remove(name) {
+        this.element.className = this.names().filter(other => other !== name).join(' ');
+    }
+
+    toggle(name, force = !this.contains(name)) {
+        force ? this.add(name) : this.remove(name);
+        return force;
+    }
+}
+
+class Element extends Node {
+    constructor(tagName) {
+        super();
+        this.tagName = tagName.toLowerCase();
+        this.childNodes = [];
+        this.className = '';
+        this.attributes = {};
+        this.dataset = {};
+        this.style = {};
+        this.classList = new ClassList(this);
+        this.listeners = {};
+    }
+
+    get children() {
+        return this.childNodes.filter(node => node instanceof Element);
+    }
+
+    get firstChild() {
+        return this.childNodes[0] || null;
+    }
+
+    get firstElementChild() {
+        return this.children[0] || null;
+    }
+
+    get nextElementSibling() {
+        let node = this.nextSibling;
+        while (node && !(node instanceof Element)) node = node.nextSibling;
+        return node;
+    }
+
+    appendChild(node) {
+        return this.insertBefore(node, null);
+    }
+
+    insertBefore(node, reference) {
+        node.remove();
+        const index = reference ? this.childNodes.indexOf(reference) : this.childNodes.length;
+        this.childNodes.splice(index, 0, node);
+        node.parentNode = this;
+        return node;
+    }
+
+    replaceChildren(...nodes) {
+        this.childNodes.forEach(node => { node.parentNode = null; });
+        this.childNodes = [];
+        nodes.forEach(node => this.appendChild(node));
+    }
+
+    addEventListener(type, listener) {
+        (this.listeners[type] = this.listeners[type] || []).push(listener);
+    }
+
+    setAttribute(name, value) {
+        value = String(value);
+        if (name === 'class') {
+            this.className = value;
+        } else if (name.startsWith('data-')) {
+            this.dataset[name.slice(5)] = value;
+        } else {
+            this.attributes[name] = value;
+        }
+    }
+
+    set src(value) { this.attributes.src = value; }
+    set alt(value) { this.attributes.alt = value; }
+    set loading(value) { this.attributes.loading = value; }
+    set decoding(value) { this.attributes.decoding = value; }
+
+    get textContent() {
+        return this.childNodes.map(node => node.textContent).join('');
+    }
+
+    set textContent(text) {
+        this.replaceChildren(...(text === '' ? [] : [new Text(String(text))]));
+    }
+
+    get innerHTML() {
+        return this.childNodes.map(node => (node instanceof Text ? escapeText(node.data) : node.outerHTML)).join('');
+    }
+
+    set innerHTML(html) {
+        this.replaceChildren(...parseHtml(html));
+    }
+
+    get outerHTML() {
+        const attributes = Object.entries(this.attributes);
+        if (this.className) attributes.unshift(['class', this.className]);
+        Object.entries(this.dataset).forEach(([name, value]) => attributes.push([`data-${name}`, value]));
+        const open = `<${this.tagName}${attributes.map(([name, value]) => ` ${name}="${escapeText(String(value)).replace(/"/g, '&quot;')}"`).join('')}>`;
+        return VOID_TAGS.has(this.tagName) ? open : `${open}${this.innerHTML}</${this.tagName}>`;
+    }
+
+    // Emulated layout: see cardHeight()
+    get offsetHeight() {
+        if (this.style.height) return parseFloat(this.style.height);
+        return this.classList.contains('slide-card') ? cardHeight(this) : 0;
+    }
+
+    matches(selector) {
+        const { tag, classes, dataName, dataValue } = parseSelector(selector);
+        if (tag && this.tagName !== tag) return false;
+        if (classes.length) {
+            const names = ` ${this.className} `;
+            if (!classes.every(name => names.includes(` ${name} `))) return false;
+        }
+        return !dataName || String(this.dataset[dataName]) === dataValue;
+    }
+
+    closest(selector) {
+        let node = this;
+        while (node instanceof Element && !node.matches(selector)) node = node.parentNode;
+        return node instanceof Element ? node : null;
+    }
+
+    querySelectorAll(selector) {
+        const found = [];
+        const visit = element => element.children.forEach(child => {
+            if (child.matches(selector)) found.push(child);
+            visit(child);
+        });
+        visit(this);
+        return found;
+    }
+
+    querySelector(selector) {
+        return this.querySelectorAll(selector)[0] || null;
+    }
+}
+
+// Compound selectors only: tag, classes and one [data-name="value"]
+const selectors = new Map();
+
+function parseSelector(selector) {
+    if (!selectors.has(selector)) {
+        const match = /^([a-z0-9]*)((?:\.[\w-]+)*)(?:\[data-([\w-]+)="([^"]*)"\])?$/i.exec(selector.trim());
+        if (!match) throw new Error(`Unsupported selector ${selector}`);
+        const [, tag, classes, dataName, dataValue] = match;
+        selectors.set(selector, { tag: tag.toLowerCase(), classes: classes.split('.').filter(Boolean), dataName, dataValue });
+    }
+    return selectors.get(selector);
+}
+
+// Enough of an HTML parser for the old renderer's templates
+function parseHtml(html) {
+    const root = new Element('template');
+    let current = root;
+    const pattern = /<\/([a-z0-9]+)\s*>|<([a-z0-9]+)((?:\s+[\w-]+(?:="[^"]*")?)*)\s*\/?>|([^<]+)/gi;
+    let match;
+    while ((match = pattern.exec(html))) {
+        const [, closing, tag, attributes, text] = match;
+        if (closing) {
+            current = current.parentNode;
+        } else if (tag) {
+            const element = new Element(tag);
+            (attributes.match(/[\w-]+(?:="[^"]*")?/g) || []).forEach(attribute => {
+                const [name, value = ''] = attribute.split(/=(.*)/s);
+                element.setAttribute(name, unescapeText(value.replace(/^"|"$/g, '')));
+            });
+            current.appendChild(element);
+            if (!VOID_TAGS.has(element.tagName)) current = element;
+        } else {
+            current.appendChild(new Text(unescapeText(text)));
+        }
+    }
+    return [...root.childNodes];
+}
+
+const document = {
+    createElement: tag => new Element(tag),
+    querySelectorAll: selector => (document.body ? document.body.querySelectorAll(selector) : []),
+    body: null
+};
+
+// Card heights of the emulated layout (px)
+function cardHeight(card) {
+    const items = card.querySelectorAll('li').length;
+    const image = card.querySelector('img') ? 140 : 0;
+    return 80 + 22 * items + image;
+}
+
+// IntersectionObserver over the emulated layout, answered by deliver()
+class EmulatedIntersectionObserver {
+    constructor(callback, options) {
+        this.callback = callback;
+        this.root = options.root;
+        this.margin = parseFloat(options.rootMargin) || 0;
+        this.targets = new Map();
+        EmulatedIntersectionObserver.instances.push(this);
+    }
+
+    observe(target) {
+        this.targets.set(target, null);
+    }
+
+    unobserve(target) {
+        this.targets.delete(target);
+    }
+
+    // Report the targets whose intersection changed (all of them the first time)
+    deliver() {
+        const top = this.root.scrollTop - this.margin;
+        const bottom = this.root.scrollTop + this.root.clientHeight + this.margin;
+        const changes = [];
+        let y = 0;
+        this.root.children.forEach(card => {
+            const height = card.offsetHeight;
+            if (this.targets.has(card)) {
+                const intersecting = y < bottom && y + height > top;
+                if (this.targets.get(card) !== intersecting) {
+                    this.targets.set(card, intersecting);
+                    changes.push({ target: card, isIntersecting: intersecting });
+                }
+            }
+            y += height;
+        });
+        if (changes.length) this.callback(changes);
+    }
+}
+EmulatedIntersectionObserver.instances = [];
+
+function settle() {
+    // Filling cards in changes the layout: deliver until nothing changes
+    for (let round = 0; round < 10; round += 1) {
+        const before = counters.created;
+        EmulatedIntersectionObserver.instances.forEach(observer => observer.deliver());
+        if (counters.created === before) break;
+    }
+}
+
+// ---------------------------------------------------------------------------
+// The renderers
+
+// The preview before static/js/slide_preview.js (static/js/app.js at the time)
+const OLD_RENDERER = `
+function updateSlidesPreview(index) {
+    if (currentSlides.length === 0) {
+        slidesPreview.innerHTML = '<div class="no-slides"><i class="bi bi-file-earmark-plus"></i><p>No slides yet</p><small>Start chatting to create your presentation</small></div>';
+        return;
+    }
+    if (index !== undefined) {
+        renderSlideCard(index);
+        return;
+    }
+    slidesPreview.innerHTML = '';
+    currentSlides.forEach((slide, i) => renderSlideCard(i));
+}
+
+function renderSlideCard(index) {
+    const slide = currentSlides[index];
+    if (!slide) return;
+    const placeholder = slidesPreview.querySelector('.no-slides');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    const slideCard = createSlideCard(slide, index);
+    const existing = slidesPreview.querySelector('.slide-card[data-index="' + index + '"]');
+    if (existing) {
+        if (existing.classList.contains('active')) {
+            slideCard.classList.add('active');
+        }
+        existing.replaceWith(slideCard);
+        return;
+    }
+    const next = Array.from(slidesPreview.querySelectorAll('.slide-card'))
+        .find(card => Number(card.dataset.index) > index);
+    slidesPreview.insertBefore(slideCard, next || null);
+}
+
+function createSlideCard(slide, index) {
+    const slideCard = document.createElement('div');
+    slideCard.className = 'slide-card';
+    slideCard.dataset.index = index;
+    let contentHtml = '';
+    if (Array.isArray(slide.content)) {
+        contentHtml = '<ul>' + slide.content.map(point => '<li>' + escapeHtml(point) + '</li>').join('') + '</ul>';
+    } else if (typeof slide.content === 'string') {
+        contentHtml = '<p>' + escapeHtml(slide.content) + '</p>';
+    }
+    let imageHtml = '';
+    if (slide.has_image && slide.image_url) {
+        const previewUrl = slide.thumbnail_url || slide.image_url;
+        imageHtml = '<img class="slide-thumbnail" src="' + escapeHtml(previewUrl) + '" alt="" loading="lazy" decoding="async">'
+            + '<div class="slide-image-indicator"><i class="bi bi-image-fill"></i> Has Image</div>';
+    }
+    slideCard.innerHTML = '<div class="slide-number">' + (index + 1) + '</div><h6>'
+        + escapeHtml(slide.title || 'Untitled Slide') + '</h6>' + contentHtml + imageHtml;
+    slideCard.addEventListener('click', () => {
+        document.querySelectorAll('.slide-card').forEach(card => card.classList.remove('active'));
+        slideCard.classList.add('active');
+    });
+    return slideCard;
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+`;
+
+function newPreview() {
+    const container = new Element('div');
+    container.scrollTop = 0;
+    container.clientHeight = options.viewport;
+    document.body = container;
+    EmulatedIntersectionObserver.instances = [];
+    return container;
+}
+
+function oldRenderer() {
+    const container = newPreview();
+    const context = vm.createContext({ document, slidesPreview: container, currentSlides: [] });
+    vm.runInContext(OLD_RENDERER, context);
+    return {
+        container,
+        show: (slides) => {
+            context.currentSlides = slides;
+            vm.runInContext('updateSlidesPreview()', context);
+        },
+        showOne: (slides, hashes, index) => {
+            context.currentSlides = slides;
+            vm.runInContext(`updateSlidesPreview(${index})`, context);
+        }
+    };
+}
+
+const PREVIEW_SOURCE = fs.readFileSync(
+    path.join(__dirname, '..', 'static', 'js', 'slide_preview.js'), 'utf8');
+
+function newRenderer() {
+    const container = newPreview();
+    const context = vm.createContext({ document, IntersectionObserver: EmulatedIntersectionObserver });
+    vm.runInContext(PREVIEW_SOURCE + '\nthis.SlidePreview = SlidePreview;', context);
+    const preview = new context.SlidePreview(container);
+    return {
+        container,
+        show: (slides, hashes) => {
+            preview.render(slides, hashes);
+            settle();
+        },
+        showOne: (slides, hashes, index) => {
+            preview.update(index, slides[index], hashes[index]);
+            settle();
+        }
+    };
+}
+
+// ---------------------------------------------------------------------------
+// Decks and scenarios
+
+const WORDS = ('renewable energy grows as costs fall while storage networks policy markets and demand '
+    + 'shape adoption across regions with new jobs investment research risks and benefits').split(' ');
+
+function makeSlide(random, number) {
+    const words = count => Array.from({ length: count }, () => WORDS[Math.floor(random() * WORDS.length)]).join(' ');
+    const slide = {
+        title: `${number}. ${words(4)}`,
+        content: Array.from({ length: 3 + Math.floor(random() * 4) }, () => words(8 + Math.floor(random() * 8))),
+        has_image: random() < 0.5,
+        image_query: words(2)
+    };
+    if (slide.has_image) {
+        slide.image_url = `/static/uploads/img_${number}.jpg`;
+        slide.thumbnail_url = `/static/uploads/thumb_${number}.jpg`;
+    }
+    return slide;
+}
+
+function seeded(seed) {
+    return () => {
+        seed = (seed * 1103515245 + 12345) % 2147483648;
+        return seed / 2147483648;
+    };
+}
+
+// Stand-in for session_state.slide_hash (any stable hash of the slide works)
+function slideHash(slide) {
+    return crypto.createHash('sha256').update(JSON.stringify(slide)).digest('hex').slice(0, 16);
+}
+
+function deck(slides) {
+    return { slides, hashes: slides.map(slideHash) };
+}
+
+function scenarios(size) {
+    const random = seeded(size);
+    const base = deck(Array.from({ length: size }, (_, i) => makeSlide(random, i + 1)));
+    const middle = Math.floor(size / 2);
+
+    const edited = base.slides.map(slide => ({ ...slide }));
+    edited[middle].content = [...edited[middle].content, 'One more point from the edit'];
+
+    const imaged = base.slides.map(slide => ({ ...slide }));
+    imaged[middle] = { ...imaged[middle], has_image: true, image_url: '/static/uploads/new.jpg',
+        thumbnail_url: '/static/uploads/new_thumb.jpg' };
+
+    return [
+        { name: 'initial', before: null, after: base },
+        { name: 'edit', before: base, after: deck(edited) },
+        { name: 'insert', before: base, after: deck([makeSlide(random, 0), ...base.slides]) },
+        { name: 'image', before: base, after: deck(imaged), index: middle },
+        { name: 'no-op', before: base, after: deck(base.slides.map(slide => ({ ...slide }))) }
+    ];
+}
+
+function countNodes(element) {
+    return element.childNodes.reduce((total, node) => total + 1 + (node instanceof Element ? countNodes(node) : 0), 0);
+}
+
+function measure(makeRenderer, scenario) {
+    const times = [];
+    let created = 0;
+    let renderer;
+    for (let run = 0; run < options.repeat; run += 1) {
+        renderer = makeRenderer();
+        if (scenario.before) {
+            renderer.show(scenario.before.slides, scenario.before.hashes);
+        }
+        const createdBefore = counters.created;
+        const started = process.hrtime.bigint();
+        if (scenario.index !== undefined) {
+            renderer.showOne(scenario.after.slides, scenario.after.hashes, scenario.index);
+        } else {
+            renderer.show(scenario.after.slides, scenario.after.hashes);
+        }
+        times.push(Number(process.hrtime.bigint() - started) / 1e6);
+        created = counters.created - createdBefore;
+    }
+    times.sort((a, b) => a - b);
+    return {
+        ms: Number(times[Math.floor(times.length / 2)].toFixed(3)),
+        nodes_created: created,
+        nodes_in_preview: countNodes(renderer.container),
+        images_in_preview: renderer.container.querySelectorAll('img').length
+    };
+}
+
+function parseOptions(argv) {
+    const parsed = { sizes: [10, 50, 200, 500], repeat: 5, viewport: 800 };
+    for (let i = 0; i < argv.length; i += 1) {
+        if (argv[i] === '--sizes') {
+            parsed.sizes = [];
+            while (argv[i + 1] && !argv[i + 1].startsWith('--')) parsed.sizes.push(Number(argv[++i]));
+        } else if (argv[i] === '--repeat' || argv[i] === '--viewport') {
+            parsed[argv[i].slice(2)] = Number(argv[++i]);
+        } else {
+            console.error('usage: node benchmarks/bench_preview.js [--sizes N ...] [--repeat N] [--viewport PX]');
+            process.exit(2);
+        }
+    }
+    return parsed;
+}
+
+const options = parseOptions(process.argv.slice(2));
+
+function main() {
+    const report = { viewport_px: options.viewport, repeat: options.repeat, runs: [] };
+    options.sizes.forEach(size => {
+        scenarios(size).forEach(scenario => {
+            report.runs.push({
+                slides: size,
+                scenario: scenario.name,
+                full_rebuild: measure(oldRenderer, scenario),
+                keyed_virtualized: measure(newRenderer, scenario)
+            });
+        });
+    });
+    console.log(JSON.stringify(report, null, 2));
+}
+
+main();
@@ -0,0 +1,153 @@
+"""
+Response cache: hit latency, matching quality and lookup cost.
+
+- latency: /chat p50/p99 for a cache miss (stand-in model with a fixed
+  latency), an exact repeat and a reworded prompt
+- matching: paraphrase pairs that should share an answer and look-alike
+  pairs that must not (different slide counts, narrower topics)
+- restart: a fresh cache object over the same database still hits
+- lookup: cost of a miss and a near-duplicate hit with the cache filled
+
+    python benchmarks/bench_response_cache.py --latency 1.5 --entries 5000
+"""
+import argparse
+import json
+import sys
+import time
+
+from harness import (StubImageServer, boot_app, canned_deck, canned_responder, logged_in_client, summarize,
+                     use_stub_model)
+from services import get_services
+
+SHOULD_MATCH = [
+    ("make a presentation about climate change", "create slides on climate change"),
+    ("Presentation on the history of the Roman Empire", "roman empire history slides"),
+    ("Give me 5 slides about healthy eating", "create five slides on healthy eating"),
+    ("slides explaining machine learning basics", "Machine learning basics presentation, please"),
+    ("A deck about renewable energy sources", "Renewable energy sources!"),
+]
+
+MUST_NOT_MATCH = [
+    ("5 slides about climate change", "10 slides about climate change"),
+    ("climate change", "climate change in africa"),
+    ("history of the roman empire", "history of the ottoman empire"),
+    ("python for data science", "python for web development"),
+    ("benefits of remote work", "drawbacks of remote work"),
+]
+
+TOPICS = [
+    "climate change", "roman empire", "machine learning", "healthy eating",
+    "renewable energy", "space exploration", "ocean pollution", "ancient egypt",
+]
+
+
+def chat_latencies(client, prompts):
+    latencies = []
+    matches = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        response = client.post('/chat', json={'prompt': prompt})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        matches.append(response.get_json().get('cached'))
+    return latencies, matches
+
+
+def run_latency(app, client, runs):
+    report = {}
+    prompts = [f"presentation about {topic} number {i}" for i, topic in enumerate(TOPICS * runs)][:runs]
+    latencies, _ = chat_latencies(client, prompts)
+    report["miss"] = summarize(latencies)
+
+    latencies, matches = chat_latencies(client, prompts)
+    assert all(match == 'exact' for match in matches), matches
+    report["exact_hit"] = summarize(latencies)
+
+    reworded = [f"create slides on {p.split('about ', 1)[1]}" for p in prompts]
+    latencies, matches = chat_latencies(client, reworded)
+    assert all(match == 'near' for match in matches), matches
+    report["near_hit"] = summarize(latencies)
+    return report
+
+
+def run_matching(cache):
+    cache.clear()
+    report = {"should_match": 0, "should_match_total": len(SHOULD_MATCH),
+              "false_matches": 0, "must_not_match_total": len(MUST_NOT_MATCH), "misses": [], "false": []}
+    answer = {"slides": canned_deck(3)["slides"], "message": "ok"}
+    for first, second in SHOULD_MATCH:
+        cache.store(first, answer)
+        if cache.lookup(second)[0] is not None:
+            report["should_match"] += 1
+        else:
+            report["misses"].append([first, second])
+    for first, second in MUST_NOT_MATCH:
+        cache.store(first, answer)
+        if cache.lookup(second)[0] is not None:
+            report["false_matches"] += 1
+            report["false"].append([first, second])
+    return report
+
+
+def run_restart(cache):
+    from response_cache import ResponseCache
+    cache.store("presentation about the water cycle", {"slides": canned_deck(2)["slides"], "message": "ok"})
+    restarted = ResponseCache(namespace=cache.namespace)
+    return {"hit_after_restart": restarted.lookup("slides about the water cycle")[1]}
+
+
+def run_lookup_cost(cache, entries, repeat):
+    cache.clear()
+    answer = {"slides": canned_deck(5)["slides"], "message": "ok"}
+    started = time.perf_counter()
+    for i in range(entries):
+        # Distinct topics so the LSH buckets stay realistic
+        cache.store(f"presentation about topic{i} subject{i * 7 % 1000} area{i % 97}", answer)
+    fill_s = time.perf_counter() - started
+
+    def timed(prompt):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            cache.lookup(prompt)
+        return round((time.perf_counter() - started) / repeat * 1e3, 3)
+
+    return {
+        "entries": len(cache._entries),
+        "store_ms": round(fill_s / entries * 1e3, 3),
+        "miss_ms": timed("presentation about something never seen before"),
+        "near_hit_ms": timed(f"slides on topic{entries // 2} subject{entries // 2 * 7 % 1000} area{entries // 2 % 97}"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--latency', type=float, default=1.5, help='seconds per model call')
+    parser.add_argument('--runs', type=int, default=8)
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with StubImageServer(latency=0.0) as stub:
+        app = boot_app(UNSPLASH_SOURCE_URL=stub.url, PICSUM_URL=stub.url,
+                              RESPONSE_CACHE_MAX_ENTRIES=args.entries)
+        use_stub_model(app, canned_responder(canned_deck(7)), latency=args.latency)
+        client = logged_in_client(app)
+
+        with app.app_context():
+            cache = get_services(app).response_cache
+            report = {
+                "latency": run_latency(app, client, args.runs),
+                "stats": cache.stats(),
+                "matching": run_matching(cache),
+                "restart": run_restart(cache),
+                "lookup": run_lookup_cost(cache, args.entries, args.repeat),
+            }
+    print(json.dumps(report, indent=2))
+
+    matching = report["matching"]
+    if matching["false_matches"] or matching["should_match"] < matching["should_match_total"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Full-text search over many saved decks: FTS5 index vs. scanning the JSON.
+
+Seeds one user with --decks presentations (plus decks of other users) of
+varied text, with word frequencies skewed like real text, then reports:
+
+- backfill: time to index every deck, and database size before/after
+- queries: search latency (search() and the /search endpoint) for a rare
+  word, a medium and a very common one, two words, and a plural (found
+  through stemming) - next to the match count and the naive alternative,
+  a LIKE scan of the user's slides_data
+- writes: cost of keeping the index in sync when a deck is saved
+
+    python benchmarks/bench_search.py --decks 100000
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import string
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from harness import boot_app, logged_in_client, summarize
+from services import get_services
+
+COMMON = ("energy solar wind grid storage policy market growth cost carbon emissions climate adoption "
+          "technology battery efficiency demand supply network investment future risk impact research "
+          "data model customer revenue strategy team product design security cloud platform scale").split()
+
+
+def vocabulary(rng, size):
+    """
+    Made-up words, most frequent first
+    Returns: (words, cumulative Zipf-like weights for random.choices)
+    """
+    words = list(COMMON)
+    while len(words) < size:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10))))
+    return words, list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+
+def make_deck(rng, words, weights, slide_count):
+    def phrase(count):
+        return ' '.join(rng.choices(words, cum_weights=weights, k=count))
+    return [{
+        "title": phrase(rng.randint(2, 5)).title(),
+        "content": [phrase(rng.randint(6, 12)).capitalize() + '.' for _ in range(rng.randint(3, 5))],
+        "image_search_query": phrase(3),
+        "image_position": "background" if index == 0 else "right",
+    } for index in range(slide_count)]
+
+
+def seed(db_path, user_id, decks, other_users, slides_per_deck, words, weights):
+    """Insert decks straight into SQLite in the old slides_data format, not indexed yet"""
+    rng = random.Random(3)
+    connection = sqlite3.connect(db_path)
+    connection.executemany(
+        'INSERT INTO user (id, username, email, password, created_at) VALUES (?, ?, ?, ?, ?)',
+        [(user_id + n, f"other{n}", f"other{n}@example.com", 'x', datetime.utcnow()) for n in range(1, other_users + 1)]
+    )
+    start = datetime(2023, 1, 1)
+    total = decks + decks // 4
+    batch = []
+    for index in range(total):
+        owner = user_id if index < decks else user_id + 1 + index % other_users
+        slides = make_deck(rng, words, weights, slides_per_deck)
+        updated = start + timedelta(seconds=index * 7)
+        batch.append((slides[0]["title"], owner, json.dumps(slides), updated, updated, len(slides), ''))
+        if len(batch) == 5000 or index == total - 1:
+            connection.executemany(
+                'INSERT INTO presentation (title, user_id, slides_data, created_at, updated_at, slide_count, summary) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', batch
+            )
+            batch = []
+    connection.commit()
+    connection.close()
+
+
+def db_size_mb(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    connection.close()
+    return round(os.path.getsize(db_path) / 1024 / 1024, 1)
+
+
+def timed(fn, runs):
+    latencies = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--decks', type=int, default=100000, help='decks of the benchmarked user')
+    parser.add_argument('--other-users', type=int, default=50)
+    parser.add_argument('--slides', type=int, default=7, help='slides per deck')
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--like-runs', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    words, weights = vocabulary(rng, args.vocabulary)
+
+    workdir = tempfile.mkdtemp(prefix='slides-search-')
+    app = boot_app(workdir)
+    client = logged_in_client(app)
+    db_path = os.path.join(workdir, 'bench.db')
+    from models import User, db
+    from search_index import backfill_search_index, search
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench').one().id
+
+    started = time.perf_counter()
+    seed(db_path, user_id, args.decks, args.other_users, args.slides, words, weights)
+    report = {"decks": args.decks, "seed_s": round(time.perf_counter() - started, 1),
+              "backfill": {"db_mb_before": db_size_mb(db_path)}}
+
+    with app.app_context():
+        started = time.perf_counter()
+        report["backfill"]["decks"] = backfill_search_index()
+        report["backfill"]["seconds"] = round(time.perf_counter() - started, 1)
+    report["backfill"]["db_mb_after"] = db_size_mb(db_path)
+
+    queries = {
+        "rare_word": words[-1],
+        "medium_word": words[len(COMMON) + 60],
+        "common_word": COMMON[0],
+        "two_words": f"{COMMON[0]} {words[len(COMMON) + 5]}",
+        "plural": COMMON[3] + 's',
+    }
+    report["queries"] = {}
+    with app.app_context():
+        for name, query in queries.items():
+            fts, (results, _) = timed(lambda: search(user_id, query, 24, 1), args.runs)
+            matches = db.session.execute(
+                db.text("SELECT count(*) FROM presentation_search WHERE presentation_search MATCH :q"),
+                {"q": f'owner : "u{user_id}" AND {{title slide_titles content image_queries}} : '
+                      + ' '.join(f'"{term}"' for term in query.split())}
+            ).scalar()
+            endpoint, _ = timed(lambda: client.get(f'/search?q={query}&limit=24').get_data(), args.runs)
+            like_terms = query.split()
+            like_sql = ("SELECT id FROM presentation WHERE user_id = :user_id AND "
+                        + " AND ".join(f"slides_data LIKE :t{n}" for n in range(len(like_terms))) + " LIMIT 24")
+            like, _ = timed(lambda: db.session.execute(db.text(like_sql), {
+                "user_id": user_id, **{f"t{n}": f"%{term}%" for n, term in enumerate(like_terms)}
+            }).all(), args.like_runs)
+            report["queries"][name] = {"query": query, "matches": matches, "search": fts, "endpoint": endpoint,
+                                       "like_scan": like, "first_title": results[0]["title_html"] if results else None}
+
+        store = get_services(app).presentation_store
+        deck = make_deck(rng, words, weights, args.slides)
+        presentation_id = store.create(user_id, deck)
+        from search_index import index_deck
+        index_only, _ = timed(lambda: (index_deck(presentation_id, user_id, deck[0]["title"], deck),
+                                       db.session.commit()), args.runs)
+        edits = iter(range(10 ** 9))
+        save, _ = timed(lambda: store.save(user_id, presentation_id,
+                                           [dict(deck[0], title=f"Edited {next(edits)}")] + deck[1:]), args.runs)
+        report["writes"] = {"index_deck_and_commit": index_only, "store_save_one_slide": save}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Multi-process check of per-user presentation state.
+
+Starts N single-threaded worker processes (like gunicorn sync workers) on one
+SQLite database and spreads simulated users over them round-robin, the way a
+load balancer would. Every user creates a deck, then alternates /update and
+/get-slides on different workers. The run fails if any user ever sees a deck
+that isn't theirs or an edit made on one worker is missing on another.
+Throughput is reported for each worker count.
+
+    python benchmarks/bench_session_state.py --workers 1 2 4 --users 16 --rounds 10
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from harness import summarize
+
+
+class SessionModel:
+    """Deck titled after the user, and a patch that marks slide 1 as edited"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __call__(self, prompt):
+        time.sleep(self.latency)
+        if '"patch"' in prompt:
+            targeted = json.loads(prompt.split('when slides are only being added):', 1)[1].split('\n', 2)[1])
+            slide = dict(targeted["1"])
+            slide["title"] = slide["title"] + " *"
+            answer = {"patch": [{"op": "replace", "slide": 1, "data": slide}], "message": "Edited slide 1"}
+        else:
+            owner = re.search(r'Hello (\S+)!', prompt).group(1)
+            answer = {
+                "slides": [{"title": f"{owner} slide {i + 1}", "content": [owner], "image_search_query": ""} for i in range(3)],
+                "message": f"Deck for {owner}",
+            }
+        return json.dumps(answer)
+
+
+def init_db(workdir):
+    from harness import boot_app
+    boot_app(workdir)
+
+
+def serve(workdir, latency, ports):
+    from werkzeug.serving import make_server
+
+    from harness import boot_app, use_stub_model
+
+    # Keep the report readable: no request logs or app prints from workers
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    sys.stdout = open(os.devnull, 'w')
+
+    app = boot_app(workdir)
+    app.config['TESTING'] = False
+    use_stub_model(app, SessionModel(latency))
+    server = make_server('127.0.0.1', 0, app, threaded=False)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def simulate_user(name, workers, rounds, ready, latencies, errors):
+    http = requests.Session()
+    turn = [hash(name) % len(workers)]
+
+    def url(path):
+        # Round-robin over the workers, as a load balancer would
+        turn[0] = (turn[0] + 1) % len(workers)
+        return workers[turn[0]] + path
+
+    http.post(url('/signup'), json={'username': name, 'email': f'{name}@example.com', 'password': 'secret-pass'})
+    http.post(url('/login'), json={'username': name, 'password': 'secret-pass'}).raise_for_status()
+    deck = http.post(url('/chat'), json={'prompt': 'my deck'}).json()
+    presentation_id = deck["presentation_id"]
+
+    # Only the edit/read rounds are timed, not signup and bcrypt
+    ready.wait()
+    for round_number in range(rounds):
+        started = time.perf_counter()
+        edited = http.post(url('/update'), json={'prompt': 'edit slide 1'}).json()
+        current = http.get(url('/get-slides')).json()
+        latencies.append(time.perf_counter() - started)
+
+        expected_title = f"{name} slide 1" + " *" * (round_number + 1)
+        for response in (edited, current):
+            titles = [slide["title"] for slide in response.get("slides", [])]
+            if response.get("presentation_id") != presentation_id or not titles:
+                errors.append(f"{name}: wrong or missing deck {response.get('presentation_id')} (expected {presentation_id})")
+            elif any(not title.startswith(f"{name} ") for title in titles):
+                errors.append(f"{name}: saw another user's slides {titles}")
+            elif titles[0] != expected_title:
+                errors.append(f"{name}: stale slide 1 {titles[0]!r}, expected {expected_title!r}")
+
+
+def run(worker_count, users, rounds, latency):
+    workdir = tempfile.mkdtemp(prefix='slides-session-')
+    ctx = multiprocessing.get_context('spawn')
+
+    init = ctx.Process(target=init_db, args=(workdir,))
+    init.start()
+    init.join()
+
+    ports = ctx.Queue()
+    processes = [ctx.Process(target=serve, args=(workdir, latency, ports), daemon=True) for _ in range(worker_count)]
+    for process in processes:
+        process.start()
+    workers = [f"http://127.0.0.1:{ports.get(timeout=60)}" for _ in processes]
+
+    latencies, errors = [], []
+    ready = threading.Barrier(users + 1)
+    threads = [
+        threading.Thread(target=simulate_user, args=(f"user{i}", workers, rounds, ready, latencies, errors))
+        for i in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    for process in processes:
+        process.terminate()
+
+    return {
+        "workers": worker_count,
+        "requests": len(latencies) * 2,
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(len(latencies) * 2 / elapsed, 1),
+        "update_plus_get": summarize(latencies),
+        "errors": errors[:10],
+        "error_count": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per model call')
+    args = parser.parse_args()
+
+    report = [run(count, args.users, args.rounds, args.latency) for count in args.workers]
+    print(json.dumps(report, indent=2))
+    if any(row["error_count"] for row in report):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
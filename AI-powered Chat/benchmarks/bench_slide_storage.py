@@ -0,0 +1,183 @@
+"""
+Slide storage: JSON blob per deck vs. encoded per-slide rows.
+
+For decks of 10, 100 and 500 slides (varied text, image fields and
+image_meta like generated decks have):
+
+- size: database size with every deck in the old slides_data format, then
+  after `migrate_all()` moved them to slide rows (both after VACUUM), and
+  the migration time
+- save: old full JSON rewrite vs. saving a deck with one slide edited
+  (cached deck and cold cache) vs. every slide changed
+- load: old JSON decode vs. loading the deck cold, one slide, the outline
+
+    python benchmarks/bench_slide_storage.py --sizes 10 100 500 --decks 20
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from harness import boot_app, summarize
+from services import get_services
+
+WORDS = ("energy solar wind grid storage policy market growth cost carbon emissions climate adoption "
+         "technology battery efficiency demand supply network investment future risk impact research "
+         "data model customer revenue strategy team product design security cloud platform scale").split()
+
+
+def make_slide(rng, index):
+    digest = hashlib.sha256(f"{rng.random()}".encode()).hexdigest()
+    return {
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).title(),
+        "content": [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "."
+                    for _ in range(rng.randint(3, 5))],
+        "image_search_query": " ".join(rng.choice(WORDS) for _ in range(3)),
+        "image_position": rng.choice(("right", "left", "top", "bottom")) if index else "background",
+        "has_image": True,
+        "image_url": f"/static/uploads/img_{digest[:32]}.jpg",
+        "thumbnail_url": f"/static/uploads/img_{digest[:32]}_thumb.webp",
+        "image_meta": {
+            "width": 1600, "height": rng.choice((900, 1067, 1200)), "bytes": rng.randint(150000, 450000),
+            "sha256": hashlib.sha256(digest.encode()).hexdigest(),
+            "thumb_width": 320, "thumb_height": 240, "thumb_bytes": rng.randint(12000, 30000),
+            "source_sha256": digest, "source_bytes": rng.randint(800000, 4000000),
+        },
+    }
+
+
+def make_deck(rng, size):
+    return [make_slide(rng, index) for index in range(size)]
+
+
+def vacuumed_size(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    connection.execute('VACUUM')
+    connection.close()
+    return os.path.getsize(db_path)
+
+
+def timed(fn, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--decks', type=int, default=20, help='decks of each size')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    workdir = tempfile.mkdtemp(prefix='slides-storage-')
+    app = boot_app(workdir)
+    db_path = os.path.join(workdir, 'bench.db')
+    store = get_services(app).presentation_store
+
+    from models import Presentation, User, db
+    with app.app_context():
+        db.session.add(User(username='bench', email='bench@example.com', password='x'))
+        db.session.commit()
+        user_id = User.query.filter_by(username='bench').one().id
+
+    # Old format: one JSON text per deck, as the app wrote it before
+    decks = {size: [make_deck(rng, size) for _ in range(args.decks)] for size in args.sizes}
+    connection = sqlite3.connect(db_path)
+    ids = {size: [] for size in args.sizes}
+    for size, deck_list in decks.items():
+        for slides in deck_list:
+            now = datetime.utcnow()
+            cursor = connection.execute(
+                'INSERT INTO presentation (title, user_id, slides_data, created_at, updated_at, slide_count, summary) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (slides[0]["title"], user_id, json.dumps(slides), now, now, size, '')
+            )
+            ids[size].append(cursor.lastrowid)
+    connection.commit()
+    connection.close()
+
+    report = {"size": {"json_blob_mb": round(vacuumed_size(db_path) / 1024 / 1024, 2)}}
+    with app.app_context():
+        started = time.perf_counter()
+        moved = store.migrate_all()
+        report["size"]["migration_s"] = round(time.perf_counter() - started, 2)
+        report["size"]["decks_migrated"] = moved
+    report["size"]["slide_rows_mb"] = round(vacuumed_size(db_path) / 1024 / 1024, 2)
+    report["size"]["ratio"] = round(report["size"]["json_blob_mb"] / report["size"]["slide_rows_mb"], 2)
+
+    report["decks"] = []
+    with app.app_context():
+        for size in args.sizes:
+            slides = decks[size][0]
+            presentation_id = ids[size][0]
+            legacy_id = store.create(user_id, [])
+            db.session.query(Presentation).filter_by(id=legacy_id).update({"slides_data": json.dumps(slides)})
+            db.session.commit()
+
+            def legacy_save():
+                # What save() did before: rewrite the whole deck as one JSON text
+                presentation = db.session.get(Presentation, legacy_id)
+                presentation.slides_data = json.dumps(slides)
+                presentation.updated_at = datetime.utcnow()
+                db.session.commit()
+
+            def legacy_load():
+                db.session.expire_all()
+                json.loads(db.session.get(Presentation, legacy_id).slides_data)
+
+            edits = iter(range(10 ** 9))
+
+            def edit_one(cold):
+                edited = list(store.get(user_id, presentation_id)["slides"])
+                index = next(edits) % size
+                edited[index] = dict(edited[index], title=f"Edited {index}")
+                if cold:
+                    store._entries.clear()
+                store.save(user_id, presentation_id, edited)
+
+            def rewrite_all():
+                store.save(user_id, presentation_id, [dict(slide, title=f"{slide['title']} {next(edits)}")
+                                                      for slide in store.get(user_id, presentation_id)["slides"]])
+
+            def cold_load():
+                store._entries.clear()
+                store.get(user_id, presentation_id)
+
+            def one_slide():
+                store._entries.clear()
+                store.get_slide(user_id, presentation_id, size // 2)
+
+            def outline():
+                store.outline(user_id, presentation_id)
+
+            written = store.stats()["slides_written"]
+            row = {
+                "slides": size,
+                "save_json_blob": timed(legacy_save, args.runs),
+                "save_one_slide_cached": timed(lambda: edit_one(False), args.runs),
+                "save_one_slide_cold": timed(lambda: edit_one(True), args.runs),
+                "save_all_slides": timed(rewrite_all, max(3, args.runs // 4)),
+                "load_json_blob": timed(legacy_load, args.runs),
+                "load_deck_cold": timed(cold_load, args.runs),
+                "load_one_slide": timed(one_slide, args.runs),
+                "load_outline": timed(outline, args.runs),
+            }
+            row["slides_written"] = store.stats()["slides_written"] - written
+            report["decks"].append(row)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
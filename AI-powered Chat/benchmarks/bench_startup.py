@@ -0,0 +1,142 @@
+"""
+Worker cold start: how long a fresh process takes to import the app, create it and serve a first request.
+
+Each run is a new interpreter against a database seeded with --decks decks,
+reporting:
+
+- process_ms: interpreter start to first response, measured by the parent
+- import_ms / create_ms / first_request_ms: `import app`, create_app() and
+  a GET /login through the test client, measured in the child
+- rss_mb: peak resident memory of the child
+- heavy_modules: which optional libraries are loaded after that first
+  request, and the cumulative import time of the big ones (from one extra
+  run with `python -X importtime`, which slows imports down itself)
+
+Scenarios: "restart" (database already prepared, the normal worker boot)
+and "first start" (the schema fingerprint removed first, so the schema
+check and backfills run as they do once after a deploy).
+
+--app-dir runs the same measurement against another checkout, e.g. one
+from before create_app() existed (the app was then built at import).
+
+    python benchmarks/bench_startup.py --decks 20000 --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import APP_DIR, boot_app, canned_deck, logged_in_client
+
+HEAVY_MODULES = ['flask', 'sqlalchemy', 'flask_sqlalchemy', 'requests', 'PIL', 'pptx', 'google.generativeai',
+                 'flask_bcrypt']
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, '.')
+import app as app_module
+imported = time.perf_counter()
+create_app = getattr(app_module, 'create_app', None)
+app = create_app() if create_app else app_module.app
+created = time.perf_counter()
+response = app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_ms": (created - imported) * 1000,
+    "first_request_ms": (served - created) * 1000,
+    "status": response.status_code,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def seed(workdir, decks):
+    app = boot_app(workdir)
+    logged_in_client(app)
+    from models import User
+    from services import get_services
+    store = get_services(app).presentation_store
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench').one().id
+        for start in range(0, decks, 500):
+            store.create_many(user_id, [(canned_deck(7, f"topic {n}")["slides"], None)
+                                        for n in range(start, min(start + 500, decks))])
+
+
+def forget_schema(db_path):
+    import sqlite3
+    connection = sqlite3.connect(db_path)
+    connection.execute("DELETE FROM schema_state")
+    connection.commit()
+    connection.close()
+
+
+def import_times(stderr):
+    """Cumulative -X importtime microseconds of the top-level import of each heavy module"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.rstrip()
+        module = name.strip()
+        if module in HEAVY_MODULES and module not in times:
+            times[module] = round(int(cumulative) / 1000, 1)
+    return times
+
+
+def run_once(app_dir, env, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=app_dir, env=env, capture_output=True, text=True, timeout=120)
+    process_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["process_ms"] = process_ms
+    report["import_times_ms"] = import_times(result.stderr)
+    return report
+
+
+def summarize_runs(runs, profiled):
+    summary = {key: round(statistics.median(run[key] for run in runs), 1)
+               for key in ("process_ms", "import_ms", "create_ms", "first_request_ms", "rss_mb")}
+    summary["status"] = runs[-1]["status"]
+    summary["heavy_modules"] = {"loaded": profiled["loaded"], "import_ms": profiled["import_times_ms"]}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--decks', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--app-dir', default=APP_DIR, help='checkout to measure (default: this one)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='slides-startup-')
+    seed(workdir, args.decks)
+    db_path = os.path.join(workdir, 'bench.db')
+    env = {**os.environ, "LLM_BACKEND": "stub", "LOG_LEVEL": "WARNING", "DATABASE_URL": f"sqlite:///{db_path}",
+           "UPLOAD_FOLDER": os.path.join(workdir, 'uploads'), "EXPORT_FOLDER": os.path.join(workdir, 'exports')}
+
+    report = {"app_dir": os.path.abspath(args.app_dir), "decks": args.decks, "runs": args.runs}
+    # Also makes every measured run see a prepared database and a warm page cache
+    profiled = run_once(args.app_dir, env, importtime=True)
+    report["restart"] = summarize_runs([run_once(args.app_dir, env) for _ in range(args.runs)], profiled)
+    first_starts = []
+    for _ in range(args.runs):
+        forget_schema(db_path)
+        first_starts.append(run_once(args.app_dir, env))
+    report["first_start"] = summarize_runs(first_starts, profiled)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
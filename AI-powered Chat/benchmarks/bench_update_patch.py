@@ -0,0 +1,92 @@
+"""
+Prompt/output tokens and latency of /update, full-deck vs. patch mode.
+
+Edits one bullet on slide 3 of decks of increasing size. The stand-in model
+answers in whichever format the prompt asks for (a full deck or a patch) and
+sleeps for a base latency plus a per-output-token cost, so latency follows
+output size the way a real model's does. Tokens are approximated as
+characters / 4.
+
+    python benchmarks/bench_update_patch.py --sizes 5 10 25 50 100
+"""
+import argparse
+import json
+import time
+
+from harness import boot_app, canned_deck, logged_in_client, summarize, use_stub_model
+
+
+def approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class EditingModel:
+    """Applies "add a bullet to slide 3" in the format the prompt requests"""
+
+    def __init__(self, base_latency, per_token):
+        self.base_latency = base_latency
+        self.per_token = per_token
+        self.calls = []
+
+    def __call__(self, prompt):
+        if '"patch"' in prompt:
+            targeted = json.loads(prompt.split('when slides are only being added):', 1)[1].split('\n', 2)[1])
+            slide = dict(targeted["3"])
+            slide["content"] = slide["content"] + ["A new bullet"]
+            answer = {"patch": [{"op": "replace", "slide": 3, "data": slide}], "message": "Added a bullet to slide 3"}
+        else:
+            slides = json.loads(prompt.split('Current slides:', 1)[1].split('\n', 2)[1])
+            slides[2]["content"].append("A new bullet")
+            answer = {"slides": slides, "message": "Added a bullet to slide 3"}
+
+        text = "```json\n" + json.dumps(answer, indent=2) + "\n```"
+        self.calls.append((approx_tokens(prompt), approx_tokens(text)))
+        time.sleep(self.base_latency + approx_tokens(text) * self.per_token)
+        return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 25, 50, 100])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--base-latency', type=float, default=0.05, help='seconds per model call')
+    parser.add_argument('--per-token', type=float, default=0.0005, help='seconds per output token')
+    args = parser.parse_args()
+
+    app = boot_app()
+    model = EditingModel(args.base_latency, args.per_token)
+    use_stub_model(app, model)
+    client = logged_in_client(app)
+
+    report = []
+    for size in args.sizes:
+        deck = canned_deck(size)["slides"]
+        for slide in deck:
+            # Decks coming back from /chat carry their image fields
+            slide.update({"image_url": "/static/uploads/img_0.jpg", "has_image": True})
+
+        row = {"slides": size}
+        for mode in ("full", "auto"):
+            model.calls.clear()
+            latencies = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                response = client.post('/update', json={'prompt': 'Add a bullet to slide 3', 'slides': deck, 'mode': mode})
+                latencies.append(time.perf_counter() - started)
+                body = response.get_json()
+                assert response.status_code == 200, body
+                assert body["slides"][2]["content"][-1] == "A new bullet"
+                assert body["slides"][2]["has_image"], "image fields must survive the edit"
+            prompt_tokens, output_tokens = model.calls[-1]
+            row["patch" if mode == "auto" else "full"] = {
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                **summarize(latencies),
+            }
+        report.append(row)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
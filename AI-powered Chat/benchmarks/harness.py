@@ -0,0 +1,271 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Everything here runs locally: a stub HTTP server stands in for the image
+hosts, the app is booted against a throwaway SQLite database and upload
+folder, and the model calls go to the stub LLM backend (canned slide JSON).
+"""
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    """p50/p95/p99/mean of a list of latencies in seconds, reported in ms"""
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+    }
+
+
+def make_jpeg(width=800, height=600, color=(70, 110, 160)):
+    from PIL import Image
+    buf = BytesIO()
+    Image.new('RGB', (width, height), color).save(buf, 'JPEG', quality=80)
+    return buf.getvalue()
+
+
+class StubImageServer:
+    """
+    Local stand-in for source.unsplash.com and picsum.photos
+
+    Every GET/HEAD sleeps for `latency` seconds and answers with `status` and
+    a JPEG body, or with 503 for a share `error_rate` of the requests (drawn
+    from a seeded RNG). Both hosts can be served from the same port: point
+    UNSPLASH_SOURCE_URL and PICSUM_URL at `url`.
+    """
+
+    def __init__(self, latency=0.2, status=200, body=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.status = status
+        self.body = body if body is not None else make_jpeg()
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, send_body):
+                with stub._lock:
+                    stub.requests += 1
+                    status = 503 if stub._rng.random() < stub.error_rate else stub.status
+                    if status == 503:
+                        stub.errors += 1
+                time.sleep(stub.latency)
+                self.send_response(status)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(stub.body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(stub.body)
+
+            def do_GET(self):
+                self._reply(True)
+
+            def do_HEAD(self):
+                self._reply(False)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve_pooled(app, port, threads):
+    """
+    Serve a WSGI app until the process is killed, each connection handled on
+    one of a fixed number of threads, the way `gunicorn --worker-class gthread
+    --threads N app:app` runs it
+    """
+    from werkzeug.serving import BaseWSGIServer
+    # A line per request on stderr
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 2048
+
+        def __init__(self):
+            super().__init__('127.0.0.1', port, app)
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle_connection, request, client_address)
+
+        def handle_connection(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer().serve_forever()
+
+
+def wait_until_serving(server, url, timeout=60):
+    """Wait for a server process (Popen) to answer on url"""
+    import httpx
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url + '/login', timeout=1)
+            return
+        except httpx.HTTPError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"server on {url} did not start")
+            time.sleep(0.2)
+
+
+def canned_deck(slide_count=7, topic="climate change"):
+    """Slide JSON in the shape the chat prompt asks the model for"""
+    slides = []
+    for i in range(slide_count):
+        slides.append({
+            "title": f"{topic.title()} part {i + 1}",
+            "content": [f"Point {j + 1} about {topic}" for j in range(4)],
+            "image_search_query": f"{topic} photo {i + 1}",
+            "image_position": "background" if i == 0 else "right",
+        })
+    return {"slides": slides, "message": f"Created {slide_count} slides about {topic}."}
+
+
+def canned_responder(deck=None):
+    """Stub-backend responder that always answers with the same deck"""
+    text = "```json\n" + json.dumps(deck or canned_deck(), indent=2) + "\n```"
+    return lambda prompt: text
+
+
+WORDS = ["solar", "forest", "city", "river", "market", "robot", "garden", "mountain", "ocean", "library", "bridge",
+         "harvest", "engine", "festival", "desert", "island", "laboratory", "stadium", "museum", "railway",
+         "factory", "satellite", "village", "glacier", "orchestra", "kitchen", "workshop", "harbor", "canyon",
+         "classroom", "telescope", "vineyard", "airport", "reef", "castle", "studio", "meadow", "tower"]
+
+
+def random_responder(seed=0, slides=(4, 12)):
+    """
+    Stub-backend responder with randomized new decks: slide count, titles,
+    bullets and image search queries drawn from a seeded RNG. Edits are
+    answered by stub_response().
+    """
+    from llm_client import stub_response
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def respond(prompt):
+        if 'Current slides:' in prompt or 'Respond ONLY with a JSON patch' in prompt:
+            return stub_response(prompt)
+        with lock:
+            deck = [rng.sample(WORDS, 3) + [rng.randint(2, 5)] for _ in range(rng.randint(*slides))]
+        answer = {
+            "slides": [
+                {
+                    "title": f"{first.title()} and {second}",
+                    "content": [f"How {first} meets {third}, point {j + 1}" for j in range(bullets)],
+                    "image_search_query": f"{first} {second} {third}",
+                    "image_position": "background" if i == 0 else "right",
+                }
+                for i, (first, second, third, bullets) in enumerate(deck)
+            ],
+            "message": f"Created {len(deck)} slides."
+        }
+        return "```json\n" + json.dumps(answer, indent=2) + "\n```"
+    return respond
+
+
+def use_stub_model(app, responder=None, latency=0.0, failure_rate=0.0, seed=0, **client_options):
+    """
+    Point the app's LLM client at a local stub backend
+    responder: function(prompt) -> model text, default: stub_response()
+    failure_rate: share of calls failing with 429/503 (seeded)
+    Returns: the new LLMClient
+    """
+    from llm_client import LLMClient, StubBackend
+    from services import get_services
+    backend = StubBackend(latency=latency, failure_rate=failure_rate, seed=seed, responder=responder)
+    client = LLMClient(backend, **client_options)
+    get_services(app).llm = client
+    return client
+
+
+def boot_app(workdir=None, admission=False, **env):
+    """
+    Create the app against a temporary database, upload, export and asset
+    cache folder. Admission control (admission.py) is off unless admission
+    is set: a benchmark drives the app as one user, far faster than a person,
+    and would measure the user's token bucket instead of the code under test.
+    Returns: Flask app (its resources: services.get_services(app))
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='slides-bench-')
+    os.environ.setdefault('LLM_BACKEND', 'stub')
+    # Per-request logs would drown the report printed on stdout
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['EXPORT_FOLDER'] = os.path.join(workdir, 'exports')
+    os.environ['ASSET_CACHE_FOLDER'] = os.path.join(workdir, 'assets')
+    if not admission:
+        os.environ['ADMISSION_USER_RATE'] = os.environ['ADMISSION_GLOBAL_RATE'] = '0'
+    # The front-end libraries aren't vendored in a checkout
+    os.environ.setdefault('ASSET_CDN_FALLBACK', '1')
+    for key, value in env.items():
+        os.environ[key] = str(value)
+
+    from app import create_app
+    from models import db
+    app = create_app({'TESTING': True})
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def logged_in_client(app, username='bench', password='bench-password'):
+    """Sign up (if needed) and log in a test client"""
+    client = app.test_client()
+    client.post('/signup', json={'username': username, 'email': f'{username}@example.com', 'password': password})
+    response = client.post('/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return client
@@ -0,0 +1,740 @@
+"""
+Generating and editing decks (/chat, /chat/stream, /update, /batch and the
+job endpoints), the saved presentations and history search, and the
+generation stats.
+"""
+import json
+import logging
+
+from flask import (Blueprint, Response, current_app, jsonify, redirect, render_template, request, session,
+                   stream_with_context, url_for)
+from flask_login import current_user, login_required
+
+from admission import admission_required, admit_batch, chat_cost, update_cost
+from batch_generation import BatchInputError, batch_format, parse_prompts, prompt_items
+from generation import (batch_runner, build_chat_prompt, count_images, fallback_result, generate_deck,
+                        lookup_response, personalize_message, remember_response, remember_turn,
+                        response_cache_for, save_presentation)
+from http_cache import cached_json, deck_etag, not_modified
+from instrumentation import log, stage
+from job_queue import PRIORITY_LOW, PRIORITY_NORMAL
+from llm_client import LLMError
+from llm_json import ModelOutputError, SlideStreamParser, parse_model_json
+from models import User, db, release_connection
+from search_index import search
+from services import conversation_memory, get_services, job_queue, llm, presentation_store, user_cache
+from session_state import deck_title, slide_hash, slide_hashes
+from slide_images import new_image_batch
+from slide_patch import apply_patch, build_full_prompt, build_patch_prompt, find_target_slides, restore_image_fields
+
+bp = Blueprint('chat', __name__)
+
+
+@bp.route('/')
+def index():
+    """Render the main chat interface or login page"""
+    if current_user.is_authenticated:
+        return render_template('index.html', username=current_user.username)
+    return redirect(url_for('auth.login'))
+
+
+# Longest search input looked at (characters)
+MAX_SEARCH_LENGTH = 200
+
+
+def search_decks(query, limit, page):
+    """
+    Full-text search of the current user's decks
+    Returns: (results, whether there is a next page), see search_index.search()
+    """
+    with stage("search", page=page) as span:
+        results, has_more = search(current_user.id, query, limit, page)
+        span["results"] = len(results)
+    return results, has_more
+
+
+def page_number(value):
+    """1-based page number from a query argument (bad values give the first page)"""
+    try:
+        return max(1, int(value or 1))
+    except ValueError:
+        return 1
+
+
+@bp.route('/history')
+@login_required
+def history():
+    """
+    Show one page of the user's presentation history, newest first, or with
+    ?q= the best matches of a full-text search
+    """
+    query = request.args.get('q', '')[:MAX_SEARCH_LENGTH]
+    if query.strip():
+        page = page_number(request.args.get('page'))
+        presentations, has_more = search_decks(query, current_app.config['HISTORY_PAGE_SIZE'], page)
+        return render_template('history.html', presentations=presentations, query=query, page=page,
+                               next_page=page + 1 if has_more else None, username=current_user.username)
+    
+    cursor = request.args.get('cursor')
+    try:
+        presentations, next_cursor = presentation_store.list_page(
+            current_user.id, current_app.config['HISTORY_PAGE_SIZE'], cursor
+        )
+    except ValueError:
+        return redirect(url_for('chat.history'))
+    return render_template('history.html', presentations=presentations, next_cursor=next_cursor,
+                           first_page=not cursor, query='', username=current_user.username)
+
+
+@bp.route('/history.json')
+@login_required
+def history_json():
+    """
+    One page of the user's presentation history as JSON
+    Query: cursor (next_cursor of the previous page), limit
+    Returns: {"presentations": [...], "next_cursor": str or null}
+    """
+    try:
+        limit = int(request.args.get('limit', current_app.config['HISTORY_PAGE_SIZE']))
+        presentations, next_cursor = presentation_store.list_page(
+            current_user.id, max(1, min(limit, current_app.config['HISTORY_MAX_PAGE_SIZE'])), request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    for presentation in presentations:
+        presentation["created_at"] = presentation["created_at"].isoformat()
+        presentation["updated_at"] = presentation["updated_at"].isoformat()
+    return jsonify({"presentations": presentations, "next_cursor": next_cursor})
+
+
+@bp.route('/search')
+@login_required
+def search_presentations():
+    """
+    Full-text search of the user's presentations (titles, slide titles,
+    bullet points, image queries), best matches first
+    Query: q, page (1-based), limit
+    Returns: {"query": str, "page": n, "next_page": n or null, "results": [{"id", "title",
+              "title_html", "snippet_html", "slide_count", "created_at", "updated_at"}]}
+    title_html and snippet_html are escaped HTML with the matches in <mark>.
+    """
+    query = request.args.get('q', '')[:MAX_SEARCH_LENGTH]
+    try:
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', current_app.config['HISTORY_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({"error": "page and limit must be numbers"}), 400
+    if page < 1:
+        return jsonify({"error": "page must be 1 or more"}), 400
+    
+    results, has_more = search_decks(query, max(1, min(limit, current_app.config['HISTORY_MAX_PAGE_SIZE'])), page)
+    for result in results:
+        result["created_at"] = result["created_at"].isoformat()
+        result["updated_at"] = result["updated_at"].isoformat()
+    return jsonify({"query": query, "page": page, "next_page": page + 1 if has_more else None, "results": results})
+
+
+def wants_async():
+    """Whether the client asked for a job instead of waiting for the deck"""
+    data = request.get_json(silent=True) or {}
+    return bool(data.get('async')) or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def enqueue_chat(data, user_prompt, include_images):
+    """
+    Queue a /chat request as a background job
+    Returns: 202 response with the job's status URL
+    """
+    priority = PRIORITY_LOW if data.get('priority') == 'low' else PRIORITY_NORMAL
+    job_id = job_queue.enqueue(current_user.id, "chat",
+                               {"prompt": user_prompt, "include_images": include_images}, priority)
+    log("job_queued", job_id=job_id, priority=priority, user_id=current_user.id)
+    status_url = url_for('chat.job_status', job_id=job_id)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {
+        "Location": status_url
+    }
+
+
+@bp.route('/chat', methods=['POST'])
+@login_required
+@admission_required(chat_cost)
+def chat():
+    """
+    Handle chat requests for generating PowerPoint slides
+    Expects: {"prompt": "user message", "include_images": [], "async": false, "priority": "normal" | "low"}
+    Returns: {"slides": [...], "slide_hashes": [...], "message": "AI response", "presentation_id": id,
+              "cached": "exact" | "near" (only when served from the response cache)}
+    With "async": true (or a "Prefer: respond-async" header) the deck is
+    generated by a background worker instead: 202 {"job_id": id, "status_url": url}
+    """
+    try:
+        data = request.get_json()
+        user_prompt = data.get('prompt', '')
+        include_images = data.get('include_images', [])
+        
+        if not user_prompt:
+            return jsonify({"error": "No prompt provided"}), 400
+        
+        if wants_async():
+            return enqueue_chat(data, user_prompt, include_images)
+        
+        result = generate_deck(current_user, user_prompt, include_images)
+        result["slide_hashes"] = slide_hashes(result["slides"])
+        
+        # Make it the user's current deck
+        if result.get("presentation_id") is not None:
+            session['presentation_id'] = result["presentation_id"]
+        
+        return jsonify(result)
+    
+    except LLMError as e:
+        # Timed out, overloaded or failing after retries
+        log("chat_failed", logging.WARNING, error=str(e), status=e.status)
+        return jsonify({"error": str(e)}), e.status
+    
+    except Exception as e:
+        log("chat_failed", logging.ERROR, exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """
+    Status of a queued generation job
+    Returns: job dict; once done, "result" holds the deck like /chat returns it
+    and the deck becomes the user's current one
+    """
+    job = job_queue.get(current_user.id, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    result = job["result"]
+    if job["status"] == "done" and result and result.get("presentation_id") is not None:
+        stored = presentation_store.get(current_user.id, result["presentation_id"])
+        if stored is not None:
+            result["slides"] = stored["slides"]
+            result["slide_hashes"] = slide_hashes(stored["slides"])
+            session['presentation_id'] = result["presentation_id"]
+    return jsonify(job)
+
+
+@bp.route('/jobs/<int:job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    """Cancel a queued or running generation job"""
+    status = job_queue.cancel(current_user.id, job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job_id": job_id, "status": status})
+
+
+def read_batch_request():
+    """
+    Prompts of a /batch request: an uploaded .csv/.jsonl file (field "file"),
+    a text/csv or application/x-ndjson body, or JSON {"prompts": [...]}
+    Returns: list of batch items
+    Raises: BatchInputError
+    """
+    max_prompts = current_app.config['BATCH_MAX_PROMPTS']
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = batch_format(upload.filename, upload.mimetype)
+        if fmt is None:
+            raise BatchInputError("Upload a .csv or .jsonl file")
+        return parse_prompts(upload.read(), fmt, max_prompts)
+    if request.is_json:
+        return prompt_items((request.get_json(silent=True) or {}).get('prompts'), max_prompts)
+    fmt = batch_format(content_type=request.content_type)
+    if fmt is None:
+        raise BatchInputError("Send a CSV or JSONL file, or JSON {\"prompts\": [...]}")
+    return parse_prompts(request.get_data(), fmt, max_prompts)
+
+
+@bp.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    """
+    Generate one deck per prompt of a CSV or JSONL file (see read_batch_request)
+    Query: concurrency (decks generated at once, default BATCH_CONCURRENCY)
+    Streams: NDJSON progress events, one per line - "started", "generated" or
+    "failed" per deck, "saved" with the presentation IDs of each group of
+    decks written, then "done" with the totals (see batch_generation.py)
+    """
+    try:
+        items = read_batch_request()
+        concurrency = request.args.get('concurrency', type=int)
+    except BatchInputError as e:
+        return jsonify({"error": str(e)}), 400
+    if concurrency is not None and concurrency < 1:
+        return jsonify({"error": "concurrency must be 1 or more"}), 400
+    
+    # One new deck per prompt
+    refused = admit_batch(len(items))
+    if refused is not None:
+        return refused
+    
+    user_id = current_user.id
+    log("batch_started", user_id=user_id, decks=len(items))
+    runner = batch_runner(user_id, concurrency)
+    return Response(
+        stream_with_context(json.dumps(event) + '\n' for event in runner.run(items)),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def image_event(index, slide):
+    """Payload of an image_ready event, with the slide's new hash"""
+    return {
+        "index": index,
+        "has_image": slide.get("has_image", False),
+        "image_url": slide.get("image_url"),
+        "thumbnail_url": slide.get("thumbnail_url"),
+        "hash": slide_hash(slide)
+    }
+
+
+@bp.route('/chat/stream', methods=['POST'])
+@login_required
+@admission_required(chat_cost)
+def chat_stream():
+    """
+    Streaming variant of /chat using Server-Sent Events
+    Expects: {"prompt": "user message", "include_images": []}
+    Emits: "slide" as soon as each slide is complete, "image_ready" as each
+    image finishes (both with the slide's hash), then "done" with the presentation ID, message and
+    response cache match (or "error")
+    """
+    data = request.get_json() or {}
+    user_prompt = data.get('prompt', '')
+    include_images = data.get('include_images', [])
+    
+    if not user_prompt:
+        return jsonify({"error": "No prompt provided"}), 400
+    
+    username = current_user.username
+    user_id = current_user.id
+    system_prompt = build_chat_prompt(username, user_prompt)
+    cache = response_cache_for(current_user)
+    
+    # The session cookie is sent with the response headers, before any slide
+    # exists, so the deck row is created up front and filled in at the end
+    presentation_id = save_presentation(user_id, [])
+    if presentation_id is None:
+        return jsonify({"error": "Could not create presentation"}), 500
+    session['presentation_id'] = presentation_id
+    
+    def generate():
+        parser = SlideStreamParser()
+        batch = new_image_batch(user_id)
+        slides = []
+        saved = False
+        
+        try:
+            result, cache_match = lookup_response(cache, user_prompt, include_images)
+            release_connection()
+            
+            if result is not None:
+                for index, slide in enumerate(result["slides"]):
+                    slides.append(slide)
+                    batch.submit(index, slide)
+                    yield sse_event("slide", {"index": index, "slide": slide, "hash": slide_hash(slide)})
+            else:
+                generated = []
+                # Includes the time the client takes to read the slides sent so far
+                with stage("llm_stream") as span:
+                    for chunk in llm.stream(system_prompt):
+                        for slide in parser.feed(chunk):
+                            index = len(slides)
+                            # Copy for the cache before image workers add their fields
+                            generated.append(dict(slide))
+                            slides.append(slide)
+                            batch.submit(index, slide)
+                            yield sse_event("slide", {"index": index, "slide": slide, "hash": slide_hash(slide)})
+                        
+                        # Images of earlier slides may finish while the model is still writing
+                        for index, slide in batch.poll():
+                            yield sse_event("image_ready", image_event(index, slide))
+                    span["slides"] = len(slides)
+                
+                result = parser.document()
+                if generated:
+                    remember_response(cache, username, user_prompt, include_images,
+                                      {"slides": generated, "message": result.get("message")})
+            
+            if not slides:
+                # Nothing parseable arrived, fall back to a single text slide
+                result = fallback_result(parser.text.strip())
+                for index, slide in enumerate(result["slides"]):
+                    slides.append(slide)
+                    batch.submit(index, slide)
+                    yield sse_event("slide", {"index": index, "slide": slide, "hash": slide_hash(slide)})
+            
+            # Images still missing once the text is complete
+            with stage("images", slides=len(slides)) as span:
+                for index, slide in batch.drain():
+                    yield sse_event("image_ready", image_event(index, slide))
+                count_images(span, slides)
+            
+            with stage("db_save", slides=len(slides)) as span:
+                saved = presentation_store.save(user_id, presentation_id, slides)
+                span.update(presentation_id=presentation_id, title=deck_title(slides))
+            remember_turn(presentation_id, user_prompt, result.get("message"), kind='create')
+            
+            yield sse_event("done", {
+                "presentation_id": presentation_id,
+                "message": personalize_message(result.get("message"), username),
+                "slide_count": len(slides),
+                "cached": cache_match
+            })
+        
+        except Exception as e:
+            log("chat_stream_failed", logging.ERROR, exc_info=not isinstance(e, LLMError), error=str(e))
+            yield sse_event("error", {"error": str(e)})
+        
+        finally:
+            if not saved:
+                # Failed or the client went away, don't leave an empty deck behind
+                db.session.rollback()
+                presentation_store.delete(user_id, presentation_id)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+class UpdateError(Exception):
+    """An /update request that can't be carried out, answered with status and the message"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def plan_update(data):
+    """
+    The part of /update before the model call: the deck being edited, the
+    slides the instruction is about, and the prompt
+    Returns: dict with user_id, prompt, presentation_id, slides, targets,
+    mode, system_prompt and memory_tokens
+    Raises: UpdateError
+    """
+    user_prompt = data.get('prompt', '')
+    
+    if not user_prompt:
+        raise UpdateError("No prompt provided")
+    
+    presentation_id = data.get('presentation_id', session.get('presentation_id'))
+    stored = presentation_store.get(current_user.id, presentation_id)
+    if stored is None:
+        presentation_id = None
+    
+    current_slides = data.get('slides')
+    if current_slides is None:
+        current_slides = stored["slides"] if stored else []
+    
+    targets = None
+    if data.get('mode') != 'full':
+        targets = find_target_slides(user_prompt, current_slides, data.get('slide_indices'))
+    
+    # Create prompt for updating slides
+    memory, memory_tokens = conversation_memory.context(presentation_id)
+    if targets is None:
+        system_prompt = build_full_prompt(user_prompt, current_slides, memory)
+    else:
+        system_prompt = build_patch_prompt(user_prompt, current_slides, targets, memory)
+    
+    return {
+        "user_id": current_user.id,
+        "prompt": user_prompt,
+        "presentation_id": presentation_id,
+        "slides": current_slides,
+        "targets": targets,
+        "mode": "full" if targets is None else "patch",
+        "system_prompt": system_prompt,
+        "memory_tokens": memory_tokens
+    }
+
+
+def read_update(plan, response):
+    """
+    Parse the model's answer to plan_update()'s prompt: a patch of the
+    targeted slides, or a whole new deck
+    Returns: (result, slides, changed indices, mode)
+    Raises: UpdateError if nothing can be parsed
+    """
+    response_text = response.text.strip()
+    current_slides = plan["slides"]
+    
+    result = None
+    if plan["targets"] is not None:
+        try:
+            with stage("parse", mode="patch"):
+                result = parse_model_json(response_text, key="patch")
+                slides, changed = apply_patch(current_slides, result["patch"], plan["targets"])
+            mode = "patch"
+        except ModelOutputError:
+            # The model ignored the patch format, try a full deck instead
+            result = None
+    
+    if result is None:
+        try:
+            with stage("parse", mode="full"):
+                result = parse_model_json(response_text)
+        except ModelOutputError:
+            raise UpdateError("Failed to parse AI response", 500)
+        slides = result["slides"]
+        changed = restore_image_fields(current_slides, slides)
+        mode = "full"
+    
+    return result, slides, changed, mode
+
+
+def needs_image(slides, changed):
+    """New slides and slides with a new image query need an image"""
+    return [index for index in changed if "has_image" not in slides[index]]
+
+
+def save_update(plan, result, slides, changed, mode):
+    """
+    Save an edited deck and add the request to its conversation
+    Returns: the /update response
+    """
+    presentation_id = plan["presentation_id"]
+    if presentation_id is not None:
+        with stage("db_save", slides=len(slides), changed=len(changed)):
+            presentation_store.save(current_user.id, presentation_id, slides)
+        session['presentation_id'] = presentation_id
+        remember_turn(presentation_id, plan["prompt"], result.get("message"), changed)
+    
+    return jsonify({
+        "slides": slides,
+        "slide_hashes": slide_hashes(slides),
+        "message": result.get("message") or "Slides updated successfully!",
+        "changed": changed,
+        "mode": mode,
+        "presentation_id": presentation_id
+    })
+
+
+@bp.route('/update', methods=['POST'])
+@login_required
+@admission_required(update_cost)
+def update():
+    """
+    Handle slide update requests
+    Instructions about specific slides ("slide 3", a slide title, or the
+    slide_indices sent by the client) are applied as a patch: only those
+    slides go to the model and the rest of the deck is merged server-side.
+    Earlier requests about a saved deck are sent along (conversation.py),
+    so an instruction can build on them.
+    The edited deck is saved to presentation_id (default: the user's current
+    deck); "slides" can be omitted to edit the stored version.
+    Expects: {"prompt": "edit instruction", "slides": [current slides], "presentation_id": id,
+              "slide_indices": [optional 0-based indices], "mode": "auto" | "full"}
+    Returns: {"slides": [...], "slide_hashes": [...], "message": "AI response", "changed": [indices],
+              "mode": "patch" | "full"}
+    """
+    try:
+        plan = plan_update(request.get_json())
+        release_connection()
+        
+        # Generate updated content
+        with stage("llm_call", mode=plan["mode"], memory_tokens=plan["memory_tokens"]) as span:
+            response = llm.generate(plan["system_prompt"])
+            span.update(attempts=response.attempts, prompt_tokens=response.prompt_tokens,
+                        output_tokens=response.output_tokens)
+        
+        result, slides, changed, mode = read_update(plan, response)
+        
+        new_images = needs_image(slides, changed)
+        if new_images:
+            with stage("images", slides=len(new_images)) as span:
+                batch = new_image_batch(plan["user_id"])
+                for index in new_images:
+                    batch.submit(index, slides[index])
+                for _ in batch.drain():
+                    pass
+                count_images(span, [slides[index] for index in new_images])
+        
+        # Update stored presentation
+        return save_update(plan, result, slides, changed, mode)
+    
+    except UpdateError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    except LLMError as e:
+        # Timed out, overloaded or failing after retries
+        log("update_failed", logging.WARNING, error=str(e), status=e.status)
+        return jsonify({"error": str(e)}), e.status
+    
+    except Exception as e:
+        log("update_failed", logging.ERROR, exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+def deck_version(presentation_id, variant=''):
+    """
+    ETag of a response about one of the current user's decks, and the 304
+    to send instead when the client already has it - from one single-row
+    query, without loading the deck
+    variant: tells apart the responses of one deck version (outline, a slide)
+    Returns: (etag or None, Response or None) - (None, None) if there's no
+    such deck or it has no content hash yet
+    """
+    version = presentation_store.version(current_user.id, presentation_id)
+    if version is None or version[1] is None:
+        return None, None
+    etag = deck_etag(presentation_id, *version) + variant
+    return etag, not_modified(etag)
+
+
+@bp.route('/get-slides', methods=['GET'])
+@login_required
+def get_slides():
+    """
+    Get the slides of the user's current presentation
+    Conditional: 304 while the deck is unchanged (If-None-Match)
+    """
+    presentation_id = session.get('presentation_id')
+    _, unchanged = deck_version(presentation_id)
+    if unchanged is not None:
+        return unchanged
+    stored = presentation_store.get(current_user.id, presentation_id)
+    if stored is None:
+        return jsonify({"slides": []})
+    return cached_json({"slides": stored["slides"], "slide_hashes": slide_hashes(stored["slides"]),
+                        "presentation_id": presentation_id},
+                       deck_etag(presentation_id, stored["updated_at"], stored["content_hash"]))
+
+
+@bp.route('/load-presentation/<int:presentation_id>')
+@login_required
+def load_presentation(presentation_id):
+    """
+    Load a specific presentation from history and make it the current one
+    Conditional: 304 while the deck is unchanged (If-None-Match)
+    """
+    _, unchanged = deck_version(presentation_id)
+    if unchanged is not None:
+        session['presentation_id'] = presentation_id
+        return unchanged
+    presentation = presentation_store.get(current_user.id, presentation_id)
+    
+    if not presentation:
+        return jsonify({"error": "Presentation not found"}), 404
+    
+    session['presentation_id'] = presentation_id
+    return cached_json({
+        "slides": presentation["slides"],
+        "slide_hashes": slide_hashes(presentation["slides"]),
+        "presentation_id": presentation_id,
+        "title": presentation["title"],
+        "created_at": presentation["created_at"].isoformat(),
+        "updated_at": presentation["updated_at"].isoformat()
+    }, deck_etag(presentation_id, presentation["updated_at"], presentation["content_hash"]))
+
+
+@bp.route('/presentation/<int:presentation_id>/outline')
+@login_required
+def presentation_outline(presentation_id):
+    """Slide titles of a saved presentation, without loading the slides (conditional, like /get-slides)"""
+    etag, unchanged = deck_version(presentation_id, '-outline')
+    if unchanged is not None:
+        return unchanged
+    titles = presentation_store.outline(current_user.id, presentation_id)
+    
+    if titles is None:
+        return jsonify({"error": "Presentation not found"}), 404
+    
+    return cached_json({"presentation_id": presentation_id, "titles": titles}, etag)
+
+
+@bp.route('/presentation/<int:presentation_id>/slides/<int:index>')
+@login_required
+def presentation_slide(presentation_id, index):
+    """A single slide (0-based index) of a saved presentation (conditional, like /get-slides)"""
+    etag, unchanged = deck_version(presentation_id, f'-slide{index}')
+    if unchanged is not None:
+        return unchanged
+    slide = presentation_store.get_slide(current_user.id, presentation_id, index)
+    
+    if slide is None:
+        return jsonify({"error": "Slide not found"}), 404
+    
+    return cached_json({"presentation_id": presentation_id, "index": index, "slide": slide}, etag)
+
+
+@bp.route('/delete-presentation/<int:presentation_id>', methods=['DELETE'])
+@login_required
+def delete_presentation(presentation_id):
+    """Delete a presentation"""
+    if not presentation_store.delete(current_user.id, presentation_id):
+        return jsonify({"error": "Presentation not found"}), 404
+    
+    if session.get('presentation_id') == presentation_id:
+        session.pop('presentation_id')
+    
+    return jsonify({"success": True, "message": "Presentation deleted"})
+
+
+@bp.route('/settings/response-cache', methods=['GET', 'POST'])
+@login_required
+def response_cache_setting():
+    """
+    Get or change whether the user's new decks may come from the response cache
+    Expects (POST): {"enabled": true | false}
+    Returns: {"enabled": bool}
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        if not isinstance(data.get('enabled'), bool):
+            return jsonify({"error": "enabled must be true or false"}), 400
+        user = db.session.get(User, current_user.id)
+        user.response_cache_enabled = data['enabled']
+        db.session.commit()
+        # current_user is the cached identity
+        user_cache.invalidate(user.id)
+        return jsonify({"enabled": user.response_cache_enabled})
+    return jsonify({"enabled": current_user.response_cache_enabled})
+
+
+@bp.route('/stats/llm', methods=['GET'])
+@login_required
+def llm_stats():
+    """Request, retry, token and latency counters of this worker's model client"""
+    return jsonify(llm.stats())
+
+
+@bp.route('/stats/jobs', methods=['GET'])
+@login_required
+def job_stats():
+    """Job queue depth and this process's worker counters"""
+    return jsonify(job_queue.stats())
+
+
+@bp.route('/stats/cache', methods=['GET'])
+@login_required
+def cache_stats():
+    """
+    Hit rates of the response, image and presentation caches of this worker,
+    and the size of the conversation context sent with edits (empty for a
+    component that hasn't been used yet)
+    """
+    services = get_services()
+    return jsonify({
+        "response_cache": services.stats('response_cache'),
+        "image_cache": services.stats('image_cache'),
+        "export_cache": services.stats('export_cache'),
+        "presentation_store": services.stats('presentation_store'),
+        "conversation_memory": services.stats('conversation_memory')
+    })
@@ -0,0 +1,143 @@
+"""
+Maintenance commands, added to the `flask` CLI by create_app().
+"""
+import json
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from batch_generation import BatchInputError, batch_format, parse_prompts
+from generation import batch_runner
+from http_cache import VENDOR_LIBRARIES, integrity, load_vendor_lock, save_vendor_lock
+from media_store import register_untracked_files
+from models import User
+from services import assets, job_queue, media_sweeper, presentation_store
+
+
+@click.command('migrate-slides')
+@click.option('--batch-size', default=200, show_default=True, help='Decks per transaction')
+@with_appcontext
+def migrate_slides_command(batch_size):
+    """Move every deck still stored as one JSON blob to per-slide rows"""
+    moved = presentation_store.migrate_all(batch_size)
+    print(f"✅ Moved {moved} presentations to per-slide storage")
+
+
+@click.command('generate-batch')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username that owns the decks')
+@click.option('--concurrency', default=None, type=int, help='Decks generated at once (default: BATCH_CONCURRENCY)')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format (default: from the file extension)')
+@with_appcontext
+def generate_batch_command(path, username, concurrency, fmt):
+    """Generate one deck per prompt of a CSV or JSONL file, printing NDJSON progress"""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}")
+    fmt = fmt or batch_format(path)
+    if fmt is None:
+        raise click.ClickException("Can't tell the format from the file name, pass --format")
+    with open(path, 'rb') as f:
+        try:
+            items = parse_prompts(f.read(), fmt, max_prompts=None)
+        except BatchInputError as e:
+            raise click.ClickException(str(e))
+    for event in batch_runner(user.id, concurrency).run(items):
+        print(json.dumps(event), flush=True)
+
+
+@click.command('backfill-media')
+@with_appcontext
+def backfill_media_command():
+    """Record which image files existing decks use, then register the other files in the upload folder"""
+    checked = presentation_store.backfill_media()
+    registered = register_untracked_files(current_app.config['UPLOAD_FOLDER'])
+    print(f"✅ Checked {checked} presentations, registered {registered} unused files "
+          f"(deleted after {current_app.config['MEDIA_GRACE_PERIOD']}s unless a deck uses them)")
+
+
+@click.command('sweep-media')
+@with_appcontext
+def sweep_media_command():
+    """Delete the image files that no deck has used for MEDIA_GRACE_PERIOD"""
+    files, freed = media_sweeper.sweep()
+    print(f"🧹 Deleted {files} unused files ({freed / 1024 / 1024:.1f} MB)")
+
+
+@click.command('run-jobs')
+@click.option('--workers', default=None, type=int, help='Worker threads (default: JOB_WORKERS)')
+@with_appcontext
+def run_jobs_command(workers):
+    """Run generation job workers in this process until interrupted"""
+    job_queue.stop()
+    if workers is not None:
+        job_queue.workers = workers
+    job_queue.start()
+    print(f"👷 Running {job_queue.workers} job workers, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        job_queue.stop(timeout=current_app.config['LLM_TIMEOUT'])
+
+
+@click.command('vendor-assets')
+@click.option('--cdn-url', default=None, help='npm CDN to download from (default: ASSET_CDN_URL)')
+@click.option('--pin', is_flag=True, help='Record the hash of files not in vendor.lock.json yet (a new library '
+                                          'or version, downloaded from a source you trust)')
+@with_appcontext
+def vendor_assets_command(cdn_url, pin):
+    """Download the pinned front-end libraries into the vendor folder, checked against vendor.lock.json"""
+    import requests
+    cdn_url = (cdn_url or assets.cdn_url).rstrip('/')
+    lock = load_vendor_lock()
+    downloads = {}
+    for name, library in VENDOR_LIBRARIES.items():
+        response = requests.get(f"{cdn_url}/{library}", timeout=30)
+        if response.status_code != 200:
+            raise click.ClickException(f"{library}: HTTP {response.status_code}")
+        found = integrity(response.content)
+        if name not in lock and not pin:
+            raise click.ClickException(f"{library} is not pinned in vendor.lock.json (its hash: {found}); "
+                                       f"check it and run again with --pin")
+        if lock.setdefault(name, found) != found:
+            raise click.ClickException(f"{library}: hash {found} doesn't match the pinned {lock[name]}")
+        downloads[name] = response.content
+        print(f"📦 {library} ({len(response.content) / 1024:.0f} KB)")
+
+    # Nothing is written unless every file checked out
+    for name, content in downloads.items():
+        path = os.path.join(assets.vendor_folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+    if pin:
+        save_vendor_lock(lock)
+    print(f"✅ Vendored {len(downloads)} files into {assets.vendor_folder}")
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Check the vendored libraries and compress every static asset ahead of the first request (at deploy time)"""
+    problems = assets.check_vendored(load_vendor_lock())
+    if problems and not (assets.cdn_fallback and set(problems.values()) == {"missing"}):
+        raise click.ClickException("vendored libraries: " + ", ".join(
+            f"{name} ({problem})" for name, problem in problems.items()) + "; run `flask vendor-assets`")
+    built = assets.build()
+    print(f"✅ Compressed {built} assets into {assets.cache_folder}")
+
+
+COMMANDS = [
+    migrate_slides_command,
+    generate_batch_command,
+    backfill_media_command,
+    sweep_media_command,
+    run_jobs_command,
+    vendor_assets_command,
+    build_assets_command,
+]
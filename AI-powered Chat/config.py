@@ -0,0 +1,149 @@
+"""
+App settings: every key create_app() puts in app.config, read from the
+environment (and .env) with its default.
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Image file types accepted by /upload-image
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+
+
+def config_from_env(instance_path):
+    """
+    Settings from environment variables (loads .env first)
+    instance_path: the app's instance folder, default parent of EXPORT_FOLDER
+    Returns: dict of config keys
+    """
+    load_dotenv()
+    config = {}
+    config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
+    config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///presentations.db')
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Accounts (accounts.py): identity of logged-in users cached per process
+    # (seconds, users); bcrypt cost (each round doubles it, existing hashes
+    # are upgraded at login) and the threads hashing passwords, with at most
+    # PASSWORD_HASH_QUEUE sign-ins waiting for them before 503s
+    config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', '60'))
+    config['USER_CACHE_MAX_ENTRIES'] = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+    config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))
+    config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+    config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', '4'))
+
+    # Structured logs: LOG_FORMAT "json" (one object per line) or "text", and the
+    # /metrics bearer token (unset: open, for a scraper on a private network)
+    config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+    config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'json')
+    config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+    # Configure upload settings
+    config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'static/uploads')
+    config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+
+    # Image hosts (overridable so benchmarks can point at a local stub server)
+    config['UNSPLASH_SOURCE_URL'] = os.getenv('UNSPLASH_SOURCE_URL', 'https://source.unsplash.com').rstrip('/')
+    config['PICSUM_URL'] = os.getenv('PICSUM_URL', 'https://picsum.photos').rstrip('/')
+
+    # Image pipeline: global cap on image jobs, per-deck concurrency and deadline (seconds)
+    config['IMAGE_POOL_WORKERS'] = int(os.getenv('IMAGE_POOL_WORKERS', '16'))
+    config['IMAGE_DECK_CONCURRENCY'] = int(os.getenv('IMAGE_DECK_CONCURRENCY', '4'))
+    config['IMAGE_DECK_DEADLINE'] = float(os.getenv('IMAGE_DECK_DEADLINE', '25'))
+
+    # Async serving (asgi.py): connections of the shared HTTP client for image
+    # downloads, across every request of the process
+    config['ASYNC_HTTP_MAX_CONNECTIONS'] = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '100'))
+    # Threads that run the sync views there (every route but /chat and /update)
+    config['ASGI_SYNC_THREADS'] = int(os.getenv('ASGI_SYNC_THREADS', '32'))
+
+    # Admission control for the generation endpoints (admission.py): token
+    # buckets per user and for the whole deployment, in tokens per minute (0:
+    # no limit) and burst size. A typical new deck costs about 1 token and an
+    # edit of it 0.7, so the burst covers a new deck and a dozen quick edits,
+    # and the rate a deck or edit every few seconds after that. Short
+    # of tokens, a request waits up to ADMISSION_MAX_WAIT seconds for its turn
+    # if fewer than ADMISSION_QUEUE_DEPTH requests of the process are waiting,
+    # and gets a 429 otherwise
+    config['ADMISSION_USER_RATE'] = float(os.getenv('ADMISSION_USER_RATE', '10'))
+    config['ADMISSION_USER_BURST'] = float(os.getenv('ADMISSION_USER_BURST', '10'))
+    config['ADMISSION_GLOBAL_RATE'] = float(os.getenv('ADMISSION_GLOBAL_RATE', '300'))
+    config['ADMISSION_GLOBAL_BURST'] = float(os.getenv('ADMISSION_GLOBAL_BURST', '100'))
+    config['ADMISSION_MAX_WAIT'] = float(os.getenv('ADMISSION_MAX_WAIT', '10'))
+    config['ADMISSION_QUEUE_DEPTH'] = int(os.getenv('ADMISSION_QUEUE_DEPTH', '8'))
+
+    # Image cache: how many search terms to remember and for how long (seconds)
+    config['IMAGE_CACHE_MAX_ENTRIES'] = int(os.getenv('IMAGE_CACHE_MAX_ENTRIES', '2000'))
+    config['IMAGE_CACHE_TTL'] = int(os.getenv('IMAGE_CACHE_TTL', str(24 * 3600)))
+
+    # Image files no deck uses are deleted after MEDIA_GRACE_PERIOD seconds (keep
+    # it at least IMAGE_CACHE_TTL), checked every MEDIA_SWEEP_INTERVAL; per-user
+    # disk quota in bytes (0: no limit)
+    config['MEDIA_GRACE_PERIOD'] = int(os.getenv('MEDIA_GRACE_PERIOD', str(max(24 * 3600, config['IMAGE_CACHE_TTL']))))
+    config['MEDIA_SWEEP_INTERVAL'] = int(os.getenv('MEDIA_SWEEP_INTERVAL', '600'))
+    config['MEDIA_QUOTA_BYTES'] = int(os.getenv('MEDIA_QUOTA_BYTES', str(500 * 1024 * 1024)))
+
+    # Decoded decks kept in memory by each worker process
+    config['PRESENTATION_CACHE_SIZE'] = int(os.getenv('PRESENTATION_CACHE_SIZE', '256'))
+
+    # Background generation jobs: worker threads per process (0 to only run them
+    # with `flask run-jobs`), and how long a running job is held before it is
+    # considered lost and queued again (seconds)
+    config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '2'))
+    config['JOB_LEASE'] = int(os.getenv('JOB_LEASE', '300'))
+    config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+    # Batch generation (/batch, `flask generate-batch`): decks generated at once
+    # (at most LLM_MAX_IN_FLIGHT), prompts per batch, and finished decks saved
+    # per transaction
+    config['BATCH_CONCURRENCY'] = int(os.getenv('BATCH_CONCURRENCY', '4'))
+    config['BATCH_MAX_PROMPTS'] = int(os.getenv('BATCH_MAX_PROMPTS', '500'))
+    config['BATCH_SAVE_EVERY'] = int(os.getenv('BATCH_SAVE_EVERY', '25'))
+
+    # Decks per history page (HTML and JSON), and the most a JSON client may ask for
+    config['HISTORY_PAGE_SIZE'] = int(os.getenv('HISTORY_PAGE_SIZE', '24'))
+    config['HISTORY_MAX_PAGE_SIZE'] = 100
+
+    # Response cache for new decks: exact prompt matches, plus near-duplicate
+    # prompts whose topic words overlap by at least RESPONSE_CACHE_SIMILARITY
+    config['RESPONSE_CACHE_ENABLED'] = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'
+    config['RESPONSE_CACHE_NEAR_DUPLICATES'] = os.getenv('RESPONSE_CACHE_NEAR_DUPLICATES', '1') == '1'
+    config['RESPONSE_CACHE_SIMILARITY'] = float(os.getenv('RESPONSE_CACHE_SIMILARITY', '0.8'))
+    config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '5000'))
+    config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))
+
+    # Conversation memory of edited decks: tokens of earlier requests sent with
+    # each /update (0: none), at most CONVERSATION_SUMMARY_TOKENS of them for the
+    # summary of requests that no longer fit
+    config['CONVERSATION_TOKEN_BUDGET'] = int(os.getenv('CONVERSATION_TOKEN_BUDGET', '400'))
+    config['CONVERSATION_SUMMARY_TOKENS'] = int(os.getenv('CONVERSATION_SUMMARY_TOKENS', '150'))
+
+    # Rendered .pptx files, reused while a deck is unchanged
+    config['EXPORT_FOLDER'] = os.getenv('EXPORT_FOLDER', os.path.join(instance_path, 'exports'))
+    config['EXPORT_CACHE_MAX_FILES'] = int(os.getenv('EXPORT_CACHE_MAX_FILES', '200'))
+
+    # Static assets served fingerprinted from /assets/: compressed copies, the
+    # vendored front-end libraries (unset: static/vendor, filled by `flask
+    # vendor-assets`) and the npm CDN they are downloaded from. Libraries
+    # that haven't been vendored are loaded from the CDN, checked by the
+    # browser against their pinned hash; with ASSET_CDN_FALLBACK=0 (once
+    # `flask vendor-assets` has run) such a page fails instead
+    config['ASSET_CACHE_FOLDER'] = os.getenv('ASSET_CACHE_FOLDER', os.path.join(instance_path, 'assets'))
+    config['ASSET_VENDOR_FOLDER'] = os.getenv('ASSET_VENDOR_FOLDER')
+    config['ASSET_CDN_URL'] = os.getenv('ASSET_CDN_URL', 'https://cdn.jsdelivr.net/npm').rstrip('/')
+    config['ASSET_CDN_FALLBACK'] = os.getenv('ASSET_CDN_FALLBACK', '1') == '1'
+
+    # Configure Gemini AI (the client connects on first use)
+    config['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
+    config['GEMINI_MODEL'] = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp')
+
+    # Model calls: "gemini", or "stub" for local deterministic answers (load tests, CI)
+    config['LLM_BACKEND'] = os.getenv('LLM_BACKEND', 'gemini')
+    config['LLM_TIMEOUT'] = float(os.getenv('LLM_TIMEOUT', '60'))
+    config['LLM_MAX_RETRIES'] = int(os.getenv('LLM_MAX_RETRIES', '3'))
+    config['LLM_MAX_IN_FLIGHT'] = int(os.getenv('LLM_MAX_IN_FLIGHT', '8'))
+    config['LLM_STUB_LATENCY'] = float(os.getenv('LLM_STUB_LATENCY', '0.5'))
+    config['LLM_STUB_FAILURE_RATE'] = float(os.getenv('LLM_STUB_FAILURE_RATE', '0'))
+    config['LLM_STUB_SEED'] = int(os.getenv('LLM_STUB_SEED', '0'))
+    return config
@@ -0,0 +1,298 @@
+"""
+Conversation memory for decks edited over several /update calls.
+
+Every request that changes a deck - and the one it was created from - is
+stored as a turn together with the model's reply and the slides it changed,
+so the next edit prompt can tell the model what was asked before ("make it
+shorter again", "same style as the last change") without the user
+repeating it.
+
+The conversation part of an edit prompt is kept within a token budget.
+When the turns no longer fit, the oldest ones are folded into a rolling
+summary: the request the deck was created from, how many edits followed,
+the words they were mostly about, the slides edited most and the latest
+folded requests. The summary is computed here, without a model call, has
+its own smaller budget, and folded turns are deleted, so a deck edited 500
+times costs the same prompt tokens and rows read as one edited 20 times.
+
+Tokens are counted with a local approximation (count_tokens): no tokenizer
+download and no count-tokens API call.
+"""
+import json
+import re
+import threading
+
+from models import ConversationSummary, ConversationTurn, db
+from response_cache import content_words, normalize_prompt
+
+# Letter runs, single digits, and any other non-space character
+_TOKEN_PIECES = re.compile(r'[A-Za-z]+|\d|[^\sA-Za-z\d]')
+
+# Words of edit requests that say what to do rather than what about
+EDIT_WORDS = frozenset("""
+    change changed update edit replace rewrite reword add remove delete drop insert move swap put
+    shorten shorter longer expand extend condense simplify improve fix make use keep turn
+    more less bit little instead again also too just only same other another new old
+    point points bullet bullets title titles text content slide slides deck last first next
+    previous one two three four five it its this that them these those
+    something anything everything every each all
+""".split())
+
+SUMMARY_HEADER = "Summary of earlier requests:"
+RECENT_HEADER = "Recent requests, oldest first:"
+
+# Folded requests quoted in the summary, and at most this many topic words
+# and slide numbers kept
+LATEST_FOLDED = 3
+MAX_KEYWORDS = 50
+MAX_SLIDE_NUMBERS = 12
+
+
+def piece_tokens(piece):
+    # Common words are one token, long ones a few
+    return (len(piece) + 5) // 6 if piece[0].isalpha() else 1
+
+
+def count_tokens(text):
+    """
+    Approximate token count of text for a BPE/SentencePiece model: one per
+    6 letters of a word, one per digit and per punctuation mark (so JSON
+    costs what it does)
+    Returns: int
+    """
+    return sum(piece_tokens(piece) for piece in _TOKEN_PIECES.findall(text or ''))
+
+
+def clip(text, tokens):
+    """
+    Text on one line, cut to at most `tokens` tokens
+    Returns: the text, ending in "…" when it was cut
+    """
+    text = ' '.join(str(text or '').split())
+    if count_tokens(text) <= tokens:
+        return text
+    used = 0
+    for match in _TOKEN_PIECES.finditer(text):
+        used += piece_tokens(match.group())
+        # One token left for the ellipsis
+        if used > tokens - 1:
+            return text[:match.start()].rstrip() + '…'
+    return text
+
+
+def topic_words(request):
+    """Words of an edit request that say what it was about"""
+    return sorted(
+        word for word in content_words(normalize_prompt(request))
+        if word not in EDIT_WORDS and len(word) > 2 and not word.isdigit()
+    )
+
+
+def slide_numbers(changed):
+    """Stored form of the changed slides: 1-based numbers, "3,5" """
+    return ','.join(str(index + 1) for index in sorted(changed)[:MAX_SLIDE_NUMBERS])
+
+
+def format_turn(turn):
+    """One turn as a line of the prompt"""
+    if turn.kind == 'create':
+        return f'- Created the deck: "{turn.request}"'
+    line = f'- "{turn.request}"'
+    if turn.slides:
+        line += f" (changed slides {turn.slides.replace(',', ', ')})"
+    if turn.reply:
+        line += f' - you replied: "{turn.reply}"'
+    return line
+
+
+def render_context(summary, turns):
+    """Conversation section of an edit prompt"""
+    lines = []
+    if summary:
+        lines += [SUMMARY_HEADER, summary]
+    if turns:
+        lines += [RECENT_HEADER] + [format_turn(turn) for turn in turns]
+    return '\n'.join(lines)
+
+
+def context_tokens(summary_tokens, turns):
+    """Tokens of render_context() from the stored counts (whitespace is free, so they add up)"""
+    tokens = sum(turn.tokens for turn in turns)
+    if summary_tokens:
+        tokens += summary_tokens + count_tokens(SUMMARY_HEADER)
+    if turns:
+        tokens += count_tokens(RECENT_HEADER)
+    return tokens
+
+
+def new_state():
+    return {"origin": None, "edits": 0, "keywords": {}, "slides": {}, "latest": []}
+
+
+def top_counts(counts, limit):
+    """Keys with the highest counts, first seen first on ties"""
+    return [key for key, _ in sorted(counts.items(), key=lambda item: -item[1])[:limit]]
+
+
+def fold_turn(state, turn):
+    """Add a turn to the summary state"""
+    if turn.kind == 'create':
+        state["origin"] = turn.request
+        return
+    state["edits"] += 1
+    keywords = state["keywords"]
+    for word in topic_words(turn.request):
+        keywords[word] = keywords.get(word, 0) + 1
+    if len(keywords) > MAX_KEYWORDS:
+        state["keywords"] = {word: keywords[word] for word in top_counts(keywords, MAX_KEYWORDS)}
+    for number in filter(None, turn.slides.split(',')):
+        state["slides"][number] = state["slides"].get(number, 0) + 1
+    if len(state["slides"]) > MAX_SLIDE_NUMBERS:
+        state["slides"] = {number: state["slides"][number] for number in top_counts(state["slides"], MAX_SLIDE_NUMBERS)}
+    state["latest"] = (state["latest"] + [turn.request])[-LATEST_FOLDED:]
+
+
+def render_summary(state, budget):
+    """
+    Summary text of the folded turns within budget tokens: fewer latest
+    requests and topic words are shown until it fits
+    """
+    origin = f'The deck was created from: "{clip(state["origin"], budget // 3)}"' if state["origin"] else None
+    for latest, keywords in ((LATEST_FOLDED, 8), (2, 8), (1, 5), (0, 5), (0, 0)):
+        lines = [origin] if origin else []
+        if state["edits"]:
+            line = f"{state['edits']} earlier edit{'s' if state['edits'] != 1 else ''}"
+            words = top_counts(state["keywords"], keywords)
+            if words:
+                line += ", mostly about: " + ", ".join(words)
+            lines.append(line)
+            if state["slides"]:
+                numbers = sorted(top_counts(state["slides"], 6), key=int)
+                lines.append("Slides edited most: " + ", ".join(numbers))
+            if latest:
+                lines.append("Latest of those: " + "; ".join(
+                    f'"{clip(request, budget // 6)}"' for request in state["latest"][-latest:]
+                ))
+        text = '\n'.join(lines)
+        if count_tokens(text) <= budget:
+            return text
+    return clip(text, budget)
+
+
+def forget_conversation(presentation_id):
+    """Delete a deck's turns and summary (the caller commits)"""
+    ConversationTurn.query.filter_by(presentation_id=presentation_id).delete()
+    ConversationSummary.query.filter_by(presentation_id=presentation_id).delete()
+
+
+class ConversationMemory:
+    """
+    Turns and rolling summaries of deck conversations
+    budget: tokens of conversation context in an edit prompt (0: no memory)
+    summary_budget: tokens of the summary, within the budget
+    """
+
+    def __init__(self, budget=400, summary_budget=150):
+        self.budget = budget
+        self.summary_budget = min(summary_budget, budget // 2)
+        # A single turn never takes more than a quarter of the budget
+        self.turn_budget = budget // 4
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.folded = 0
+        self.contexts = 0
+        self.context_tokens = 0
+        self.max_context_tokens = 0
+
+    def record(self, presentation_id, request, reply=None, changed=(), kind='edit'):
+        """
+        Store one turn of a deck's conversation, folding the oldest turns into
+        the summary once they no longer fit the budget
+        changed: 0-based indices of the slides the turn changed
+        kind: "create" for the request the deck was generated from
+        """
+        if self.budget <= 0 or presentation_id is None:
+            return
+        turn = ConversationTurn(
+            presentation_id=presentation_id,
+            kind=kind,
+            request=clip(request, self.turn_budget * 2 // 3),
+            reply=clip(reply, self.turn_budget // 3),
+            slides=slide_numbers(changed)
+        )
+        turn.tokens = count_tokens(format_turn(turn))
+        db.session.add(turn)
+        db.session.flush()
+        folded = self._fold(presentation_id)
+        db.session.commit()
+        with self._lock:
+            self.recorded += 1
+            self.folded += folded
+
+    def _fold(self, presentation_id):
+        """
+        Move the oldest turns into the summary until the context fits the
+        budget (the newest turn is always kept as it is)
+        Returns: number of turns folded
+        """
+        turns = ConversationTurn.query.filter_by(presentation_id=presentation_id).order_by(ConversationTurn.id).all()
+        summary = db.session.get(ConversationSummary, presentation_id)
+        summary_tokens = summary.tokens if summary is not None else 0
+        if context_tokens(summary_tokens, turns) <= self.budget:
+            return 0
+
+        state = json.loads(summary.state) if summary is not None else new_state()
+        folded = 0
+        while len(turns) > 1 and context_tokens(summary_tokens, turns) > self.budget:
+            turn = turns.pop(0)
+            fold_turn(state, turn)
+            db.session.delete(turn)
+            folded += 1
+            text = render_summary(state, self.summary_budget)
+            summary_tokens = count_tokens(text)
+        if not folded:
+            return 0
+
+        if summary is None:
+            summary = ConversationSummary(presentation_id=presentation_id)
+            db.session.add(summary)
+        summary.state = json.dumps(state)
+        summary.summary = text
+        summary.tokens = summary_tokens
+        return folded
+
+    def context(self, presentation_id):
+        """
+        Conversation section for a deck's next edit prompt: the summary and
+        the turns not folded into it, within the budget
+        Returns: (text, tokens) - ("", 0) for a deck without a conversation
+        """
+        if self.budget <= 0 or presentation_id is None:
+            return "", 0
+        summary = db.session.query(ConversationSummary.summary, ConversationSummary.tokens).filter_by(
+            presentation_id=presentation_id
+        ).first()
+        turns = ConversationTurn.query.filter_by(presentation_id=presentation_id).order_by(ConversationTurn.id).all()
+        summary_text, summary_tokens = summary if summary is not None else ("", 0)
+        # Only after the budget was lowered: the next record() folds them
+        while len(turns) > 1 and context_tokens(summary_tokens, turns) > self.budget:
+            turns.pop(0)
+
+        text = render_context(summary_text, turns)
+        tokens = count_tokens(text)
+        with self._lock:
+            self.contexts += 1
+            self.context_tokens += tokens
+            self.max_context_tokens = max(self.max_context_tokens, tokens)
+        return text, tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "recorded": self.recorded,
+                "folded": self.folded,
+                "contexts": self.contexts,
+                "mean_context_tokens": round(self.context_tokens / self.contexts, 1) if self.contexts else 0.0,
+                "max_context_tokens": self.max_context_tokens
+            }
@@ -0,0 +1,353 @@
+"""
+Generating new decks: the chat prompt, the response cache lookups and the
+model call, then the slide images. Used by /chat and /chat/stream, the
+background job handler and batch generation, and as coroutines by the async
+/chat (asgi.py).
+"""
+import hashlib
+import json
+import logging
+import re
+
+from flask import current_app
+
+from batch_generation import BatchRunner
+from instrumentation import log, stage
+from llm_json import ModelOutputError, parse_model_json
+from models import User, db, db_step, release_connection
+from services import conversation_memory, llm, presentation_store, response_cache
+from session_state import deck_title
+from slide_images import add_images_async, new_image_batch
+from slide_patch import strip_image_fields
+
+
+def build_chat_prompt(username, user_prompt):
+    """
+    Build the Gemini prompt for generating a new deck
+    Returns: prompt string
+    """
+    # Create a detailed prompt for Gemini to generate slide content
+    # Add personalized greeting with user's name
+    user_greeting = f"Hello {username}! "
+    
+    system_prompt = user_greeting + """You are an AI assistant specialized in creating PowerPoint presentations with images.
+        
+        CRITICAL: You MUST add image_search_query to EVERY slide (except pure text conclusion slides).
+        
+        Your response MUST be in this exact JSON format:
+        {
+          "slides": [
+            {
+              "title": "Slide Title",
+              "content": ["Point 1", "Point 2", "Point 3"],
+              "image_search_query": "specific descriptive search terms",
+              "image_position": "right"
+            }
+          ],
+          "message": "A brief confirmation message to the user"
+        }
+        
+        MANDATORY RULES:
+        - EVERY slide MUST have "image_search_query" field (cannot be empty or null)
+        - Use very specific, descriptive search terms for images
+        - For title slides: use dramatic, relevant background images
+        - For content slides: use illustrative, topic-related images
+        - image_position options: "right" (default), "left", "center", "background" (for title slides)
+        
+        EXAMPLES OF GOOD image_search_query:
+        - "artificial intelligence neural network visualization"
+        - "climate change melting glacier arctic"
+        - "healthy food colorful vegetables fruits"
+        - "modern office teamwork collaboration"
+        - "space exploration rocket launch"
+        
+        Guidelines:
+        - Create 5-7 slides unless specified otherwise
+        - Each slide needs clear title and 3-5 bullet points
+        - First slide (title): use "background" position
+        - Content slides: use "right" or "left" position
+        - Last slide (conclusion): use "center" or "background"
+        - Make image searches highly specific to slide content
+        
+        User request: """ + user_prompt
+    return system_prompt
+
+
+# Changes whenever the prompt template does, so old cached answers are not reused
+SYSTEM_PROMPT_VERSION = hashlib.sha256(build_chat_prompt('', '').encode()).hexdigest()[:12]
+
+
+def response_cache_for(user):
+    """
+    Response cache to use for a user's new decks
+    Returns: the cache, or None if it is disabled or the user opted out
+    """
+    if current_app.config['RESPONSE_CACHE_ENABLED'] and user.response_cache_enabled:
+        return response_cache
+    return None
+
+
+def response_cache_variant(include_images):
+    """Part of the cache key besides the prompt: the image count changes the answer"""
+    return f"images={len(include_images or [])}"
+
+
+def remember_response(cache, username, user_prompt, include_images, result):
+    """
+    Store a parsed model result in the response cache, without image fields
+    Results that mention the user by name are not shared with other users.
+    """
+    if cache is None or not result.get("slides"):
+        return
+    cached = {
+        "slides": [strip_image_fields(slide) for slide in result["slides"]],
+        "message": result.get("message")
+    }
+    if re.search(r'\b' + re.escape(username) + r'\b', json.dumps(cached), re.IGNORECASE):
+        return
+    try:
+        cache.store(user_prompt, cached, response_cache_variant(include_images))
+    except Exception as cache_error:
+        db.session.rollback()
+        log("response_cache_store_failed", logging.WARNING, error=str(cache_error))
+
+
+def save_presentation(user_id, slides):
+    """
+    Save a generated deck to the user's history
+    Returns: presentation ID or None if saving failed
+    """
+    try:
+        with stage("db_save", slides=len(slides)) as span:
+            presentation_id = presentation_store.create(user_id, slides)
+            span.update(presentation_id=presentation_id, title=deck_title(slides))
+        return presentation_id
+    except Exception:
+        # Logged by stage()
+        db.session.rollback()
+        return None
+
+
+def remember_turn(presentation_id, request, reply=None, changed=(), kind='edit'):
+    """
+    Add a request to a deck's conversation memory (conversation.py)
+    Failing only costs later edits that context, so it is logged and ignored.
+    """
+    try:
+        conversation_memory.record(presentation_id, request, reply, changed, kind)
+    except Exception as e:
+        db.session.rollback()
+        log("conversation_record_failed", logging.WARNING, presentation_id=presentation_id, error=str(e))
+
+
+def personalize_message(message, username):
+    """Prefix the model's confirmation message with the user's name"""
+    if not message:
+        return f"Great work, {username}! Your slides are ready!"
+    return f"{username}, " + message
+
+
+def fallback_result(response_text):
+    """Single-slide result used when the model output is not valid JSON"""
+    return {
+        "slides": [
+            {
+                "title": "Generated Content",
+                "content": response_text.split('\n')[:5]
+            }
+        ],
+        "message": "Slides generated successfully!"
+    }
+
+
+def lookup_response(cache, user_prompt, include_images):
+    """
+    Look a new deck's prompt up in the response cache
+    Returns: (result, "exact" | "near") or (None, None)
+    """
+    if cache is None:
+        return None, None
+    with stage("response_cache") as span:
+        result, cache_match = cache.lookup(user_prompt, response_cache_variant(include_images))
+        span["outcome"] = cache_match or "miss"
+    return result, cache_match
+
+
+def count_images(span, slides):
+    """Add how many slides got an image to a stage's log line ("partial" if not all did)"""
+    span["images"] = sum(1 for slide in slides if slide.get("has_image", False))
+    if span["images"] < len(slides):
+        span["outcome"] = "partial"
+
+
+def read_deck_response(cache, user, user_prompt, include_images, response):
+    """
+    Parse the model's answer for a new deck and store it in the response cache
+    Returns: result dict (fallback_result() when nothing can be recovered)
+    """
+    response_text = response.text.strip()
+    log("llm_response", logging.DEBUG, text=response_text[:500])
+    
+    # Parse JSON response (repairs fences, prose, trailing commas and truncation)
+    try:
+        with stage("parse"):
+            result = parse_model_json(response_text)
+        remember_response(cache, user.username, user_prompt, include_images, result)
+    except ModelOutputError:
+        # If nothing can be recovered, create a structured response
+        result = fallback_result(response_text)
+    return result
+
+
+def build_deck(user, user_prompt, include_images, check_cancelled=None):
+    """
+    Generate and illustrate a new deck for a user, without saving it
+    check_cancelled: optional function called between steps, raises to stop
+    Returns: {"slides": [...], "message": model message or missing,
+              "cached": "exact" | "near" (only when served from the response cache)}
+    Raises: LLMError if the model call fails
+    """
+    # Same or nearly the same prompt seen before: skip the model call
+    cache = response_cache_for(user)
+    result, cache_match = lookup_response(cache, user_prompt, include_images)
+    
+    if result is not None:
+        result["cached"] = cache_match
+    else:
+        system_prompt = build_chat_prompt(user.username, user_prompt)
+        release_connection()
+        
+        # Generate content using Gemini
+        with stage("llm_call") as span:
+            response = llm.generate(system_prompt)
+            span.update(attempts=response.attempts, prompt_tokens=response.prompt_tokens,
+                        output_tokens=response.output_tokens)
+        result = read_deck_response(cache, user, user_prompt, include_images, response)
+    
+    if check_cancelled:
+        check_cancelled()
+    
+    # Fetch images for slides that have image_search_query
+    slides_with_images = result.get("slides", [])
+    with stage("images", slides=len(slides_with_images)) as span:
+        batch = new_image_batch(user.id)
+        for index, slide in enumerate(slides_with_images):
+            batch.submit(index, slide)
+        for _ in batch.drain():
+            pass
+        count_images(span, slides_with_images)
+    
+    result["slides"] = slides_with_images
+    return result
+
+
+def save_deck(user, user_prompt, result):
+    """
+    Save a built deck to the user's history and start its conversation
+    Returns: result, with presentation_id (missing if saving failed) and the
+    personalized message
+    """
+    presentation_id = save_presentation(user.id, result["slides"])
+    if presentation_id is not None:
+        result["presentation_id"] = presentation_id
+        remember_turn(presentation_id, user_prompt, result.get("message"), kind='create')
+    
+    # Add personalized message
+    result["message"] = personalize_message(result.get("message"), user.username)
+    return result
+
+
+def generate_deck(user, user_prompt, include_images, check_cancelled=None):
+    """
+    Generate, illustrate and save a new deck for a user
+    check_cancelled: optional function called between steps, raises to stop
+    Returns: {"slides": [...], "message": str, "presentation_id": id or missing,
+              "cached": "exact" | "near" (only when served from the response cache)}
+    Raises: LLMError if the model call fails
+    """
+    result = build_deck(user, user_prompt, include_images, check_cancelled)
+    
+    if check_cancelled:
+        check_cancelled()
+    return save_deck(user, user_prompt, result)
+
+
+async def abuild_deck(user, user_prompt, include_images):
+    """
+    build_deck() as a coroutine: the model call and the image downloads are
+    awaited on the event loop, the database work runs on a worker thread
+    (user is only read there, see models.db_step)
+    """
+    def lookup():
+        cache = response_cache_for(user)
+        return (cache, user.id, user.username) + lookup_response(cache, user_prompt, include_images)
+    
+    cache, user_id, username, result, cache_match = await db_step(lookup)
+    
+    if result is not None:
+        result["cached"] = cache_match
+    else:
+        system_prompt = build_chat_prompt(username, user_prompt)
+        with stage("llm_call") as span:
+            response = await llm.agenerate(system_prompt)
+            span.update(attempts=response.attempts, prompt_tokens=response.prompt_tokens,
+                        output_tokens=response.output_tokens)
+        result = await db_step(read_deck_response, cache, user, user_prompt, include_images, response)
+    
+    slides_with_images = result.get("slides", [])
+    with stage("images", slides=len(slides_with_images)) as span:
+        await add_images_async(user_id, slides_with_images, range(len(slides_with_images)))
+        count_images(span, slides_with_images)
+    
+    result["slides"] = slides_with_images
+    return result
+
+
+async def agenerate_deck(user, user_prompt, include_images):
+    """generate_deck() as a coroutine (see abuild_deck)"""
+    result = await abuild_deck(user, user_prompt, include_images)
+    return await db_step(save_deck, user, user_prompt, result)
+
+
+def run_chat_job(user_id, payload, check_cancelled):
+    """
+    Job handler for queued /chat requests
+    Returns: job result (the deck itself is read from the presentation when polled)
+    """
+    user = db.session.get(User, user_id)
+    result = generate_deck(user, payload["prompt"], payload.get("include_images", []), check_cancelled)
+    if result.get("presentation_id") is None:
+        return result
+    return {
+        "presentation_id": result["presentation_id"],
+        "message": result["message"],
+        "slide_count": len(result["slides"]),
+        "cached": result.get("cached")
+    }
+
+
+def batch_runner(user_id, concurrency=None):
+    """
+    Runner for one batch of a user's decks: decks are built on the batch's
+    own threads, each in its own app context, and saved in bulk
+    Returns: BatchRunner
+    """
+    def build(item):
+        with current_app.app_context():
+            user = db.session.get(User, user_id)
+            return build_deck(user, item["prompt"], [])
+    
+    def save(finished):
+        try:
+            with stage("db_save", decks=len(finished), slides=sum(len(item["slides"]) for item in finished)):
+                return presentation_store.create_many(
+                    user_id, [(item["slides"], item["title"]) for item in finished]
+                )
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    config = current_app.config
+    concurrency = concurrency or config['BATCH_CONCURRENCY']
+    return BatchRunner(build, save, concurrency=min(concurrency, config['LLM_MAX_IN_FLIGHT']),
+                       save_every=config['BATCH_SAVE_EVERY'])
@@ -0,0 +1,383 @@
+"""
+HTTP caching: ETags and conditional GETs for the deck JSON endpoints, and
+fingerprinted, precompressed static assets including the vendored
+front-end libraries.
+
+Deck responses carry a strong ETag built from the deck's content hash and
+updated_at, which the presentation row stores, with "Cache-Control:
+private, no-cache". The browser revalidates on every use and gets a
+bodyless 304 while the deck is unchanged, and the view answers that from
+one single-row query, without loading any slides. Bodies are compressed
+(brotli or gzip) when the client accepts it.
+
+Assets are served from /assets/ under names that contain a hash of their
+content (css/style.3fa1b2c4d5e6.css). That lets browsers cache them for a
+year without revalidating, since a changed file gets a new URL. Each is
+compressed once per encoding, on its first request or with `flask
+build-assets`, into ASSET_CACHE_FOLDER. Bootstrap, Bootstrap Icons and
+PptxGenJS are served from the vendor folder, filled by `flask vendor-assets`
+with the pinned versions; every file is checked against its integrity hash
+in vendor.lock.json. A library missing from the vendor folder is loaded
+from ASSET_CDN_URL, with its pinned hash as the integrity attribute so the
+browser refuses a file that changed; with ASSET_CDN_FALLBACK=0 such a page
+fails (MissingAsset) instead, and so does `flask build-assets`.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import Response, abort, current_app, request, send_file
+from markupsafe import Markup
+from werkzeug.security import safe_join
+
+from services import get_services
+
+try:
+    import brotli
+except ImportError:
+    # Optional: gzip only
+    brotli = None
+
+ASSET_URL_PREFIX = '/assets/'
+
+# Fingerprinted assets never change: a year, the longest browsers honour
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Digest characters in a fingerprinted file name
+FINGERPRINT_LENGTH = 12
+_FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+# Front-end libraries served as vendor/<name>: path on the npm CDN (package@version/file)
+VENDOR_PREFIX = 'vendor/'
+VENDOR_LIBRARIES = {
+    'bootstrap.min.css': 'bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'bootstrap.bundle.min.js': 'bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'bootstrap-icons/bootstrap-icons.css': 'bootstrap-icons@1.10.0/font/bootstrap-icons.css',
+    'bootstrap-icons/fonts/bootstrap-icons.woff2': 'bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff2',
+    'bootstrap-icons/fonts/bootstrap-icons.woff': 'bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff',
+    'pptxgen.bundle.js': 'pptxgenjs@3.12.0/dist/pptxgen.bundle.js',
+}
+
+# Integrity hash ("sha384-<base64>", as in Subresource Integrity) of each vendored file
+VENDOR_LOCK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor.lock.json')
+
+# Folders of the static folder that are not assets
+NOT_ASSETS = ('uploads', 'vendor')
+
+# Already compressed formats
+INCOMPRESSIBLE = ('.woff2', '.woff', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico')
+
+# Response bodies smaller than this are sent as they are
+MIN_COMPRESS_BYTES = 512
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('font/woff', '.woff')
+
+
+class MissingAsset(Exception):
+    """A vendored library a page needs is not in the vendor folder"""
+
+
+def integrity(data):
+    """Subresource Integrity hash of a file's content"""
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode('ascii')
+
+
+def load_vendor_lock(path=VENDOR_LOCK):
+    """Returns: {vendored file name: integrity hash} of the pinned libraries"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_vendor_lock(lock, path=VENDOR_LOCK):
+    with open(path, 'w') as f:
+        json.dump(dict(sorted(lock.items())), f, indent=2)
+        f.write('\n')
+
+
+def compress(data, encoding, best=True):
+    """
+    Compress a body for Content-Encoding
+    best: highest ratio (assets, compressed once) instead of fast (per response)
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def response_encoding():
+    """Best encoding the client accepts, None for an uncompressed response"""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def representation_etag(etag, encoding):
+    """Strong ETags differ per encoding of the same content"""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def deck_etag(presentation_id, updated_at, content_hash):
+    """ETag of a deck's JSON: changes with its slides and with updated_at"""
+    return f"{presentation_id}-{content_hash[:20]}-{updated_at.strftime('%Y%m%d%H%M%S%f')}"
+
+
+def revalidate(response):
+    """Cache headers of per-user JSON: stored by the browser, revalidated on every use"""
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def not_modified(etag):
+    """
+    304 response when the request's If-None-Match already has this version
+    (in the encoding this response would use)
+    Returns: Response or None
+    """
+    tag = representation_etag(etag, response_encoding())
+    if not request.if_none_match.contains(tag):
+        return None
+    response = Response(status=304)
+    response.set_etag(tag)
+    return revalidate(response)
+
+
+def cached_json(payload, etag=None):
+    """
+    JSON response with an ETag (default: hash of the body), compressed when
+    the client accepts it, or a 304 when If-None-Match matches
+    """
+    data = current_app.json.dumps(payload).encode()
+    encoding = response_encoding() if len(data) >= MIN_COMPRESS_BYTES else None
+    tag = representation_etag(etag or hashlib.sha256(data).hexdigest()[:32], encoding)
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        response = Response(compress(data, encoding, best=False) if encoding else data, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(tag)
+    return revalidate(response)
+
+
+def asset_url(name):
+    """URL of a static asset for templates (see AssetStore.url)"""
+    return get_services().assets.url(name)
+
+
+def asset_integrity(name):
+    """
+    integrity and crossorigin attributes of a pinned library for templates
+    Returns: the attributes, or '' for an asset that isn't pinned
+    """
+    pinned = get_services().assets.pinned_hash(name)
+    if pinned is None:
+        return ''
+    return Markup(' integrity="%s" crossorigin="anonymous"') % pinned
+
+
+def serve_asset(filename):
+    """
+    A static asset under /assets/, in the best encoding the client accepts.
+    Under its current fingerprinted name it is cached for a year without
+    revalidation; under any other name (a plain path, an old fingerprint) it
+    is revalidated with its ETag.
+    """
+    assets = get_services().assets
+    found = assets.resolve(filename)
+    if found is None:
+        abort(404)
+    name, path, digest, current = found
+    encoding = response_encoding()
+    encoded = assets.encoded(name, path, digest, encoding)
+    if encoded is None:
+        encoding = None
+    response = send_file(
+        encoded or path,
+        mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        etag=representation_etag(digest[:32], encoding),
+        conditional=True
+    )
+    if encoding and response.status_code != 304:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable' if current else 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+class AssetStore:
+    """
+    Fingerprints and compressed copies of the static assets
+    static_folder: the app's static files (uploads are not assets)
+    vendor_folder: the vendored libraries, served as vendor/<name>
+    cache_folder: where compressed copies are written
+    cdn_url: npm CDN the pinned libraries are downloaded from
+    cdn_fallback: load libraries not vendored from cdn_url instead of failing
+    lock: {vendored file name: integrity hash}, as in vendor.lock.json
+    """
+
+    def __init__(self, static_folder, vendor_folder, cache_folder, cdn_url, cdn_fallback=False, lock=None):
+        self.static_folder = static_folder
+        self.vendor_folder = vendor_folder
+        self.cache_folder = cache_folder
+        self.cdn_url = cdn_url.rstrip('/')
+        self.cdn_fallback = cdn_fallback
+        self.lock = lock or {}
+        # name -> ((mtime_ns, size), sha256 hex digest)
+        self._digests = {}
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.cdn_urls = 0
+
+    def path(self, name):
+        """File behind an asset name, or None"""
+        if name.startswith(VENDOR_PREFIX):
+            root, relative = self.vendor_folder, name[len(VENDOR_PREFIX):]
+        elif name.split('/', 1)[0] in NOT_ASSETS:
+            return None
+        else:
+            root, relative = self.static_folder, name
+        path = safe_join(root, relative)
+        return path if path is not None and os.path.isfile(path) else None
+
+    def digest(self, name):
+        """
+        Content hash of an asset, computed again only when the file changes
+        Returns: (path, hex digest) or (None, None) if there is no such asset
+        """
+        path = self.path(name)
+        if path is None:
+            return None, None
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            known = self._digests.get(name)
+        if known is not None and known[0] == version:
+            return path, known[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._digests[name] = (version, digest)
+        return path, digest
+
+    def url(self, name):
+        """
+        Fingerprinted URL of an asset, or with cdn_fallback the CDN URL of a
+        library that hasn't been vendored
+        Raises: MissingAsset for a library that hasn't been vendored
+        """
+        _, digest = self.digest(name)
+        if digest is None:
+            library = VENDOR_LIBRARIES.get(name[len(VENDOR_PREFIX):]) if name.startswith(VENDOR_PREFIX) else None
+            if library is not None:
+                if not self.cdn_fallback:
+                    raise MissingAsset(f"{name} is not vendored: run `flask vendor-assets` "
+                                       f"(or set ASSET_CDN_FALLBACK=1 to load it from {self.cdn_url})")
+                with self._lock:
+                    self.cdn_urls += 1
+                return f"{self.cdn_url}/{library}"
+            return ASSET_URL_PREFIX + name
+        stem, ext = os.path.splitext(name)
+        return f"{ASSET_URL_PREFIX}{stem}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+    def pinned_hash(self, name):
+        """Returns: the integrity hash a vendored library is pinned to, or None"""
+        if not name.startswith(VENDOR_PREFIX):
+            return None
+        return self.lock.get(name[len(VENDOR_PREFIX):])
+
+    def resolve(self, requested):
+        """
+        Asset of a path requested under /assets/
+        Returns: (name, path, digest, whether the URL has the current
+        fingerprint) or None
+        """
+        match = _FINGERPRINTED.match(requested)
+        if match:
+            name = match['stem'] + match['ext']
+            path, digest = self.digest(name)
+            if digest is not None:
+                return name, path, digest, digest.startswith(match['digest'])
+        path, digest = self.digest(requested)
+        if digest is None:
+            return None
+        return requested, path, digest, False
+
+    def encoded(self, name, path, digest, encoding):
+        """
+        Copy of an asset compressed with encoding, written on first use
+        Returns: its path, or None when the asset is sent as it is
+        """
+        if encoding is None or name.lower().endswith(INCOMPRESSIBLE):
+            return None
+        target = os.path.join(self.cache_folder, f"{digest}{os.path.splitext(name)[1]}.{encoding}")
+        if os.path.exists(target):
+            return target
+        with open(path, 'rb') as f:
+            data = compress(f.read(), encoding)
+        os.makedirs(self.cache_folder, exist_ok=True)
+        # Written under a temporary name: another worker may be serving it already
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_folder)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, target)
+        with self._lock:
+            self.compressed += 1
+        return target
+
+    def check_vendored(self, lock):
+        """
+        Vendored libraries that are missing or don't match their pinned hash
+        Returns: {name: "missing" | "not pinned" | "hash mismatch"}
+        """
+        problems = {}
+        for name in VENDOR_LIBRARIES:
+            path = os.path.join(self.vendor_folder, name)
+            if not os.path.isfile(path):
+                problems[name] = "missing"
+            elif name not in lock:
+                problems[name] = "not pinned"
+            else:
+                with open(path, 'rb') as f:
+                    if integrity(f.read()) != lock[name]:
+                        problems[name] = "hash mismatch"
+        return problems
+
+    def names(self):
+        """Every asset: the static files and the vendored libraries"""
+        names = []
+        for root, prefix, skip in ((self.static_folder, '', NOT_ASSETS), (self.vendor_folder, VENDOR_PREFIX, ())):
+            for directory, subdirectories, files in os.walk(root):
+                relative = os.path.relpath(directory, root).replace(os.sep, '/')
+                if relative == '.':
+                    subdirectories[:] = [d for d in subdirectories if d not in skip]
+                    relative = ''
+                else:
+                    relative += '/'
+                names.extend(prefix + relative + filename for filename in files)
+        return sorted(names)
+
+    def build(self):
+        """
+        Compress every asset in every encoding ahead of the first request
+        Returns: number of assets
+        """
+        names = self.names()
+        for name in names:
+            path, digest = self.digest(name)
+            for encoding in ENCODINGS:
+                self.encoded(name, path, digest, encoding)
+        return len(names)
+
+    def stats(self):
+        with self._lock:
+            return {"assets": len(self._digests), "compressed": self.compressed, "cdn_urls": self.cdn_urls}
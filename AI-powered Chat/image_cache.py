@@ -0,0 +1,163 @@
+"""
+Image cache for slide images.
+
+Maps a normalized image search term (the stop-word filtered keywords that
+fetch_image_from_unsplash() sends to Unsplash) to the local image that was
+already downloaded for it. Entries expire after a TTL and the least
+recently used ones are evicted once the cache is full. Concurrent lookups of
+the same term share a single download, whether they come from sync views
+(get_or_resolve) or async ones (aget_or_resolve).
+
+Image files are named after the hash of their content (see
+image_processing.py), so identical images are only stored once and two
+decks can never overwrite each other's files.
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def write_atomic(filepath, data):
+    """Write bytes to a temporary file first so readers never see a partial image"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ImageCache:
+    """Thread-safe LRU + TTL cache of search term -> local image URL"""
+
+    def __init__(self, max_entries=1000, ttl=24 * 3600, exists=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Checks that a cached URL still points at a file on disk
+        self.exists = exists or (lambda value: True)
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, term):
+        # Caller holds self._lock
+        entry = self._entries.get(term)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic() or not self.exists(value):
+            del self._entries[term]
+            return None
+        self._entries.move_to_end(term)
+        return value
+
+    def get(self, term):
+        with self._lock:
+            value = self._lookup(term)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, term, value):
+        with self._lock:
+            self._entries[term] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(term)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _claim(self, term):
+        """
+        Look term up for get_or_resolve()
+        Returns: (cached value or None, the term's waiter, whether this
+        caller resolves it)
+        """
+        with self._lock:
+            value = self._lookup(term)
+            if value is not None:
+                self.hits += 1
+                return value, None, False
+            waiter = self._in_flight.get(term)
+            if waiter is None:
+                waiter = self._in_flight[term] = {"event": threading.Event(), "value": None}
+                self.misses += 1
+                return None, waiter, True
+            self.hits += 1
+            return None, waiter, False
+
+    def get_or_resolve(self, term, resolve):
+        """
+        Return the cached value for term, calling resolve() on a miss
+        Concurrent callers for the same term wait for the first one's result.
+        Failed resolutions (None) are not cached.
+        """
+        value, waiter, leader = self._claim(term)
+        if value is not None:
+            return value
+
+        if not leader:
+            waiter["event"].wait()
+            return waiter["value"]
+
+        try:
+            value = resolve()
+            waiter["value"] = value
+            if value is not None:
+                self.put(term, value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(term, None)
+            waiter["event"].set()
+
+    async def aget_or_resolve(self, term, resolve):
+        """
+        get_or_resolve() for the event loop: resolve is a coroutine function,
+        and waiting for another caller's resolution doesn't block the loop
+        """
+        value, waiter, leader = self._claim(term)
+        if value is not None:
+            return value
+
+        if not leader:
+            # The leader may be a pool thread of a sync view
+            while not waiter["event"].is_set():
+                await asyncio.sleep(0.01)
+            return waiter["value"]
+
+        try:
+            value = await resolve()
+            waiter["value"] = value
+            if value is not None:
+                self.put(term, value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(term, None)
+            waiter["event"].set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
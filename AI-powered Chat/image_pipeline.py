@@ -0,0 +1,214 @@
+"""
+Concurrent image pipeline for slide decks.
+
+Resolves and downloads the images of every slide in parallel instead of one
+slide at a time. A single process-wide thread pool caps the total number of
+outbound image jobs, and each deck is additionally limited to a few slides in
+flight so one large deck cannot take over the whole pool. Slides that are not
+finished when the deck's deadline expires are returned with has_image False.
+Jobs run in a copy of the submitting thread's context, so their logs and
+metrics keep the ID of the request they belong to.
+
+resolve_images_async() is the same for the async views (asgi.py): the jobs
+are coroutines on the event loop instead of pool threads.
+"""
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import log
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=16):
+    """
+    Return the shared image worker pool, creating it on first use
+    max_workers is the global cap on concurrent image jobs for the process
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='slide-image')
+        return _executor
+
+
+def apply_image(slide, image):
+    """Set the fields of a resolved image (or has_image False) on a slide"""
+    if isinstance(image, dict):
+        # Results can be shared between slides (image cache), copy nested dicts
+        slide.update({key: dict(value) if isinstance(value, dict) else value for key, value in image.items()})
+        slide["has_image"] = True
+    elif image:
+        slide["image_url"] = image
+        slide["has_image"] = True
+    else:
+        slide["has_image"] = False
+    return slide
+
+
+class SlideImageBatch:
+    """
+    Image jobs for the slides of one deck
+
+    resolve(query, index) must return a local image URL, a dict of image
+    fields to set on the slide (including "image_url"), or None. Slides can be
+    submitted one by one (e.g. while a response is still streaming in) and the
+    finished ones collected with poll() or drain().
+    """
+
+    def __init__(self, resolve, max_concurrency=4, deadline=30.0, executor=None):
+        self.resolve = resolve
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.deadline = deadline
+        self.executor = executor or get_executor()
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._results = queue.Queue()
+        self._outstanding = {}
+        self._started_at = None
+
+    def submit(self, index, slide):
+        """
+        Queue the image job for a slide
+        Returns: True if a job was queued, False if the slide has no image query
+        """
+        query = (slide.get("image_search_query") or "").strip()
+        if not query:
+            slide["has_image"] = False
+            return False
+
+        with self._lock:
+            if self._started_at is None:
+                # The deadline covers image work only, not the model call
+                self._started_at = time.monotonic()
+            self._outstanding[index] = slide
+            if self._in_flight < self.max_concurrency:
+                self._start(index, query)
+            else:
+                self._pending.append((index, query))
+        return True
+
+    def _start(self, index, query):
+        # Caller holds self._lock
+        self._in_flight += 1
+        self.executor.submit(contextvars.copy_context().run, self._run, index, query)
+
+    def _run(self, index, query):
+        try:
+            image = self.resolve(query, index)
+        except Exception as e:
+            log("image_job_failed", logging.WARNING, slide=index + 1, error=str(e))
+            image = None
+
+        self._results.put((index, image))
+
+        with self._lock:
+            self._in_flight -= 1
+            if self._pending and not self._closed:
+                next_index, next_query = self._pending.popleft()
+                self._start(next_index, next_query)
+
+    def remaining(self):
+        """Seconds left before the deadline (None if there is no deadline)"""
+        if self.deadline is None:
+            return None
+        if self._started_at is None:
+            return self.deadline
+        return max(0.0, self._started_at + self.deadline - time.monotonic())
+
+    @property
+    def outstanding(self):
+        return len(self._outstanding)
+
+    def _apply(self, index, image):
+        slide = self._outstanding.pop(index, None)
+        if slide is None:
+            # Finished after the deadline, the slide was already given up on
+            return None
+        return apply_image(slide, image)
+
+    def poll(self):
+        """
+        Collect the slides finished so far without blocking
+        Returns: list of (index, slide)
+        """
+        finished = []
+        while True:
+            try:
+                index, image = self._results.get_nowait()
+            except queue.Empty:
+                return finished
+            slide = self._apply(index, image)
+            if slide is not None:
+                finished.append((index, slide))
+
+    def drain(self):
+        """
+        Yield (index, slide) as each outstanding slide finishes. Once the
+        deadline passes, the remaining slides are yielded with has_image False.
+        """
+        while self._outstanding:
+            timeout = self.remaining()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                index, image = self._results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            slide = self._apply(index, image)
+            if slide is not None:
+                yield index, slide
+
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+            timed_out = sorted(self._outstanding.items())
+            self._outstanding.clear()
+
+        for index, slide in timed_out:
+            slide["has_image"] = False
+            yield index, slide
+
+
+async def resolve_images_async(slides, indices, resolve, max_concurrency=4, deadline=30.0):
+    """
+    Images of slides[index] for each index, like SlideImageBatch.drain(), as
+    coroutines on the running event loop: at most max_concurrency at once,
+    and slides not finished by the deadline get has_image False
+    resolve(query, index): coroutine function returning what a
+    SlideImageBatch's resolve returns
+    """
+    slots = asyncio.Semaphore(max(1, int(max_concurrency)))
+
+    async def run(index, query):
+        async with slots:
+            try:
+                return await resolve(query, index)
+            except Exception as e:
+                log("image_job_failed", logging.WARNING, slide=index + 1, error=str(e))
+                return None
+
+    jobs = {}
+    for index in indices:
+        query = (slides[index].get("image_search_query") or "").strip()
+        if query:
+            jobs[index] = asyncio.ensure_future(run(index, query))
+        else:
+            slides[index]["has_image"] = False
+    if not jobs:
+        return
+
+    _, unfinished = await asyncio.wait(jobs.values(), timeout=deadline)
+    for job in unfinished:
+        job.cancel()
+    for index, job in jobs.items():
+        apply_image(slides[index], job.result() if job not in unfinished else None)
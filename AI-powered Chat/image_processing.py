@@ -0,0 +1,135 @@
+"""
+Image processing stage for slide images and uploads.
+
+Every image is decoded once and stored as two variants instead of the bytes
+that were received:
+
+- a slide-sized JPEG (longest side at most 1600px), used by the slides
+  themselves and by exports
+- a small WebP thumbnail (longest side at most 320px) for the preview
+
+EXIF orientation is applied and all metadata (EXIF, GPS, ICC, comments) is
+dropped. Large JPEGs are reduced while decoding (Pillow's draft mode), so a
+12 megapixel photo never has to be decoded at full size.
+
+Variants are named after the SHA-256 of the source bytes, so the same image
+received twice is recognised without decoding it again. They are stored two
+directory levels deep by the first hex digits of that hash (ab/cd/img_...),
+so no directory ever holds more than a small share of the files.
+"""
+import hashlib
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from image_cache import write_atomic
+
+SLIDE_MAX_SIZE = 1600
+THUMB_MAX_SIZE = 320
+JPEG_QUALITY = 85
+WEBP_QUALITY = 75
+
+# Refuse decompression bombs (Pillow only warns below twice its own limit)
+MAX_PIXELS = 60_000_000
+
+
+class ImageProcessingError(ValueError):
+    """The bytes are not an image Pillow can decode, or it is too large"""
+
+
+def variant_names(source_digest):
+    """Paths, relative to the upload folder, of the slide-sized image and the thumbnail of a source"""
+    stem = f"{source_digest[:2]}/{source_digest[2:4]}/img_{source_digest[:32]}"
+    return f"{stem}.jpg", f"{stem}_thumb.webp"
+
+
+def _flatten(image):
+    """RGB version of an image, transparent areas on white"""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt, **options):
+    buf = BytesIO()
+    image.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def _describe(path):
+    """Size and hash of a stored variant, read from the file header and bytes"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    with Image.open(BytesIO(data)) as image:
+        width, height = image.size
+    return width, height, len(data), hashlib.sha256(data).hexdigest()
+
+
+def process_image(data, folder):
+    """
+    Store the slide-sized and thumbnail variants of image bytes in folder
+    Returns: {"filename", "thumbnail" (paths relative to folder), "meta": {width, height, bytes, sha256,
+    thumb_width, thumb_height, thumb_bytes, source_sha256, source_bytes}}
+    Raises: ImageProcessingError if the bytes can't be used
+    """
+    source_digest = hashlib.sha256(data).hexdigest()
+    filename, thumbnail = variant_names(source_digest)
+    slide_path = os.path.join(folder, filename)
+    thumb_path = os.path.join(folder, thumbnail)
+
+    if os.path.exists(slide_path) and os.path.exists(thumb_path):
+        # Seen before: no decode, just the headers for the metadata
+        width, height, size, digest = _describe(slide_path)
+        thumb_width, thumb_height, thumb_size, _ = _describe(thumb_path)
+    else:
+        try:
+            with Image.open(BytesIO(data)) as image:
+                if image.width * image.height > MAX_PIXELS:
+                    raise ImageProcessingError(f"Image too large ({image.width}x{image.height})")
+                scale = SLIDE_MAX_SIZE / max(image.size)
+                if scale < 1:
+                    # JPEG: let the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+                    image.draft('RGB', (int(image.width * scale), int(image.height * scale)))
+                image = _flatten(ImageOps.exif_transpose(image))
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageProcessingError("Cannot decode image, the file is damaged or not a supported format") from e
+
+        # Copies carry no EXIF/ICC into the encoders, so the output has no metadata
+        slide_image = image.copy()
+        slide_image.info = {}
+        slide_image.thumbnail((SLIDE_MAX_SIZE, SLIDE_MAX_SIZE), Image.LANCZOS)
+        thumb_image = slide_image.copy()
+        thumb_image.thumbnail((THUMB_MAX_SIZE, THUMB_MAX_SIZE), Image.LANCZOS)
+
+        slide_bytes = _encode(slide_image, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        thumb_bytes = _encode(thumb_image, 'WEBP', quality=WEBP_QUALITY, method=4)
+        os.makedirs(os.path.dirname(slide_path), exist_ok=True)
+        write_atomic(slide_path, slide_bytes)
+        write_atomic(thumb_path, thumb_bytes)
+
+        width, height = slide_image.size
+        size, digest = len(slide_bytes), hashlib.sha256(slide_bytes).hexdigest()
+        thumb_width, thumb_height = thumb_image.size
+        thumb_size = len(thumb_bytes)
+
+    return {
+        "filename": filename,
+        "thumbnail": thumbnail,
+        "meta": {
+            "width": width,
+            "height": height,
+            "bytes": size,
+            "sha256": digest,
+            "thumb_width": thumb_width,
+            "thumb_height": thumb_height,
+            "thumb_bytes": thumb_size,
+            "source_sha256": source_digest,
+            "source_bytes": len(data),
+        },
+    }
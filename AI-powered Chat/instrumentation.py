@@ -0,0 +1,337 @@
+"""
+Metrics and structured logs.
+
+Counters and histograms are kept in memory and rendered in the Prometheus
+text format by /metrics. They are per process: with several worker
+processes, scrape each one (or run a single process per metrics target).
+
+Log lines are JSON objects (LOG_FORMAT=text for a readable form) carrying
+the ID of the request, or job, they belong to. Records go through a queue
+and are written by a background thread, so a slow stdout never holds up a
+request.
+
+    with stage("llm_call") as span:
+        ...
+        span["outcome"] = "fallback"   # label of the observation
+        span["tokens"] = 1234          # extra field of the log line
+
+records the stage's duration in slides_stage_seconds{stage, provider,
+outcome} and logs one "stage" line with its fields.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Seconds: from a cache lookup to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes: from a small thumbnail to the upload limit
+BYTES_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 16_000_000)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Histogram:
+    """Cumulative histogram with labels (bucket counts, sum and count)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[slot] += 1
+            counts[-1] += value
+
+    def snapshot(self, **labels):
+        """
+        Totals of one label set
+        Returns: {"count": n, "sum": total}
+        """
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            if counts is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": sum(counts[:-1]), "sum": counts[-1]}
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])} "
+                             f"{cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(counts[-1], 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    The process's metrics, plus collectors that report gauges at scrape time
+    (for components that already keep their own counters, like the caches)
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, prefix, collect):
+        """
+        Report the numeric values of collect() (a stats dict) as gauges named
+        <prefix>_<key> on every scrape (registering a prefix again replaces
+        its collector, e.g. for an app created again)
+        """
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def render(self):
+        """
+        Everything in the Prometheus text exposition format (version 0.0.4)
+        Returns: str
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for prefix, collect in collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                log("collector_failed", logging.WARNING, collector=prefix, error=str(e))
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'slides_stage_seconds', 'Time spent in each stage of generating or editing a deck',
+    ('stage', 'provider', 'outcome')
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    'slides_http_request_seconds', 'HTTP request latency by endpoint',
+    ('method', 'endpoint', 'status')
+)
+IMAGE_DOWNLOAD_BYTES = REGISTRY.histogram(
+    'slides_image_download_bytes', 'Size of downloaded source images', (), BYTES_BUCKETS
+)
+LLM_TOKENS = REGISTRY.counter('slides_llm_tokens_total', 'Model tokens by direction', ('direction',))
+LLM_RETRIES = REGISTRY.counter('slides_llm_retries_total', 'Model request attempts that were retried')
+LLM_FAILURES = REGISTRY.counter('slides_llm_failures_total', 'Model requests that failed after retries', ('error',))
+
+
+@contextmanager
+def stage(name, provider='', **fields):
+    """
+    Time one stage: observe slides_stage_seconds and log a "stage" line
+    Yields a dict: set "outcome" to label the result (default "ok", or
+    "error" if the block raises), other keys are added to the log line.
+    """
+    span = {}
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span.setdefault("outcome", "error")
+        span.setdefault("error", str(e) or type(e).__name__)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        outcome = span.pop("outcome", "ok")
+        STAGE_SECONDS.observe(seconds, stage=name, provider=provider, outcome=outcome)
+        level = logging.WARNING if outcome == "error" else logging.INFO
+        extra = {"provider": provider} if provider else {}
+        log("stage", level, stage=name, outcome=outcome, duration_ms=round(seconds * 1000, 2),
+            **extra, **fields, **span)
+
+
+# Logging
+
+logger = logging.getLogger('slides')
+
+
+def log(event, level=logging.INFO, exc_info=None, **fields):
+    """Log one structured event (the request ID is added on the way out)"""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+
+def new_request_id(incoming=None):
+    """
+    Request ID to use: the caller's X-Request-ID if it looks sane, else a new one
+    Returns: str
+    """
+    if incoming and len(incoming) <= 64 and all(c.isalnum() or c in '-_.:' for c in incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, event, request_id and the event's fields"""
+
+    def format(self, record):
+        line = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            line["request_id"] = request_id
+        line.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable variant for development: time level [request] event key=value..."""
+
+    def format(self, record):
+        fields = ' '.join(f"{key}={value}" for key, value in (getattr(record, 'fields', None) or {}).items())
+        line = (f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} "
+                f"[{getattr(record, 'request_id', None) or '-'}] {record.getMessage()} {fields}").rstrip()
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that captures the request ID before the record leaves the thread"""
+
+    def prepare(self, record):
+        # In-process queue: keep exc_info for the formatter instead of
+        # pre-formatting the record like the base class does
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener = None
+
+
+def configure_logging(level='INFO', fmt='json', stream=None):
+    """
+    Send the 'slides' logger's records through a queue to a background
+    writer thread (call once at startup; later calls replace the setup)
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(_ContextQueueHandler(records))
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+
+@atexit.register
+def _flush_logs():
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,369 @@
+"""
+Background generation jobs.
+
+Jobs are rows in the generation_job table, so the queue is shared by every
+worker process on the same database and survives restarts. Worker threads
+claim jobs with a single atomic UPDATE, which picks, within the highest
+priority waiting:
+
+1. users with the fewest jobs already running,
+2. then each user's oldest job before anyone's second one,
+3. then the user whose last job started longest ago (or who never had
+   one), so users take turns even when jobs finish as fast as they start,
+4. then the oldest job.
+
+so one user queueing a hundred decks only ever gets their turn alongside
+everyone else instead of in front of them.
+
+A running job holds a lease that its process renews while it works on it.
+When a process dies, its leases run out and the jobs are queued again (or
+failed after max_attempts). Cancelling a queued job removes it from the
+queue; a running job is told to stop at its next check.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from instrumentation import log, request_id_var
+from models import GenerationJob, db
+
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 0
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Raised by check_cancelled() when the job was cancelled while running"""
+
+
+def job_dict(job):
+    """Public view of a job row"""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with fair scheduling across users
+
+    handlers: {kind: function(user_id, payload, check_cancelled) -> result dict}
+    Handlers run inside an app context; check_cancelled() raises JobCancelled
+    if the job should stop.
+    """
+
+    def __init__(self, app, handlers, workers=2, lease=300, max_attempts=3,
+                 poll_interval=1.0, retention=24 * 3600, fair=True):
+        self.app = app
+        self.handlers = handlers
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.fair = fair
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running = {}  # job id -> worker id
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.recovered = 0
+
+    # Producer side
+
+    def enqueue(self, user_id, kind, payload, priority=PRIORITY_NORMAL):
+        """
+        Add a job to the queue
+        Returns: job ID
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = GenerationJob(user_id=user_id, kind=kind, priority=priority, payload=json.dumps(payload))
+        db.session.add(job)
+        db.session.commit()
+        self._wake.set()
+        return job.id
+
+    def get(self, user_id, job_id):
+        """
+        One of the user's jobs
+        Returns: job dict, or None if it doesn't exist or belongs to someone else
+        """
+        job = GenerationJob.query.filter_by(id=job_id, user_id=user_id).first()
+        return job_dict(job) if job else None
+
+    def cancel(self, user_id, job_id):
+        """
+        Cancel one of the user's jobs: queued jobs are dropped at once,
+        running jobs stop at their next check
+        Returns: the job's status afterwards, or None if it doesn't exist
+        """
+        now = datetime.utcnow()
+        dropped = db.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id, GenerationJob.user_id == user_id, GenerationJob.status == 'queued')
+            .values(status='cancelled', cancel_requested=True, finished_at=now)
+        ).rowcount
+        if not dropped:
+            db.session.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id, GenerationJob.user_id == user_id, GenerationJob.status == 'running')
+                .values(cancel_requested=True)
+            )
+        db.session.commit()
+        if dropped:
+            with self._lock:
+                self.cancelled += 1
+        status = db.session.query(GenerationJob.status).filter_by(id=job_id, user_id=user_id).scalar()
+        return status
+
+    # Worker side
+
+    def claim(self, worker_id):
+        """
+        Take the next job for a worker
+        Returns: (job ID, user ID, kind, payload) or None if nothing is queued
+        """
+        queued = select(GenerationJob.id).where(GenerationJob.status == 'queued').limit(1)
+        if db.session.execute(queued).first() is None:
+            # Nothing to do: don't take the write lock just to find out
+            db.session.rollback()
+            return None
+
+        if self.fair:
+            turn = func.row_number().over(
+                partition_by=GenerationJob.user_id,
+                order_by=(GenerationJob.priority.desc(), GenerationJob.id)
+            )
+            waiting = select(
+                GenerationJob.id, GenerationJob.user_id, GenerationJob.priority, turn.label('turn')
+            ).where(GenerationJob.status == 'queued').subquery()
+            running = select(
+                GenerationJob.user_id, func.count().label('running')
+            ).where(GenerationJob.status == 'running').group_by(GenerationJob.user_id).subquery()
+            # When each waiting user last had a job started (never: first)
+            served = select(
+                GenerationJob.user_id, func.max(GenerationJob.started_at).label('last_started')
+            ).where(
+                GenerationJob.user_id.in_(select(GenerationJob.user_id).where(GenerationJob.status == 'queued'))
+            ).group_by(GenerationJob.user_id).subquery()
+            next_job = select(waiting.c.id).outerjoin(
+                running, waiting.c.user_id == running.c.user_id
+            ).outerjoin(served, waiting.c.user_id == served.c.user_id).order_by(
+                waiting.c.priority.desc(), func.coalesce(running.c.running, 0), waiting.c.turn,
+                served.c.last_started.asc().nulls_first(), waiting.c.id
+            ).limit(1).scalar_subquery()
+        else:
+            next_job = select(GenerationJob.id).where(GenerationJob.status == 'queued').order_by(
+                GenerationJob.priority.desc(), GenerationJob.id
+            ).limit(1).scalar_subquery()
+
+        now = datetime.utcnow()
+        row = db.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == next_job, GenerationJob.status == 'queued')
+            .values(status='running', worker_id=worker_id, started_at=now,
+                    lease_expires_at=now + timedelta(seconds=self.lease),
+                    attempts=GenerationJob.attempts + 1)
+            .returning(GenerationJob.id, GenerationJob.user_id, GenerationJob.kind, GenerationJob.payload)
+        ).first()
+        db.session.commit()
+        if row is None:
+            return None
+        with self._lock:
+            self._running[row.id] = worker_id
+        return row.id, row.user_id, row.kind, json.loads(row.payload)
+
+    def _finish(self, job_id, worker_id, status, result=None, error=None):
+        # Only the worker holding the job may finish it (its lease may have been taken over)
+        db.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id, GenerationJob.worker_id == worker_id,
+                   GenerationJob.status == 'running')
+            .values(status=status, result=json.dumps(result) if result is not None else None,
+                    error=error, finished_at=datetime.utcnow(), lease_expires_at=None)
+        )
+        db.session.commit()
+        with self._lock:
+            self._running.pop(job_id, None)
+            if status == 'done':
+                self.completed += 1
+            elif status == 'failed':
+                self.failed += 1
+            else:
+                self.cancelled += 1
+
+    def run_one(self, worker_id):
+        """
+        Claim and run a single job
+        Returns: True if a job was run
+        """
+        claimed = self.claim(worker_id)
+        if claimed is None:
+            return False
+        job_id, user_id, kind, payload = claimed
+        # Logs of the job's stages carry job-<id> instead of a request ID
+        token = request_id_var.set(f"job-{job_id}")
+        try:
+            self._run_claimed(worker_id, job_id, user_id, kind, payload)
+        finally:
+            request_id_var.reset(token)
+        return True
+
+    def _run_claimed(self, worker_id, job_id, user_id, kind, payload):
+        def check_cancelled():
+            # Own connection: the handler's transaction may still see an older snapshot
+            with db.engine.connect() as connection:
+                requested = connection.execute(
+                    select(GenerationJob.cancel_requested).where(GenerationJob.id == job_id)
+                ).scalar()
+            if requested:
+                raise JobCancelled()
+
+        log("job_started", job_id=job_id, kind=kind, user_id=user_id, worker=worker_id)
+        try:
+            result = self.handlers[kind](user_id, payload, check_cancelled)
+        except JobCancelled:
+            db.session.rollback()
+            log("job_cancelled", job_id=job_id, kind=kind)
+            self._finish(job_id, worker_id, 'cancelled')
+        except Exception as e:
+            db.session.rollback()
+            log("job_failed", logging.ERROR, exc_info=True, job_id=job_id, kind=kind, error=str(e))
+            self._finish(job_id, worker_id, 'failed', error=str(e))
+        else:
+            log("job_done", job_id=job_id, kind=kind)
+            self._finish(job_id, worker_id, 'done', result=result)
+
+    def recover(self):
+        """
+        Requeue running jobs whose lease ran out (their process died), or
+        fail them once they used up max_attempts
+        Returns: number of jobs recovered
+        """
+        now = datetime.utcnow()
+        expired = (GenerationJob.status == 'running', GenerationJob.lease_expires_at < now)
+        failed = db.session.execute(
+            update(GenerationJob)
+            .where(*expired, GenerationJob.attempts >= self.max_attempts)
+            .values(status='failed', error='Worker lost (too many attempts)', finished_at=now, worker_id=None)
+        ).rowcount
+        requeued = db.session.execute(
+            update(GenerationJob)
+            .where(*expired)
+            .values(status='queued', worker_id=None, lease_expires_at=None)
+        ).rowcount
+        db.session.commit()
+        if requeued or failed:
+            log("jobs_recovered", logging.WARNING, requeued=requeued, failed=failed)
+            with self._lock:
+                self.recovered += requeued
+                self.failed += failed
+            self._wake.set()
+        return requeued + failed
+
+    def renew_leases(self):
+        """Extend the leases of the jobs this process is running"""
+        with self._lock:
+            running = dict(self._running)
+        if not running:
+            return
+        db.session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id.in_(running), GenerationJob.status == 'running')
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease))
+        )
+        db.session.commit()
+
+    def prune(self):
+        """Delete finished jobs older than the retention period"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        GenerationJob.query.filter(
+            GenerationJob.status.in_(FINISHED), GenerationJob.finished_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    # Threads
+
+    def _worker(self, index):
+        worker_id = f"{self.process_id}:{index}"
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self.run_one(worker_id)
+            except Exception as e:
+                log("job_worker_error", logging.ERROR, worker=worker_id, error=str(e))
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _housekeeping(self):
+        interval = max(1.0, self.lease / 4)
+        while not self._stop.wait(interval):
+            try:
+                with self.app.app_context():
+                    self.renew_leases()
+                    self.recover()
+                    self.prune()
+            except Exception as e:
+                log("job_housekeeping_error", logging.ERROR, error=str(e))
+
+    def start(self):
+        """Start the worker threads and the lease/recovery thread (once)"""
+        with self._lock:
+            if self._threads:
+                return
+            self._start_threads()
+
+    def _start_threads(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, args=(index,), name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._housekeeping, name='job-housekeeping', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the threads after their current job"""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+        self._stop.clear()
+
+    def stats(self):
+        counts = dict(db.session.query(GenerationJob.status, func.count()).group_by(GenerationJob.status).all())
+        with self._lock:
+            return {
+                "queued": counts.get('queued', 0),
+                "running": counts.get('running', 0),
+                "workers": self.workers,
+                "running_here": len(self._running),
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "recovered": self.recovered,
+            }
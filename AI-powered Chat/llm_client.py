@@ -0,0 +1,455 @@
+"""
+Generation client used by every route that calls the model.
+
+LLMClient wraps a backend with what a bare generate_content() call lacks:
+
+- a timeout on every call (the Gemini SDK in use has no per-request
+  timeout, so calls run on the client's own threads and are abandoned when
+  they take too long)
+- retries with exponential backoff and full jitter on retryable errors
+  (429, 5xx, timeouts, dropped connections)
+- a cap on requests in flight, shared by sync, streaming and async calls
+- token and latency accounting, reported by stats() and, with retries and
+  failures, to the process metrics (instrumentation.py)
+
+Backends:
+
+- GeminiBackend: google-generativeai, imported and configured on first use
+  so a missing GEMINI_API_KEY no longer stops the app from starting. One
+  GenerativeModel per process, so its gRPC channel is reused by all calls.
+- StubBackend: deterministic local answers with configurable latency and
+  failure rate, for load tests and CI without network access or an API key.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from queue import Empty, Queue
+
+from instrumentation import LLM_FAILURES, LLM_RETRIES, LLM_TOKENS, log
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """A generation failed; status is the HTTP status to answer with"""
+    status = 502
+
+
+class LLMTimeout(LLMError):
+    status = 504
+
+
+class LLMBusy(LLMError):
+    """Too many requests in flight for longer than the timeout"""
+    status = 503
+
+
+def approx_tokens(text):
+    """Rough token count (4 characters per token) when the backend reports none"""
+    return max(1, len(text or '') // 4)
+
+
+def is_retryable(error):
+    if isinstance(error, (LLMTimeout, ConnectionError, TimeoutError)):
+        return True
+    # google.api_core exceptions and StubBackendError carry the HTTP status as .code
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+
+class Generation:
+    """Result of one generate() call"""
+
+    def __init__(self, text, prompt_tokens, output_tokens, latency, attempts):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.latency = latency
+        self.attempts = attempts
+
+
+class GeminiBackend:
+    name = 'gemini'
+
+    def __init__(self, model_name, api_key):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                if not self.api_key:
+                    raise LLMError("GEMINI_API_KEY not found in environment variables")
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    @staticmethod
+    def _usage(response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return None
+        return usage.prompt_token_count, usage.candidates_token_count
+
+    def generate(self, prompt):
+        response = self.model().generate_content(prompt)
+        return response.text, self._usage(response)
+
+    def stream(self, prompt):
+        for chunk in self.model().generate_content(prompt, stream=True):
+            yield chunk.text
+
+    async def agenerate(self, prompt):
+        response = await self.model().generate_content_async(prompt)
+        return response.text, self._usage(response)
+
+
+class StubBackendError(Exception):
+    """Injected failure of the stub backend"""
+
+    def __init__(self, code):
+        super().__init__(f"Stub backend failure ({code})")
+        self.code = code
+
+
+class StubBackend:
+    """
+    Local stand-in for the model. Answers come from responder(prompt), by
+    default stub_response(); failures are drawn from a seeded RNG, so a run
+    with the same seed and call order fails the same calls.
+    """
+    name = 'stub'
+    model_name = 'stub'
+
+    def __init__(self, latency=0.5, failure_rate=0.0, seed=0, responder=None, chunk_size=64):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.responder = responder or stub_response
+        self.chunk_size = chunk_size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self._lock:
+            roll = self._rng.random()
+            code = self._rng.choice((429, 503))
+        if roll < self.failure_rate:
+            raise StubBackendError(code)
+
+    def generate(self, prompt):
+        self._maybe_fail()
+        time.sleep(self.latency)
+        return self.responder(prompt), None
+
+    def stream(self, prompt):
+        self._maybe_fail()
+        text = self.responder(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+        # Spread the latency over the chunks like a streaming model would
+        for chunk in chunks:
+            time.sleep(self.latency / len(chunks))
+            yield chunk
+
+    async def agenerate(self, prompt):
+        self._maybe_fail()
+        await asyncio.sleep(self.latency)
+        return self.responder(prompt), None
+
+
+def stub_response(prompt):
+    """
+    Deterministic answer in the format the prompt asks for: a new deck, a
+    JSON patch for /update, or the full edited deck
+    Returns: model-style text (JSON in a ```json fence)
+    """
+    instruction = re.search(r'User wants to: (.*)', prompt)
+    instruction = instruction.group(1).strip() if instruction else ''
+
+    if 'Respond ONLY with a JSON patch' in prompt:
+        targeted = json.loads(prompt.split('when slides are only being added):', 1)[1].split('\n', 2)[1])
+        patch = []
+        for number, slide in targeted.items():
+            slide = dict(slide)
+            slide['content'] = list(slide.get('content', [])) + [f"Updated: {instruction}"]
+            patch.append({"op": "replace", "slide": int(number), "data": slide})
+        if not patch:
+            count = int(re.search(r'The deck has (\d+) slides', prompt).group(1))
+            patch.append({"op": "insert", "after": count, "data": {
+                "title": instruction[:60] or "New Slide",
+                "content": [f"Added: {instruction}"],
+                "image_search_query": instruction[:60]
+            }})
+        answer = {"patch": patch, "message": f"Applied: {instruction}"}
+    elif 'Current slides:' in prompt:
+        slides = json.loads(prompt.split('Current slides:', 1)[1].split('\n', 2)[1])
+        answer = {"slides": slides, "message": f"Applied: {instruction}"}
+    else:
+        topic = prompt.rsplit('User request:', 1)[-1].strip() or 'your topic'
+        count = re.search(r'\b(\d+)\s+slides?\b', topic)
+        count = min(int(count.group(1)), 50) if count else 5
+        answer = {
+            "slides": [
+                {
+                    "title": f"{topic[:60].title()} - Part {i + 1}",
+                    "content": [f"Key point {j + 1} about {topic[:60]}" for j in range(3)],
+                    "image_search_query": f"{topic[:60]} {i + 1}",
+                    "image_position": "background" if i == 0 else "right"
+                }
+                for i in range(count)
+            ],
+            "message": f"Created {count} slides about {topic[:60]}."
+        }
+    return "```json\n" + json.dumps(answer, indent=2) + "\n```"
+
+
+class LLMClient:
+    """Timeouts, retries, an in-flight cap and accounting around a backend"""
+
+    def __init__(self, backend, timeout=60.0, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, max_in_flight=8, seed=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='llm')
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = dict.fromkeys((
+            'requests', 'failures', 'retries', 'timeouts', 'busy',
+            'prompt_tokens', 'output_tokens', 'in_flight', 'peak_in_flight'
+        ), 0)
+
+    @property
+    def model_name(self):
+        return self.backend.model_name
+
+    # Accounting
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+            self._counters['peak_in_flight'] = max(self._counters['peak_in_flight'], self._counters['in_flight'])
+
+    def _finish(self, started, prompt, text, usage, attempts):
+        latency = time.perf_counter() - started
+        prompt_tokens, output_tokens = usage or (approx_tokens(prompt), approx_tokens(text))
+        with self._lock:
+            self._latencies.append(latency)
+        self._count(requests=1, prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+        LLM_TOKENS.inc(prompt_tokens, direction='prompt')
+        LLM_TOKENS.inc(output_tokens, direction='output')
+        return Generation(text, prompt_tokens, output_tokens, latency, attempts)
+
+    def _failed(self, error, attempt):
+        """
+        Decide whether to retry after a failed attempt
+        Returns: seconds to wait before the next attempt
+        Raises: LLMError when the error is final
+        """
+        if isinstance(error, LLMTimeout):
+            self._count(timeouts=1)
+        if attempt > self.max_retries or not is_retryable(error):
+            self._count(requests=1, failures=1)
+            LLM_FAILURES.inc(error=type(error).__name__)
+            if isinstance(error, LLMError):
+                raise error
+            raise LLMError(f"Model request failed: {error}") from error
+        self._count(retries=1)
+        LLM_RETRIES.inc()
+        # Full jitter: anywhere between 0 and the exponential cap
+        cap = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        with self._lock:
+            wait = self._rng.uniform(0, cap)
+        log("llm_retry", logging.WARNING, attempt=attempt, error=str(error), wait_s=round(wait, 2))
+        return wait
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count(busy=1)
+            raise LLMBusy("Too many model requests in flight, try again shortly")
+        self._count(in_flight=1)
+
+    def _release(self):
+        self._count(in_flight=-1)
+        self._slots.release()
+
+    # Sync
+
+    def _call(self, prompt):
+        self._acquire()
+
+        def run():
+            try:
+                return self.backend.generate(prompt)
+            finally:
+                # The slot is held until the backend really returns, even
+                # after the caller has given up on it
+                self._release()
+
+        future = self._executor.submit(run)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise LLMTimeout(f"Model did not answer within {self.timeout:g}s")
+
+    def generate(self, prompt):
+        """
+        Generate a completion, retrying retryable failures
+        Returns: Generation
+        Raises: LLMError (LLMTimeout, LLMBusy) once retries are exhausted
+        """
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                text, usage = self._call(prompt)
+                return self._finish(started, prompt, text, usage, attempt)
+            except Exception as error:
+                time.sleep(self._failed(error, attempt))
+
+    def stream(self, prompt):
+        """
+        Generate a completion as text chunks. Failures before the first chunk
+        are retried; the timeout applies to the wait for each chunk.
+        Returns: iterator of strings
+        """
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            parts = []
+            try:
+                for chunk in self._stream_once(prompt):
+                    parts.append(chunk)
+                    yield chunk
+                self._finish(started, prompt, ''.join(parts), None, attempt)
+                return
+            except Exception as error:
+                if parts:
+                    # Already sent to the caller, can't start over
+                    self._count(requests=1, failures=1, timeouts=int(isinstance(error, LLMTimeout)))
+                    LLM_FAILURES.inc(error=type(error).__name__)
+                    if isinstance(error, LLMError):
+                        raise
+                    raise LLMError(f"Model stream failed: {error}") from error
+                time.sleep(self._failed(error, attempt))
+
+    def _stream_once(self, prompt):
+        self._acquire()
+        chunks = Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for chunk in self.backend.stream(prompt):
+                    if stop.is_set():
+                        break
+                    chunks.put(('chunk', chunk))
+                chunks.put(('end', None))
+            except Exception as error:
+                chunks.put(('error', error))
+            finally:
+                self._release()
+
+        self._executor.submit(produce)
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=self.timeout)
+                except Empty:
+                    raise LLMTimeout(f"Model stream stalled for {self.timeout:g}s")
+                if kind == 'end':
+                    return
+                if kind == 'error':
+                    raise value
+                yield value
+        finally:
+            # Also reached when the consumer stops early (client went away)
+            stop.set()
+
+    # Async
+
+    async def _aacquire(self):
+        deadline = time.monotonic() + self.timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self._count(busy=1)
+                raise LLMBusy("Too many model requests in flight, try again shortly")
+            await asyncio.sleep(0.01)
+        self._count(in_flight=1)
+
+    async def agenerate(self, prompt):
+        """Async generate(), for use from an event loop"""
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self._aacquire()
+                try:
+                    text, usage = await asyncio.wait_for(self.backend.agenerate(prompt), self.timeout)
+                except asyncio.TimeoutError:
+                    raise LLMTimeout(f"Model did not answer within {self.timeout:g}s")
+                finally:
+                    self._release()
+                return self._finish(started, prompt, text, usage, attempt)
+            except Exception as error:
+                await asyncio.sleep(self._failed(error, attempt))
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def percentile(pct):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1000, 1)
+
+        counters.update({
+            "backend": self.backend.name,
+            "model": self.model_name,
+            "max_in_flight": self.max_in_flight,
+            "latency_p50_ms": percentile(50),
+            "latency_p99_ms": percentile(99),
+        })
+        return counters
+
+
+def client_from_config(config):
+    """
+    Build the LLM client from the app config (LLM_* and GEMINI_* settings)
+    Returns: LLMClient
+    """
+    if config['LLM_BACKEND'] == 'stub':
+        backend = StubBackend(
+            latency=config['LLM_STUB_LATENCY'],
+            failure_rate=config['LLM_STUB_FAILURE_RATE'],
+            seed=config['LLM_STUB_SEED']
+        )
+    elif config['LLM_BACKEND'] == 'gemini':
+        backend = GeminiBackend(config['GEMINI_MODEL'], config['GEMINI_API_KEY'])
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND {config['LLM_BACKEND']!r} (expected 'gemini' or 'stub')")
+
+    return LLMClient(
+        backend,
+        timeout=config['LLM_TIMEOUT'],
+        max_retries=config['LLM_MAX_RETRIES'],
+        max_in_flight=config['LLM_MAX_IN_FLIGHT']
+    )
@@ -0,0 +1,359 @@
+"""
+Tolerant, incremental parsing of the JSON the model returns.
+
+The model is asked for {"slides": [{...}, {...}], "message": "..."}, but what
+comes back is often wrapped in a ```json block, surrounded by prose, cut off
+before the end, or sprinkled with trailing commas. Instead of failing (and
+paying for a full re-generation), this module repairs those faults:
+
+- parse_model_json() parses a complete response
+- SlideStreamParser consumes a streamed response chunk by chunk and returns
+  every slide object as soon as its closing brace arrives
+"""
+import json
+import re
+
+# How many candidate document starts to try before giving up on a response
+MAX_START_CANDIDATES = 5
+
+_decoder = json.JSONDecoder(strict=False)
+
+# Characters the streaming scanner has to look at in each state
+_STRING_SPECIAL = re.compile(r'["\\]')
+_STRUCTURAL = re.compile(r'[{}\[\]":]')
+_DOCUMENT_START = re.compile(r'[{\[]')
+
+
+class ModelOutputError(ValueError):
+    """Raised when no JSON document can be recovered from model output"""
+
+
+def _candidate_starts(text):
+    """
+    Positions where the JSON document may start, best guess first
+    Returns: list of (position, whether the bracket there is at the top
+    level rather than nested in an earlier one)
+    """
+    fence = text.find("```json")
+    offset = fence + 7 if fence != -1 else 0
+
+    starts = []
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(offset, len(text)):
+        c = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c in '{[':
+            starts.append((i, depth == 0))
+            if len(starts) == MAX_START_CANDIDATES:
+                break
+            depth += 1
+        elif c in '}]':
+            depth = max(depth - 1, 0)
+        elif c == '"' and depth:
+            # Quotes in the prose around the document don't open strings
+            in_string = True
+    if fence != -1 and not starts:
+        # ```json marker without a document after it, search the whole text
+        return _candidate_starts(text[:fence])
+    return starts
+
+
+def repair_json(text, start=0):
+    """
+    Rewrite a possibly broken JSON document starting at text[start] into
+    valid JSON: prose after the document, // comments and trailing commas
+    are dropped, raw newlines in strings are escaped and an unterminated
+    document is closed. A truncated final member is cut off.
+    Returns: list of candidate strings, most complete first
+    """
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    # (length of out, open containers) after the last complete member
+    checkpoint = None
+
+    i = start
+    n = len(text)
+    while i < n:
+        c = text[i]
+
+        if in_string:
+            if escape:
+                escape = False
+                out.append(c)
+            elif c == '\\':
+                escape = True
+                out.append(c)
+            elif c == '"':
+                in_string = False
+                out.append(c)
+            elif c == '\n':
+                out.append('\\n')
+            elif c == '\r':
+                out.append('\\r')
+            elif c == '\t':
+                out.append('\\t')
+            else:
+                out.append(c)
+            i += 1
+            continue
+
+        if c == '"':
+            in_string = True
+            out.append(c)
+        elif c in '{[':
+            stack.append('}' if c == '{' else ']')
+            out.append(c)
+        elif c in '}]':
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                return [''.join(out)]
+        elif c == ',':
+            _strip_trailing_comma(out)
+            checkpoint = (len(out), list(stack))
+            out.append(c)
+        elif c == '/' and text.startswith('//', i):
+            # Line comment
+            newline = text.find('\n', i)
+            i = n if newline == -1 else newline
+            continue
+        elif c == '`':
+            # Closing ``` fence inside an unterminated document
+            break
+        else:
+            out.append(c)
+        i += 1
+
+    # The document was cut off, close whatever is still open
+    candidates = []
+    tail = list(out)
+    if in_string:
+        if escape:
+            tail.pop()
+        tail.append('"')
+    candidates.append(_close(tail, stack))
+    if checkpoint is not None:
+        length, open_stack = checkpoint
+        candidates.append(_close(out[:length], open_stack))
+    return candidates
+
+
+def _strip_trailing_comma(out):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ',':
+        del out[j:]
+
+
+def _close(out, stack):
+    out = list(out)
+    # Drop a dangling separator left by the truncation
+    while out and (out[-1].isspace() or out[-1] in ',:'):
+        out.pop()
+    for closer in reversed(stack):
+        out.append(closer)
+    return ''.join(out)
+
+
+def _loads(candidate):
+    try:
+        return _decoder.decode(candidate)
+    except json.JSONDecodeError:
+        return None
+
+
+def _is_patch_op(item):
+    return "op" in item
+
+
+def _is_value_of(text, start, key):
+    """Whether the bracket at text[start] opens the value of "key" in an object"""
+    return re.search(r'"%s"\s*:\s*$' % re.escape(key), text[max(start - len(key) - 40, 0):start]) is not None
+
+
+def normalize_document(value, key="slides", wrap_list=True):
+    """
+    Coerce a parsed value into {key: [...], "message": ...}. A list is taken
+    as the key's list only with wrap_list: when it is the whole document or
+    the key's value in an object that can't be parsed, not when it belongs
+    to some other key. Items must have the key's shape, patch operations
+    ("op") or slides (no "op"), so a full deck isn't read as a patch, nor a
+    patch as a deck.
+    Returns: dict or None if the value does not look like a deck
+    """
+    if isinstance(value, list) and wrap_list:
+        value = {key: value}
+    if not isinstance(value, dict):
+        return None
+    items = value.get(key)
+    if not isinstance(items, list):
+        return None
+    items = [item for item in items if isinstance(item, dict)]
+    if any(_is_patch_op(item) != (key == "patch") for item in items):
+        return None
+    value[key] = items
+    return value
+
+
+def parse_model_json(text, key="slides"):
+    """
+    Parse a complete model response into a deck document
+    key: name of the list the document must contain ("slides", or "patch"
+    for patch-mode edits)
+    Returns: dict with the key's list (and "message" if the model sent one)
+    Raises: ModelOutputError if nothing usable can be recovered
+    """
+    for start, top_level in _candidate_starts(text):
+        wrap_list = top_level or _is_value_of(text, start, key)
+        # Fast path: a valid document, possibly followed by prose or a fence
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            value = None
+        document = normalize_document(value, key, wrap_list)
+        if document is not None:
+            return document
+
+        for candidate in repair_json(text, start):
+            document = normalize_document(_loads(candidate), key, wrap_list)
+            if document is not None:
+                return document
+
+    raise ModelOutputError(f"No JSON with a \"{key}\" list found in model response")
+
+
+class SlideStreamParser:
+    """Character-level scanner that emits complete slide objects"""
+
+    def __init__(self):
+        self.text = ""
+        self.slides = []
+        self.done = False
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._slides_depth = None
+        self._slide_start = None
+
+    def feed(self, chunk):
+        """
+        Add a chunk of model output
+        Returns: list of slide dicts completed by this chunk
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+        stack = self._stack
+
+        i = self._pos
+        n = len(text)
+        while i < n and not self.done:
+            if self._in_string:
+                if self._escape:
+                    # Escaped character split across two chunks
+                    self._escape = False
+                    i += 1
+                    continue
+                # Jump to the next quote or backslash
+                match = _STRING_SPECIAL.search(text, i)
+                if match is None:
+                    i = n
+                    break
+                i = match.start()
+                if text[i] == '\\':
+                    if i + 1 < n:
+                        i += 2
+                    else:
+                        self._escape = True
+                        i = n
+                    continue
+                self._in_string = False
+                self._last_string = text[self._string_start + 1:i]
+                i += 1
+                continue
+
+            # Outside strings only brackets, quotes and colons matter; before
+            # the document starts (prose or a ``` fence) only brackets do
+            match = (_STRUCTURAL if stack else _DOCUMENT_START).search(text, i)
+            if match is None:
+                i = n
+                break
+            i = match.start()
+            c = text[i]
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in '{[':
+                stack.append(c)
+                if c == '[' and self._slides_depth is None:
+                    # Either a bare array of slides or the value of "slides"
+                    if len(stack) == 1 or (len(stack) == 2 and stack[0] == '{' and self._key == 'slides'):
+                        self._slides_depth = len(stack)
+                elif c == '{' and self._slides_depth is not None and len(stack) == self._slides_depth + 1:
+                    self._slide_start = i
+            elif c in '}]':
+                if stack:
+                    stack.pop()
+                if c == '}' and self._slide_start is not None and len(stack) == self._slides_depth:
+                    slide = self._decode(text[self._slide_start:i + 1])
+                    if slide is not None:
+                        self.slides.append(slide)
+                        completed.append(slide)
+                    self._slide_start = None
+                elif c == ']' and self._slides_depth is not None and len(stack) < self._slides_depth:
+                    self._slides_depth = None
+                if not stack:
+                    if self.slides:
+                        self.done = True
+                    else:
+                        # Bracketed prose like "[Draft]", keep looking for the deck
+                        self._key = None
+            elif c == ':' and len(stack) == 1:
+                self._key = self._last_string
+            i += 1
+
+        self._pos = i
+        return completed
+
+    @staticmethod
+    def _decode(fragment):
+        value = _loads(fragment)
+        if value is None:
+            for candidate in repair_json(fragment):
+                value = _loads(candidate)
+                if value is not None:
+                    break
+        return value if isinstance(value, dict) else None
+
+    def document(self):
+        """
+        The full parsed document once the stream has ended. Slides already
+        emitted are kept even if the rest of the response is unusable.
+        Returns: dict with "slides" (and "message" when the model sent one)
+        """
+        try:
+            result = parse_model_json(self.text)
+        except ModelOutputError:
+            return {"slides": list(self.slides)}
+        if len(result["slides"]) < len(self.slides):
+            result["slides"] = list(self.slides)
+        return result
+
@@ -0,0 +1,305 @@
+"""
+Image files in the upload folder, and which decks use them.
+
+Every file the app stores (downloaded slide images, uploads, and their
+thumbnails) is a row in media_file, and every deck that shows it a row in
+media_ref. media_file.ref_count is the number of those rows; PresentationStore
+keeps both in step with the deck in the same transaction (sync_deck_media,
+release_deck_media).
+
+A file no deck uses - its last deck was deleted or edited, or no deck picked
+it up yet (a fresh upload, the images of a deck that failed) - carries
+orphaned_at, and MediaSweeper deletes it once it has been unused for the
+grace period. Keep the grace period at least as long as the image cache TTL,
+so a file the image cache can still hand out is never deleted.
+
+Quotas: a user's usage is the size of the files their decks show - counted
+once per deck, as if each deck had its own copy, so deleting a deck always
+frees what it used - plus the unused files they stored themselves. The deck
+part is a running total in user.media_bytes, updated with the references, so
+checking a quota never sums a user's files.
+
+Files written before this table existed are unknown to it, so they are never
+swept; `flask backfill-media` registers them.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from instrumentation import log
+from models import MediaFile, MediaRef, User, db
+
+UPLOAD_URL_PREFIX = '/static/uploads/'
+
+
+def media_path(url):
+    """
+    Path of an uploads URL relative to the upload folder
+    Returns: path, or None for other URLs and paths that would leave the folder
+    """
+    if not isinstance(url, str) or not url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    path = url[len(UPLOAD_URL_PREFIX):]
+    if '\\' in path or any(part in ('', '.', '..') for part in path.split('/')):
+        return None
+    return path
+
+
+def deck_media_paths(slides):
+    """Upload folder paths of the images and thumbnails shown by a deck"""
+    paths = set()
+    for slide in slides:
+        if not isinstance(slide, dict):
+            continue
+        for key in ('image_url', 'thumbnail_url'):
+            path = media_path(slide.get(key))
+            if path:
+                paths.add(path)
+    return paths
+
+
+def register_media(files, owner_id=None):
+    """
+    Record stored files, [(path, bytes)], as unused for now. A known file
+    that no deck uses starts its grace period again (caller commits).
+    """
+    if not files:
+        return
+    now = datetime.utcnow()
+    statement = sqlite_insert(MediaFile).values([
+        {"path": path, "bytes": size, "owner_id": owner_id, "ref_count": 0, "created_at": now, "orphaned_at": now}
+        for path, size in files
+    ])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[MediaFile.path],
+        set_={"orphaned_at": case((MediaFile.ref_count == 0, statement.excluded.orphaned_at), else_=None)}
+    ))
+
+
+def _file_sizes(folder, paths):
+    sizes = []
+    for path in paths:
+        try:
+            sizes.append((path, os.path.getsize(os.path.join(folder, path))))
+        except OSError:
+            continue
+    return sizes
+
+
+def _media_ids(paths):
+    if not paths:
+        return {}
+    return dict(db.session.execute(select(MediaFile.path, MediaFile.id).where(MediaFile.path.in_(paths))).all())
+
+
+def _charge(user_id, amount):
+    if amount:
+        db.session.execute(update(User).where(User.id == user_id).values(media_bytes=User.media_bytes + amount))
+
+
+def _release(user_id, refs):
+    """Decrement the reference counts of [(media ID, bytes)] a deck stopped using"""
+    if not refs:
+        return
+    media_ids = [media_id for media_id, _ in refs]
+    _charge(user_id, -sum(size for _, size in refs))
+    db.session.execute(
+        update(MediaFile).where(MediaFile.id.in_(media_ids)).values(ref_count=MediaFile.ref_count - 1)
+    )
+    db.session.execute(
+        update(MediaFile).where(MediaFile.id.in_(media_ids), MediaFile.ref_count <= 0)
+        .values(ref_count=0, orphaned_at=datetime.utcnow())
+    )
+
+
+def sync_deck_media(presentation_id, user_id, slides, folder=None):
+    """
+    Make a deck's references match the files its slides show (caller
+    commits). Files not registered yet are, from their size on disk in
+    folder, if it is given.
+    """
+    wanted = deck_media_paths(slides)
+    current = {path: (media_id, size) for path, media_id, size in db.session.execute(
+        select(MediaFile.path, MediaRef.media_id, MediaRef.bytes).join(MediaRef, MediaRef.media_id == MediaFile.id)
+        .where(MediaRef.presentation_id == presentation_id)
+    ).all()}
+
+    added = wanted - current.keys()
+    if added:
+        known = _media_ids(added)
+        if folder and len(known) < len(added):
+            register_media(_file_sizes(folder, added - known.keys()), user_id)
+            known = _media_ids(added)
+        if known:
+            sizes = db.session.execute(
+                select(MediaFile.id, MediaFile.bytes).where(MediaFile.id.in_(known.values()))
+            ).all()
+            db.session.execute(insert(MediaRef), [
+                {"presentation_id": presentation_id, "media_id": media_id, "bytes": size}
+                for media_id, size in sizes
+            ])
+            db.session.execute(
+                update(MediaFile).where(MediaFile.id.in_(known.values()))
+                .values(ref_count=MediaFile.ref_count + 1, orphaned_at=None)
+            )
+            _charge(user_id, sum(size for _, size in sizes))
+
+    removed = [current[path] for path in current.keys() - wanted]
+    if removed:
+        db.session.execute(delete(MediaRef).where(
+            MediaRef.presentation_id == presentation_id, MediaRef.media_id.in_([media_id for media_id, _ in removed])
+        ))
+        _release(user_id, removed)
+
+
+def release_deck_media(presentation_id, user_id):
+    """Drop every reference of a deck that is being deleted (caller commits)"""
+    refs = db.session.execute(
+        select(MediaRef.media_id, MediaRef.bytes).where(MediaRef.presentation_id == presentation_id)
+    ).all()
+    if refs:
+        db.session.execute(delete(MediaRef).where(MediaRef.presentation_id == presentation_id))
+        _release(user_id, refs)
+
+
+def media_usage(user_id):
+    """
+    Bytes counted against a user's quota
+    Returns: int
+    """
+    shown = db.session.execute(select(User.media_bytes).where(User.id == user_id)).scalar() or 0
+    unused = db.session.execute(
+        select(func.coalesce(func.sum(MediaFile.bytes), 0))
+        .where(MediaFile.owner_id == user_id, MediaFile.ref_count == 0)
+    ).scalar()
+    return shown + unused
+
+
+def over_quota(user_id, quota):
+    """Whether a user has used up their quota (a quota of 0 or None means no limit)"""
+    return bool(quota) and media_usage(user_id) >= quota
+
+
+def register_untracked_files(folder, batch_size=1000):
+    """
+    Register the image files in folder that aren't in media_file yet, as
+    unused: the next deck that shows one picks it up, the rest are swept
+    after the grace period
+    Returns: number of files registered
+    """
+    registered = 0
+    batch = []
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            if name.endswith('.part'):
+                # Being written by write_atomic()
+                continue
+            batch.append(os.path.relpath(os.path.join(directory, name), folder).replace(os.sep, '/'))
+            if len(batch) >= batch_size:
+                registered += _register_unknown(folder, batch)
+                batch = []
+    return registered + _register_unknown(folder, batch)
+
+
+def _register_unknown(folder, paths):
+    unknown = set(paths) - _media_ids(paths).keys()
+    register_media(_file_sizes(folder, sorted(unknown)))
+    db.session.commit()
+    return len(unknown)
+
+
+class MediaSweeper:
+    """Deletes files that no deck has used for the grace period, in the background"""
+
+    def __init__(self, app, folder, grace_period=24 * 3600, interval=600, batch_size=500):
+        self.app = app
+        self.folder = folder
+        self.grace_period = grace_period
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.sweeps = 0
+        self.files_deleted = 0
+        self.bytes_freed = 0
+
+    def sweep(self):
+        """
+        Delete every file that has been unused for longer than the grace period
+        Returns: (files deleted, bytes freed)
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_period)
+        files = freed = 0
+        while True:
+            # Rows first: a deck saved from now on can't pick these files up
+            rows = db.session.execute(
+                delete(MediaFile)
+                .where(MediaFile.id.in_(
+                    select(MediaFile.id).where(MediaFile.ref_count == 0, MediaFile.orphaned_at < cutoff)
+                    .limit(self.batch_size)
+                ))
+                .returning(MediaFile.path, MediaFile.bytes)
+            ).all()
+            db.session.commit()
+            for path, size in rows:
+                try:
+                    os.remove(os.path.join(self.folder, path))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    log("media_delete_failed", logging.WARNING, path=path, error=str(e))
+                    continue
+                files += 1
+                freed += size
+            if len(rows) < self.batch_size:
+                break
+
+        with self._lock:
+            self.sweeps += 1
+            self.files_deleted += files
+            self.bytes_freed += freed
+        if files:
+            log("media_swept", files=files, bytes=freed)
+        return files, freed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                log("media_sweep_error", logging.ERROR, error=str(e))
+
+    def start(self):
+        """Start the sweeper thread (once)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='media-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        self._stop.clear()
+
+    def stats(self):
+        orphaned = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(MediaFile.bytes), 0)).where(MediaFile.ref_count == 0)
+        ).one()
+        with self._lock:
+            return {
+                "sweeps": self.sweeps,
+                "files_deleted": self.files_deleted,
+                "bytes_freed": self.bytes_freed,
+                "unused_files": orphaned[0],
+                "unused_bytes": orphaned[1],
+            }
@@ -0,0 +1,138 @@
+"""
+Image uploads, the user's stored images and disk usage, and .pptx export.
+"""
+import logging
+
+from flask import Blueprint, current_app, jsonify, request, send_file, session
+from flask_login import current_user, login_required
+from werkzeug.utils import secure_filename
+
+from admission import admission_required, upload_cost
+from config import ALLOWED_EXTENSIONS
+from http_cache import cached_json
+from image_pipeline import get_executor
+from instrumentation import log, stage
+from media_store import media_usage, over_quota
+from services import export_cache, presentation_store
+from slide_images import image_fields, local_image_path, record_stored_image
+
+bp = Blueprint('media', __name__)
+
+# How many uploaded images to remember in each user's session
+MAX_SESSION_IMAGES = 20
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+@bp.route('/export/<int:presentation_id>.pptx')
+@login_required
+def export_pptx(presentation_id):
+    """
+    Download a saved presentation as .pptx, rendered on the server
+    The file is cached by slide content, so unchanged decks aren't rendered again.
+    """
+    presentation = presentation_store.get(current_user.id, presentation_id)
+    
+    if not presentation:
+        return jsonify({"error": "Presentation not found"}), 404
+    
+    with stage("export", presentation_id=presentation_id, slides=len(presentation["slides"])):
+        path, deck_key = export_cache.get_or_render(presentation["slides"])
+    
+    # Opened here so a concurrent prune can't remove the file mid-download
+    return send_file(
+        open(path, 'rb'),
+        mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        as_attachment=True,
+        download_name=f"{secure_filename(presentation['title']) or 'presentation'}.pptx",
+        etag=deck_key,
+        conditional=True
+    )
+
+
+@bp.route('/upload-image', methods=['POST'])
+@login_required
+@admission_required(upload_cost)
+def upload_image():
+    """
+    Handle image uploads for slides
+    The upload is stored as a slide-sized JPEG plus a thumbnail, like
+    downloaded images; decoding runs on the image worker pool. It counts
+    against the user's disk quota (413 once that is used up) and is deleted
+    after MEDIA_GRACE_PERIOD unless a deck shows it by then.
+    Returns: {"success": true, "filename": "...", "url": "...", "thumbnail_url": "...", "image_meta": {...}}
+    """
+    quota = current_app.config['MEDIA_QUOTA_BYTES']
+    try:
+        if 'image' not in request.files:
+            return jsonify({"error": "No image file provided"}), 400
+        
+        file = request.files['image']
+        
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        
+        if file and allowed_file(file.filename):
+            if over_quota(current_user.id, quota):
+                return jsonify({"error": "Storage quota used up, delete some presentations first"}), 413
+            
+            # Pillow is imported with the first image
+            from image_processing import ImageProcessingError, process_image
+            
+            data = file.read()
+            job = get_executor(current_app.config['IMAGE_POOL_WORKERS']).submit(
+                process_image, data, current_app.config['UPLOAD_FOLDER']
+            )
+            try:
+                processed = job.result()
+            except ImageProcessingError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            record_stored_image(processed, current_user.id)
+            if quota and media_usage(current_user.id) > quota:
+                # Unused, so the sweeper removes it
+                return jsonify({"error": "Image doesn't fit in the storage quota"}), 413
+            
+            image = image_fields(processed)
+            
+            # Remember the image in the uploader's session
+            uploaded_images = session.get('uploaded_images', [])
+            uploaded_images.append({
+                "filename": processed["filename"],
+                "url": image["image_url"],
+                "thumbnail_url": image["thumbnail_url"]
+            })
+            session['uploaded_images'] = uploaded_images[-MAX_SESSION_IMAGES:]
+            
+            return jsonify({
+                "success": True,
+                "filename": processed["filename"],
+                "url": image["image_url"],
+                "thumbnail_url": image["thumbnail_url"],
+                "image_meta": image["image_meta"]
+            })
+        else:
+            return jsonify({"error": "Invalid file type. Allowed: png, jpg, jpeg, gif, bmp, webp"}), 400
+    
+    except Exception as e:
+        log("upload_failed", logging.ERROR, exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/get-images', methods=['GET'])
+def get_images():
+    """
+    Get the images uploaded in this session (that weren't swept since)
+    Conditional: 304 while the list is unchanged (If-None-Match)
+    """
+    images = [image for image in session.get('uploaded_images', []) if local_image_path(image.get("url"))]
+    return cached_json({"images": images})
+
+
+@bp.route('/stats/storage', methods=['GET'])
+@login_required
+def storage_stats():
+    """Disk space used by the current user's images, and their quota (0: no limit)"""
+    return jsonify({"used_bytes": media_usage(current_user.id), "quota_bytes": current_app.config['MEDIA_QUOTA_BYTES']})
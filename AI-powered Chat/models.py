@@ -0,0 +1,259 @@
+"""
+Database models, shared by the app and the helper modules.
+"""
+import asyncio
+import hashlib
+from datetime import datetime
+
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+db = SQLAlchemy()
+
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    response_cache_enabled = db.Column(db.Boolean, nullable=False, default=True, server_default=text('1'))
+    # Size of the image files shown by the user's decks, one count per deck (media_store)
+    media_bytes = db.Column(db.BigInteger, nullable=False, default=0, server_default=text('0'))
+    presentations = db.relationship('Presentation', backref='user', lazy=True, cascade='all, delete-orphan')
+
+
+class Presentation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    slides_data = db.Column(db.Text, nullable=False)  # JSON string, '' once moved to PresentationSlide rows
+    # 0: slides in slides_data, 1: one PresentationSlide row per slide
+    storage_version = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Listing columns, kept up to date by PresentationStore so history never reads slides_data
+    slide_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    summary = db.Column(db.String(200))  # NULL until backfilled
+    # Hash of the slides (session_state.deck_hash), part of the deck's ETag; NULL until first read
+    content_hash = db.Column(db.String(32))
+
+    __table_args__ = (
+        # Covers the history listing: seek by user, newest first, every listed column in the index
+        db.Index('ix_presentation_history', 'user_id', 'updated_at', 'id', 'created_at', 'title', 'slide_count', 'summary'),
+    )
+
+
+class PresentationSlide(db.Model):
+    __tablename__ = 'presentation_slide'
+    presentation_id = db.Column(db.Integer, db.ForeignKey('presentation.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # 0-based
+    title = db.Column(db.String(200), nullable=False, default='')  # outline without decoding
+    data = db.Column(db.LargeBinary, nullable=False)  # slide_storage.encode_slide()
+
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_job'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(32), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)  # higher runs first
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    payload = db.Column(db.Text, nullable=False)  # JSON string
+    result = db.Column(db.Text)  # JSON string
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker_id = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)  # a running job past this lost its worker
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_generation_job_queue', 'status', 'user_id', 'priority', 'id'),
+        db.Index('ix_generation_job_user', 'user_id', 'id'),
+    )
+
+
+class MediaFile(db.Model):
+    __tablename__ = 'media_file'
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), unique=True, nullable=False)  # relative to the upload folder
+    bytes = db.Column(db.Integer, nullable=False, default=0)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # who uploaded or downloaded it first
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # rows in media_ref
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    orphaned_at = db.Column(db.DateTime, index=True)  # set while ref_count is 0: swept after the grace period
+
+    __table_args__ = (
+        db.Index('ix_media_file_owner', 'owner_id', 'ref_count'),
+    )
+
+
+class MediaRef(db.Model):
+    __tablename__ = 'media_ref'
+    presentation_id = db.Column(db.Integer, db.ForeignKey('presentation.id'), primary_key=True)
+    media_id = db.Column(db.Integer, db.ForeignKey('media_file.id'), primary_key=True)
+    bytes = db.Column(db.Integer, nullable=False, default=0)  # the file's size, counted in user.media_bytes
+
+    __table_args__ = (
+        db.Index('ix_media_ref_media', 'media_id'),
+    )
+
+
+class CachedResponse(db.Model):
+    __tablename__ = 'response_cache'
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of namespace, variant and prompt
+    namespace = db.Column(db.String(64), nullable=False, index=True)
+    variant = db.Column(db.String(64), nullable=False, default='')
+    prompt = db.Column(db.Text, nullable=False)  # normalized prompt
+    words = db.Column(db.Text, nullable=False)  # content words for near-duplicate matching
+    response = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class ConversationTurn(db.Model):
+    __tablename__ = 'conversation_turn'
+    id = db.Column(db.Integer, primary_key=True)
+    presentation_id = db.Column(db.Integer, db.ForeignKey('presentation.id'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False, default='edit')  # create or edit
+    request = db.Column(db.Text, nullable=False)  # the user's instruction, clipped
+    reply = db.Column(db.Text, nullable=False, default='')  # the model's message, clipped
+    slides = db.Column(db.String(200), nullable=False, default='')  # changed slide numbers, "3,5"
+    tokens = db.Column(db.Integer, nullable=False, default=0)  # of the turn's line in a prompt
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_conversation_turn_presentation', 'presentation_id', 'id'),
+    )
+
+
+class ConversationSummary(db.Model):
+    __tablename__ = 'conversation_summary'
+    presentation_id = db.Column(db.Integer, db.ForeignKey('presentation.id'), primary_key=True)
+    state = db.Column(db.Text, nullable=False)  # JSON: what the folded turns said (conversation.py)
+    summary = db.Column(db.Text, nullable=False)  # as sent in edit prompts
+    tokens = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RateBucket(db.Model):
+    __tablename__ = 'rate_bucket'
+    key = db.Column(db.String(64), primary_key=True)  # "user:<id>" or "global"
+    tokens = db.Column(db.Float, nullable=False)  # negative while requests wait for their turn
+    updated_at = db.Column(db.Float, nullable=False)  # Unix time tokens was computed at
+
+
+class SchemaState(db.Model):
+    __tablename__ = 'schema_state'
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(64), nullable=False)
+
+
+def schema_fingerprint():
+    """
+    Hash of every table, column and index of the models, to tell whether a
+    database was already brought up to date with them
+    Returns: hex string
+    """
+    parts = []
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        for column in table.columns:
+            default = column.server_default.arg if column.server_default is not None else None
+            parts.append(f"{column.name} {column.type!r} {column.nullable} {getattr(default, 'text', default)}")
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            parts.append(f"{index.name} {[column.name for column in index.columns]}")
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def stored_schema_fingerprint(engine):
+    """
+    Fingerprint saved by the last mark_schema_current()
+    Returns: str, or None for a database that predates it
+    """
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                text("SELECT value FROM schema_state WHERE name = 'fingerprint'")
+            ).scalar()
+    except SQLAlchemyError:
+        return None
+
+
+def mark_schema_current(engine, fingerprint):
+    """Save the fingerprint of the models the database was brought up to date with"""
+    with engine.begin() as connection:
+        connection.execute(SchemaState.__table__.delete().where(SchemaState.name == 'fingerprint'))
+        connection.execute(SchemaState.__table__.insert().values(name='fingerprint', value=fingerprint))
+
+
+def upgrade_schema(engine):
+    """
+    Bring an existing database up to date with the models: create tables
+    added since it was made and add missing columns and indexes, which
+    create_all never does (new NOT NULL columns need a server_default=text(...))
+    """
+    db.metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg.text}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+                connection.execute(text(ddl))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def release_connection():
+    """
+    End the session's transaction before a long wait (the model, the image
+    hosts) so its connection goes back to the pool: a request waiting must
+    not hold one the image workers need. Everything is committed when it is
+    written, so nothing is lost; ORM objects are expired and reload on their
+    next use.
+    """
+    db.session.rollback()
+
+
+async def db_step(function, *args):
+    """
+    Run a blocking step of an async view (database work) on a worker thread,
+    in the current request's context, then release its connection (see
+    release_connection), so the pool size doesn't cap the requests in flight
+    """
+    def step():
+        try:
+            return function(*args)
+        finally:
+            release_connection()
+    return await asyncio.to_thread(step)
+
+
+def configure_sqlite(engine):
+    """
+    Let several worker processes share one SQLite file: WAL journal so
+    readers don't block the writer, and a busy timeout instead of failing
+    immediately with "database is locked"
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=30000')
+        cursor.close()
@@ -0,0 +1,238 @@
+"""
+Server-side .pptx rendering of stored decks.
+
+Follows the layout of generatePowerPoint() in static/js/app.js (slide number,
+title, bullets, image on the side given by image_position, footer), on a
+10 x 7.5 inch slide, the size those coordinates were laid out for. Images
+are read from the local upload folder instead of being fetched over HTTP;
+python-pptx stores identical images once.
+
+Rendered files are kept in a folder keyed by a hash of the slide JSON, so
+downloading an unchanged deck again is just a file send.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from PIL import Image
+from pptx import Presentation as PptxPresentation
+from pptx.dml.color import RGBColor
+from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
+from pptx.oxml.ns import qn
+from pptx.util import Inches, Pt
+
+from instrumentation import log
+
+# Bump when the layout changes so cached files are rendered again
+RENDERER_VERSION = 1
+
+SLIDE_WIDTH = 10
+SLIDE_HEIGHT = 7.5
+
+TITLE_COLOR = '1F4788'
+TEXT_COLOR = '333333'
+NUMBER_COLOR = '666666'
+FOOTER_COLOR = '999999'
+FOOTER_TEXT = 'Generated by AI PowerPoint Assistant'
+
+# (content box, image box) as (x, y, w, h) in inches, by image_position
+LAYOUTS = {
+    'top': ((0.7, 4.8, 8.6, 2), (2.5, 1.7, 5, 2.8)),
+    'bottom': ((0.7, 1.7, 8.6, 2.5), (2.5, 4.5, 5, 2.5)),
+    'left': ((5, 1.7, 4.5, 5), (0.5, 1.7, 4.2, 5)),
+    'right': ((0.7, 1.7, 4.5, 5), (5.5, 1.7, 4, 5)),
+}
+NO_IMAGE_CONTENT_BOX = (0.7, 1.7, 8.6, 5)
+
+
+def deck_hash(slides):
+    """Cache key of a deck: hash of its canonical JSON and the renderer version"""
+    canonical = json.dumps(slides, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{RENDERER_VERSION}:{canonical}".encode()).hexdigest()
+
+
+def _add_text(slide, box, text, size, color, bold=False, align=PP_ALIGN.LEFT):
+    x, y, w, h = box
+    frame = slide.shapes.add_textbox(Inches(x), Inches(y), Inches(w), Inches(h)).text_frame
+    frame.word_wrap = True
+    paragraph = frame.paragraphs[0]
+    paragraph.alignment = align
+    run = paragraph.add_run()
+    run.text = text
+    run.font.size = Pt(size)
+    run.font.bold = bold
+    run.font.color.rgb = RGBColor.from_string(color)
+    return frame
+
+
+def _set_bullet(paragraph):
+    properties = paragraph._p.get_or_add_pPr()
+    properties.set('marL', str(Inches(0.25)))
+    properties.set('indent', str(-Inches(0.25)))
+    bullet = properties.makeelement(qn('a:buChar'), {'char': '•'})
+    properties.append(bullet)
+
+
+def _add_bullets(slide, box, points):
+    x, y, w, h = box
+    frame = slide.shapes.add_textbox(Inches(x), Inches(y), Inches(w), Inches(h)).text_frame
+    frame.word_wrap = True
+    frame.vertical_anchor = MSO_ANCHOR.TOP
+    for index, point in enumerate(points):
+        paragraph = frame.paragraphs[0] if index == 0 else frame.add_paragraph()
+        _set_bullet(paragraph)
+        run = paragraph.add_run()
+        run.text = str(point)
+        run.font.size = Pt(16)
+        run.font.color.rgb = RGBColor.from_string(TEXT_COLOR)
+
+
+def _add_picture(slide, box, path, sizes):
+    """Picture filling the box, cropped to keep its aspect ratio"""
+    if path not in sizes:
+        with Image.open(path) as image:
+            sizes[path] = image.size
+    width, height = sizes[path]
+
+    x, y, w, h = box
+    picture = slide.shapes.add_picture(path, Inches(x), Inches(y), Inches(w), Inches(h))
+    image_ratio = width / height
+    box_ratio = w / h
+    if image_ratio > box_ratio:
+        picture.crop_left = picture.crop_right = (1 - box_ratio / image_ratio) / 2
+    elif image_ratio < box_ratio:
+        picture.crop_top = picture.crop_bottom = (1 - image_ratio / box_ratio) / 2
+
+
+def render_pptx(slides, image_path, out):
+    """
+    Render a deck to .pptx
+    image_path: function(image_url) -> local file path or None
+    out: path or binary file object to write to
+    """
+    deck = PptxPresentation()
+    deck.slide_width = Inches(SLIDE_WIDTH)
+    deck.slide_height = Inches(SLIDE_HEIGHT)
+    deck.core_properties.author = 'AI PowerPoint Generator'
+    deck.core_properties.title = 'AI Generated Presentation'
+    deck.core_properties.subject = 'Auto-generated presentation'
+    blank = deck.slide_layouts[6]
+    sizes = {}
+
+    for index, data in enumerate(slides):
+        slide = deck.slides.add_slide(blank)
+        path = image_path(data.get('image_url')) if data.get('has_image') and data.get('image_url') else None
+
+        _add_text(slide, (0.5, 0.3, 0.5, 0.3), str(index + 1), 12, NUMBER_COLOR)
+        _add_text(slide, (0.5, 0.7, 9, 0.8), data.get('title') or 'Untitled Slide', 32, TITLE_COLOR, bold=True)
+
+        if path:
+            content_box, image_box = LAYOUTS.get(data.get('image_position'), LAYOUTS['right'])
+        else:
+            content_box, image_box = NO_IMAGE_CONTENT_BOX, None
+
+        content = data.get('content')
+        if isinstance(content, list) and content:
+            _add_bullets(slide, content_box, content)
+        elif isinstance(content, str):
+            _add_text(slide, content_box, content, 16, TEXT_COLOR)
+
+        if path:
+            try:
+                _add_picture(slide, image_box, path, sizes)
+            except (OSError, ValueError) as e:
+                log("export_image_skipped", logging.WARNING, slide=index + 1, error=str(e))
+
+        _add_text(slide, (0.5, 7, 9, 0.3), FOOTER_TEXT, 10, FOOTER_COLOR, align=PP_ALIGN.CENTER)
+
+    deck.save(out)
+
+
+class ExportCache:
+    """
+    Rendered decks on disk, one file per deck hash. Concurrent requests for
+    the same deck wait for a single render.
+    """
+
+    def __init__(self, folder, image_path, max_files=200):
+        self.folder = folder
+        self.image_path = image_path
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._renders = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f"{key}.pptx")
+
+    def get_or_render(self, slides):
+        """
+        Rendered file of a deck, rendering it if needed
+        Returns: (path, deck hash)
+        """
+        key = deck_hash(slides)
+        path = self.path_for(key)
+
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                self._touch(path)
+                return path, key
+            event = self._renders.get(key)
+            owner = event is None
+            if owner:
+                event = self._renders[key] = threading.Event()
+                self.misses += 1
+
+        if not owner:
+            event.wait()
+            if os.path.exists(path):
+                return path, key
+            # The other render failed, try ourselves
+            return self.get_or_render(slides)
+
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    render_pptx(slides, self.image_path, f)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        finally:
+            with self._lock:
+                self._renders.pop(key, None)
+            event.set()
+
+        self.prune()
+        return path, key
+
+    @staticmethod
+    def _touch(path):
+        # mtime doubles as last use for prune()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        """Delete the least recently used files beyond max_files"""
+        files = [entry for entry in os.scandir(self.folder) if entry.name.endswith('.pptx')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:len(files) - self.max_files]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,333 @@
+"""
+Response cache in front of the deck-generation model call.
+
+Two tiers:
+
+- exact: the prompt is normalized (case, punctuation, whitespace) and hashed
+  together with a namespace (model + system prompt version) and a variant
+  (anything else that changes the answer, e.g. the number of attached
+  images)
+- near-duplicate: "make a presentation about climate change" and "create
+  slides on climate change" reduce to the same content words. Candidates
+  are found with MinHash + LSH banding over those words and accepted when
+  their exact Jaccard similarity reaches the threshold. Numbers must match
+  exactly, so "5 slides" never reuses a 10 slide deck.
+
+Entries live in the response_cache table, so a restart keeps them, and in
+an in-process LRU that holds the LSH index. Both are bounded by a TTL and a
+maximum entry count.
+"""
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from models import CachedResponse, db
+
+# Words that say "make me a deck" rather than what the deck is about
+FILLER_WORDS = frozenset("""
+    a an the and or of on in to for about with regarding covering explaining
+    explain describe introduce introduction overview
+    me my i we us you can could would please want need like some
+    make create generate build give write prepare produce design do
+    presentation presentations slide slides deck decks powerpoint ppt pptx
+    talk short quick simple detailed new
+""".split())
+
+NUMBER_WORDS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5',
+    'six': '6', 'seven': '7', 'eight': '8', 'nine': '9', 'ten': '10',
+    'eleven': '11', 'twelve': '12', 'fifteen': '15', 'twenty': '20',
+}
+
+_WORD = re.compile(r'[^\W_]+')
+
+# MinHash: NUM_PERM hash functions in BANDS bands of NUM_PERM // BANDS rows
+NUM_PERM = 64
+BANDS = 16
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(b'a%d' % i, digest_size=8).digest(), 'big') % (_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(b'b%d' % i, digest_size=8).digest(), 'big') % _PRIME,
+    )
+    for i in range(NUM_PERM)
+]
+
+
+def normalize_prompt(prompt):
+    """
+    Canonical form of a prompt for the exact-match tier
+    Returns: lowercase words separated by single spaces (digits kept)
+    """
+    text = unicodedata.normalize('NFKC', prompt or '').lower()
+    return ' '.join(_WORD.findall(text))
+
+
+def content_words(normalized):
+    """
+    Words that carry the topic of a prompt, for the near-duplicate tier
+    Returns: frozenset of words
+    """
+    words = set()
+    for word in normalized.split():
+        word = NUMBER_WORDS.get(word, word)
+        if word in FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+
+def minhash(words):
+    """MinHash signature of a word set"""
+    hashes = [
+        struct.unpack('>Q', hashlib.blake2b(word.encode(), digest_size=8).digest())[0] & _MAX_HASH
+        for word in words
+    ]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def lsh_bands(signature):
+    """Bucket keys of a signature, one per band"""
+    rows = NUM_PERM // BANDS
+    return [hash((band,) + signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _numbers(words):
+    return frozenset(word for word in words if word.isdigit())
+
+
+class _Entry:
+    __slots__ = ('key', 'variant', 'words', 'bands', 'response', 'expires')
+
+    def __init__(self, key, variant, words, response, expires):
+        self.key = key
+        self.variant = variant
+        self.words = words
+        self.bands = [(variant, band) for band in lsh_bands(minhash(words))] if words else []
+        self.response = response
+        self.expires = expires
+
+
+class ResponseCache:
+    """
+    Exact + near-duplicate cache of parsed model responses, persisted in
+    the response_cache table. Methods that touch the database need an app
+    context.
+    """
+
+    def __init__(self, namespace, max_entries=5000, ttl=7 * 24 * 3600,
+                 similarity=0.8, near_duplicates=True):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.near_duplicates = near_duplicates
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._stores = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def key(self, normalized, variant=''):
+        raw = f"{self.namespace}\x00{variant}\x00{normalized}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # In-memory index (callers hold the lock)
+
+    def _add(self, entry):
+        self._drop(entry.key)
+        self._entries[entry.key] = entry
+        for band in entry.bands:
+            self._buckets.setdefault(band, set()).add(entry.key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= now:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, variant, words, now):
+        if not words:
+            return None
+        candidates = set()
+        for band in lsh_bands(minhash(words)):
+            candidates |= self._buckets.get((variant, band), set())
+
+        numbers = _numbers(words)
+        best, best_score = None, self.similarity
+        for key in candidates:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= now or _numbers(entry.words) != numbers:
+                continue
+            score = jaccard(words, entry.words)
+            if score >= best_score:
+                best, best_score = entry, score
+        if best is not None:
+            self._entries.move_to_end(best.key)
+        return best
+
+    def _load(self):
+        """Fill the in-memory index from the table on first use"""
+        if self._loaded:
+            return
+        self._loaded = True
+        rows = CachedResponse.query.filter(
+            CachedResponse.namespace == self.namespace,
+            CachedResponse.expires_at > datetime.utcnow()
+        ).order_by(CachedResponse.last_used_at.desc()).limit(self.max_entries).all()
+        with self._lock:
+            for row in reversed(rows):
+                self._add(self._entry_from_row(row))
+
+    def _entry_from_row(self, row):
+        expires = time.time() + max(0.0, (row.expires_at - datetime.utcnow()).total_seconds())
+        words = frozenset(row.words.split())
+        return _Entry(row.key, row.variant, words, row.response, expires)
+
+    # Public API
+
+    def lookup(self, prompt, variant=''):
+        """
+        Find a cached response for a prompt
+        Returns: (response dict, "exact" | "near") or (None, None)
+        """
+        self._load()
+        normalized = normalize_prompt(prompt)
+        key = self.key(normalized, variant)
+        now = time.time()
+
+        with self._lock:
+            entry = self._live(key, now)
+            kind = 'exact'
+            if entry is None and self.near_duplicates:
+                entry = self._nearest(variant, content_words(normalized), now)
+                kind = 'near'
+
+        if entry is None:
+            # Another worker process may have stored it since we loaded
+            row = db.session.get(CachedResponse, key)
+            if row is not None and row.expires_at > datetime.utcnow():
+                entry = self._entry_from_row(row)
+                kind = 'exact'
+                with self._lock:
+                    self._add(entry)
+
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        with self._lock:
+            if kind == 'exact':
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+        self._touch(entry.key)
+        return json.loads(entry.response), kind
+
+    def store(self, prompt, response, variant=''):
+        """Cache a parsed response (a JSON-serializable dict) for a prompt"""
+        self._load()
+        normalized = normalize_prompt(prompt)
+        words = content_words(normalized)
+        key = self.key(normalized, variant)
+        text = json.dumps(response, separators=(',', ':'))
+        now = datetime.utcnow()
+
+        row = db.session.get(CachedResponse, key) or CachedResponse(key=key)
+        row.namespace = self.namespace
+        row.variant = variant
+        row.prompt = normalized
+        row.words = ' '.join(sorted(words))
+        row.response = text
+        row.created_at = now
+        row.last_used_at = now
+        row.expires_at = now + timedelta(seconds=self.ttl)
+        db.session.add(row)
+        db.session.commit()
+
+        with self._lock:
+            self._add(_Entry(key, variant, words, text, time.time() + self.ttl))
+            self._stores += 1
+            prune = self._stores % 100 == 1
+        if prune:
+            self.prune()
+
+    def _touch(self, key):
+        # Last use drives LRU eviction of the table
+        try:
+            CachedResponse.query.filter_by(key=key).update({'last_used_at': datetime.utcnow()})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    def prune(self):
+        """
+        Delete expired rows and the least recently used rows beyond max_entries
+        Returns: number of rows deleted
+        """
+        deleted = CachedResponse.query.filter(CachedResponse.expires_at <= datetime.utcnow()).delete()
+        stale = db.session.query(CachedResponse.key).filter_by(namespace=self.namespace).order_by(
+            CachedResponse.last_used_at.desc()
+        ).offset(self.max_entries).all()
+        if stale:
+            deleted += CachedResponse.query.filter(
+                CachedResponse.key.in_([key for key, in stale])
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def clear(self):
+        """Forget every entry of this namespace, in memory and in the table"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+        CachedResponse.query.filter_by(namespace=self.namespace).delete()
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
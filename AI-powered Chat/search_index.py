@@ -0,0 +1,200 @@
+"""
+Full-text search over a user's saved decks (SQLite FTS5).
+
+One row per deck in the presentation_search virtual table, with the deck's
+ID as rowid: the deck title, the slide titles, the bullet text and the image
+search queries, plus an "owner" column holding a u<user ID> token. Queries
+always match that token too, so FTS5 intersects the posting lists and never
+looks at other users' decks.
+
+Slides are stored compressed (slide_storage), which triggers can't read, so
+PresentationStore keeps the index in sync on create, save and delete in the
+same transaction. Decks saved before the index existed are added by
+backfill_search_index() at startup.
+
+Results are ranked with bm25 (title matches count most) among the user's
+SEARCH_CANDIDATES newest matching decks: FTS5 walks the posting lists newest
+first and stops there, so a word that is in every deck doesn't mean scoring
+every deck. Highlighting (the title, and a snippet of the bullets; HTML-
+escaped, matches wrapped in <mark>) is only done for the page returned.
+"""
+import json
+import re
+from html import escape
+
+from sqlalchemy import DateTime, text
+
+from models import PresentationSlide, db
+from slide_storage import decode_slides
+
+SEARCH_TABLE = 'presentation_search'
+TOKENIZER = 'porter unicode61 remove_diacritics 2'
+# bm25 weight per column: owner, title, slide_titles, content, image_queries
+RANK = 'bm25(0.0, 10.0, 5.0, 1.0, 2.0)'
+TEXT_COLUMNS = '{title slide_titles content image_queries}'
+
+# Terms of a query that are used, the rest is ignored
+MAX_TERMS = 8
+SNIPPET_TOKENS = 16
+# Newest matches that are ranked; older ones are not returned
+SEARCH_CANDIDATES = 1000
+
+# Match markers put in by FTS5, swapped for <mark> after escaping
+_OPEN, _CLOSE = '\x02', '\x03'
+
+
+def create_search_index(engine):
+    """Create the FTS5 table if it doesn't exist yet (needs SQLite with FTS5)"""
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+        ).first()
+        if exists:
+            return
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            f"owner, title, slide_titles, content, image_queries, tokenize='{TOKENIZER}')"
+        ))
+        # Stored in the index, so ORDER BY rank uses these weights
+        connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', :rank)"),
+                           {"rank": RANK})
+
+
+def _text(value):
+    if isinstance(value, list):
+        return '\n'.join(str(item) for item in value if item is not None)
+    return str(value) if value is not None else ''
+
+
+def deck_document(title, slides):
+    """
+    Searchable text of a deck
+    Returns: dict of column -> text
+    """
+    slides = [slide for slide in slides if isinstance(slide, dict)]
+    return {
+        "title": title or '',
+        "slide_titles": '\n'.join(_text(slide.get("title")) for slide in slides),
+        "content": '\n'.join(_text(slide.get("content")) for slide in slides),
+        "image_queries": '\n'.join(_text(slide.get("image_search_query")) for slide in slides),
+    }
+
+
+def index_deck(presentation_id, user_id, title, slides):
+    """Add or replace a deck in the search index (caller commits)"""
+    index_decks(user_id, [(presentation_id, title, slides)])
+
+
+def index_decks(user_id, decks):
+    """Add or replace several of a user's decks, [(presentation ID, title, slides)], in one statement"""
+    db.session.execute(
+        text(f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, owner, title, slide_titles, content, image_queries) "
+             f"VALUES (:id, :owner, :title, :slide_titles, :content, :image_queries)"),
+        [{"id": presentation_id, "owner": f"u{user_id}", **deck_document(title, slides)}
+         for presentation_id, title, slides in decks]
+    )
+
+
+def remove_deck(presentation_id):
+    """Drop a deck from the search index (caller commits)"""
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": presentation_id})
+
+
+def match_expression(user_id, query):
+    """
+    FTS5 query for a user's search box input: every word must match
+    (stemmed, so "glaciers" finds "glacier"); FTS5 syntax is not passed through
+    Returns: MATCH expression, or None if the input has no words
+    """
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    phrases = ' '.join(f'"{term}"' for term in terms)
+    return f'owner : "u{int(user_id)}" AND {TEXT_COLUMNS} : ({phrases})'
+
+
+def highlighted(value):
+    """HTML-escape FTS5 output and turn its match markers into <mark> tags"""
+    return escape(value or '').replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def search(user_id, query, limit=20, page=1):
+    """
+    Search one user's decks, best matches first
+    Returns: (list of dicts with id, title, title_html, snippet_html,
+    slide_count, created_at, updated_at - whether there is a next page)
+    """
+    match = match_expression(user_id, query)
+    if match is None:
+        return [], False
+    # Ranks the newest SEARCH_CANDIDATES matches (rowid order is what FTS5
+    # can stop early on), then highlights only the page
+    ids = db.session.execute(
+        text(
+            f"SELECT id FROM ("
+            f"SELECT rowid AS id, rank AS score FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match "
+            f"ORDER BY rowid DESC LIMIT :candidates"
+            f") ORDER BY score, id DESC LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "candidates": SEARCH_CANDIDATES, "limit": limit + 1,
+         "offset": (max(page, 1) - 1) * limit}
+    ).scalars().all()
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    if not ids:
+        return [], False
+
+    rows = db.session.execute(
+        text(
+            f"SELECT p.id, p.title, p.slide_count, p.created_at, p.updated_at, "
+            f"highlight({SEARCH_TABLE}, 1, :open, :close) AS title_html, "
+            f"snippet({SEARCH_TABLE}, 3, :open, :close, '…', :tokens) AS snippet_html "
+            f"FROM {SEARCH_TABLE} JOIN presentation p ON p.id = {SEARCH_TABLE}.rowid "
+            # A rowid range is one pass for FTS5, IN would be a lookup per ID
+            f"WHERE {SEARCH_TABLE} MATCH :match AND {SEARCH_TABLE}.rowid BETWEEN :low AND :high "
+            f"AND p.id IN (SELECT value FROM json_each(:ids)) AND p.user_id = :user_id"
+        ).columns(created_at=DateTime, updated_at=DateTime),
+        {"match": match, "low": min(ids), "high": max(ids), "ids": json.dumps(ids), "user_id": user_id,
+         "open": _OPEN, "close": _CLOSE, "tokens": SNIPPET_TOKENS}
+    ).mappings().all()
+
+    by_id = {row["id"]: row for row in rows}
+    results = []
+    for presentation_id in ids:
+        if presentation_id not in by_id:
+            continue
+        item = dict(by_id[presentation_id])
+        item["title_html"] = highlighted(item["title_html"])
+        item["snippet_html"] = highlighted(item["snippet_html"])
+        results.append(item)
+    return results, has_more
+
+
+def backfill_search_index(batch_size=500):
+    """
+    Index decks saved before the search index existed
+    Returns: number of decks indexed
+    """
+    indexed = 0
+    while True:
+        rows = db.session.execute(
+            text(f"SELECT id, user_id, title, storage_version, slides_data FROM presentation "
+                 f"WHERE id NOT IN (SELECT rowid FROM {SEARCH_TABLE}) LIMIT :limit"),
+            {"limit": batch_size}
+        ).all()
+        if not rows:
+            return indexed
+        for presentation_id, user_id, title, storage_version, slides_data in rows:
+            try:
+                if storage_version:
+                    blobs = db.session.query(PresentationSlide.data).filter_by(
+                        presentation_id=presentation_id
+                    ).order_by(PresentationSlide.position).all()
+                    slides = decode_slides(data for (data,) in blobs)
+                else:
+                    slides = json.loads(slides_data) if slides_data else []
+            except ValueError:
+                slides = []
+            index_deck(presentation_id, user_id, title, slides if isinstance(slides, list) else [])
+        db.session.commit()
+        indexed += len(rows)
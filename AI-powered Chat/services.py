@@ -0,0 +1,211 @@
+"""
+The app's long-lived resources: model client, caches, presentation store,
+conversation memory, job queue, media sweeper, static assets, the HTTP
+client of the async views, admission control, the cache of logged-in users
+and the password hasher.
+
+create_app() only attaches a Services object to the app. Each resource is
+built - and the libraries behind it imported - the first time a request,
+job or command uses it, so starting a worker costs no more than importing
+Flask and the models: a worker that never exports a deck never imports
+python-pptx, and the model client connects with its first call.
+
+Views and helpers use the module-level proxies below (llm,
+presentation_store, ...), which resolve to the resources of the current
+app. Code holding the app object uses get_services(app) instead.
+"""
+import os
+import threading
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+EXTENSION_NAME = 'slides'
+
+
+class resource:
+    """
+    Like functools.cached_property, but the first lookup is locked so
+    concurrent requests share one instance. Assigning the attribute
+    replaces the resource (benchmarks swap in a stub model client).
+    """
+
+    def __init__(self, create):
+        self.create = create
+        self.name = create.__name__
+        self.__doc__ = create.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        with instance._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.create(instance)
+        return instance.__dict__[self.name]
+
+
+class Services:
+    """Resources of one app, each created on first use"""
+
+    def __init__(self, app):
+        self.app = app
+        # Re-entrant: creating one resource may need another
+        self._lock = threading.RLock()
+
+    def created(self, name):
+        """Whether a resource exists yet (looking it up would create it)"""
+        return name in self.__dict__
+
+    def stats(self, name):
+        """
+        stats() of a resource, for the /metrics collectors
+        Returns: dict, empty while the resource hasn't been created
+        """
+        return getattr(self, name).stats() if self.created(name) else {}
+
+    @resource
+    def llm(self):
+        from llm_client import client_from_config
+        return client_from_config(self.app.config)
+
+    @resource
+    def presentation_store(self):
+        # Decks live in the database; this caches decoded decks per (user, presentation)
+        from session_state import PresentationStore
+        return PresentationStore(max_entries=self.app.config['PRESENTATION_CACHE_SIZE'],
+                                 upload_folder=self.app.config['UPLOAD_FOLDER'])
+
+    @resource
+    def image_cache(self):
+        from image_cache import ImageCache
+        from slide_images import uploaded_file_exists
+        folder = self.app.config['UPLOAD_FOLDER']
+        return ImageCache(
+            max_entries=self.app.config['IMAGE_CACHE_MAX_ENTRIES'],
+            ttl=self.app.config['IMAGE_CACHE_TTL'],
+            exists=lambda image: uploaded_file_exists(image, folder)
+        )
+
+    @resource
+    def export_cache(self):
+        # Imports python-pptx and Pillow
+        from pptx_export import ExportCache
+        from slide_images import local_image_path
+        folder = self.app.config['UPLOAD_FOLDER']
+        return ExportCache(
+            self.app.config['EXPORT_FOLDER'],
+            image_path=lambda image_url: local_image_path(image_url, folder),
+            max_files=self.app.config['EXPORT_CACHE_MAX_FILES']
+        )
+
+    @resource
+    def response_cache(self):
+        from generation import SYSTEM_PROMPT_VERSION
+        from response_cache import ResponseCache
+        return ResponseCache(
+            namespace=f"{self.llm.model_name}:{SYSTEM_PROMPT_VERSION}",
+            max_entries=self.app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+            ttl=self.app.config['RESPONSE_CACHE_TTL'],
+            similarity=self.app.config['RESPONSE_CACHE_SIMILARITY'],
+            near_duplicates=self.app.config['RESPONSE_CACHE_NEAR_DUPLICATES']
+        )
+
+    @resource
+    def conversation_memory(self):
+        from conversation import ConversationMemory
+        return ConversationMemory(
+            budget=self.app.config['CONVERSATION_TOKEN_BUDGET'],
+            summary_budget=self.app.config['CONVERSATION_SUMMARY_TOKENS']
+        )
+
+    @resource
+    def job_queue(self):
+        from generation import run_chat_job
+        from job_queue import JobQueue
+        return JobQueue(
+            self.app,
+            handlers={"chat": run_chat_job},
+            workers=self.app.config['JOB_WORKERS'],
+            lease=self.app.config['JOB_LEASE'],
+            max_attempts=self.app.config['JOB_MAX_ATTEMPTS'],
+            poll_interval=self.app.config['JOB_POLL_INTERVAL']
+        )
+
+    @resource
+    def media_sweeper(self):
+        from media_store import MediaSweeper
+        return MediaSweeper(
+            self.app,
+            self.app.config['UPLOAD_FOLDER'],
+            grace_period=self.app.config['MEDIA_GRACE_PERIOD'],
+            interval=self.app.config['MEDIA_SWEEP_INTERVAL']
+        )
+
+    @resource
+    def assets(self):
+        from http_cache import AssetStore, load_vendor_lock
+        return AssetStore(
+            self.app.static_folder,
+            self.app.config['ASSET_VENDOR_FOLDER'] or os.path.join(self.app.static_folder, 'vendor'),
+            self.app.config['ASSET_CACHE_FOLDER'],
+            self.app.config['ASSET_CDN_URL'],
+            cdn_fallback=self.app.config['ASSET_CDN_FALLBACK'],
+            lock=load_vendor_lock()
+        )
+
+    @resource
+    def async_http(self):
+        # Used on the ASGI server's event loop only (asgi.py closes it)
+        import httpx
+        limit = self.app.config['ASYNC_HTTP_MAX_CONNECTIONS']
+        return httpx.AsyncClient(limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+                                 timeout=15)
+
+    @resource
+    def admission(self):
+        from admission import admission_from_config
+        return admission_from_config(self.app.config)
+
+    @resource
+    def bcrypt(self):
+        from flask_bcrypt import Bcrypt
+        return Bcrypt(self.app)
+
+    @resource
+    def user_cache(self):
+        from accounts import UserCache
+        return UserCache(max_entries=self.app.config['USER_CACHE_MAX_ENTRIES'], ttl=self.app.config['USER_CACHE_TTL'])
+
+    @resource
+    def passwords(self):
+        from accounts import PasswordHasher
+        return PasswordHasher(
+            self.bcrypt,
+            rounds=self.app.config['BCRYPT_LOG_ROUNDS'],
+            workers=self.app.config['PASSWORD_HASH_WORKERS'],
+            max_pending=self.app.config['PASSWORD_HASH_QUEUE']
+        )
+
+
+def get_services(app=None):
+    """
+    Resources of an app (default: the current one)
+    Returns: Services
+    """
+    return (app or current_app).extensions[EXTENSION_NAME]
+
+
+llm = LocalProxy(lambda: get_services().llm)
+presentation_store = LocalProxy(lambda: get_services().presentation_store)
+image_cache = LocalProxy(lambda: get_services().image_cache)
+export_cache = LocalProxy(lambda: get_services().export_cache)
+response_cache = LocalProxy(lambda: get_services().response_cache)
+conversation_memory = LocalProxy(lambda: get_services().conversation_memory)
+job_queue = LocalProxy(lambda: get_services().job_queue)
+media_sweeper = LocalProxy(lambda: get_services().media_sweeper)
+assets = LocalProxy(lambda: get_services().assets)
+async_http = LocalProxy(lambda: get_services().async_http)
+admission = LocalProxy(lambda: get_services().admission)
+bcrypt = LocalProxy(lambda: get_services().bcrypt)
+user_cache = LocalProxy(lambda: get_services().user_cache)
+passwords = LocalProxy(lambda: get_services().passwords)
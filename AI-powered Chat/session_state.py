@@ -0,0 +1,546 @@
+"""
+Per-user presentation state.
+
+Replaces the process-global current_presentation: every deck lives in the
+Presentation table, keyed by user ID and presentation ID, and the deck a user
+is working on is remembered in their (cookie) session. An in-process LRU of
+decoded decks sits in front of the table so repeated reads skip the JSON
+decode; writes go straight through to the database.
+
+Each cached deck is validated against the row's updated_at with a cheap
+single-column query, so a deck changed by another worker process is never
+served stale.
+
+The history listing never reads slides: every write also stores the slide
+count and a short summary of the first slide, and list_page() reads them from
+the covering index, one keyset page at a time.
+
+Slides are stored one row per slide (PresentationSlide), encoded by
+slide_storage. A save only writes the slides that changed, and a single slide
+or the outline can be read without decoding the whole deck. Decks saved
+before that still have their JSON in slides_data; they are moved to slide
+rows the first time they are read or saved, or all at once with
+`flask migrate-slides`.
+
+Every write also stores a hash of the slides (content_hash), which with
+updated_at makes the deck's HTTP ETag (http_cache.py): version() reads both
+with one single-row query, so a conditional GET of an unchanged deck is
+answered without loading it. Decks saved before that get their hash the
+first time they are read.
+
+Every write also updates the deck's row in the full-text search index
+(search_index.py) and the references to the image files it shows
+(media_store.py) in the same transaction. Deleting a deck also deletes its
+conversation memory (conversation.py).
+"""
+import base64
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import and_, insert, or_, text, update
+
+from conversation import forget_conversation
+from media_store import release_deck_media, sync_deck_media
+from models import Presentation, PresentationSlide, db
+from search_index import index_deck, index_decks, remove_deck
+from slide_storage import decode_slide, decode_slides, encode_slide
+
+SUMMARY_LENGTH = 160
+
+# Presentation.storage_version of decks stored as PresentationSlide rows
+STORAGE_SLIDE_ROWS = 1
+
+
+class PresentationStore:
+    """
+    LRU cache of decks in front of the Presentation table (write-through)
+    upload_folder: where image files not registered in media_file yet are
+    looked up when a deck references them
+    """
+
+    def __init__(self, max_entries=256, upload_folder=None):
+        self.max_entries = max_entries
+        self.upload_folder = upload_folder
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.slides_written = 0
+        self.migrated = 0
+
+    def _remember(self, presentation, slides):
+        entry = {
+            "id": presentation.id,
+            "title": presentation.title,
+            "slides": slides,
+            "created_at": presentation.created_at,
+            "updated_at": presentation.updated_at,
+            "content_hash": presentation.content_hash,
+        }
+        with self._lock:
+            key = (presentation.user_id, presentation.id)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _forget(self, user_id, presentation_id):
+        with self._lock:
+            self._entries.pop((user_id, presentation_id), None)
+
+    def _cached_slides(self, user_id, presentation_id, updated_at):
+        """Cached slides of a deck if they are still current, else None"""
+        with self._lock:
+            entry = self._entries.get((user_id, presentation_id))
+            if entry is not None and entry["updated_at"] == updated_at:
+                self._entries.move_to_end((user_id, presentation_id))
+                self.hits += 1
+                return entry
+            self.misses += 1
+        return None
+
+    def get(self, user_id, presentation_id):
+        """
+        Load one of the user's decks
+        Returns: dict with id, title, slides, created_at, updated_at,
+        content_hash - or None
+        if the deck doesn't exist or belongs to someone else. The slides list
+        is shared with the cache, so callers must not modify it in place.
+        """
+        if presentation_id is None:
+            return None
+
+        updated_at = db.session.query(Presentation.updated_at).filter_by(
+            id=presentation_id, user_id=user_id
+        ).scalar()
+        if updated_at is None:
+            self._forget(user_id, presentation_id)
+            return None
+
+        entry = self._cached_slides(user_id, presentation_id, updated_at)
+        if entry is not None:
+            return entry
+
+        presentation = db.session.get(Presentation, presentation_id)
+        if presentation.storage_version != STORAGE_SLIDE_ROWS:
+            slides = self._migrate(presentation)
+            db.session.commit()
+        else:
+            slides = self._load_slides(presentation_id)
+            if presentation.content_hash is None:
+                self._store_hash(presentation, slides)
+                db.session.commit()
+        return self._remember(presentation, slides)
+
+    def version(self, user_id, presentation_id):
+        """
+        What the ETag of one of the user's decks is made of, without loading it
+        Returns: (updated_at, content_hash) - content_hash None for a deck not
+        read since hashes were added - or None if the deck doesn't exist
+        """
+        if presentation_id is None:
+            return None
+        row = db.session.query(Presentation.updated_at, Presentation.content_hash).filter_by(
+            id=presentation_id, user_id=user_id
+        ).first()
+        return tuple(row) if row is not None else None
+
+    def get_slide(self, user_id, presentation_id, index):
+        """
+        Load a single slide of one of the user's decks, decoding only that slide
+        Returns: slide dict, or None if the deck or the slide doesn't exist
+        """
+        row = db.session.query(Presentation.updated_at, Presentation.storage_version).filter_by(
+            id=presentation_id, user_id=user_id
+        ).first()
+        if row is None or index < 0:
+            return None
+
+        entry = self._cached_slides(user_id, presentation_id, row.updated_at)
+        if entry is None and row.storage_version != STORAGE_SLIDE_ROWS:
+            entry = self.get(user_id, presentation_id)
+        if entry is not None:
+            return entry["slides"][index] if index < len(entry["slides"]) else None
+
+        data = db.session.query(PresentationSlide.data).filter_by(
+            presentation_id=presentation_id, position=index
+        ).scalar()
+        return decode_slide(data) if data is not None else None
+
+    def outline(self, user_id, presentation_id):
+        """
+        Slide titles of one of the user's decks, without decoding any slide
+        Returns: list of titles, or None if the deck doesn't exist
+        """
+        storage_version = db.session.query(Presentation.storage_version).filter_by(
+            id=presentation_id, user_id=user_id
+        ).scalar()
+        if storage_version is None:
+            return None
+        if storage_version != STORAGE_SLIDE_ROWS:
+            return [slide_title(slide) for slide in self.get(user_id, presentation_id)["slides"]]
+        rows = db.session.query(PresentationSlide.title).filter_by(
+            presentation_id=presentation_id
+        ).order_by(PresentationSlide.position).all()
+        return [title for (title,) in rows]
+
+    def create(self, user_id, slides, title=None):
+        """
+        Insert a new deck for the user
+        Returns: presentation ID
+        """
+        presentation = Presentation(
+            title=title or deck_title(slides),
+            user_id=user_id,
+            slides_data='',
+            storage_version=STORAGE_SLIDE_ROWS,
+            slide_count=len(slides),
+            summary=deck_summary(slides),
+            content_hash=deck_hash(slides)
+        )
+        db.session.add(presentation)
+        db.session.flush()
+        self._insert_slides(presentation.id, enumerate(slides))
+        index_deck(presentation.id, user_id, presentation.title, slides)
+        sync_deck_media(presentation.id, user_id, slides, self.upload_folder)
+        db.session.commit()
+        self._remember(presentation, slides)
+        return presentation.id
+
+    def create_many(self, user_id, decks):
+        """
+        Insert several new decks for the user in one transaction: one
+        multi-row insert each for the decks, their slides and the search
+        index. The decks are not put in the cache.
+        decks: list of (slides, title or None)
+        Returns: presentation IDs, in the order of decks
+        """
+        if not decks:
+            return []
+        now = datetime.utcnow()
+        rows = [{
+            "title": title or deck_title(slides),
+            "user_id": user_id,
+            "slides_data": '',
+            "storage_version": STORAGE_SLIDE_ROWS,
+            "slide_count": len(slides),
+            "summary": deck_summary(slides),
+            "content_hash": deck_hash(slides),
+            "created_at": now,
+            "updated_at": now,
+        } for slides, title in decks]
+        ids = db.session.execute(
+            insert(Presentation).returning(Presentation.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        self._insert_slides_many(
+            (presentation_id, position, slide)
+            for presentation_id, (slides, _) in zip(ids, decks)
+            for position, slide in enumerate(slides)
+        )
+        index_decks(user_id, [(presentation_id, row["title"], slides)
+                              for presentation_id, row, (slides, _) in zip(ids, rows, decks)])
+        for presentation_id, (slides, _) in zip(ids, decks):
+            sync_deck_media(presentation_id, user_id, slides, self.upload_folder)
+        db.session.commit()
+        return ids
+
+    def save(self, user_id, presentation_id, slides, title=None):
+        """
+        Replace the slides of one of the user's decks, writing only the
+        slides that changed
+        Returns: True if the deck exists and was saved
+        """
+        presentation = db.session.get(Presentation, presentation_id)
+        if presentation is None or presentation.user_id != user_id:
+            self._forget(user_id, presentation_id)
+            return False
+
+        if presentation.storage_version != STORAGE_SLIDE_ROWS:
+            # Still in slides_data: every slide is new
+            PresentationSlide.query.filter_by(presentation_id=presentation_id).delete()
+            previous = []
+        else:
+            entry = self._cached_slides(user_id, presentation_id, presentation.updated_at)
+            previous = entry["slides"] if entry is not None else self._load_slides(presentation_id)
+
+        inserts, updates = [], []
+        for position, slide in enumerate(slides):
+            if position < len(previous) and previous[position] == slide:
+                continue
+            row = {"presentation_id": presentation_id, "position": position,
+                   "title": slide_title(slide), "data": encode_slide(slide)}
+            (updates if position < len(previous) else inserts).append(row)
+
+        if updates:
+            db.session.execute(update(PresentationSlide), updates)
+        if inserts:
+            db.session.execute(insert(PresentationSlide), inserts)
+        if len(previous) > len(slides):
+            PresentationSlide.query.filter(
+                PresentationSlide.presentation_id == presentation_id,
+                PresentationSlide.position >= len(slides)
+            ).delete()
+
+        presentation.slides_data = ''
+        presentation.storage_version = STORAGE_SLIDE_ROWS
+        presentation.title = title or deck_title(slides)
+        presentation.slide_count = len(slides)
+        presentation.summary = deck_summary(slides)
+        presentation.content_hash = deck_hash(slides)
+        presentation.updated_at = datetime.utcnow()
+        index_deck(presentation_id, user_id, presentation.title, slides)
+        sync_deck_media(presentation_id, user_id, slides, self.upload_folder)
+        db.session.commit()
+        with self._lock:
+            self.slides_written += len(inserts) + len(updates)
+        self._remember(presentation, slides)
+        return True
+
+    def delete(self, user_id, presentation_id):
+        """
+        Delete one of the user's decks
+        Returns: True if a deck was deleted
+        """
+        self._forget(user_id, presentation_id)
+        presentation = Presentation.query.filter_by(id=presentation_id, user_id=user_id).first()
+        if presentation is None:
+            return False
+        PresentationSlide.query.filter_by(presentation_id=presentation_id).delete()
+        remove_deck(presentation_id)
+        forget_conversation(presentation_id)
+        release_deck_media(presentation_id, user_id)
+        db.session.delete(presentation)
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def _load_slides(presentation_id):
+        rows = db.session.query(PresentationSlide.data).filter_by(
+            presentation_id=presentation_id
+        ).order_by(PresentationSlide.position).all()
+        return decode_slides(data for (data,) in rows)
+
+    def _insert_slides(self, presentation_id, positioned_slides):
+        self._insert_slides_many((presentation_id, position, slide) for position, slide in positioned_slides)
+
+    def _insert_slides_many(self, slides):
+        rows = [
+            {"presentation_id": presentation_id, "position": position,
+             "title": slide_title(slide), "data": encode_slide(slide)}
+            for presentation_id, position, slide in slides
+        ]
+        if rows:
+            db.session.execute(insert(PresentationSlide), rows)
+        with self._lock:
+            self.slides_written += len(rows)
+
+    def _migrate(self, presentation):
+        """
+        Move a deck from slides_data to slide rows (caller commits)
+        Returns: the slides
+        """
+        slides = json.loads(presentation.slides_data) if presentation.slides_data else []
+        PresentationSlide.query.filter_by(presentation_id=presentation.id).delete()
+        self._insert_slides(presentation.id, enumerate(slides))
+        # Core UPDATE with updated_at set to itself: moving storage is not an edit
+        db.session.execute(
+            update(Presentation).where(Presentation.id == presentation.id).values(
+                slides_data='', storage_version=STORAGE_SLIDE_ROWS, content_hash=deck_hash(slides),
+                updated_at=Presentation.updated_at
+            ),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.expire(presentation, ['slides_data', 'storage_version', 'content_hash'])
+        with self._lock:
+            self.migrated += 1
+        return slides
+
+    @staticmethod
+    def _store_hash(presentation, slides):
+        """Store the content hash of a deck saved before it had one (caller commits)"""
+        # Core UPDATE with updated_at set to itself, like _migrate()
+        db.session.execute(
+            update(Presentation).where(Presentation.id == presentation.id).values(
+                content_hash=deck_hash(slides), updated_at=Presentation.updated_at
+            ),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.expire(presentation, ['content_hash'])
+
+    def migrate_all(self, batch_size=200):
+        """
+        Move every deck still stored in slides_data to slide rows
+        Returns: number of decks moved
+        """
+        moved = 0
+        while True:
+            ids = [presentation_id for (presentation_id,) in db.session.query(Presentation.id).filter(
+                Presentation.storage_version != STORAGE_SLIDE_ROWS
+            ).limit(batch_size).all()]
+            if not ids:
+                return moved
+            for presentation_id in ids:
+                self._migrate(db.session.get(Presentation, presentation_id))
+            db.session.commit()
+            db.session.expunge_all()
+            moved += len(ids)
+
+    def backfill_media(self, batch_size=200):
+        """
+        Record the image files used by every deck (decks saved before the
+        media table existed have no references)
+        Returns: number of decks looked at
+        """
+        checked = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(
+                Presentation.id, Presentation.user_id, Presentation.storage_version, Presentation.slides_data
+            ).filter(Presentation.id > last_id).order_by(Presentation.id).limit(batch_size).all()
+            if not rows:
+                return checked
+            for presentation_id, user_id, storage_version, slides_data in rows:
+                try:
+                    if storage_version == STORAGE_SLIDE_ROWS:
+                        slides = self._load_slides(presentation_id)
+                    else:
+                        slides = json.loads(slides_data) if slides_data else []
+                except ValueError:
+                    slides = []
+                sync_deck_media(presentation_id, user_id, slides if isinstance(slides, list) else [],
+                                self.upload_folder)
+            db.session.commit()
+            checked += len(rows)
+            last_id = rows[-1].id
+
+    def list_page(self, user_id, limit, cursor=None):
+        """
+        One page of the user's decks, most recently updated first, without
+        loading any slides
+        cursor: next_cursor of the previous page, None for the first page
+        Returns: (list of dicts with id, title, slide_count, summary,
+        created_at, updated_at - next_cursor or None on the last page)
+        Raises: ValueError if the cursor is malformed
+        """
+        query = db.session.query(
+            Presentation.id, Presentation.title, Presentation.slide_count, Presentation.summary,
+            Presentation.created_at, Presentation.updated_at
+        ).filter(Presentation.user_id == user_id)
+
+        if cursor:
+            updated_at, presentation_id = decode_cursor(cursor)
+            # The first condition alone bounds the index seek; the OR breaks ties on id
+            query = query.filter(Presentation.updated_at <= updated_at, or_(
+                Presentation.updated_at < updated_at,
+                and_(Presentation.updated_at == updated_at, Presentation.id < presentation_id)
+            ))
+
+        rows = query.order_by(Presentation.updated_at.desc(), Presentation.id.desc()).limit(limit + 1).all()
+        items = [row._asdict() for row in rows[:limit]]
+        for item in items:
+            item["summary"] = item["summary"] or ""
+        next_cursor = encode_cursor(items[-1]["updated_at"], items[-1]["id"]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "slides_written": self.slides_written, "migrated": self.migrated}
+
+
+def deck_title(slides):
+    """Title of a deck: the first slide's title"""
+    return slides[0].get("title", "Untitled Presentation") if slides else "Untitled Presentation"
+
+
+def slide_title(slide):
+    """Title of a slide for the outline"""
+    return str(slide.get("title") or "")[:200] if isinstance(slide, dict) else ""
+
+
+def deck_hash(slides):
+    """Hash of a deck's slides, the same for equal slides whatever their key order"""
+    data = json.dumps(slides, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+
+def slide_hash(slide):
+    """
+    Short hash of one slide as the client receives it; the preview only
+    re-renders slides whose hash changed (static/js/slide_preview.js)
+    """
+    data = json.dumps(slide, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def slide_hashes(slides):
+    return [slide_hash(slide) for slide in slides]
+
+
+def deck_summary(slides):
+    """Short plain-text summary of a deck for listings: the first slide's content"""
+    if not slides or not isinstance(slides[0], dict):
+        return ""
+    content = slides[0].get("content")
+    if isinstance(content, list):
+        content = " · ".join(str(point) for point in content)
+    summary = re.sub(r'\s+', ' ', str(content or '')).strip()
+    if len(summary) > SUMMARY_LENGTH:
+        summary = summary[:SUMMARY_LENGTH - 1].rstrip() + "…"
+    return summary
+
+
+def encode_cursor(updated_at, presentation_id):
+    """Opaque history cursor: position of the last deck of a page"""
+    raw = f"{updated_at.isoformat()}|{presentation_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of encode_cursor()
+    Returns: (updated_at, presentation_id)
+    Raises: ValueError if the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        updated_at, presentation_id = raw.split('|')
+        return datetime.fromisoformat(updated_at), int(presentation_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def backfill_summaries(batch_size=500):
+    """
+    Fill slide_count and summary of decks saved before those columns existed
+    Returns: number of decks updated
+    """
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            text('SELECT id, slides_data FROM presentation WHERE summary IS NULL LIMIT :limit'),
+            {"limit": batch_size}
+        ).all()
+        if not rows:
+            break
+        values = []
+        for presentation_id, slides_data in rows:
+            try:
+                slides = json.loads(slides_data)
+            except ValueError:
+                slides = []
+            if not isinstance(slides, list):
+                slides = []
+            values.append({"id": presentation_id, "count": len(slides), "summary": deck_summary(slides)})
+        db.session.execute(
+            text('UPDATE presentation SET slide_count = :count, summary = :summary WHERE id = :id'),
+            values
+        )
+        db.session.commit()
+        updated += len(values)
+    return updated
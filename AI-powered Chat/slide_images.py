@@ -0,0 +1,368 @@
+"""
+Images for slides: search the image hosts for a slide's query, download
+the result and store it in the upload folder (image_processing.py), with
+repeated search terms served from the image cache.
+
+requests and Pillow are imported by the functions that download and decode
+images, not when the app starts.
+
+The async views (asgi.py) use the a-prefixed versions: the same requests,
+made with the app's shared httpx.AsyncClient on the event loop, with only
+the image decoding and the database writes sent to the worker pool.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+
+from flask import current_app
+
+from image_pipeline import SlideImageBatch, get_executor, resolve_images_async
+from instrumentation import IMAGE_DOWNLOAD_BYTES, log, stage
+from media_store import UPLOAD_URL_PREFIX, media_path, over_quota, register_media
+from models import db, db_step, release_connection
+from services import async_http, image_cache
+
+
+def normalize_image_query(query):
+    """
+    Reduce an image search query to its top keywords
+    Returns: comma-separated search term (also used as the image cache key)
+    """
+    # Remove common words and use top keywords
+    stop_words = ['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about']
+    words = [w.lower() for w in query.split() if w.lower() not in stop_words]
+
+    # Use top 3-4 most relevant keywords
+    return ','.join(words[:4])
+
+
+def fetch_image_from_unsplash(query, index=0):
+    """
+    Fetch a relevant image from Unsplash based on search query
+    Returns: image URL or None
+    """
+    import requests
+
+    # Using Unsplash Source API (no API key required)
+    # Format: https://source.unsplash.com/{WIDTH}x{HEIGHT}/?{KEYWORD}
+    search_term = normalize_image_query(query)
+
+    # Build URL - Unsplash Source uses comma-separated keywords
+    image_url = f"{current_app.config['UNSPLASH_SOURCE_URL']}/800x600/?{search_term}"
+
+    try:
+        # Test if image is accessible
+        with stage("image_resolve", provider="unsplash", slide=index + 1, url=image_url) as span:
+            response = requests.get(image_url, timeout=10, allow_redirects=True)
+            span["status"] = response.status_code
+            if response.status_code != 200:
+                # 503 when Unsplash is unavailable
+                span["outcome"] = "fallback"
+    except Exception:
+        # Logged by stage(), use the fallback service
+        return fetch_image_fallback(query, index)
+
+    if response.status_code == 200:
+        # Get the final redirected URL
+        return response.url
+    return fetch_image_fallback(query, index)
+
+
+def fetch_image_fallback(query, index=0):
+    """
+    Fallback image service using Lorem Picsum (always available)
+    Returns: image URL
+    """
+    import requests
+
+    # Lorem Picsum provides random images with optional seed
+    # Format: https://picsum.photos/seed/{SEED}/800/600
+    picsum_url = current_app.config['PICSUM_URL']
+    seed = f"{query.replace(' ', '-')}-{index}"
+    fallback_url = f"{picsum_url}/seed/{seed}/800/600"
+
+    try:
+        # Test if accessible
+        with stage("image_resolve", provider="picsum", slide=index + 1, url=fallback_url) as span:
+            response = requests.head(fallback_url, timeout=5)
+            span["status"] = response.status_code
+            if response.status_code != 200:
+                span["outcome"] = "fallback"
+    except Exception:
+        # Logged by stage(). Last resort: basic random image
+        return f"{picsum_url}/800/600?random={index}"
+
+    if response.status_code == 200:
+        return fallback_url
+
+    # If even fallback fails, use basic Lorem Picsum
+    return f"{picsum_url}/800/600?random={index}"
+
+
+def image_fields(processed):
+    """Slide fields of an image stored by process_image()"""
+    return {
+        "image_url": f"{UPLOAD_URL_PREFIX}{processed['filename']}",
+        "thumbnail_url": f"{UPLOAD_URL_PREFIX}{processed['thumbnail']}",
+        "image_meta": processed["meta"]
+    }
+
+
+def store_image(data):
+    """
+    Store an image's slide-sized and thumbnail variants in the upload folder
+    Returns: process_image() result
+    Raises: ImageProcessingError for data that isn't a usable image
+    """
+    # Pillow is imported with the first image
+    from image_processing import process_image
+    return process_image(data, current_app.config['UPLOAD_FOLDER'])
+
+
+def record_stored_image(processed, owner_id):
+    """
+    Register both files of an image stored by process_image() in the media
+    table, unused until a deck shows them (runs on any thread)
+    """
+    meta = processed["meta"]
+    with current_app.app_context():
+        try:
+            register_media([(processed["filename"], meta["bytes"]), (processed["thumbnail"], meta["thumb_bytes"])],
+                           owner_id)
+            db.session.commit()
+        except Exception as e:
+            # Only means the files are never swept
+            db.session.rollback()
+            log("media_register_failed", logging.WARNING, path=processed["filename"], error=str(e))
+
+
+def download_and_save_image(image_url, slide_index, owner_id=None):
+    """
+    Download image from URL and store its slide-sized and thumbnail variants
+    in the uploads folder (see image_processing.py)
+    Returns: dict of image fields (image_url, thumbnail_url, image_meta) or None
+    """
+    import requests
+
+    try:
+        with stage("image_download", slide=slide_index + 1) as span:
+            response = requests.get(image_url, timeout=15, stream=True)
+            span["status"] = response.status_code
+            if response.status_code != 200:
+                span["outcome"] = "failed"
+                return None
+
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=8192):
+                data.extend(chunk)
+                if len(data) > current_app.config['MAX_CONTENT_LENGTH']:
+                    span["outcome"] = "too_large"
+                    return None
+            span["bytes"] = len(data)
+        IMAGE_DOWNLOAD_BYTES.observe(len(data))
+
+        # Identical images are stored once, whichever deck downloads them
+        with stage("image_process", slide=slide_index + 1) as span:
+            processed = store_image(bytes(data))
+            meta = processed["meta"]
+            span.update(width=meta['width'], height=meta['height'], bytes=meta['bytes'],
+                        thumb_bytes=meta['thumb_bytes'])
+        record_stored_image(processed, owner_id)
+
+        return image_fields(processed)
+
+    except Exception:
+        # Download errors and unusable images, logged by stage()
+        return None
+
+
+def local_image_path(image_url, folder=None):
+    """
+    File behind an image URL in the upload folder (default: the app's)
+    Returns: path, or None for other URLs and missing files
+    """
+    relative = media_path(image_url)
+    if relative is None:
+        return None
+    path = os.path.join(folder or current_app.config['UPLOAD_FOLDER'], relative)
+    return path if os.path.exists(path) else None
+
+
+def uploaded_file_exists(image, folder=None):
+    """Whether the files of a cached image (fields dict or URL) are still in the upload folder"""
+    urls = [image["image_url"], image.get("thumbnail_url")] if isinstance(image, dict) else [image]
+    return all(local_image_path(url, folder) is not None for url in urls if url)
+
+
+def resolve_slide_image(query, index, owner_id=None):
+    """
+    Find and download the image for one slide (runs on the image worker pool)
+    Repeated search terms are served from the image cache without any request.
+    Returns: dict of image fields or None
+    """
+    def fetch_and_download():
+        log("image_search", logging.DEBUG, slide=index + 1, query=query)
+        image_url = fetch_image_from_unsplash(query, index)
+        if not image_url:
+            return None
+        return download_and_save_image(image_url, index, owner_id)
+
+    return image_cache.get_or_resolve(normalize_image_query(query), fetch_and_download)
+
+
+def cached_slide_image(query, index):
+    """Image for one slide only if it is already stored (image cache hit), no download"""
+    return image_cache.get(normalize_image_query(query))
+
+
+def new_image_batch(user_id):
+    """
+    Create the image batch for one of a user's decks using the configured
+    limits. A user over their disk quota only gets images that are already
+    stored; nothing is downloaded for them.
+    The request's database connection is released for the image workers.
+    """
+    config = current_app.config
+    quota_exceeded = over_quota(user_id, config['MEDIA_QUOTA_BYTES'])
+    release_connection()
+    if quota_exceeded:
+        log("media_quota_exceeded", logging.WARNING, user_id=user_id)
+        resolve = cached_slide_image
+    else:
+        def resolve(query, index):
+            return resolve_slide_image(query, index, user_id)
+    return SlideImageBatch(
+        resolve,
+        max_concurrency=config['IMAGE_DECK_CONCURRENCY'],
+        deadline=config['IMAGE_DECK_DEADLINE'],
+        executor=get_executor(config['IMAGE_POOL_WORKERS'])
+    )
+
+
+# Async versions, for the event loop of the ASGI app
+
+async def in_worker_pool(function, *args):
+    """Run a blocking image step (Pillow, media registration) on the image worker pool, in this request's context"""
+    executor = get_executor(current_app.config['IMAGE_POOL_WORKERS'])
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, contextvars.copy_context().run, function, *args
+    )
+
+
+async def afetch_image_from_unsplash(query, index=0):
+    """
+    fetch_image_from_unsplash() on the shared async HTTP client
+    Returns: image URL or None
+    """
+    search_term = normalize_image_query(query)
+    image_url = f"{current_app.config['UNSPLASH_SOURCE_URL']}/800x600/?{search_term}"
+
+    try:
+        with stage("image_resolve", provider="unsplash", slide=index + 1, url=image_url) as span:
+            response = await async_http.get(image_url, timeout=10, follow_redirects=True)
+            span["status"] = response.status_code
+            if response.status_code != 200:
+                span["outcome"] = "fallback"
+    except Exception:
+        # Logged by stage(), use the fallback service
+        return await afetch_image_fallback(query, index)
+
+    if response.status_code == 200:
+        return str(response.url)
+    return await afetch_image_fallback(query, index)
+
+
+async def afetch_image_fallback(query, index=0):
+    """
+    fetch_image_fallback() on the shared async HTTP client
+    Returns: image URL
+    """
+    picsum_url = current_app.config['PICSUM_URL']
+    seed = f"{query.replace(' ', '-')}-{index}"
+    fallback_url = f"{picsum_url}/seed/{seed}/800/600"
+
+    try:
+        with stage("image_resolve", provider="picsum", slide=index + 1, url=fallback_url) as span:
+            response = await async_http.head(fallback_url, timeout=5)
+            span["status"] = response.status_code
+            if response.status_code != 200:
+                span["outcome"] = "fallback"
+    except Exception:
+        return f"{picsum_url}/800/600?random={index}"
+
+    if response.status_code == 200:
+        return fallback_url
+    return f"{picsum_url}/800/600?random={index}"
+
+
+async def adownload_and_save_image(image_url, slide_index, owner_id=None):
+    """
+    download_and_save_image() on the shared async HTTP client
+    Returns: dict of image fields or None
+    """
+    try:
+        with stage("image_download", slide=slide_index + 1) as span:
+            async with async_http.stream('GET', image_url, timeout=15) as response:
+                span["status"] = response.status_code
+                if response.status_code != 200:
+                    span["outcome"] = "failed"
+                    return None
+
+                data = bytearray()
+                async for chunk in response.aiter_bytes(8192):
+                    data.extend(chunk)
+                    if len(data) > current_app.config['MAX_CONTENT_LENGTH']:
+                        span["outcome"] = "too_large"
+                        return None
+            span["bytes"] = len(data)
+        IMAGE_DOWNLOAD_BYTES.observe(len(data))
+
+        with stage("image_process", slide=slide_index + 1) as span:
+            processed = await in_worker_pool(store_image, bytes(data))
+            meta = processed["meta"]
+            span.update(width=meta['width'], height=meta['height'], bytes=meta['bytes'],
+                        thumb_bytes=meta['thumb_bytes'])
+        await in_worker_pool(record_stored_image, processed, owner_id)
+
+        return image_fields(processed)
+
+    except Exception:
+        # Download errors and unusable images, logged by stage()
+        return None
+
+
+async def aresolve_slide_image(query, index, owner_id=None):
+    """
+    resolve_slide_image() as a coroutine
+    Returns: dict of image fields or None
+    """
+    async def fetch_and_download():
+        log("image_search", logging.DEBUG, slide=index + 1, query=query)
+        image_url = await afetch_image_from_unsplash(query, index)
+        if not image_url:
+            return None
+        return await adownload_and_save_image(image_url, index, owner_id)
+
+    return await image_cache.aget_or_resolve(normalize_image_query(query), fetch_and_download)
+
+
+async def add_images_async(user_id, slides, indices):
+    """
+    Images for slides[index] of each index of one of a user's decks, with
+    the limits of new_image_batch() (and its disk quota check)
+    """
+    config = current_app.config
+    if await db_step(over_quota, user_id, config['MEDIA_QUOTA_BYTES']):
+        log("media_quota_exceeded", logging.WARNING, user_id=user_id)
+
+        async def resolve(query, index):
+            return cached_slide_image(query, index)
+    else:
+        async def resolve(query, index):
+            return await aresolve_slide_image(query, index, user_id)
+    await resolve_images_async(
+        slides, indices, resolve,
+        max_concurrency=config['IMAGE_DECK_CONCURRENCY'],
+        deadline=config['IMAGE_DECK_DEADLINE']
+    )
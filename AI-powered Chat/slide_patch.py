@@ -0,0 +1,275 @@
+"""
+Patch-mode slide editing.
+
+Instead of sending the whole deck to the model and asking for every slide
+back, /update works out which slides an instruction targets ("slide 3",
+"slides 2-4", "the last slide", a slide title, or an explicit index list from
+the client). Only those slides are sent in full, the rest as a one-line
+outline, and the model answers with a small JSON patch that is merged into
+the deck server-side. Image fields are never sent to the model and are kept
+on merge.
+
+Both prompts can carry the deck's earlier requests (conversation.py) ahead
+of the new instruction.
+"""
+import json
+import re
+
+# Fields filled in by the server, not by the model
+IMAGE_FIELDS = ('image_url', 'has_image', 'thumbnail_url', 'image_meta')
+
+ORDINALS = {
+    'first': 0, 'second': 1, 'third': 2, 'fourth': 3, 'fifth': 4,
+    'sixth': 5, 'seventh': 6, 'eighth': 7, 'ninth': 8, 'tenth': 9,
+}
+
+# "slide 3", "slides 2, 4 and 5", "slides 2-4", "slide #3"
+_SLIDE_NUMBERS = re.compile(
+    r'\bslides?\s*#?\s*(\d+(?:\s*(?:,|&|and|to|through|-|–)\s*#?\s*\d+)*)',
+    re.IGNORECASE
+)
+_NUMBER_RANGE = re.compile(r'(\d+)\s*(?:to|through|-|–)\s*(\d+)', re.IGNORECASE)
+_ORDINAL_SLIDE = re.compile(r'\b(' + '|'.join(ORDINALS) + r'|last|final|title|opening|closing)\s+slide\b', re.IGNORECASE)
+_WHOLE_DECK = re.compile(r'\b(all|every|each|whole|entire)\b\s*(?:of\s+the\s+)?(?:slides?|deck|presentation)', re.IGNORECASE)
+_ADD_SLIDE = re.compile(r'\b(add|insert|append|include)\b[^.]*?\bslides?\b', re.IGNORECASE)
+_QUOTED = re.compile(r'["“\'‘]([^"”\'’]{4,})["”\'’]')
+
+# Titles shorter than this are too generic to match against a prompt
+MIN_TITLE_MATCH = 4
+
+
+def find_target_slides(prompt, slides, explicit=None):
+    """
+    Work out which slides an edit instruction is about
+    explicit: optional list of 0-based slide indices sent by the client
+    Returns: sorted list of 0-based indices (empty when the instruction only
+    adds slides), or None when the instruction is about the whole deck or
+    nothing specific could be found
+    """
+    if not slides or _WHOLE_DECK.search(prompt):
+        return None
+
+    count = len(slides)
+    targets = set()
+
+    for index in explicit or []:
+        if isinstance(index, int) and 0 <= index < count:
+            targets.add(index)
+
+    for match in _SLIDE_NUMBERS.finditer(prompt):
+        numbers = match.group(1)
+        for start, end in _NUMBER_RANGE.findall(numbers):
+            targets.update(range(int(start) - 1, int(end)))
+        for number in re.findall(r'\d+', _NUMBER_RANGE.sub(' ', numbers)):
+            targets.add(int(number) - 1)
+
+    for match in _ORDINAL_SLIDE.finditer(prompt):
+        word = match.group(1).lower()
+        if word in ('last', 'final', 'closing'):
+            targets.add(count - 1)
+        elif word in ('title', 'opening'):
+            targets.add(0)
+        else:
+            targets.add(ORDINALS[word])
+
+    if not targets:
+        lowered = prompt.lower()
+        quoted = [q.lower() for q in _QUOTED.findall(prompt)]
+        for index, slide in enumerate(slides):
+            title = str(slide.get('title') or '').strip().lower()
+            if len(title) < MIN_TITLE_MATCH:
+                continue
+            if title in lowered or any(q in title for q in quoted):
+                targets.add(index)
+
+    # "slide 9" in a 5 slide deck may mean "add slide 9", handled as an insert
+    targets = sorted(i for i in targets if 0 <= i < count)
+    if not targets and _ADD_SLIDE.search(prompt):
+        return []
+    return targets or None
+
+
+def strip_image_fields(slide):
+    """Copy of a slide without the server-managed image fields"""
+    return {key: value for key, value in slide.items() if key not in IMAGE_FIELDS}
+
+
+def outline(slides):
+    """One line per slide: number and title"""
+    return "\n".join(
+        f"{index + 1}. {slide.get('title', 'Untitled Slide')}"
+        for index, slide in enumerate(slides)
+    )
+
+
+def conversation_section(memory):
+    """Prompt lines with the deck's earlier requests, nothing without any"""
+    if not memory:
+        return ""
+    return f"""Earlier in this conversation (the slides above already include these changes):
+        {memory}
+
+        """
+
+
+def build_patch_prompt(user_prompt, slides, targets, memory=None):
+    """
+    Prompt that sends only the targeted slides plus an outline of the rest
+    memory: optional conversation context of the deck (conversation.py)
+    Returns: prompt string
+    """
+    targeted = {str(index + 1): strip_image_fields(slides[index]) for index in targets}
+
+    return f"""You are an AI assistant helping to edit PowerPoint presentations.
+
+        The deck has {len(slides)} slides. Outline (number. title):
+        {outline(slides)}
+
+        Full content of the slides being edited, by slide number (may be empty
+        when slides are only being added):
+        {json.dumps(targeted, separators=(',', ':'))}
+
+        {conversation_section(memory)}User wants to: {user_prompt}
+
+        Respond ONLY with a JSON patch in this format:
+        {{
+          "patch": [
+            {{"op": "replace", "slide": 3, "data": {{"title": "Slide Title", "content": ["Point 1", "Point 2"], "image_search_query": "search terms"}}}},
+            {{"op": "insert", "after": 3, "data": {{"title": "New Slide", "content": ["Point 1"], "image_search_query": "search terms"}}}},
+            {{"op": "delete", "slide": 4}}
+          ],
+          "message": "Brief description of changes made"
+        }}
+
+        Important:
+        - Only "replace" or "delete" the slides whose full content is shown above
+        - "replace" must contain the complete updated slide, not just the changed fields
+        - Use "insert" with "after": 0 to add a slide at the start
+        - Slide numbers count from 1 and refer to the outline above
+        - Make only the changes requested by the user
+        """
+
+
+def build_full_prompt(user_prompt, slides, memory=None):
+    """
+    Prompt for instructions that concern the whole deck
+    memory: optional conversation context of the deck (conversation.py)
+    Returns: prompt string
+    """
+    compact = [strip_image_fields(slide) for slide in slides]
+
+    return f"""You are an AI assistant helping to edit PowerPoint presentations.
+
+        Current slides:
+        {json.dumps(compact, separators=(',', ':'))}
+
+        {conversation_section(memory)}User wants to: {user_prompt}
+
+        Please provide the UPDATED complete slide deck in this JSON format:
+        {{
+          "slides": [
+            {{
+              "title": "Slide Title",
+              "content": ["Point 1", "Point 2", "Point 3"],
+              "image_search_query": "specific descriptive search terms"
+            }}
+          ],
+          "message": "Brief description of changes made"
+        }}
+
+        Important:
+        - Return ALL slides, including unchanged ones
+        - Make only the changes requested by the user
+        - Maintain the same structure and format
+        - If editing a specific slide number, count from 1 (not 0)
+        """
+
+
+def merge_slide(old, new):
+    """
+    Updated slide with the old slide's image fields (and any field the model
+    left out) preserved
+    """
+    merged = dict(old)
+    merged.update(strip_image_fields(new))
+    if merged.get('image_search_query') != old.get('image_search_query'):
+        # The image no longer matches, let the caller fetch a new one
+        for key in IMAGE_FIELDS:
+            merged.pop(key, None)
+    return merged
+
+
+def apply_patch(slides, patch, targets):
+    """
+    Merge a model patch into the deck
+    Returns: (new slides, list of indices in the new deck whose content changed)
+    """
+    count = len(slides)
+    targets = set(targets)
+    replaced = {}
+    deleted = set()
+    inserts = {}
+
+    for op in patch if isinstance(patch, list) else []:
+        if not isinstance(op, dict):
+            continue
+        kind = op.get('op')
+        data = op.get('data')
+        try:
+            if kind == 'replace' and isinstance(data, dict):
+                index = int(op.get('slide')) - 1
+                if index in targets:
+                    replaced[index] = merge_slide(slides[index], data)
+            elif kind == 'delete':
+                index = int(op.get('slide')) - 1
+                if index in targets:
+                    deleted.add(index)
+            elif kind == 'insert' and isinstance(data, dict):
+                after = min(max(int(op.get('after', count)), 0), count)
+                inserts.setdefault(after, []).append(strip_image_fields(data))
+        except (TypeError, ValueError):
+            continue
+
+    result = []
+    changed = []
+
+    def add(slide, is_changed):
+        if is_changed:
+            changed.append(len(result))
+        result.append(slide)
+
+    for slide in inserts.get(0, []):
+        add(slide, True)
+    for index, slide in enumerate(slides):
+        if index not in deleted:
+            add(replaced.get(index, slide), index in replaced)
+        for new_slide in inserts.get(index + 1, []):
+            add(new_slide, True)
+
+    return result, changed
+
+
+def restore_image_fields(old_slides, new_slides):
+    """
+    Put the image fields back on a fully regenerated deck, matching slides by
+    title first and by position when the title changed
+    Returns: list of indices whose slides changed
+    """
+    by_title = {}
+    for slide in old_slides:
+        by_title.setdefault(str(slide.get('title', '')).strip().lower(), slide)
+
+    changed = []
+    for index, slide in enumerate(new_slides):
+        old = by_title.get(str(slide.get('title', '')).strip().lower())
+        if old is None and index < len(old_slides):
+            old = old_slides[index]
+        if old is None:
+            changed.append(index)
+            continue
+        merged = merge_slide(old, slide)
+        if strip_image_fields(merged) != strip_image_fields(old):
+            changed.append(index)
+        slide.clear()
+        slide.update(merged)
+    return changed
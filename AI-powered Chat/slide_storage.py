@@ -0,0 +1,93 @@
+"""
+Binary encoding of stored slides.
+
+Each slide is stored as its own row (PresentationSlide) holding one encoded
+blob: a format byte followed by the payload.
+
+- FORMAT_JSON: compact UTF-8 JSON, used when compression doesn't pay off
+- FORMAT_DEFLATE: the same JSON, raw deflate (no zlib header or checksum,
+  4 KB window) with a preset dictionary of the keys and values every slide
+  repeats, so even a single small slide compresses well
+
+ZDICT is part of the format: a blob can only be decompressed with the exact
+dictionary it was compressed with. Never edit it; add a new format byte with
+a new dictionary instead and keep decoding the old one.
+"""
+import json
+import zlib
+
+FORMAT_JSON = 0
+FORMAT_DEFLATE = 1
+
+COMPRESSION_LEVEL = 6
+# Raw deflate, 4 KB window: a slide is rarely bigger and the codec state is 16x smaller
+WBITS = -12
+
+# Most frequent strings last: zlib prefers the closest match. The keys follow
+# the order the generation and image pipeline write them in
+ZDICT = (
+    b'"image_position":"background","image_position":"center","image_position":"left",'
+    b'"image_position":"top","image_position":"bottom",'
+    b'"has_image":false}'
+    b'","thumb_width":320,"thumb_height":'
+    b',"thumb_bytes":'
+    b',"source_sha256":"'
+    b'","source_bytes":'
+    b'},"has_image":true}'
+    b'_thumb.webp","image_meta":{"width":1600,"height":'
+    b',"bytes":'
+    b',"sha256":"'
+    b'.jpg","thumbnail_url":"/static/uploads/'
+    b'","image_position":"right","image_url":"/static/uploads/'
+    b'"],"image_search_query":"'
+    b'","content":["'
+    b'","'
+    b'{"title":"'
+)
+
+
+def encode_slide(slide):
+    """
+    Encode one slide for storage
+    Returns: bytes (format byte + payload)
+    """
+    raw = json.dumps(slide, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, WBITS, zdict=ZDICT)
+    packed = compressor.compress(raw) + compressor.flush()
+    if len(packed) < len(raw):
+        return bytes([FORMAT_DEFLATE]) + packed
+    return bytes([FORMAT_JSON]) + raw
+
+
+def _payload(data):
+    """JSON bytes of an encoded slide"""
+    if not data:
+        raise ValueError("Empty slide blob")
+    fmt, payload = data[0], data[1:]
+    if fmt == FORMAT_DEFLATE:
+        decompressor = zlib.decompressobj(WBITS, zdict=ZDICT)
+        try:
+            return decompressor.decompress(payload) + decompressor.flush()
+        except zlib.error as e:
+            raise ValueError(f"Damaged slide blob: {e}") from e
+    if fmt == FORMAT_JSON:
+        return payload
+    raise ValueError(f"Unknown slide format {fmt}")
+
+
+def decode_slide(data):
+    """
+    Inverse of encode_slide()
+    Returns: slide dict
+    Raises: ValueError for an unknown format or a damaged blob
+    """
+    return json.loads(_payload(data))
+
+
+def decode_slides(blobs):
+    """
+    Decode a whole deck in one JSON parse (cheaper than one per slide)
+    Returns: list of slide dicts
+    Raises: ValueError for an unknown format or a damaged blob
+    """
+    return json.loads(b'[' + b','.join(_payload(data) for data in blobs) + b']')
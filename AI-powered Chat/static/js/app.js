@@ -1,5 +1,8 @@
 // Global Variables
 let currentSlides = [];
+// Server hash of each slide (kept apart from the slides sent back to /update)
+let currentHashes = [];
+let currentPresentationId = null;
 let chatHistory = [];
 
 // DOM Elements
@@ -11,6 +14,7 @@ const generatePptBtn = document.getElementById('generatePptBtn');
 const clearSlidesBtn = document.getElementById('clearSlidesBtn');
 const slidesPreview = document.getElementById('slidesPreview');
 const loadingOverlay = document.getElementById('loadingOverlay');
+const slidePreview = new SlidePreview(slidesPreview);
 
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
@@ -38,7 +42,7 @@ function setupEventListeners() {
     clearChatBtn.addEventListener('click', clearChat);
     
     // Generate PowerPoint
-    generatePptBtn.addEventListener('click', generatePowerPoint);
+    generatePptBtn.addEventListener('click', downloadPowerPoint);
     
     // Clear slides
     clearSlidesBtn.addEventListener('click', clearSlides);
@@ -70,32 +74,25 @@ async function sendMessage() {
         // Determine if this is an edit or new generation
         const isEdit = detectEditIntent(message);
         
-        let response;
-        if (isEdit && currentSlides.length > 0) {
-            // Send to update endpoint
-            response = await fetch('/update', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    prompt: message,
-                    slides: currentSlides
-                })
-            });
-        } else {
-            // Send to chat endpoint
-            response = await fetch('/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    prompt: message
-                })
-            });
+        if (!isEdit || currentSlides.length === 0) {
+            // New decks are streamed slide by slide
+            await streamChat(message);
+            return;
         }
         
+        // Send to update endpoint
+        const response = await fetch('/update', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                prompt: message,
+                slides: currentSlides,
+                slide_indices: selectedSlideIndices()
+            })
+        });
+        
         if (!response.ok) {
             throw new Error('Failed to get response from server');
         }
@@ -108,6 +105,8 @@ async function sendMessage() {
         
         // Update slides
         currentSlides = data.slides || [];
+        currentHashes = data.slide_hashes || [];
+        currentPresentationId = data.presentation_id ?? currentPresentationId;
         
         // Add AI response to chat
         const aiMessage = data.message || 'Slides generated successfully!';
@@ -128,6 +127,102 @@ async function sendMessage() {
     }
 }
 
+// Generate a new deck through the streaming endpoint (Server-Sent Events)
+async function streamChat(message) {
+    const response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            prompt: message
+        })
+    });
+    
+    if (!response.ok || !response.body) {
+        throw new Error('Failed to get response from server');
+    }
+    
+    // Start from an empty deck, slides are added as they arrive
+    currentSlides = [];
+    currentHashes = [];
+    currentPresentationId = null;
+    updateSlidesPreview();
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            handleStreamEvent(parseServerSentEvent(rawEvent));
+        }
+    }
+}
+
+// Parse one "event: ...\ndata: ..." block
+function parseServerSentEvent(rawEvent) {
+    let event = 'message';
+    const dataLines = [];
+    
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    
+    return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+}
+
+// Apply one streamed event to the deck
+function handleStreamEvent({ event, data }) {
+    if (event === 'slide') {
+        currentSlides[data.index] = data.slide;
+        currentHashes[data.index] = data.hash;
+        updateSlidesPreview(data.index);
+        
+        // The first slide is on screen, the spinner is no longer needed
+        hideLoading();
+        clearSlidesBtn.disabled = false;
+    } else if (event === 'image_ready') {
+        const slide = currentSlides[data.index];
+        if (!slide) return;
+        slide.has_image = data.has_image;
+        if (data.image_url) {
+            slide.image_url = data.image_url;
+        }
+        if (data.thumbnail_url) {
+            slide.thumbnail_url = data.thumbnail_url;
+        }
+        currentHashes[data.index] = data.hash;
+        updateSlidesPreview(data.index);
+    } else if (event === 'done') {
+        currentPresentationId = data.presentation_id;
+        addMessageToChat(data.message || 'Slides generated successfully!', 'ai');
+        generatePptBtn.disabled = currentSlides.length === 0;
+        clearSlidesBtn.disabled = currentSlides.length === 0;
+    } else if (event === 'error') {
+        throw new Error(data.error);
+    }
+}
+
+// 0-based indices of the slides selected in the preview (sent with edits)
+function selectedSlideIndices() {
+    return Array.from(slidesPreview.querySelectorAll('.slide-card.active'))
+        .map(card => Number(card.dataset.index));
+}
+
 // Detect if message is an edit intent
 function detectEditIntent(message) {
     const editKeywords = ['edit', 'update', 'change', 'modify', 'replace', 'add to', 'remove from'];
@@ -165,56 +260,50 @@ function addMessageToChat(message, sender, isError = false) {
     chatHistory.push({ message, sender, timestamp: new Date() });
 }
 
-// Update slides preview
-function updateSlidesPreview() {
-    if (currentSlides.length === 0) {
-        slidesPreview.innerHTML = `
-            <div class="no-slides">
-                <i class="bi bi-file-earmark-plus"></i>
-                <p>No slides yet</p>
-                <small>Start chatting to create your presentation</small>
-            </div>
-        `;
+// Update slides preview (pass an index to render just that slide); cards of
+// unchanged slides are kept (static/js/slide_preview.js)
+function updateSlidesPreview(index) {
+    if (index !== undefined) {
+        slidePreview.update(index, currentSlides[index], currentHashes[index]);
         return;
     }
     
-    slidesPreview.innerHTML = '';
+    slidePreview.render(currentSlides, currentHashes);
+}
+
+// Download the saved deck as rendered by the server, falling back to
+// building it in the browser when the deck isn't saved
+async function downloadPowerPoint() {
+    if (currentPresentationId === null) {
+        generatePowerPoint();
+        return;
+    }
     
-    currentSlides.forEach((slide, index) => {
-        const slideCard = document.createElement('div');
-        slideCard.className = 'slide-card';
-        slideCard.dataset.index = index;
-        
-        let contentHtml = '';
-        if (Array.isArray(slide.content)) {
-            contentHtml = '<ul>' + slide.content.map(point => `<li>${escapeHtml(point)}</li>`).join('') + '</ul>';
-        } else if (typeof slide.content === 'string') {
-            contentHtml = `<p>${escapeHtml(slide.content)}</p>`;
-        }
-        
-        // Add image indicator if slide has image
-        let imageIndicator = '';
-        if (slide.has_image && slide.image_url) {
-            imageIndicator = '<div class="slide-image-indicator"><i class="bi bi-image-fill"></i> Has Image</div>';
+    showLoading();
+    
+    try {
+        const response = await fetch(`/export/${currentPresentationId}.pptx`);
+        if (!response.ok) {
+            throw new Error(`Export failed (${response.status})`);
         }
         
-        slideCard.innerHTML = `
-            <div class="slide-number">${index + 1}</div>
-            <h6>${escapeHtml(slide.title || 'Untitled Slide')}</h6>
-            ${contentHtml}
-            ${imageIndicator}
-        `;
-        
-        slideCard.addEventListener('click', () => {
-            document.querySelectorAll('.slide-card').forEach(card => card.classList.remove('active'));
-            slideCard.classList.add('active');
-        });
+        const fileName = `AI_Presentation_${new Date().toISOString().slice(0, 10)}.pptx`;
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(await response.blob());
+        link.download = fileName;
+        link.click();
+        setTimeout(() => URL.revokeObjectURL(link.href), 1000);
         
-        slidesPreview.appendChild(slideCard);
-    });
+        addMessageToChat(`✅ PowerPoint generated successfully! File: ${fileName}`, 'ai');
+    } catch (error) {
+        console.error('Server export failed, building in the browser:', error);
+        generatePowerPoint();
+    } finally {
+        hideLoading();
+    }
 }
 
-// Generate PowerPoint
+// Generate PowerPoint in the browser (PptxGenJS)
 function generatePowerPoint() {
     if (currentSlides.length === 0) {
         alert('No slides to generate. Please create slides first.');
@@ -425,6 +514,8 @@ function clearSlides() {
     }
     
     currentSlides = [];
+    currentHashes = [];
+    currentPresentationId = null;
     updateSlidesPreview();
     generatePptBtn.disabled = true;
     clearSlidesBtn.disabled = true;
@@ -0,0 +1,242 @@
+// Slide preview renderer: keyed, incremental and virtualized
+//
+// Every slide's card is keyed by the slide's hash ("slide_hashes" in the
+// server's responses, "hash" in streamed events; the slide's JSON when there
+// is none). render() keeps the card of every slide whose key is unchanged,
+// only renumbering it when it moved, builds cards for new or changed slides
+// and removes the others, so an edit touches the cards of the edited slides.
+//
+// Cards far from the visible part of the preview are placeholders: an empty
+// card of the card's last measured (or an estimated) height. An
+// IntersectionObserver fills cards in as they come within `overscan` of the
+// view and empties them again once they are that far out of it, so a long
+// deck keeps a screenful or two of full cards and thumbnails in the page.
+// Without IntersectionObserver every card is filled in.
+class SlidePreview {
+    constructor(container, options = {}) {
+        this.container = container;
+        this.overscan = options.overscan ?? 600;
+        this.estimatedHeight = options.estimatedHeight ?? 160;
+        // Cards filled in right away, before the observer first reports
+        this.eagerCards = options.eagerCards ?? 12;
+        // Slide index -> { key, slide, card, filled, height }
+        this.entries = [];
+        this.cardEntries = new WeakMap();
+        this.observer = typeof IntersectionObserver === 'function'
+            ? new IntersectionObserver(changes => this.onIntersection(changes), {
+                root: container,
+                rootMargin: `${this.overscan}px 0px`
+            })
+            : null;
+
+        // One listener for every card, present and future
+        container.addEventListener('click', event => {
+            const card = event.target.closest('.slide-card');
+            if (!card || !this.cardEntries.has(card)) return;
+            container.querySelectorAll('.slide-card.active').forEach(other => other.classList.remove('active'));
+            card.classList.add('active');
+        });
+    }
+
+    // Key of a slide without a server hash
+    static keyOf(slide) {
+        return 'json:' + JSON.stringify(slide);
+    }
+
+    // Show a whole deck (hashes: the server's slide_hashes, optional)
+    render(slides, hashes = []) {
+        if (!slides.some(slide => slide)) {
+            this.clear();
+            return;
+        }
+        this.removeEmptyState();
+
+        // Cards of the previous render by key; equal slides reuse them in order
+        const reusable = new Map();
+        this.entries.forEach(entry => {
+            if (!entry) return;
+            const queue = reusable.get(entry.key);
+            queue ? queue.push(entry) : reusable.set(entry.key, [entry]);
+        });
+
+        const entries = [];
+        slides.forEach((slide, index) => {
+            const key = hashes[index] || SlidePreview.keyOf(slide);
+            const entry = reusable.get(key)?.shift();
+            if (entry) {
+                entry.slide = slide;
+                this.setIndex(entry, index);
+                entries[index] = entry;
+            } else {
+                entries[index] = this.createEntry(slide, key, index, index < this.eagerCards);
+            }
+        });
+        reusable.forEach(queue => queue.forEach(entry => this.removeEntry(entry)));
+
+        // Put the cards in slide order, moving only those out of place
+        let cursor = this.container.firstElementChild;
+        entries.forEach(entry => {
+            if (entry.card === cursor) {
+                cursor = cursor.nextElementSibling;
+            } else {
+                this.container.insertBefore(entry.card, cursor);
+            }
+        });
+        this.entries = entries;
+    }
+
+    // Show one new or changed slide (a streamed event); false when it was already shown
+    update(index, slide, hash) {
+        const key = hash || SlidePreview.keyOf(slide);
+        const old = this.entries[index];
+        if (old && old.key === key) return false;
+        this.removeEmptyState();
+
+        const entry = this.createEntry(slide, key, index, !old || old.filled);
+        if (old) {
+            entry.card.classList.toggle('active', old.card.classList.contains('active'));
+            entry.height = old.height;
+            old.card.replaceWith(entry.card);
+            this.forget(old);
+        } else {
+            // Keep cards in slide order even if they arrive out of order
+            const next = this.entries.find((other, i) => other && i > index);
+            this.container.insertBefore(entry.card, next ? next.card : null);
+        }
+        this.entries[index] = entry;
+        return true;
+    }
+
+    // No slides: the "No slides yet" message
+    clear() {
+        this.entries.forEach(entry => entry && this.forget(entry));
+        this.entries = [];
+        this.container.innerHTML = `
+            <div class="no-slides">
+                <i class="bi bi-file-earmark-plus"></i>
+                <p>No slides yet</p>
+                <small>Start chatting to create your presentation</small>
+            </div>
+        `;
+    }
+
+    removeEmptyState() {
+        const empty = this.container.querySelector('.no-slides');
+        if (empty) {
+            empty.remove();
+        }
+    }
+
+    createEntry(slide, key, index, filled) {
+        const card = document.createElement('div');
+        card.className = 'slide-card';
+        card.dataset.index = index;
+        const entry = { key, slide, card, filled: false, height: 0 };
+        this.cardEntries.set(card, entry);
+
+        if (filled || !this.observer) {
+            this.fill(entry);
+        } else {
+            this.empty(entry);
+        }
+        if (this.observer) {
+            this.observer.observe(card);
+        }
+        return entry;
+    }
+
+    removeEntry(entry) {
+        entry.card.remove();
+        this.forget(entry);
+    }
+
+    forget(entry) {
+        if (this.observer) {
+            this.observer.unobserve(entry.card);
+        }
+        this.cardEntries.delete(entry.card);
+    }
+
+    setIndex(entry, index) {
+        if (Number(entry.card.dataset.index) === index) return;
+        entry.card.dataset.index = index;
+        const number = entry.filled && entry.card.querySelector('.slide-number');
+        if (number) {
+            number.textContent = index + 1;
+        }
+    }
+
+    onIntersection(changes) {
+        changes.forEach(change => {
+            const entry = this.cardEntries.get(change.target);
+            if (!entry) return;
+            if (change.isIntersecting) {
+                this.fill(entry);
+            } else {
+                this.empty(entry);
+            }
+        });
+    }
+
+    // Build the card's content (text only, never HTML from the slide)
+    fill(entry) {
+        if (entry.filled) return;
+        const { slide, card } = entry;
+        const parts = [
+            previewElement('div', 'slide-number', String(Number(card.dataset.index) + 1)),
+            previewElement('h6', null, slide.title || 'Untitled Slide')
+        ];
+
+        if (Array.isArray(slide.content)) {
+            const list = previewElement('ul');
+            slide.content.forEach(point => list.appendChild(previewElement('li', null, String(point))));
+            parts.push(list);
+        } else if (typeof slide.content === 'string') {
+            parts.push(previewElement('p', null, slide.content));
+        }
+
+        // Small thumbnail for the preview (decks saved before thumbnails existed
+        // only have the full image), plus the image indicator
+        if (slide.has_image && slide.image_url) {
+            const thumbnail = previewElement('img', 'slide-thumbnail');
+            thumbnail.src = slide.thumbnail_url || slide.image_url;
+            thumbnail.alt = '';
+            thumbnail.loading = 'lazy';
+            thumbnail.decoding = 'async';
+            const indicator = previewElement('div', 'slide-image-indicator', ' Has Image');
+            indicator.insertBefore(previewElement('i', 'bi bi-image-fill'), indicator.firstChild);
+            parts.push(thumbnail, indicator);
+        }
+
+        card.classList.remove('slide-placeholder');
+        card.style.height = '';
+        card.replaceChildren(...parts);
+        entry.filled = true;
+    }
+
+    // Drop the card's content, keeping its height so the scroll position holds
+    empty(entry) {
+        const { card } = entry;
+        if (entry.filled) {
+            entry.height = card.offsetHeight || entry.height;
+        } else if (card.classList.contains('slide-placeholder')) {
+            return;
+        }
+        card.replaceChildren();
+        card.classList.add('slide-placeholder');
+        card.style.height = `${entry.height || this.estimatedHeight}px`;
+        entry.filled = false;
+    }
+}
+
+// Element with a class and text content
+function previewElement(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) {
+        node.className = className;
+    }
+    if (text !== undefined) {
+        node.textContent = text;
+    }
+    return node;
+}
@@ -0,0 +1,103 @@
+"""
+Shared fixtures: an app on a throwaway SQLite database and upload folder,
+with the stub model, no admission control and no network.
+"""
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def app_config(tmp_path, **overrides):
+    """
+    Config overrides for a test app; nothing leaves the machine (the image
+    hosts point at a closed local port)
+    Returns: dict
+    """
+    config = {
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'EXPORT_FOLDER': str(tmp_path / 'exports'),
+        'ASSET_CACHE_FOLDER': str(tmp_path / 'assets'),
+        'UNSPLASH_SOURCE_URL': 'http://127.0.0.1:9',
+        'PICSUM_URL': 'http://127.0.0.1:9',
+        'LLM_BACKEND': 'stub',
+        'LLM_STUB_LATENCY': 0.0,
+        'LLM_STUB_FAILURE_RATE': 0.0,
+        'ADMISSION_USER_RATE': 0,
+        'ADMISSION_GLOBAL_RATE': 0,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'JOB_WORKERS': 0,
+        'RESPONSE_CACHE_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Factory of test apps: make_app(**config overrides)"""
+    from app import create_app
+    from models import db
+
+    def make(**overrides):
+        app = create_app(app_config(tmp_path, **overrides))
+        with app.app_context():
+            db.create_all()
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def ctx(app):
+    """An app context for tests that call the modules directly"""
+    with app.app_context():
+        yield app
+
+
+def create_user(username):
+    """
+    Add a user straight to the database (within an app context)
+    Returns: user ID
+    """
+    from models import User, db
+    user = User(username=username, email=f"{username}@example.com", password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def logged_in_client(app, username, password='test-password'):
+    """Sign up (if needed) and log in a test client"""
+    client = app.test_client()
+    client.post('/signup', json={'username': username, 'email': f'{username}@example.com', 'password': password})
+    response = client.post('/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return client
+
+
+@pytest.fixture
+def login(app):
+    """Factory of test clients signed up and logged in as a user: login(username)"""
+    return lambda username: logged_in_client(app, username)
+
+
+def sample_deck(count=3, topic='Deck'):
+    """A deck of count plain slides"""
+    return [
+        {"title": f"{topic} slide {i + 1}", "content": [f"Point {j + 1}" for j in range(3)],
+         "image_search_query": f"{topic.lower()} {i + 1}", "image_position": "right"}
+        for i in range(count)
+    ]
@@ -0,0 +1,92 @@
+"""Admission control: token buckets per user, 429 with Retry-After once a user's burst is spent."""
+import time
+
+import pytest
+
+from admission import AdmissionControl, deck_cost, take_tokens
+from conftest import logged_in_client
+
+
+@pytest.fixture
+def limited_app(make_app):
+    """Default per-user limits, no global limit, refusals instead of waits"""
+    return make_app(ADMISSION_USER_RATE=10, ADMISSION_USER_BURST=10, ADMISSION_GLOBAL_RATE=0,
+                    ADMISSION_MAX_WAIT=0)
+
+
+def test_a_deck_and_a_dozen_edits_fit_the_burst(limited_app):
+    client = logged_in_client(limited_app, 'alice')
+    assert client.post('/chat', json={'prompt': 'harbors, 8 slides'}).status_code == 200
+    for i in range(12):
+        response = client.post('/update', json={'prompt': f'tweak slide {i % 8 + 1}'})
+        assert response.status_code == 200, (i, response.get_json())
+
+
+def test_429_with_retry_after_once_the_burst_is_spent(limited_app):
+    alice = logged_in_client(limited_app, 'alice')
+    statuses = [alice.post('/chat', json={'prompt': 'orchards, 8 slides'}).status_code for _ in range(12)]
+    assert statuses[:10] == [200] * 10
+    assert 429 in statuses
+
+    refused = alice.post('/chat', json={'prompt': 'orchards, 8 slides'})
+    assert refused.status_code == 429
+    retry_after = int(refused.headers['Retry-After'])
+    assert 1 <= retry_after <= 60
+    assert refused.get_json()["retry_after"] == retry_after
+
+    # Refused before any work: no deck was saved for it
+    assert len(alice.get('/history.json?limit=100').get_json()["presentations"]) == statuses.count(200)
+
+    # Other users have their own bucket
+    bob = logged_in_client(limited_app, 'bob')
+    assert bob.post('/chat', json={'prompt': 'orchards, 8 slides'}).status_code == 200
+
+
+def test_no_limits_when_rates_are_zero(login):
+    client = login('alice')
+    assert all(client.post('/chat', json={'prompt': 'x, 1 slide'}).status_code == 200 for _ in range(15))
+
+
+def test_take_tokens_charges_all_buckets_or_none(ctx):
+    from models import RateBucket
+    now = time.time()
+    assert take_tokens([('user:1', 1.0, 5), ('global', 1.0, 2)], 2, now, 0) == (True, 0.0)
+    # The global bucket is empty: the user's is not charged either
+    admitted, wait = take_tokens([('user:1', 1.0, 5), ('global', 1.0, 2)], 1, now, 0)
+    assert not admitted and wait == pytest.approx(1.0)
+    assert RateBucket.query.filter_by(key='user:1').one().tokens == pytest.approx(3)
+    # Refilled at the rate, up to the capacity
+    assert take_tokens([('user:1', 1.0, 5), ('global', 1.0, 2)], 2, now + 100, 0) == (True, 0.0)
+    assert RateBucket.query.filter_by(key='global').one().tokens == pytest.approx(0)
+
+
+def test_short_requests_queue_instead_of_failing(ctx):
+    control = AdmissionControl(user_rate=60, user_burst=1, global_rate=0, max_wait=5, queue_depth=1)
+    assert control.reserve(1, 1) == (True, 0.0)
+    admitted, wait = control.reserve(1, 1)
+    # Reserved a second ahead: the bucket is in debt
+    assert admitted and 0 < wait <= 1.0
+    # The queue is full: refused at once, with the time the bucket needs
+    admitted, retry = control.reserve(1, 1)
+    assert not admitted and 1.0 < retry <= 2.0
+    control.done_waiting()
+    assert control.stats()["queued"] == 1 and control.stats()["refused"] == 1
+
+
+def test_costs_are_capped_at_the_burst(ctx):
+    control = AdmissionControl(user_rate=60, user_burst=1, global_rate=0, max_wait=0)
+    # A request bigger than the bucket empties it instead of never fitting
+    assert control.reserve(1, deck_cost(200)) == (True, 0.0)
+    assert not control.reserve(1, 0.1)[0]
+
+
+def test_batch_bigger_than_the_burst_is_refused(limited_app):
+    client = logged_in_client(limited_app, 'alice')
+    # 11 decks cost more than the 10-token burst: never admitted, not capped at it
+    refused = client.post('/batch', json={'prompts': [f'topic {i}' for i in range(11)]})
+    assert refused.status_code == 429
+    assert refused.get_json()["max_prompts"] == 10
+    assert 1 <= int(refused.headers['Retry-After']) <= 60
+    # Nothing was charged for it
+    assert client.post('/batch', json={'prompts': [f'topic {i}' for i in range(10)]}).status_code == 200
+    assert client.post('/chat', json={'prompt': 'one more, 8 slides'}).status_code == 429
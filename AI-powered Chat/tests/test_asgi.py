@@ -0,0 +1,123 @@
+"""ASGI entry point: coroutine views found through the Flask URL map, everything else on the WSGI app, bodies capped."""
+import asyncio
+import json
+
+import pytest
+
+import async_views
+from asgi import AsyncApp
+from conftest import logged_in_client
+
+
+def call(asgi_app, method, path, body=b'', headers=(), chunk_size=None):
+    """
+    Run one HTTP request through an ASGI app
+    chunk_size: send the body in pieces of that size, without a Content-Length
+    Returns: (status, {header: value}, body)
+    """
+    headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+    if chunk_size is None:
+        headers.append((b'content-length', str(len(body)).encode('ascii')))
+        chunks = [body]
+    else:
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http', 'path': path,
+             'root_path': '', 'query_string': query.encode('ascii'), 'headers': headers,
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 5000)}
+    sent = []
+
+    async def run():
+        pending = list(chunks)
+
+        async def receive():
+            chunk = pending.pop(0)
+            return {'type': 'http.request', 'body': chunk, 'more_body': bool(pending)}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi_app(scope, receive, send)
+
+    asyncio.run(run())
+    start = sent[0]
+    response_headers = {name.decode('latin1'): value.decode('latin1') for name, value in start['headers']}
+    return start['status'], response_headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def session_headers(app, username):
+    """Cookie header of a logged-in session, and a JSON content type"""
+    client = logged_in_client(app, username)
+    return [('Cookie', f"session={client.get_cookie('session').value}"), ('Content-Type', 'application/json')]
+
+
+@pytest.fixture
+def asgi_app(app):
+    asgi_app = AsyncApp(app)
+    yield asgi_app
+    asgi_app.sync_pool.shutdown()
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """Endpoints answered by a coroutine view, in order"""
+    endpoints = []
+    for endpoint, view in list(async_views.ROUTES.items()):
+        async def record(*args, endpoint=endpoint, view=view, **kwargs):
+            endpoints.append(endpoint)
+            return await view(*args, **kwargs)
+        monkeypatch.setitem(async_views.ROUTES, endpoint, record)
+    return endpoints
+
+
+def test_chat_and_update_run_as_coroutines(app, asgi_app, served):
+    headers = session_headers(app, 'alice')
+    status, response_headers, body = call(asgi_app, 'POST', '/chat',
+                                          json.dumps({'prompt': 'tides, 3 slides'}).encode(), headers)
+    assert status == 200
+    deck = json.loads(body)
+    assert len(deck["slides"]) == 3 and deck["presentation_id"] is not None
+
+    # The session now names the new deck: the edit applies to it
+    headers[0] = ('Cookie', response_headers['set-cookie'].split(';', 1)[0])
+
+    status, _, body = call(asgi_app, 'POST', '/update', json.dumps({'prompt': 'shorten slide 2'}).encode(), headers)
+    assert status == 200
+    assert json.loads(body)["presentation_id"] == deck["presentation_id"]
+    assert served == ['chat.chat', 'chat.update']
+
+    # The sync views see the same session and the deck the coroutines saved
+    status, _, body = call(asgi_app, 'GET', '/history.json', headers=headers)
+    assert status == 200
+    assert [item["id"] for item in json.loads(body)["presentations"]] == [deck["presentation_id"]]
+    assert served == ['chat.chat', 'chat.update']
+
+
+def test_other_requests_go_to_the_flask_app(app, asgi_app, served):
+    headers = session_headers(app, 'alice')
+    # Not found, wrong method and the sync pages
+    assert call(asgi_app, 'GET', '/no-such-page', headers=headers)[0] == 404
+    assert call(asgi_app, 'GET', '/chat', headers=headers)[0] == 405
+    assert call(asgi_app, 'GET', '/login')[0] == 200
+    assert served == []
+
+    # The coroutine view checks the login itself
+    status, _, _ = call(asgi_app, 'POST', '/chat', b'{"prompt": "x"}', [('Content-Type', 'application/json')])
+    assert status in (302, 401)
+
+
+@pytest.mark.parametrize("path", ['/chat', '/batch'])
+@pytest.mark.parametrize("chunk_size", [None, 256])
+def test_bodies_over_the_limit_get_413(make_app, path, chunk_size):
+    app = make_app(MAX_CONTENT_LENGTH=1024)
+    asgi_app = AsyncApp(app)
+    headers = session_headers(app, 'alice')
+    body = json.dumps({'prompt': 'x' * 2000, 'prompts': ['y' * 2000]}).encode()
+    try:
+        status, _, _ = call(asgi_app, 'POST', path, body, headers, chunk_size=chunk_size)
+        assert status == 413
+        # A body within the limit is read, sent whole or in chunks
+        small = json.dumps({'prompt': 'fjords, 2 slides', 'prompts': ['fjords']}).encode()
+        assert call(asgi_app, 'POST', path, small, headers, chunk_size=chunk_size)[0] == 200
+    finally:
+        asgi_app.sync_pool.shutdown()
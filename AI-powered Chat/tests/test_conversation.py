@@ -0,0 +1,96 @@
+"""Conversation memory: earlier requests in the edit prompt, folded into a summary within the token budget."""
+from conftest import create_user, sample_deck
+from conversation import SUMMARY_HEADER, ConversationMemory, clip, count_tokens
+
+
+def new_deck():
+    from services import get_services
+    return get_services().presentation_store.create(create_user('alice'), sample_deck(8))
+
+
+def test_count_tokens_and_clip():
+    assert count_tokens('') == 0
+    assert count_tokens('make slide 3 shorter') == 1 + 1 + 1 + 2
+    assert count_tokens('{"a": 1}') == 7
+    assert clip('  spread\n over   lines ', 10) == 'spread over lines'
+    clipped = clip('word ' * 50, 10)
+    assert clipped.endswith('…') and count_tokens(clipped) <= 10
+
+
+def test_turns_fold_into_a_summary_within_the_budget(ctx):
+    from models import ConversationSummary, ConversationTurn, db
+    memory = ConversationMemory(budget=200, summary_budget=80)
+    deck_id = new_deck()
+    memory.record(deck_id, 'volcanoes of Iceland, 8 slides', 'Created 8 slides', kind='create')
+    for i in range(60):
+        memory.record(deck_id, f'add a lava example to slide {i % 3 + 2} ({i})', f'Done {i}', [i % 3 + 1])
+        text, tokens = memory.context(deck_id)
+        assert tokens == count_tokens(text) <= 200
+
+    assert memory.stats()["folded"] > 0
+    # Only the turns that fit are still rows
+    assert ConversationTurn.query.filter_by(presentation_id=deck_id).count() < 20
+    summary = db.session.get(ConversationSummary, deck_id)
+    assert summary.tokens <= 80
+
+    text, _ = memory.context(deck_id)
+    assert text.startswith(SUMMARY_HEADER)
+    assert 'The deck was created from: "volcanoes of Iceland, 8 slides"' in text
+    assert '57 earlier edits, mostly about: example, lava' in text
+    assert 'Slides edited most: 2, 3, 4' in text
+    # The newest turn is kept as it was asked
+    assert text.endswith('- "add a lava example to slide 4 (59)" (changed slides 4) - you replied: "Done 59"')
+
+
+def test_a_long_turn_is_clipped(ctx):
+    memory = ConversationMemory(budget=100, summary_budget=40)
+    deck_id = new_deck()
+    memory.record(deck_id, 'rewrite everything ' * 200, 'ok ' * 200, [0])
+    text, tokens = memory.context(deck_id)
+    assert tokens <= 100
+    assert text.count('…') == 2
+
+
+def test_lowered_budget_applies_at_once(ctx):
+    deck_id = new_deck()
+    memory = ConversationMemory(budget=400)
+    for i in range(10):
+        memory.record(deck_id, f'change the title of slide {i + 1} to something about glaciers', changed=[i % 8])
+    smaller = ConversationMemory(budget=60)
+    text, tokens = smaller.context(deck_id)
+    assert tokens <= 60
+    assert 'slide 10' in text and 'slide 1 ' not in text
+
+
+def test_no_memory_with_a_zero_budget(ctx):
+    from models import ConversationTurn
+    memory = ConversationMemory(budget=0)
+    deck_id = new_deck()
+    memory.record(deck_id, 'shorten slide 2')
+    assert ConversationTurn.query.count() == 0
+    assert memory.context(deck_id) == ("", 0)
+
+
+def test_edit_prompts_carry_the_conversation(login, app):
+    from llm_client import stub_response
+    from models import ConversationTurn
+    from services import get_services
+    prompts = []
+
+    def responder(prompt):
+        prompts.append(prompt)
+        return stub_response(prompt)
+    get_services(app).llm.backend.responder = responder
+
+    client = login('alice')
+    deck_id = client.post('/chat', json={'prompt': 'coral reefs, 4 slides'}).get_json()["presentation_id"]
+    client.post('/update', json={'prompt': 'add bleaching facts to slide 2'})
+    client.post('/update', json={'prompt': 'shorten slide 3'})
+    assert 'coral reefs, 4 slides' in prompts[-1]
+    assert '"add bleaching facts to slide 2" (changed slides 2)' in prompts[-1]
+    assert '"shorten slide 3"' not in prompts[-1]
+
+    # Deleting the deck deletes its conversation
+    assert client.delete(f'/delete-presentation/{deck_id}').status_code == 200
+    with app.app_context():
+        assert ConversationTurn.query.filter_by(presentation_id=deck_id).count() == 0
@@ -0,0 +1,91 @@
+"""Keyset pagination of the history: every deck exactly once, newest first, across ties and page edges."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import create_user, sample_deck
+
+
+def make_decks(app, user_id, count, tied=0):
+    """
+    count decks; the first `tied` share one updated_at, the rest one second apart
+    Returns: deck IDs in the expected history order
+    """
+    from models import Presentation, db
+    from services import get_services
+    store = get_services(app).presentation_store
+    ids = [store.create(user_id, sample_deck(1, topic=f"Deck {i}")) for i in range(count)]
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    stamps = {}
+    for position, deck_id in enumerate(ids):
+        stamps[deck_id] = base if position < tied else base + timedelta(seconds=position)
+        db.session.get(Presentation, deck_id).updated_at = stamps[deck_id]
+    db.session.commit()
+    return sorted(ids, key=lambda deck_id: (stamps[deck_id], deck_id), reverse=True)
+
+
+def all_pages(store, user_id, limit):
+    pages, cursor = [], None
+    while True:
+        items, cursor = store.list_page(user_id, limit, cursor)
+        pages.append([item["id"] for item in items])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("count,limit,tied", [(10, 3, 0), (9, 3, 0), (3, 3, 0), (7, 2, 5), (6, 4, 6), (1, 5, 0)])
+def test_pages_cover_every_deck_once(ctx, count, limit, tied):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    expected = make_decks(ctx, user_id, count, tied)
+
+    pages = all_pages(store, user_id, limit)
+    assert [deck_id for page in pages for deck_id in page] == expected
+    assert all(len(page) == limit for page in pages[:-1])
+    # A last page that is exactly full has no cursor to an empty page
+    assert 1 <= len(pages[-1]) <= limit
+    assert len(pages) == -(-count // limit)
+
+
+def test_empty_history(ctx):
+    from services import get_services
+    assert get_services(ctx).presentation_store.list_page(create_user('alice'), 5) == ([], None)
+
+
+def test_decks_updated_between_pages_move_to_the_front(ctx):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    expected = make_decks(ctx, user_id, 6)
+    first, cursor = store.list_page(user_id, 3)
+    # Edited now: newer than the cursor, so not repeated on the next pages
+    store.save(user_id, expected[4], sample_deck(2))
+    items, _ = store.list_page(user_id, 10, cursor)
+    assert [item["id"] for item in first] == expected[:3]
+    assert [item["id"] for item in items] == [expected[3], expected[5]]
+    assert store.list_page(user_id, 1)[0][0]["id"] == expected[4]
+
+
+def test_cursor_round_trip_and_malformed_cursors():
+    from session_state import decode_cursor, encode_cursor
+    stamp = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert decode_cursor(encode_cursor(stamp, 42)) == (stamp, 42)
+    for bad in ("", "!!!", "bm9waXBl", encode_cursor(stamp, 1)[:-3]):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_history_json(login, app):
+    client = login('alice')
+    with app.app_context():
+        from models import User
+        make_decks(app, User.query.filter_by(username='alice').one().id, 5)
+
+    first = client.get('/history.json?limit=2').get_json()
+    assert len(first["presentations"]) == 2 and first["next_cursor"]
+    second = client.get(f'/history.json?limit=2&cursor={first["next_cursor"]}').get_json()
+    assert not {p["id"] for p in first["presentations"]} & {p["id"] for p in second["presentations"]}
+    # limit is clamped to at least one deck
+    assert len(client.get('/history.json?limit=0').get_json()["presentations"]) == 1
+    assert client.get('/history.json?cursor=garbage').status_code == 400
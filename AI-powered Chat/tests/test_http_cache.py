@@ -0,0 +1,125 @@
+"""Conditional deck responses (ETag / If-None-Match -> 304) and vendored asset checks."""
+import gzip
+
+import pytest
+
+from conftest import logged_in_client
+from http_cache import VENDOR_LIBRARIES, AssetStore, MissingAsset, integrity, load_vendor_lock
+
+
+@pytest.fixture
+def client(login):
+    client = login('alice')
+    deck = client.post('/chat', json={'prompt': 'tides, 40 slides'}).get_json()
+    client.deck_id = deck["presentation_id"]
+    return client
+
+
+def test_unchanged_deck_is_304(client):
+    first = client.get('/get-slides')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/get-slides', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+    assert client.get('/get-slides', headers={'If-None-Match': '"something-else"'}).status_code == 200
+
+
+def test_edit_changes_the_etag(client):
+    etag = client.get('/get-slides').headers['ETag']
+    assert client.post('/update', json={'prompt': 'shorten slide 2'}).status_code == 200
+    after = client.get('/get-slides', headers={'If-None-Match': etag})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != etag
+    assert after.get_json()["slides"][1]["content"][-1] == "Updated: shorten slide 2"
+
+
+def test_etag_differs_per_encoding(client):
+    plain = client.get('/get-slides')
+    zipped = client.get('/get-slides', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert gzip.decompress(zipped.data) == plain.data
+    # The uncompressed version's tag doesn't validate the compressed one
+    assert client.get('/get-slides', headers={'Accept-Encoding': 'gzip',
+                                              'If-None-Match': plain.headers['ETag']}).status_code == 200
+    assert client.get('/get-slides', headers={'Accept-Encoding': 'gzip',
+                                              'If-None-Match': zipped.headers['ETag']}).status_code == 304
+
+
+def test_load_presentation_304_still_selects_the_deck(client):
+    first = client.get(f'/load-presentation/{client.deck_id}')
+    etag = first.headers['ETag']
+    other = client.post('/chat', json={'prompt': 'comets, 2 slides'}).get_json()["presentation_id"]
+    assert other != client.deck_id
+
+    again = client.get(f'/load-presentation/{client.deck_id}', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert client.get('/get-slides').get_json()["presentation_id"] == client.deck_id
+
+
+def test_outline_and_slide_have_their_own_etags(client):
+    deck = client.get('/get-slides').headers['ETag']
+    outline = client.get(f'/presentation/{client.deck_id}/outline')
+    slide = client.get(f'/presentation/{client.deck_id}/slides/0')
+    assert len({deck, outline.headers['ETag'], slide.headers['ETag']}) == 3
+    assert client.get(f'/presentation/{client.deck_id}/outline',
+                      headers={'If-None-Match': outline.headers['ETag']}).status_code == 304
+    # A deck's tag doesn't answer for one of its slides
+    assert client.get(f'/presentation/{client.deck_id}/slides/0',
+                      headers={'If-None-Match': deck}).status_code == 200
+
+
+def test_other_users_get_no_304(client, login):
+    etag = client.get(f'/load-presentation/{client.deck_id}').headers['ETag']
+    bob = login('bob')
+    assert bob.get(f'/load-presentation/{client.deck_id}', headers={'If-None-Match': etag}).status_code == 404
+
+
+def test_vendored_libraries_are_checked_against_the_lock(tmp_path):
+    vendor = tmp_path / 'vendor'
+    vendor.mkdir()
+    store = AssetStore(str(tmp_path / 'static'), str(vendor), str(tmp_path / 'cache'), 'https://cdn.example')
+    names = list(VENDOR_LIBRARIES)
+    for name, data in zip(names, (b'pinned', b'tampered', b'unpinned')):
+        (vendor / name).parent.mkdir(parents=True, exist_ok=True)
+        (vendor / name).write_bytes(data)
+    lock = {names[0]: integrity(b'pinned'), names[1]: integrity(b'original')}
+
+    problems = store.check_vendored(lock)
+    assert names[0] not in problems
+    assert problems[names[1]] == "hash mismatch"
+    assert problems[names[2]] == "not pinned"
+    assert all(problems[name] == "missing" for name in names[3:])
+
+    # A page needing a library that isn't vendored fails, unless falling back to the CDN
+    with pytest.raises(MissingAsset):
+        store.url('vendor/' + names[3])
+    fallback = AssetStore(str(tmp_path / 'static'), str(vendor), str(tmp_path / 'cache'), 'https://cdn.example',
+                          cdn_fallback=True)
+    assert fallback.url('vendor/' + names[3]) == 'https://cdn.example/' + VENDOR_LIBRARIES[names[3]]
+    assert store.url('vendor/' + names[0]).startswith('/assets/vendor/')
+
+
+def test_pages_load_from_the_cdn_until_vendored(make_app):
+    # A default install has no vendor folder: pages still render, the pinned libraries with their hash
+    app = make_app()
+    assert app.config['ASSET_CDN_FALLBACK']
+    client = app.test_client()
+    for path in ('/login', '/signup'):
+        page = client.get(path)
+        assert page.status_code == 200, path
+        html = page.get_data(as_text=True)
+    lock = load_vendor_lock()
+    pinned = lock['bootstrap.min.css']
+    assert (f'href="{app.config["ASSET_CDN_URL"]}/{VENDOR_LIBRARIES["bootstrap.min.css"]}" '
+            f'integrity="{pinned}" crossorigin="anonymous"') in html
+
+    client = logged_in_client(app, 'alice')
+    for path in ('/', '/history'):
+        assert client.get(path).status_code == 200, path
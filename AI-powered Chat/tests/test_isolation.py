@@ -0,0 +1,62 @@
+"""Every deck belongs to one user: nobody else can read, change or delete it."""
+from conftest import create_user, sample_deck
+
+
+def test_store_only_returns_own_decks(ctx):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    alice, bob = create_user('alice'), create_user('bob')
+    deck_id = store.create(alice, sample_deck(topic='Alice'))
+
+    assert store.get(alice, deck_id)["slides"] == sample_deck(topic='Alice')
+    assert store.get(bob, deck_id) is None
+    assert store.get_slide(bob, deck_id, 0) is None
+    assert store.outline(bob, deck_id) is None
+
+    assert store.save(bob, deck_id, sample_deck(topic='Bob')) is False
+    assert store.delete(bob, deck_id) is False
+    assert store.get(alice, deck_id)["slides"] == sample_deck(topic='Alice')
+
+    items, _ = store.list_page(bob, 10)
+    assert items == []
+    items, _ = store.list_page(alice, 10)
+    assert [item["id"] for item in items] == [deck_id]
+
+
+def test_cache_is_keyed_by_user(ctx):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    alice, bob = create_user('alice'), create_user('bob')
+    deck_id = store.create(alice, sample_deck())
+    # In the cache now: another user must still not get it
+    assert store.get(alice, deck_id) is not None
+    assert store.get(bob, deck_id) is None
+
+
+def test_endpoints_refuse_other_users_decks(login):
+    alice, bob = login('alice'), login('bob')
+    deck = alice.post('/chat', json={'prompt': 'volcanoes, 3 slides'}).get_json()
+    deck_id = deck["presentation_id"]
+    assert deck_id is not None
+
+    assert bob.get(f'/load-presentation/{deck_id}').status_code == 404
+    assert bob.get(f'/presentation/{deck_id}/outline').status_code == 404
+    assert bob.get(f'/presentation/{deck_id}/slides/0').status_code == 404
+    assert bob.delete(f'/delete-presentation/{deck_id}').status_code == 404
+    assert bob.get('/history.json').get_json()["presentations"] == []
+    # Bob's current deck is his own (none), not the last one generated
+    assert bob.get('/get-slides').get_json()["slides"] == []
+
+    # An edit naming Alice's deck doesn't touch it
+    response = bob.post('/update', json={'prompt': 'change slide 1', 'presentation_id': deck_id})
+    assert response.get_json().get("presentation_id") is None
+    assert alice.get(f'/load-presentation/{deck_id}').get_json()["slides"] == deck["slides"]
+
+
+def test_current_deck_is_per_session_user(login):
+    alice, bob = login('alice'), login('bob')
+    alice_deck = alice.post('/chat', json={'prompt': 'rivers, 2 slides'}).get_json()
+    bob_deck = bob.post('/chat', json={'prompt': 'deserts, 4 slides'}).get_json()
+
+    assert alice.get('/get-slides').get_json()["slides"] == alice_deck["slides"]
+    assert bob.get('/get-slides').get_json()["slides"] == bob_deck["slides"]
@@ -0,0 +1,182 @@
+"""Background jobs: fair claiming across users, lease recovery and cancellation."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import create_user
+from job_queue import PRIORITY_LOW, JobQueue
+
+
+def recording_queue(app, **options):
+    """A queue without threads whose "record" jobs note the order they ran in (queue.ran)"""
+    ran = []
+
+    def record(user_id, payload, check_cancelled):
+        ran.append(payload["name"])
+        return {"name": payload["name"]}
+
+    queue = JobQueue(app, handlers={"record": record}, workers=0, **options)
+    queue.ran = ran
+    return queue
+
+
+@pytest.fixture
+def queue(ctx):
+    return recording_queue(ctx, lease=60, max_attempts=2)
+
+
+def run_all(queue):
+    while queue.run_one('worker'):
+        pass
+    return queue.ran
+
+
+def expire_leases():
+    from models import GenerationJob, db
+    GenerationJob.query.filter_by(status='running').update(
+        {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+
+def test_users_take_turns(queue):
+    alice, bob, carol = create_user('alice'), create_user('bob'), create_user('carol')
+    for i in range(4):
+        queue.enqueue(alice, "record", {"name": f"a{i}"})
+    for i in range(2):
+        queue.enqueue(bob, "record", {"name": f"b{i}"})
+    queue.enqueue(carol, "record", {"name": "c0"})
+    assert run_all(queue) == ["a0", "b0", "c0", "a1", "b1", "a2", "a3"]
+
+
+def test_users_with_running_jobs_go_last(queue):
+    alice, bob = create_user('alice'), create_user('bob')
+    a0 = queue.enqueue(alice, "record", {"name": "a0"})
+    queue.enqueue(alice, "record", {"name": "a1"})
+    b0 = queue.enqueue(bob, "record", {"name": "b0"})
+    queue.enqueue(bob, "record", {"name": "b1"})
+    assert queue.claim('w1')[0] == a0
+    # Alice already has one running: Bob's first job comes before her second
+    assert queue.claim('w2')[0] == b0
+
+
+def test_priority_comes_first_and_unfair_mode_is_fifo(ctx, queue):
+    alice, bob = create_user('alice'), create_user('bob')
+    queue.enqueue(alice, "record", {"name": "low"}, priority=PRIORITY_LOW)
+    queue.enqueue(alice, "record", {"name": "a0"})
+    queue.enqueue(alice, "record", {"name": "a1"})
+    queue.enqueue(bob, "record", {"name": "b0"})
+    assert run_all(queue) == ["a0", "b0", "a1", "low"]
+
+    fifo = recording_queue(ctx, fair=False)
+    for name in ("a2", "a3"):
+        fifo.enqueue(alice, "record", {"name": name})
+    fifo.enqueue(bob, "record", {"name": "b1"})
+    assert run_all(fifo) == ["a2", "a3", "b1"]
+
+
+def test_nothing_queued(queue):
+    assert queue.claim('w1') is None
+    assert queue.run_one('w1') is False
+
+
+def test_expired_leases_are_requeued_then_failed(queue):
+    user_id = create_user('alice')
+    job_id = queue.enqueue(user_id, "record", {"name": "a0"})
+    assert queue.claim('lost-worker')[0] == job_id
+
+    # Lease still valid: nothing to recover
+    assert queue.recover() == 0
+    expire_leases()
+    assert queue.recover() == 1
+    job = queue.get(user_id, job_id)
+    assert job["status"] == 'queued' and job["attempts"] == 1
+
+    # Second attempt (max_attempts=2) lost as well: failed for good
+    assert queue.claim('lost-again')[0] == job_id
+    expire_leases()
+    assert queue.recover() == 1
+    job = queue.get(user_id, job_id)
+    assert job["status"] == 'failed' and job["attempts"] == 2
+    assert queue.claim('w') is None
+
+
+def test_a_worker_whose_lease_was_taken_over_cannot_finish(queue):
+    from models import GenerationJob, db
+    user_id = create_user('alice')
+    job_id = queue.enqueue(user_id, "record", {"name": "a0"})
+    queue.claim('slow-worker')
+    expire_leases()
+    queue.recover()
+    queue.claim('new-worker')
+
+    queue._finish(job_id, 'slow-worker', 'failed', error='late')
+    db.session.expire_all()
+    job = db.session.get(GenerationJob, job_id)
+    assert job.status == 'running' and job.worker_id == 'new-worker'
+
+
+def test_renewed_leases_are_not_recovered(queue):
+    from models import GenerationJob, db
+    user_id = create_user('alice')
+    job_id = queue.enqueue(user_id, "record", {"name": "a0"})
+    queue.claim('w1')
+    expire_leases()
+    queue.renew_leases()
+    assert queue.recover() == 0
+    assert db.session.get(GenerationJob, job_id).lease_expires_at > datetime.utcnow()
+
+
+def test_cancel_queued_job(queue):
+    alice, bob = create_user('alice'), create_user('bob')
+    job_id = queue.enqueue(alice, "record", {"name": "a0"})
+    # Not Bob's to cancel
+    assert queue.cancel(bob, job_id) is None
+    assert queue.get(bob, job_id) is None
+    assert queue.get(alice, job_id)["status"] == 'queued'
+
+    assert queue.cancel(alice, job_id) == 'cancelled'
+    assert run_all(queue) == []
+    # Cancelling a finished job changes nothing
+    assert queue.cancel(alice, job_id) == 'cancelled'
+
+
+def test_cancel_running_job(ctx):
+    user_id = create_user('alice')
+    steps = []
+
+    def slow(job_user_id, payload, check_cancelled):
+        check_cancelled()
+        steps.append("started")
+        # The user cancels while the job runs
+        assert queue.cancel(job_user_id, payload["job"]) == 'running'
+        check_cancelled()
+        steps.append("not stopped")
+
+    queue = JobQueue(ctx, handlers={"slow": slow}, workers=0)
+    job_id = queue.enqueue(user_id, "slow", {})
+    from models import GenerationJob, db
+    db.session.get(GenerationJob, job_id).payload = '{"job": %d}' % job_id
+    db.session.commit()
+
+    assert queue.run_one('w1')
+    assert steps == ["started"]
+    assert queue.get(user_id, job_id)["status"] == 'cancelled'
+    assert queue.stats()["cancelled"] == 1
+
+
+def test_failed_and_done_jobs(ctx):
+    user_id = create_user('alice')
+
+    def fails(job_user_id, payload, check_cancelled):
+        raise RuntimeError("model down")
+
+    queue = JobQueue(ctx, handlers={"fails": fails, "works": lambda *args: {"ok": True}}, workers=0)
+    failed = queue.enqueue(user_id, "fails", {})
+    done = queue.enqueue(user_id, "works", {})
+    while queue.run_one('worker'):
+        pass
+    assert queue.get(user_id, failed)["status"] == 'failed'
+    assert queue.get(user_id, failed)["error"] == 'model down'
+    assert queue.get(user_id, done)["result"] == {"ok": True}
+    with pytest.raises(ValueError):
+        queue.enqueue(user_id, "unknown", {})
@@ -0,0 +1,103 @@
+"""Repairing model JSON: fences, prose, trailing commas, truncation, and decks vs patches."""
+import json
+
+import pytest
+
+from conftest import sample_deck
+from llm_json import ModelOutputError, SlideStreamParser, parse_model_json
+
+DECK = {"slides": sample_deck(3), "message": "Three slides"}
+PATCH = {"patch": [{"op": "replace", "slide": 2, "data": {"title": "New 2"}},
+                   {"op": "delete", "slide": 3}], "message": "Edited"}
+
+
+def fenced(value):
+    return "```json\n" + json.dumps(value, indent=2) + "\n```"
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(DECK),
+    fenced(DECK),
+    "Sure! Here is your deck:\n\n" + fenced(DECK) + "\n\nLet me know if you want changes.",
+    "Here it is: " + json.dumps(DECK) + " Enjoy [and tell me what you think].",
+    # Brackets in the prose before the document
+    "[Draft] {ok} " + json.dumps(DECK),
+    json.dumps(DECK, indent=2).replace('"\n', '",\n').replace('}\n', '},\n'),
+    json.dumps(DECK).replace('"message"', '// the reply\n"message"'),
+])
+def test_repairs_the_usual_faults(text):
+    assert parse_model_json(text) == DECK
+
+
+def test_truncated_response_keeps_the_complete_slides():
+    text = fenced(DECK)
+    cut = text[:text.index('"Deck slide 3"') + 5]
+    assert parse_model_json(cut)["slides"][:2] == DECK["slides"][:2]
+
+    cut = text[:text.index('"message"') - 4]
+    assert parse_model_json(cut)["slides"] == DECK["slides"]
+
+
+def test_bare_list_is_the_document():
+    assert parse_model_json("Slides: " + json.dumps(DECK["slides"])) == {"slides": DECK["slides"]}
+    assert parse_model_json(json.dumps(PATCH["patch"]), key="patch") == {"patch": PATCH["patch"]}
+
+
+def test_patch_key():
+    assert parse_model_json(fenced(PATCH), key="patch") == PATCH
+    # A patch isn't a deck, whether bare or under its key
+    with pytest.raises(ModelOutputError):
+        parse_model_json(fenced(PATCH))
+    with pytest.raises(ModelOutputError):
+        parse_model_json(json.dumps(PATCH["patch"]))
+
+
+def test_full_deck_is_not_read_as_a_patch():
+    with pytest.raises(ModelOutputError):
+        parse_model_json(fenced(DECK), key="patch")
+    with pytest.raises(ModelOutputError):
+        parse_model_json(json.dumps(DECK["slides"]), key="patch")
+
+
+@pytest.mark.parametrize("text", [
+    # Nested lists belong to another key, not to "slides"
+    json.dumps({"title": "One slide", "content": ["a", "b"]}),
+    json.dumps({"deck": {"pages": [{"title": "x"}]}}),
+    "No JSON here",
+    "{ not json at all",
+])
+def test_nothing_usable_raises(text):
+    with pytest.raises(ModelOutputError):
+        parse_model_json(text)
+
+
+def test_invalid_document_around_the_slides_list():
+    # The object doesn't parse (Python literals), its "slides" value does
+    text = json.dumps(DECK).replace('"Three slides"', 'None')
+    assert parse_model_json(text)["slides"] == DECK["slides"]
+    with pytest.raises(ModelOutputError):
+        parse_model_json(text, key="patch")
+
+
+def test_stream_parser_emits_slides_as_they_complete():
+    text = "Here you go:\n" + fenced(DECK)
+    parser = SlideStreamParser()
+    emitted = []
+    for i in range(0, len(text), 7):
+        emitted += parser.feed(text[i:i + 7])
+    assert emitted == DECK["slides"]
+    assert parser.document() == DECK
+
+
+def test_update_falls_back_to_the_full_deck(login, app):
+    from services import get_services
+    client = login('alice')
+    slides = sample_deck(3)
+    edited = [dict(slide) for slide in slides]
+    edited[1]["title"] = "Rewritten"
+    # Asked for a patch, the model sends back the whole deck
+    get_services(app).llm.backend.responder = lambda prompt: fenced({"slides": edited, "message": "Done"})
+
+    data = client.post('/update', json={'prompt': 'rewrite slide 2', 'slides': slides}).get_json()
+    assert data["mode"] == "full"
+    assert [slide["title"] for slide in data["slides"]] == ["Deck slide 1", "Rewritten", "Deck slide 3"]
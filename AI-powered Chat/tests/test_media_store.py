@@ -0,0 +1,154 @@
+"""Image files: reference counts follow the decks, and unused files are swept only after the grace period."""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import create_user, sample_deck
+from media_store import MediaSweeper, deck_media_paths, media_path, media_usage, over_quota, register_media
+
+
+@pytest.fixture
+def uploads(ctx):
+    """Writes image files to the upload folder: uploads(path, size) -> URL"""
+    folder = ctx.config['UPLOAD_FOLDER']
+
+    def write(path, size):
+        full = os.path.join(folder, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, 'wb') as f:
+            f.write(b'\0' * size)
+        return '/static/uploads/' + path
+    write.folder = folder
+    return write
+
+
+def deck_showing(*urls):
+    slides = sample_deck(len(urls))
+    for slide, url in zip(slides, urls):
+        slide.update(image_url=url, has_image=True)
+    return slides
+
+
+def media(path):
+    from models import MediaFile, db
+    db.session.expire_all()
+    return MediaFile.query.filter_by(path=path).one_or_none()
+
+
+def user_media_bytes(user_id):
+    from models import User, db
+    db.session.expire_all()
+    return db.session.get(User, user_id).media_bytes
+
+
+def orphan_since(path, seconds):
+    from models import MediaFile, db
+    MediaFile.query.filter_by(path=path).update({"orphaned_at": datetime.utcnow() - timedelta(seconds=seconds)})
+    db.session.commit()
+
+
+def test_media_path_only_accepts_upload_urls():
+    assert media_path('/static/uploads/ab/cd/img_x.jpg') == 'ab/cd/img_x.jpg'
+    for url in ('/static/uploads/../app.py', '/static/uploads/a//b.jpg', '/static/uploads/a\\b.jpg',
+                'https://images.example.com/a.jpg', None, 3):
+        assert media_path(url) is None
+    slides = [{"image_url": '/static/uploads/a.jpg', "thumbnail_url": '/static/uploads/a_thumb.webp'}, "junk"]
+    assert deck_media_paths(slides) == {'a.jpg', 'a_thumb.webp'}
+
+
+def test_reference_counts_follow_decks(ctx, uploads):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    a, b = uploads('ab/cd/a.jpg', 1000), uploads('ab/cd/b.jpg', 300)
+
+    first = store.create(user_id, deck_showing(a, b))
+    second = store.create(user_id, deck_showing(a))
+    assert media('ab/cd/a.jpg').ref_count == 2
+    assert media('ab/cd/b.jpg').ref_count == 1
+    # Counted once per deck
+    assert user_media_bytes(user_id) == 2 * 1000 + 300
+
+    # Showing the same file on two slides of a deck is one reference
+    store.save(user_id, first, deck_showing(a, a))
+    assert media('ab/cd/a.jpg').ref_count == 2
+    assert media('ab/cd/b.jpg').ref_count == 0
+    assert media('ab/cd/b.jpg').orphaned_at is not None
+    assert user_media_bytes(user_id) == 2 * 1000
+    # b is unused but still Alice's on disk
+    assert media_usage(user_id) == 2 * 1000 + 300
+
+    store.delete(user_id, first)
+    assert media('ab/cd/a.jpg').ref_count == 1
+    assert media('ab/cd/a.jpg').orphaned_at is None
+    store.delete(user_id, second)
+    assert media('ab/cd/a.jpg').ref_count == 0
+    assert media('ab/cd/a.jpg').orphaned_at is not None
+    assert user_media_bytes(user_id) == 0
+
+
+def test_sweep_waits_for_the_grace_period(ctx, uploads):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    kept, dropped = uploads('ab/cd/kept.jpg', 100), uploads('ab/cd/dropped.jpg', 200)
+    deck_id = store.create(user_id, deck_showing(kept, dropped))
+    store.save(user_id, deck_id, deck_showing(kept))
+    sweeper = MediaSweeper(ctx, uploads.folder, grace_period=3600)
+
+    # Unused for a minute: still within the grace period
+    orphan_since('ab/cd/dropped.jpg', 60)
+    assert sweeper.sweep() == (0, 0)
+    assert os.path.exists(os.path.join(uploads.folder, 'ab/cd/dropped.jpg'))
+
+    orphan_since('ab/cd/dropped.jpg', 3601)
+    assert sweeper.sweep() == (1, 200)
+    assert not os.path.exists(os.path.join(uploads.folder, 'ab/cd/dropped.jpg'))
+    assert media('ab/cd/dropped.jpg') is None
+    # Files in use are never swept, however old
+    assert os.path.exists(os.path.join(uploads.folder, 'ab/cd/kept.jpg'))
+    assert media('ab/cd/kept.jpg').ref_count == 1
+
+
+def test_a_file_picked_up_again_is_not_swept(ctx, uploads):
+    from models import db
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    url = uploads('ab/cd/reused.jpg', 50)
+    register_media([('ab/cd/reused.jpg', 50)], user_id)
+    db.session.commit()
+    orphan_since('ab/cd/reused.jpg', 10 ** 6)
+
+    store.create(user_id, deck_showing(url))
+    assert media('ab/cd/reused.jpg').orphaned_at is None
+    assert MediaSweeper(ctx, uploads.folder, grace_period=0).sweep() == (0, 0)
+    assert os.path.exists(os.path.join(uploads.folder, 'ab/cd/reused.jpg'))
+
+
+def test_registering_a_known_unused_file_restarts_its_grace_period(ctx, uploads):
+    from models import db
+    uploads('ab/cd/again.jpg', 10)
+    register_media([('ab/cd/again.jpg', 10)])
+    db.session.commit()
+    orphan_since('ab/cd/again.jpg', 7200)
+    register_media([('ab/cd/again.jpg', 10)])
+    db.session.commit()
+    assert MediaSweeper(ctx, uploads.folder, grace_period=3600).sweep() == (0, 0)
+
+
+def test_untracked_files_are_never_swept(ctx, uploads):
+    uploads('legacy/img_old.jpg', 10)
+    assert MediaSweeper(ctx, uploads.folder, grace_period=0).sweep() == (0, 0)
+    assert os.path.exists(os.path.join(uploads.folder, 'legacy/img_old.jpg'))
+
+
+def test_quota(ctx, uploads):
+    from services import get_services
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    store.create(user_id, deck_showing(uploads('ab/cd/big.jpg', 5000)))
+    assert over_quota(user_id, 5000)
+    assert not over_quota(user_id, 5001)
+    assert not over_quota(user_id, 0)
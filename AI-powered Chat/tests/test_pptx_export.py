@@ -0,0 +1,109 @@
+"""Server-side .pptx export: the layout of the browser export, cached by deck content."""
+import os
+from io import BytesIO
+
+from PIL import Image
+from pptx import Presentation as PptxPresentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.util import Inches
+
+from conftest import sample_deck
+from pptx_export import FOOTER_TEXT, ExportCache, deck_hash, render_pptx
+
+
+def deck_with_image(image_url, count=3):
+    slides = sample_deck(count)
+    slides[1].update(image_url=image_url, has_image=True, image_position="left")
+    return slides
+
+
+def picture_boxes(slide):
+    return [(shape.left, shape.top, shape.width, shape.height)
+            for shape in slide.shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE]
+
+
+def texts(slide):
+    return [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+
+
+def test_render_follows_the_browser_layout(tmp_path):
+    image = tmp_path / 'wide.jpg'
+    Image.new('RGB', (800, 400), 'teal').save(image)
+    slides = deck_with_image('/static/uploads/wide.jpg')
+    slides[2]["content"] = "A paragraph instead of bullets"
+    # An image that isn't in the upload folder is left out
+    slides[0].update(image_url='https://images.example.com/a.jpg', has_image=True)
+    out = tmp_path / 'deck.pptx'
+
+    render_pptx(slides, lambda url: str(image) if url == '/static/uploads/wide.jpg' else None, str(out))
+
+    deck = PptxPresentation(str(out))
+    assert (deck.slide_width, deck.slide_height) == (Inches(10), Inches(7.5))
+    assert len(deck.slides) == 3
+    first, second, third = deck.slides
+    assert texts(first) == ["1", "Deck slide 1", "Point 1\nPoint 2\nPoint 3", FOOTER_TEXT]
+    assert texts(third)[2] == "A paragraph instead of bullets"
+    assert picture_boxes(first) == [] and picture_boxes(third) == []
+    # image_position "left": the picture fills the left box, cropped to its ratio
+    [box] = picture_boxes(second)
+    assert box == (Inches(0.5), Inches(1.7), Inches(4.2), Inches(5))
+    picture = next(shape for shape in second.shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE)
+    assert picture.crop_left > 0 and picture.crop_left == picture.crop_right and picture.crop_top == 0
+
+
+def test_cache_renders_each_deck_once(tmp_path):
+    cache = ExportCache(str(tmp_path / 'exports'), image_path=lambda url: None, max_files=2)
+    slides = sample_deck(2)
+    path, key = cache.get_or_render(slides)
+    assert key == deck_hash(slides) and os.path.exists(path)
+    assert cache.get_or_render(sample_deck(2)) == (path, key)
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+    edited = sample_deck(2)
+    edited[0]["title"] = "Edited"
+    assert cache.get_or_render(edited)[1] != key
+
+    # Beyond max_files the least recently used file goes
+    os.utime(path, (1, 1))
+    cache.get_or_render(sample_deck(5))
+    assert not os.path.exists(path)
+    assert len(os.listdir(tmp_path / 'exports')) == 2
+
+
+def test_export_endpoint(login, app):
+    from services import get_services
+    client = login('alice')
+    with app.app_context():
+        from models import User
+        user_id = User.query.filter_by(username='alice').one().id
+        deck_id = get_services(app).presentation_store.create(user_id, sample_deck(4))
+
+    response = client.get(f'/export/{deck_id}.pptx')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+    assert 'attachment' in response.headers['Content-Disposition']
+    etag = response.headers['ETag']
+    assert etag.strip('"') == deck_hash(sample_deck(4))
+    assert len(PptxPresentation(BytesIO(response.get_data())).slides) == 4
+
+    assert client.get(f'/export/{deck_id}.pptx', headers={'If-None-Match': etag}).status_code == 304
+    assert login('bob').get(f'/export/{deck_id}.pptx').status_code == 404
+    assert client.get('/export/999.pptx').status_code == 404
+
+
+def test_export_reads_uploaded_images(login, app):
+    from services import get_services
+    client = login('alice')
+    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'ab'), exist_ok=True)
+    Image.new('RGB', (300, 600), 'orange').save(os.path.join(app.config['UPLOAD_FOLDER'], 'ab', 'tall.jpg'))
+    with app.app_context():
+        from models import User
+        user_id = User.query.filter_by(username='alice').one().id
+        deck_id = get_services(app).presentation_store.create(user_id, deck_with_image('/static/uploads/ab/tall.jpg'))
+
+    response = client.get(f'/export/{deck_id}.pptx')
+    assert response.status_code == 200
+    [picture] = [shape for shape in PptxPresentation(BytesIO(response.get_data())).slides[1].shapes
+                 if shape.shape_type == MSO_SHAPE_TYPE.PICTURE]
+    # Taller than the box: cropped top and bottom
+    assert picture.crop_top > 0 and picture.crop_left == 0
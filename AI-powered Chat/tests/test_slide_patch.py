@@ -0,0 +1,110 @@
+"""Patch-mode edits: only the targeted slides change, the rest of the deck is merged server-side."""
+from conftest import sample_deck
+from slide_patch import apply_patch, find_target_slides, merge_slide, restore_image_fields
+
+IMAGE = {"image_url": "https://images.example.com/a.jpg", "has_image": True,
+         "thumbnail_url": "https://images.example.com/a_thumb.webp"}
+
+
+def with_images(slides):
+    return [dict(slide, **IMAGE) for slide in slides]
+
+
+def test_find_target_slides():
+    slides = sample_deck(5)
+    assert find_target_slides("shorten slide 3", slides) == [2]
+    assert find_target_slides("merge slides 2-4", slides) == [1, 2, 3]
+    assert find_target_slides("fix the last slide", slides) == [4]
+    assert find_target_slides("reword 'Deck slide 2'", slides) == [1]
+    assert find_target_slides("change slide 1", slides, explicit=[3, 99]) == [0, 3]
+    assert find_target_slides("make every slide shorter", slides) is None
+    assert find_target_slides("add a slide about costs", slides) == []
+
+
+def test_replace_only_touches_targets():
+    slides = sample_deck(4)
+    patch = [
+        {"op": "replace", "slide": 2, "data": {"title": "New 2", "content": ["x"],
+                                              "image_search_query": "deck 2"}},
+        # Not a target: ignored
+        {"op": "replace", "slide": 3, "data": {"title": "Sneaky"}},
+        {"op": "delete", "slide": 4},
+    ]
+    result, changed = apply_patch(slides, patch, [1])
+    assert changed == [1]
+    assert result[1]["title"] == "New 2"
+    assert result[0] == slides[0] and result[2] == slides[2] and result[3] == slides[3]
+    assert len(result) == 4
+
+
+def test_delete_and_insert_positions():
+    slides = sample_deck(3)
+    patch = [
+        {"op": "delete", "slide": 2},
+        {"op": "insert", "after": 0, "data": {"title": "Intro"}},
+        {"op": "insert", "after": 3, "data": {"title": "Outro", "image_url": "https://evil.example/x.jpg"}},
+        {"op": "insert", "after": 99, "data": {"title": "Clamped"}},
+        {"op": "replace", "slide": "not a number", "data": {}},
+    ]
+    result, changed = apply_patch(slides, patch, [1])
+    assert [slide["title"] for slide in result] == ["Intro", "Deck slide 1", "Deck slide 3", "Outro", "Clamped"]
+    assert changed == [0, 3, 4]
+    # The model can't set image fields
+    assert "image_url" not in result[3]
+
+
+def test_merge_keeps_images_unless_the_query_changed():
+    old = with_images(sample_deck(1))[0]
+    kept = merge_slide(old, {"title": "Renamed", "content": ["a"], "image_search_query": old["image_search_query"]})
+    assert kept["image_url"] == IMAGE["image_url"] and kept["title"] == "Renamed"
+
+    dropped = merge_slide(old, {"title": "Renamed", "image_search_query": "something else"})
+    assert "image_url" not in dropped and "has_image" not in dropped
+
+
+def test_restore_image_fields_on_full_regeneration():
+    old = with_images(sample_deck(3))
+    new = [dict(slide) for slide in sample_deck(3)]
+    new[1]["content"] = ["changed"]
+    new.append({"title": "Brand new", "content": []})
+    assert restore_image_fields(old, new) == [1, 3]
+    assert all(slide["image_url"] == IMAGE["image_url"] for slide in new[:3])
+    assert "image_url" not in new[3]
+
+
+def test_update_endpoint_merges_the_patch(login, app):
+    from services import get_services
+    client = login('alice')
+    with app.app_context():
+        from models import User
+        user_id = User.query.filter_by(username='alice').one().id
+        slides = with_images(sample_deck(4))
+        deck_id = get_services(app).presentation_store.create(user_id, slides)
+    assert client.get(f'/load-presentation/{deck_id}').status_code == 200
+
+    # No slides sent: the stored deck is edited
+    response = client.post('/update', json={'prompt': 'add an example to slide 3'})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    data = response.get_json()
+    assert data["mode"] == "patch"
+    assert data["changed"] == [2]
+    assert data["presentation_id"] == deck_id
+    for index in (0, 1, 3):
+        assert data["slides"][index] == slides[index]
+    edited = data["slides"][2]
+    assert edited["content"][-1] == "Updated: add an example to slide 3"
+    assert edited["image_url"] == IMAGE["image_url"]
+
+    stored = client.get('/get-slides').get_json()
+    assert stored["slides"] == data["slides"]
+    assert stored["slide_hashes"] == data["slide_hashes"]
+
+
+def test_update_endpoint_full_mode(login):
+    client = login('alice')
+    slides = sample_deck(2)
+    response = client.post('/update', json={'prompt': 'make every slide shorter', 'slides': slides})
+    data = response.get_json()
+    assert data["mode"] == "full"
+    assert data["changed"] == []
+    assert data["slides"] == slides
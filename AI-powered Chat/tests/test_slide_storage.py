@@ -0,0 +1,81 @@
+"""Compressed slide rows: every slide decodes to the slide that was stored."""
+import json
+
+import pytest
+
+from conftest import create_user, sample_deck
+from slide_storage import FORMAT_DEFLATE, FORMAT_JSON, decode_slide, decode_slides, encode_slide
+
+IMAGE_SLIDE = {
+    "title": "Glaciers — retreat since 1850",
+    "content": ["Ice lost: 30%", "Ünïcødé and emoji 🧊", "Quotes \" and \\ backslashes"],
+    "image_search_query": "glacier retreat",
+    "image_position": "right",
+    "image_url": "/static/uploads/ab/cd/img_abcdef0123456789.jpg",
+    "thumbnail_url": "/static/uploads/ab/cd/img_abcdef0123456789_thumb.webp",
+    "image_meta": {"width": 1600, "height": 1067, "bytes": 183211, "sha256": "ab" * 32,
+                   "thumb_width": 320, "thumb_height": 213, "thumb_bytes": 9120},
+    "has_image": True,
+}
+
+
+@pytest.mark.parametrize("slide", [
+    IMAGE_SLIDE,
+    sample_deck(1)[0],
+    {"title": "x" * 20000, "content": [str(i) for i in range(2000)]},
+    {"title": ""},
+    {},
+])
+def test_round_trip(slide):
+    blob = encode_slide(slide)
+    assert blob[0] in (FORMAT_DEFLATE, FORMAT_JSON)
+    assert decode_slide(blob) == slide
+
+
+def test_compresses_with_the_dictionary():
+    blob = encode_slide(IMAGE_SLIDE)
+    assert blob[0] == FORMAT_DEFLATE
+    assert len(blob) < len(json.dumps(IMAGE_SLIDE, ensure_ascii=False).encode()) // 2
+
+
+def test_incompressible_slides_are_stored_as_json():
+    blob = encode_slide({})
+    assert blob == bytes([FORMAT_JSON]) + b'{}'
+
+
+def test_deck_mixing_formats_decodes():
+    blobs = [encode_slide(IMAGE_SLIDE), encode_slide({}), encode_slide(sample_deck(1)[0])]
+    assert [blob[0] for blob in blobs] == [FORMAT_DEFLATE, FORMAT_JSON, FORMAT_DEFLATE]
+    assert decode_slides(blobs) == [IMAGE_SLIDE, {}, sample_deck(1)[0]]
+
+
+@pytest.mark.parametrize("blob", [b'', b'\x09{}', bytes([FORMAT_DEFLATE]) + b'\xff\xfe\xfd'])
+def test_bad_blobs_raise_value_error(blob):
+    with pytest.raises(ValueError):
+        decode_slide(blob)
+
+
+def test_store_round_trip_and_lazy_migration(ctx):
+    from models import Presentation, PresentationSlide, db
+    from services import get_services
+    from session_state import STORAGE_SLIDE_ROWS, PresentationStore
+    store = get_services(ctx).presentation_store
+    user_id = create_user('alice')
+    slides = sample_deck(3) + [IMAGE_SLIDE]
+
+    deck_id = store.create(user_id, slides)
+    # A fresh store: read from the rows, not from the cache
+    assert PresentationStore().get(user_id, deck_id)["slides"] == slides
+    assert {data[0] for (data,) in db.session.query(PresentationSlide.data)} <= {FORMAT_DEFLATE, FORMAT_JSON}
+
+    # A deck still in slides_data moves to rows when first read, keeping updated_at
+    old = Presentation(title="Old", user_id=user_id, slides_data=json.dumps(slides), storage_version=0)
+    db.session.add(old)
+    db.session.commit()
+    updated_at = old.updated_at
+    assert PresentationStore().get(user_id, old.id)["slides"] == slides
+    migrated = db.session.get(Presentation, old.id)
+    assert migrated.storage_version == STORAGE_SLIDE_ROWS
+    assert migrated.slides_data == ''
+    assert migrated.updated_at == updated_at
+    assert PresentationSlide.query.filter_by(presentation_id=old.id).count() == len(slides)
@@ -0,0 +1,101 @@
+"""UserCache: identities served from memory until their TTL or an invalidation."""
+import time
+
+from accounts import CachedUser, UserCache
+
+
+def loader(users):
+    calls = []
+
+    def load(user_id):
+        calls.append(user_id)
+        return users.get(user_id)
+    load.calls = calls
+    return load
+
+
+def test_hits_misses_and_invalidation():
+    users = {1: CachedUser(1, 'alice', 'alice@example.com')}
+    load = loader(users)
+    cache = UserCache(ttl=60)
+
+    assert cache.get(1, load).username == 'alice'
+    assert cache.get(1, load).username == 'alice'
+    assert load.calls == [1]
+
+    users[1] = CachedUser(1, 'alice2', 'alice@example.com')
+    assert cache.get(1, load).username == 'alice'
+    cache.invalidate(1)
+    assert cache.get(1, load).username == 'alice2'
+    assert load.calls == [1, 1]
+    # Forgetting an unknown user isn't counted
+    cache.invalidate(99)
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 2, "invalidations": 1}
+
+
+def test_unknown_users_are_not_cached():
+    load = loader({})
+    cache = UserCache()
+    assert cache.get(5, load) is None
+    assert cache.get(5, load) is None
+    assert load.calls == [5, 5]
+
+
+def test_entries_expire():
+    load = loader({1: CachedUser(1, 'alice', 'a@example.com')})
+    cache = UserCache(ttl=0.05)
+    cache.get(1, load)
+    time.sleep(0.1)
+    cache.get(1, load)
+    assert load.calls == [1, 1]
+
+
+def test_least_recently_used_is_evicted():
+    users = {i: CachedUser(i, f'user{i}', f'{i}@example.com') for i in range(3)}
+    load = loader(users)
+    cache = UserCache(max_entries=2)
+    cache.get(0, load)
+    cache.get(1, load)
+    cache.get(0, load)
+    cache.get(2, load)
+    assert cache.stats()["entries"] == 2
+    cache.get(0, load)
+    cache.get(1, load)
+    assert load.calls == [0, 1, 2, 1]
+
+
+def test_settings_change_is_seen_at_once(login):
+    client = login('alice')
+    assert client.get('/settings/response-cache').get_json() == {"enabled": True}
+    assert client.post('/settings/response-cache', json={"enabled": False}).get_json() == {"enabled": False}
+    # Read from the cached identity, which the change invalidated
+    assert client.get('/settings/response-cache').get_json() == {"enabled": False}
+    assert client.post('/settings/response-cache', json={"enabled": "no"}).status_code == 400
+
+
+def test_changes_without_invalidation_wait_for_the_ttl(login, app):
+    from models import User, db
+    from services import get_services
+    client = login('alice')
+    client.get('/settings/response-cache')
+    with app.app_context():
+        user = User.query.filter_by(username='alice').one()
+        user.response_cache_enabled = False
+        db.session.commit()
+        user_id = user.id
+    # Another process changed the row: this one still has the cached identity
+    assert client.get('/settings/response-cache').get_json() == {"enabled": True}
+    get_services(app).user_cache.invalidate(user_id)
+    assert client.get('/settings/response-cache').get_json() == {"enabled": False}
+
+
+def test_deleted_user_is_logged_out(login, app):
+    from models import User, db
+    from services import get_services
+    client = login('alice')
+    with app.app_context():
+        user = User.query.filter_by(username='alice').one()
+        db.session.delete(user)
+        db.session.commit()
+        get_services(app).user_cache.invalidate(user.id)
+    assert client.get('/history.json').status_code in (302, 401)